@@ -1,7 +1,7 @@
 # backend/app/api/v1/api_v1.py
 
 from fastapi import APIRouter
-from .endpoints import submission, ai_test
+from .endpoints import submission, ai_test, chat, live
 
 api_router = APIRouter()
 
@@ -11,4 +11,12 @@ api_router.include_router(submission.router, prefix="/submission", tags=["Submis
 
 # Include the AI testing router
 # All endpoints from ai_test.py will be prefixed with /ai
-api_router.include_router(ai_test.router, prefix="/ai", tags=["AI Testing"])
\ No newline at end of file
+api_router.include_router(ai_test.router, prefix="/ai", tags=["AI Testing"])
+
+# Include the tutor chat router
+# All endpoints from chat.py will be prefixed with /chat
+api_router.include_router(chat.router, prefix="/chat", tags=["Chat"])
+
+# Include the live analysis WebSocket
+# All endpoints from live.py will be prefixed with /live
+api_router.include_router(live.router, prefix="/live", tags=["Live Analysis"])
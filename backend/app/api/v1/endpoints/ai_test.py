@@ -8,6 +8,8 @@ from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Optional
 
+from ....core import admission, quota
+from ....core.circuit_breaker import CircuitOpenError
 from ....core.security import get_current_user, User
 from ....services import gcs_service, feedback_service
 
@@ -27,7 +29,8 @@ class MockAIFeedbackResponse(BaseModel):
 def test_ai_feedback_without_db(
     *,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    charge: quota.Charge = Depends(quota.charge_analysis()),
 ):
     """
     Test AI functionality without database storage.
@@ -37,9 +40,10 @@ def test_ai_feedback_without_db(
     3. Returns results without storing in database
     """
     try:
-        # Step 1: Upload to GCS
+        # Step 1: Upload to GCS, keeping the bytes so analysis does not download them back from GCS.
+        image_bytes = gcs_service.read_upload(file)
         public_gcs_url = gcs_service.upload_image_to_gcs(
-            file=file, user_id=current_user.uid
+            file=file, user_id=current_user.uid, image_bytes=image_bytes
         )
         if not public_gcs_url:
             raise HTTPException(status_code=500, detail="Failed to upload image to GCS.")
@@ -54,8 +58,10 @@ def test_ai_feedback_without_db(
 
         # Step 3: Run AI analysis
         ai_feedback_data = feedback_service.get_errorbouding_from_image(
-            gcs_uri=gcs_uri
+            gcs_uri=gcs_uri, image_bytes=image_bytes
         )
+        if ai_feedback_data.get("status", "ok") != "ok":
+            charge.refund()  # a degraded result, not an analysis
 
         return MockAIFeedbackResponse(
             image_gcs_url=public_gcs_url,
@@ -63,6 +69,8 @@ def test_ai_feedback_without_db(
             message="AI analysis completed successfully (no database storage)"
         )
 
+    except (HTTPException, CircuitOpenError, admission.ClientDisconnected):
+        raise  # our own errors, the 503 + Retry-After handler in main.py and the admission middleware
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -73,6 +81,7 @@ def test_ai_feedback_without_db(
     "/test-bounding-boxes",
     response_model=MockAIFeedbackResponse,
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(quota.charge_analysis())],
 )
 def test_bounding_box_detection(
     *,
@@ -83,9 +92,10 @@ def test_bounding_box_detection(
     Test only the bounding box detection functionality.
     """
     try:
-        # Upload to GCS
+        # Upload to GCS, keeping the bytes so analysis does not download them back from GCS.
+        image_bytes = gcs_service.read_upload(file)
         public_gcs_url = gcs_service.upload_image_to_gcs(
-            file=file, user_id=current_user.uid
+            file=file, user_id=current_user.uid, image_bytes=image_bytes
         )
         if not public_gcs_url:
             raise HTTPException(status_code=500, detail="Failed to upload image to GCS.")
@@ -99,7 +109,7 @@ def test_bounding_box_detection(
         )
 
         # Test bounding box detection
-        bounding_boxes = feedback_service.get_bounding_from_image(gcs_uri=gcs_uri)
+        bounding_boxes = feedback_service.get_bounding_from_image(gcs_uri=gcs_uri, image_bytes=image_bytes)
         
         return MockAIFeedbackResponse(
             image_gcs_url=public_gcs_url,
@@ -110,6 +120,8 @@ def test_bounding_box_detection(
             message="Bounding box detection completed successfully"
         )
 
+    except (HTTPException, CircuitOpenError, admission.ClientDisconnected):
+        raise  # our own errors, the 503 + Retry-After handler in main.py and the admission middleware
     except Exception as e:
         raise HTTPException(
             status_code=500, 
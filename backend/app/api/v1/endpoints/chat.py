@@ -0,0 +1,92 @@
+#
+# FILE: backend/app/api/v1/endpoints/chat.py
+# Follow-up chat with the AI tutor about a submission
+#
+
+import json
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ....core import quota
+from ....core.security import get_current_user, User
+from ....services import chat_service, feedback_service, submission_archive
+from ....schemas import chat as chat_schema
+from ....db import crud_chat, crud_submission
+from ....db.database import get_db, get_read_db
+
+router = APIRouter()
+
+def _get_owned_submission(db: Session, submission_id: int, user: User):
+    submission = crud_submission.get_submission(db, submission_id=submission_id, user_id=user.uid)
+    if submission is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Submission not found.")
+    return submission
+
+def _as_server_sent_events(chunks, charge: quota.Charge):
+    """
+    Wraps reply chunks as SSE: `data:` events carrying {"text": ...}, then a
+    final `done` event (or an `error` event if the model fails mid-stream).
+    The stream outlives the quota dependency, so a failed reply is refunded here.
+    """
+    try:
+        for chunk in chunks:
+            yield f"data: {json.dumps({'text': chunk})}\n\n"
+    except Exception as e:
+        charge.refund()
+        print(f"Error while streaming chat reply: {type(e).__name__} - {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': 'The tutor could not answer right now.'})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+@router.post("/{submission_id}/messages")
+def send_chat_message(
+    submission_id: int,
+    body: chat_schema.ChatMessageCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    charge: quota.Charge = Depends(quota.charge_analysis()),
+):
+    """
+    Asks the tutor a follow-up question about a submission.
+    The reply is streamed token by token as text/event-stream.
+    """
+    submission = _get_owned_submission(db, submission_id, current_user)
+    # Fail fast (503) instead of opening a stream that can only error out.
+    feedback_service.vertex_breaker.check()
+    conversation = crud_chat.get_or_create_conversation(
+        db, submission_id=submission.id, user_id=current_user.uid
+    )
+
+    reply = chat_service.stream_reply(
+        conversation_id=conversation.id,
+        image_gcs_url=submission.image_gcs_url,
+        ai_feedback=submission_archive.feedback_of(submission),
+        message=body.message,
+    )
+    return StreamingResponse(
+        _as_server_sent_events(reply, charge),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/{submission_id}/messages", response_model=chat_schema.ChatHistoryResponse)
+def get_chat_history(
+    submission_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Returns the full conversation about a submission, including turns that
+    have since been folded into the summary. Read from the replica when one
+    is configured; a submission without a conversation yet has no messages.
+    """
+    submission = _get_owned_submission(db, submission_id, current_user)
+    conversation = crud_chat.find_conversation(db, submission_id=submission.id)
+    if conversation is None:
+        return chat_schema.ChatHistoryResponse(submission_id=submission.id, summary=None, messages=[])
+    return chat_schema.ChatHistoryResponse(
+        submission_id=submission.id,
+        summary=conversation.summary,
+        messages=crud_chat.list_messages(db, conversation_id=conversation.id),
+    )
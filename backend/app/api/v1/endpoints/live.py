@@ -0,0 +1,124 @@
+#
+# FILE: backend/app/api/v1/endpoints/live.py
+# Live analysis while the student writes, over a WebSocket
+#
+
+import asyncio
+import contextlib
+import functools
+import json
+import threading
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+
+from ....core import admission, quota
+from ....core.config import settings
+from ....core.security import User, verify_id_token
+from ....services import feedback_service, live_analysis, problem_catalog
+
+router = APIRouter()
+
+# Seconds a new connection has to send its auth message.
+AUTH_TIMEOUT_SECONDS = 10
+
+async def _analyze(user: User, image_bytes: bytes, problem_id):
+    """
+    One live analysis, charged to the user's quota like a submission. Failed
+    and degraded analyses are refunded.
+
+    Raises:
+        quota.QuotaExceeded: the user or their class is over a limit.
+    """
+    charge = quota.tracker.charge(user.uid, user.class_id) if settings.QUOTA_ENABLED else quota.NO_CHARGE
+    try:
+        feedback = await run_in_threadpool(
+            feedback_service.get_errorbouding_from_image, gcs_uri="", image_bytes=image_bytes, problem_id=problem_id
+        )
+    except BaseException:
+        charge.refund()
+        raise
+    if feedback.get("status", "ok") != "ok":
+        charge.refund()  # a degraded result, not an analysis
+    return feedback
+
+@router.websocket("/ws")
+async def live_analysis_socket(websocket: WebSocket):
+    """
+    Pushes error boxes while the student writes (app/services/live_analysis.py).
+
+    Protocol, JSON text frames unless noted:
+      -> {"type": "auth", "token": <Firebase ID token>, "problem_id": optional}
+      <- {"type": "ready", "limits": {...}}
+      -> {"type": "strokes", "width": W, "height": H,
+          "strokes": [{"points": [[x, y], ...], "width": 3, "erase": false}, ...]}
+         New strokes since the last batch, in canvas pixels.
+      -> {"type": "undo", "count": 1} | {"type": "clear"}
+      -> binary frame, or {"type": "snapshot", "image": <base64>}: a PNG of the
+         whole canvas, replacing everything sent before
+      <- {"type": "feedback", "errors": [{"error_text", "box_2d"}], "status", "lines", "lines_checked"}
+      <- {"type": "status", "state": "throttled" | "unavailable" | "over_quota", "retry_after": seconds}
+      <- {"type": "error", "detail": ...} for a message that was ignored
+    """
+    await websocket.accept()
+    if not settings.LIVE_ANALYSIS:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Live analysis is disabled.")
+        return
+    if live_analysis.open_sessions() >= settings.LIVE_MAX_SESSIONS:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many live sessions; retry later.")
+        return
+
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), timeout=AUTH_TIMEOUT_SECONDS)
+        if not isinstance(hello, dict) or hello.get("type") != "auth":
+            raise ValueError("The first message must be {\"type\": \"auth\", ...}.")
+        user = await run_in_threadpool(verify_id_token, str(hello.get("token", "")))
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, ValueError, HTTPException) as e:
+        reason = e.detail if isinstance(e, HTTPException) else str(e) or "Authentication timed out."
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=reason)
+        return
+    problem_id = hello.get("problem_id") or await run_in_threadpool(problem_catalog.default_problem_id)
+
+    session = live_analysis.LiveSession(problem_id, analyze=functools.partial(_analyze, user), send=websocket.send_json)
+    cancelled = threading.Event()
+    with admission.cancel_when(cancelled):
+        runner = asyncio.create_task(session.run())
+    print(f"Live session opened for user {user.uid} ({live_analysis.open_sessions()} open).")
+    await websocket.send_json({
+        "type": "ready",
+        "limits": {
+            "analyses_per_minute": settings.LIVE_ANALYSES_PER_MINUTE,
+            "debounce_seconds": settings.LIVE_DEBOUNCE_SECONDS,
+            "max_canvas_side": settings.LIVE_MAX_CANVAS_SIDE,
+        },
+    })
+    try:
+        while True:
+            # Also wake up when the session task ends, so a failed session closes at once.
+            receiving = asyncio.ensure_future(websocket.receive())
+            await asyncio.wait((receiving, runner), return_when=asyncio.FIRST_COMPLETED)
+            if not receiving.done():
+                receiving.cancel()
+                break
+            message = receiving.result()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                if message.get("bytes") is not None:
+                    await session.set_snapshot(message["bytes"])
+                else:
+                    await session.handle(json.loads(message.get("text") or "null") or {})
+            except (ValueError, AttributeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e) or "Malformed message."})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        cancelled.set()
+        runner.cancel()
+        session.close()
+        if runner.done() and not runner.cancelled() and runner.exception() is not None:
+            print(f"Live session failed: {type(runner.exception()).__name__} - {runner.exception()}")
+            with contextlib.suppress(Exception):
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="Live analysis failed.")
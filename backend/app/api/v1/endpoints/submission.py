@@ -1,15 +1,18 @@
 #
 # FILE: backend/app/api/v1/endpoints/submission.py
 #
-import json
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
+from ....core import admission, quota
 from ....core.security import get_current_user, User
-from ....services import gcs_service, feedback_service
+from ....core.responses import FastJSONResponse, compact_submission_payload, dumps
+from ....services import gcs_service, feedback_service, idempotency, image_derivatives, ocr_service, problem_catalog
 from ....schemas import submission as submission_schema
 from ....db import crud_submission
-from ....db.database import get_db
+from ....db.database import get_db, get_read_db
 from ....core.config import settings
 
 router = APIRouter()
@@ -23,19 +26,111 @@ def submit_solution_and_get_feedback(
     *,
     db: Session = Depends(get_db),
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    problem_id: Optional[str] = Form(None, description="Catalog problem the work answers; defaults to the MVP problem."),
+    current_user: User = Depends(get_current_user),
+    charge: quota.Charge = Depends(quota.charge_analysis()),
+    compact: bool = Query(False, description="Return the feedback once, without the duplicate ai_feedback JSON string."),
+    pack_boxes: bool = Query(False, description="With compact, send error boxes as integer arrays plus a parallel labels list."),
+    idempotency_key: Optional[str] = Header(
+        None, max_length=255, description="Retries with the same key get the first response instead of a new submission.",
+    ),
 ):
     """
     Orchestrates the full submission process:
     1. Uploads image to GCS.
     2. Sends image to a multimodal AI to generate error detections with bounding boxes.
-    3. Stores the submission in the database.
-    4. Returns the structured data to the client.
+    3. Renders a thumbnail and an annotated copy of the image next to it.
+    4. Stores the submission in the database.
+    5. Returns the structured data to the client.
+
+    With an Idempotency-Key header this runs once per key; see
+    app/services/idempotency.py.
+    """
+    problem_id = problem_id or problem_catalog.default_problem_id()
+
+    # Keep the bytes so analysis does not download them back from GCS.
+    image_bytes = gcs_service.read_upload(file)
+    if not idempotency_key:
+        _, feedback_status, response = _create_submission(db, file, image_bytes, problem_id, current_user, compact, pack_boxes)
+        if feedback_status != "ok":
+            charge.refund()  # a degraded result, not an analysis
+        return response
+
+    claim = idempotency.claim(
+        db,
+        user_id=current_user.uid,
+        key=idempotency_key,
+        request_hash=idempotency.fingerprint(image_bytes, problem_id=problem_id, compact=compact, pack_boxes=pack_boxes),
+    )
+    if claim.replay is not None:
+        charge.refund()  # nothing was analysed
+        return claim.replay
+    try:
+        submission_id, feedback_status, response = _create_submission(
+            db, file, image_bytes, problem_id, current_user, compact, pack_boxes,
+            submission_id=claim.record.submission_id,
+        )
+    except BaseException:
+        idempotency.release(db, claim.record)
+        raise
+    if feedback_status != "ok":
+        charge.refund()  # a degraded result, not an analysis
+        # Not kept for replay either: the client's retry analyses again and updates this row.
+        idempotency.defer(db, claim.record, submission_id=submission_id)
+        return response
+    if not isinstance(response, FastJSONResponse):
+        # Rendered here so the stored body is exactly what this client receives.
+        response = FastJSONResponse(status_code=status.HTTP_201_CREATED, content=response.model_dump(mode="json"))
+    idempotency.complete(db, claim.record, response, submission_id=submission_id)
+    return response
+
+@router.get("/history", response_model=submission_schema.SubmissionHistoryResponse)
+def get_submission_history(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user),
+    limit: int = Query(20, ge=1, le=100),
+    days: int = Query(90, ge=1, le=366, description="Only submissions from the last this many days."),
+):
+    """
+    The user's recent submissions, newest first, as links only: lists show
+    `thumbnail_url` (or `annotated_url`) and open the full submission on
+    demand. Entries from before derivatives existed have them as null.
     """
-    problem_id = "problem_1_algebra"
+    rows = crud_submission.list_recent_submissions(db, user_id=current_user.uid, limit=limit, days=days)
+    return FastJSONResponse(content={
+        "submissions": [
+            {
+                "submission_id": row.id,
+                "problem_id": row.problem_id,
+                "submitted_at": row.submitted_at.isoformat(),
+                "image_gcs_url": row.image_gcs_url,
+                "thumbnail_url": row.thumbnail_url,
+                "annotated_url": row.annotated_url,
+            }
+            for row in rows
+        ],
+    })
 
+def _create_submission(
+    db: Session,
+    file: UploadFile,
+    image_bytes: bytes,
+    problem_id: str,
+    current_user: User,
+    compact: bool,
+    pack_boxes: bool,
+    submission_id: Optional[int] = None,
+):
+    """
+    Uploads, analyses and stores one submission; returns (submission id,
+    feedback status, response), the status being "ok" for a fresh analysis.
+    With `submission_id` (an earlier degraded run of the same keyed request)
+    that row is updated instead of a new one being added.
+    """
+    # OCR runs in the background while the image is uploaded and analysed.
+    ocr_future = ocr_service.start_ocr(image_bytes)
     public_gcs_url = gcs_service.upload_image_to_gcs(
-        file=file, user_id=current_user.uid
+        file=file, user_id=current_user.uid, image_bytes=image_bytes
     )
     if not public_gcs_url:
         raise HTTPException(status_code=500, detail="Failed to upload image.")
@@ -48,34 +143,63 @@ def submit_solution_and_get_feedback(
 
     try:
         ai_feedback_data = feedback_service.get_errorbouding_from_image(
-            gcs_uri=gcs_uri
+            gcs_uri=gcs_uri, image_bytes=image_bytes, problem_id=problem_id
         )
+    except admission.ClientDisconnected:
+        raise  # handled by the admission middleware, not a server error
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to generate AI feedback: {e}"
         )
 
+    # Thumbnail and annotated copy render while OCR finishes.
+    derivatives_future = image_derivatives.start_derivatives(
+        image_bytes, public_gcs_url, ai_feedback_data.get("errors", [])
+    )
     # Store the AI feedback as JSON string in the database
-    ai_feedback_json_string = json.dumps(ai_feedback_data)
+    ai_feedback_json_string = dumps(ai_feedback_data).decode("utf-8")
 
     submission_data = submission_schema.SubmissionCreate(
         user_id=current_user.uid,
         problem_id=problem_id,
         image_gcs_url=public_gcs_url,
-        ocr_text="",  # We're not using OCR text anymore, using AI translation instead
+        ocr_text=ocr_service.wait_for_text(ocr_future),
         ai_feedback=ai_feedback_json_string,
     )
+    submission_data.thumbnail_url, submission_data.annotated_url = image_derivatives.wait_for_urls(derivatives_future)
 
-    db_submission = crud_submission.create_submission(
-        db=db, submission=submission_data
-    )
+    db_submission = None
+    if submission_id is not None:
+        db_submission = crud_submission.update_submission(db, submission_id=submission_id, submission=submission_data)
+    if db_submission is None:
+        db_submission = crud_submission.create_submission(
+            db=db, submission=submission_data
+        )
     
     # Return the structured response with AI feedback data
-    return submission_schema.SubmissionResponse(
+    if compact:
+        # Plain dict straight to orjson: no response_model re-validation.
+        return db_submission.id, ai_feedback_data.get("status", "ok"), FastJSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content=compact_submission_payload(
+                submission_id=db_submission.id,
+                image_gcs_url=db_submission.image_gcs_url,
+                ocr_text=db_submission.ocr_text,
+                ai_feedback_data=ai_feedback_data,
+                pack_boxes=pack_boxes,
+                thumbnail_url=db_submission.thumbnail_url,
+                annotated_url=db_submission.annotated_url,
+            ),
+        )
+
+    return db_submission.id, ai_feedback_data.get("status", "ok"), submission_schema.SubmissionResponse(
         image_gcs_url=db_submission.image_gcs_url,
         ocr_text=db_submission.ocr_text,
         ai_feedback=db_submission.ai_feedback,
         ai_feedback_data=ai_feedback_data,
+        submission_id=db_submission.id,
+        thumbnail_url=db_submission.thumbnail_url,
+        annotated_url=db_submission.annotated_url,
     )
 
 # ... (The rest of the file with old testing endpoints remains unchanged) ...
\ No newline at end of file
@@ -3,11 +3,14 @@
 # Local submission endpoint using SQLite
 #
 
-import json
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from typing import Optional
 
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, status
+
+from ....core import admission, quota
 from ....core.security import get_current_user, User
-from ....services import gcs_service, feedback_service
+from ....core.responses import FastJSONResponse, compact_submission_payload, dumps
+from ....services import gcs_service, feedback_service, image_derivatives, ocr_service, problem_catalog
 from ....schemas import submission as submission_schema
 from ....db import crud_submission
 from ....db.database_local import get_local_db
@@ -23,7 +26,11 @@ router = APIRouter()
 def submit_solution_and_get_feedback_local(
     *,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    problem_id: Optional[str] = Form(None, description="Catalog problem the work answers; defaults to the MVP problem."),
+    current_user: User = Depends(get_current_user),
+    charge: quota.Charge = Depends(quota.charge_analysis()),
+    compact: bool = Query(False, description="Return the feedback once, without the duplicate ai_feedback JSON string."),
+    pack_boxes: bool = Query(False, description="With compact, send error boxes as integer arrays plus a parallel labels list."),
 ):
     """
     Local version of submission endpoint using SQLite instead of Cloud SQL.
@@ -33,11 +40,14 @@ def submit_solution_and_get_feedback_local(
     3. Stores the submission in local SQLite database
     4. Returns the structured data to the client
     """
-    problem_id = local_settings.PROBLEM_ID_MVP or "problem_1_algebra"
+    problem_id = problem_id or local_settings.PROBLEM_ID_MVP or problem_catalog.DEFAULT_PROBLEM_ID
 
-    # Upload to GCS
+    # Upload to GCS, keeping the bytes so analysis does not download them back from GCS.
+    image_bytes = gcs_service.read_upload(file)
+    # OCR runs in the background while the image is uploaded and analysed.
+    ocr_future = ocr_service.start_ocr(image_bytes)
     public_gcs_url = gcs_service.upload_image_to_gcs(
-        file=file, user_id=current_user.uid
+        file=file, user_id=current_user.uid, image_bytes=image_bytes
     )
     if not public_gcs_url:
         raise HTTPException(status_code=500, detail="Failed to upload image.")
@@ -52,23 +62,33 @@ def submit_solution_and_get_feedback_local(
     try:
         # Get AI feedback
         ai_feedback_data = feedback_service.get_errorbouding_from_image(
-            gcs_uri=gcs_uri
+            gcs_uri=gcs_uri, image_bytes=image_bytes, problem_id=problem_id
         )
+    except admission.ClientDisconnected:
+        raise  # handled by the admission middleware, not a server error
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to generate AI feedback: {e}"
         )
 
+    if ai_feedback_data.get("status", "ok") != "ok":
+        charge.refund()  # a degraded result, not an analysis
+
+    # Thumbnail and annotated copy render while OCR finishes.
+    derivatives_future = image_derivatives.start_derivatives(
+        image_bytes, public_gcs_url, ai_feedback_data.get("errors", [])
+    )
     # Store in local SQLite database
-    ai_feedback_json_string = json.dumps(ai_feedback_data)
+    ai_feedback_json_string = dumps(ai_feedback_data).decode("utf-8")
     
     submission_data = submission_schema.SubmissionCreate(
         user_id=current_user.uid,
         problem_id=problem_id,
         image_gcs_url=public_gcs_url,
-        ocr_text="",  # Not using OCR text
+        ocr_text=ocr_service.wait_for_text(ocr_future),
         ai_feedback=ai_feedback_json_string,
     )
+    submission_data.thumbnail_url, submission_data.annotated_url = image_derivatives.wait_for_urls(derivatives_future)
 
     # Use local database session
     from ....db.database_local import get_local_db_session
@@ -81,11 +101,29 @@ def submit_solution_and_get_feedback_local(
         db.commit()
         
         # Return the structured response
+        if compact:
+            # Plain dict straight to orjson: no response_model re-validation.
+            return FastJSONResponse(
+                status_code=status.HTTP_201_CREATED,
+                content=compact_submission_payload(
+                    submission_id=db_submission.id,
+                    image_gcs_url=db_submission.image_gcs_url,
+                    ocr_text=db_submission.ocr_text,
+                    ai_feedback_data=ai_feedback_data,
+                    pack_boxes=pack_boxes,
+                    thumbnail_url=db_submission.thumbnail_url,
+                    annotated_url=db_submission.annotated_url,
+                ),
+            )
+
         return submission_schema.SubmissionResponse(
             image_gcs_url=db_submission.image_gcs_url,
             ocr_text=db_submission.ocr_text,
             ai_feedback=db_submission.ai_feedback,
             ai_feedback_data=ai_feedback_data,
+            submission_id=db_submission.id,
+            thumbnail_url=db_submission.thumbnail_url,
+            annotated_url=db_submission.annotated_url,
         )
     finally:
         db.close()
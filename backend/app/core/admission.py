@@ -0,0 +1,309 @@
+# backend/app/core/admission.py
+"""
+Admission control and load shedding for the model-backed endpoints.
+
+Every analysis holds a worker thread for as long as Vertex takes to answer, so
+when the model slows down requests pile up behind the threadpool until Cloud
+Run's timeout kills them, long after the client gave up. This module bounds
+that queue:
+
+* At most ADMISSION_MAX_IN_FLIGHT requests run at once; the rest wait in a
+  FIFO queue.
+* The time each request spends queued (its sojourn time) drives a CoDel-style
+  controller: if the *minimum* sojourn over an interval stays above the
+  target, the queue is standing rather than absorbing a burst. Until a
+  request is again admitted below the target, new arrivals are rejected
+  right away with 503 and a Retry-After estimate, and queued requests that
+  have already waited longer than the target are rejected as slots free up.
+* No request waits longer than ADMISSION_MAX_QUEUE_WAIT_MS.
+* The request body is read while the request is queued, so a client that
+  disconnects is noticed. Queued requests are dropped; running ones get their
+  cancellation flag set, which the sync analysis code checks between model
+  calls via `raise_if_cancelled()` (contextvars reach the threadpool).
+
+One controller lives in each worker process; counters are exposed through
+`snapshot()`.
+"""
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import math
+import threading
+import time
+from typing import Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+from app.core.responses import dumps
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `retry_after` is in whole seconds."""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class ClientDisconnected(Exception):
+    """Raised inside request handling once the client has gone away."""
+
+_cancelled: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "admission_cancelled", default=None
+)
+
+def client_disconnected() -> bool:
+    """True when the client of the current request has disconnected."""
+    event = _cancelled.get()
+    return event is not None and event.is_set()
+
+def raise_if_cancelled() -> None:
+    """Checkpoint for long-running work: stops it once the client has disconnected."""
+    if client_disconnected():
+        raise ClientDisconnected("client disconnected")
+
+@contextlib.contextmanager
+def cancel_when(event: threading.Event) -> Iterator[None]:
+    """
+    Ties the enclosed work to `event` instead of the HTTP request, for
+    connections the middleware does not manage (WebSockets).
+    """
+    token = _cancelled.set(event)
+    try:
+        yield
+    finally:
+        _cancelled.reset(token)
+
+class AdmissionController:
+    """
+    Concurrency limit plus CoDel-style shedding on queue delay. All methods
+    run on the worker's event loop; no locking is needed.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        target_delay: float,
+        interval: float,
+        max_queue_wait: float,
+        max_retry_after: int = 30,
+    ):
+        self.max_in_flight = max_in_flight
+        self.target_delay = target_delay
+        self.interval = interval
+        self.max_queue_wait = max_queue_wait
+        self.max_retry_after = max_retry_after
+
+        self._in_flight = 0
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = collections.deque()  # (waiter, enqueued at)
+        self._first_above_time = 0.0  # when the sojourn first went (and stayed) above target
+        self._dropping = False
+        self._service_time = 0.0  # EWMA of the time admitted requests hold a slot
+        self._last_sojourn = 0.0
+        self._counters: Dict[str, int] = collections.Counter()
+
+    # --- CoDel ---
+
+    def _on_admit(self, sojourn: float, now: float) -> None:
+        self._last_sojourn = sojourn
+        if sojourn < self.target_delay:
+            self._first_above_time = 0.0
+            if self._dropping:
+                print(f"Admission: queue delay back under {self.target_delay * 1000:.0f} ms; accepting again.")
+            self._dropping = False
+        elif self._first_above_time == 0.0:
+            self._first_above_time = now + self.interval
+        elif now >= self._first_above_time and not self._dropping:
+            self._dropping = True
+            print(
+                f"Admission: queue delay above {self.target_delay * 1000:.0f} ms for "
+                f"{self.interval * 1000:.0f} ms; shedding new requests."
+            )
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, clamped to [1, max_retry_after]."""
+        backlog = len(self._waiters) + self._in_flight
+        estimate = backlog * self._service_time / max(1, self.max_in_flight)
+        return max(1, min(self.max_retry_after, math.ceil(estimate)))
+
+    # --- slots ---
+
+    async def acquire(self) -> float:
+        """
+        Waits for a slot and returns the time spent queued.
+
+        Raises:
+            Overloaded: the controller is shedding, or the wait hit max_queue_wait.
+        """
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+            self._on_admit(0.0, time.monotonic())
+            return 0.0
+
+        if self._dropping:
+            self._counters["rejected_codel"] += 1
+            raise Overloaded("queue delay above target", self.retry_after())
+
+        enqueued = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, enqueued))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._counters["rejected_timeout"] += 1
+            raise Overloaded("timed out waiting for a slot", self.retry_after())
+        except Overloaded:
+            raise  # shed at dequeue; it never held a slot
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+        now = time.monotonic()
+        sojourn = now - enqueued
+        self._counters["admitted"] += 1
+        self._on_admit(sojourn, now)
+        return sojourn
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        """Removes a waiter that gave up; if it was already handed a slot, passes the slot on."""
+        if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+            self.release(service_time=None)
+        else:
+            waiter.cancel()
+            self._waiters = collections.deque(entry for entry in self._waiters if entry[0] is not waiter)
+
+    def release(self, service_time: Optional[float]) -> None:
+        """
+        Frees a slot, handing it straight to the oldest waiter if there is one.
+        While shedding, waiters already queued past the target are rejected instead.
+        """
+        if service_time is not None:
+            self._service_time = service_time if self._service_time == 0.0 else 0.8 * self._service_time + 0.2 * service_time
+        now = time.monotonic()
+        while self._waiters:
+            waiter, enqueued = self._waiters.popleft()
+            if waiter.done():
+                continue
+            if self._dropping and now - enqueued > self.target_delay:
+                self._counters["rejected_codel"] += 1
+                waiter.set_exception(Overloaded("queue delay above target", self.retry_after()))
+                continue
+            waiter.set_result(None)  # the slot moves to the waiter; _in_flight is unchanged
+            return
+        self._in_flight -= 1
+
+    def count(self, name: str) -> None:
+        self._counters[name] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "dropping": self._dropping,
+            "last_queue_delay_ms": round(self._last_sojourn * 1000, 1),
+            "service_time_ms": round(self._service_time * 1000, 1),
+            "target_delay_ms": round(self.target_delay * 1000, 1),
+            **{name: self._counters[name] for name in (
+                "admitted", "completed", "rejected_codel", "rejected_timeout",
+                "disconnected_queued", "disconnected_running",
+            )},
+        }
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that puts POST requests under `path_prefixes` through an
+    AdmissionController. Other requests pass straight through.
+    """
+
+    def __init__(self, app, controller: AdmissionController, path_prefixes: Iterable[str]):
+        self.app = app
+        self.controller = controller
+        self.path_prefixes = tuple(path_prefixes)
+
+    def _applies(self, scope) -> bool:
+        return (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"].startswith(self.path_prefixes)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if not self._applies(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # Pump the request body in the background. Requests are small canvases,
+        # and reading them while queued is the only way to see a disconnect.
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def pump():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        async def replay():
+            if disconnected.is_set() and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            acquire_task = asyncio.create_task(self.controller.acquire())
+            disconnect_task = asyncio.create_task(disconnected.wait())
+            await asyncio.wait({acquire_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+            disconnect_task.cancel()
+            if disconnected.is_set():
+                if not acquire_task.done():
+                    acquire_task.cancel()
+                    await asyncio.gather(acquire_task, return_exceptions=True)
+                elif acquire_task.exception() is None:
+                    self.controller.release(service_time=None)
+                self.controller.count("disconnected_queued")
+                return
+            try:
+                acquire_task.result()
+            except Overloaded as e:
+                await self._reject(send, e)
+                return
+            await self._run_admitted(scope, replay, send, disconnected)
+        finally:
+            pump_task.cancel()
+
+    async def _run_admitted(self, scope, receive, send, disconnected: asyncio.Event):
+        cancelled = threading.Event()
+        token = _cancelled.set(cancelled)
+
+        async def propagate_disconnect():
+            await disconnected.wait()
+            cancelled.set()
+            self.controller.count("disconnected_running")
+
+        watcher = asyncio.create_task(propagate_disconnect())
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        except ClientDisconnected:
+            pass  # nobody is left to send a response to
+        finally:
+            watcher.cancel()
+            _cancelled.reset(token)
+            self.controller.release(service_time=time.monotonic() - start)
+            self.controller.count("completed")
+
+    async def _reject(self, send, error: Overloaded) -> None:
+        body = dumps({"detail": f"Server overloaded ({error.reason}); retry later."})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(error.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,246 @@
+# backend/app/core/circuit_breaker.py
+"""
+Per-dependency circuit breakers.
+
+A breaker watches the outcome of the last `window_size` calls to one
+dependency (Vertex AI, GCS). Once at least `minimum_calls` are recorded and
+either the failure rate or the slow-call rate reaches its threshold, the
+breaker opens: calls fail immediately with CircuitOpenError instead of
+waiting out a timeout. After `open_seconds` it goes half-open and lets
+`half_open_probes` calls through; if they all succeed (and are not slow) it
+closes again, otherwise it reopens.
+
+Endpoints run on the threadpool, so state is guarded by a lock. Breakers are
+registered by name and reported together by `snapshot_all()`.
+"""
+
+import collections
+import math
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_call_rate_threshold: float = 0.8,
+        window_size: int = 20,
+        minimum_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._window: Deque[Tuple[bool, bool]] = collections.deque(maxlen=window_size)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probes_started = 0
+        self._probes_passed = 0
+        self._rejected = 0
+        self._last_error = ""
+
+    # --- state machine (call with the lock held) ---
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        print(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._clock()
+        if state == HALF_OPEN:
+            self._probes_started = 0
+            self._probes_passed = 0
+        if state == CLOSED:
+            self._window.clear()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _rates(self) -> Tuple[float, float]:
+        if not self._window:
+            return 0.0, 0.0
+        failed = sum(1 for f, _ in self._window if f)
+        slow = sum(1 for _, s in self._window if s)
+        return failed / len(self._window), slow / len(self._window)
+
+    def _retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (self._clock() - self._opened_at))
+
+    # --- public API ---
+
+    def allow(self) -> bool:
+        """
+        Claims permission for one call. In half-open state only
+        `half_open_probes` calls are let through until they report back.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_started < self.half_open_probes:
+                self._probes_started += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def check(self) -> None:
+        """Raises CircuitOpenError while the breaker is open, without claiming a probe."""
+        with self._lock:
+            if self._current_state() == OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, self._retry_after())
+
+    def record(self, duration: float, error: Exception = None) -> None:
+        """Reports the outcome of a call that `allow()` let through."""
+        failed = error is not None
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if failed:
+                self._last_error = f"{type(error).__name__}: {error}"[:200]
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN)
+                else:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.half_open_probes:
+                        self._transition(CLOSED)
+                return
+            if state == OPEN:
+                return  # a straggler from before the breaker opened
+            self._window.append((failed, slow))
+            if len(self._window) >= self.minimum_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._transition(OPEN)
+
+    def call(
+        self, fn: Callable[..., T], *args, is_failure: Optional[Callable[[Exception], bool]] = None, **kwargs
+    ) -> T:
+        """
+        Runs `fn` under the breaker. Errors for which `is_failure` returns
+        False (e.g. a rejected bad request) count as a working dependency.
+
+        Raises:
+            CircuitOpenError: the breaker is open (or half-open with all probes taken).
+            Whatever `fn` raised, after recording it.
+        """
+        if not self.allow():
+            with self._lock:
+                raise CircuitOpenError(self.name, self._retry_after())
+        start = self._clock()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            failed = is_failure is None or is_failure(e)
+            self.record(self._clock() - start, e if failed else None)
+            raise
+        self.record(self._clock() - start)
+        return result
+
+    def call_stream(
+        self, fn: Callable[..., Iterable[T]], *args, is_failure: Optional[Callable[[Exception], bool]] = None, **kwargs
+    ) -> Iterator[T]:
+        """
+        Like `call` for a function that returns an iterator (a streamed model
+        reply). Items are passed through. The call is timed to its first item
+        and recorded when the stream ends, fails or is abandoned. An abandoned
+        stream counts as a working call.
+        """
+        if not self.allow():
+            with self._lock:
+                raise CircuitOpenError(self.name, self._retry_after())
+        start = self._clock()
+        first_item = None
+        try:
+            for item in fn(*args, **kwargs):
+                if first_item is None:
+                    first_item = self._clock() - start
+                yield item
+        except Exception as e:
+            failed = is_failure is None or is_failure(e)
+            self.record(self._clock() - start if first_item is None else first_item, e if failed else None)
+            raise
+        except BaseException:
+            self.record(self._clock() - start if first_item is None else first_item)
+            raise
+        self.record(self._clock() - start if first_item is None else first_item)
+
+    def reset(self) -> None:
+        """Closes the breaker and forgets its window, as if just created."""
+        with self._lock:
+            self._transition(CLOSED)
+            self._window.clear()
+            self._rejected = 0
+            self._last_error = ""
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            failure_rate, slow_rate = self._rates()
+            return {
+                "state": state,
+                "calls_in_window": len(self._window),
+                "failure_rate": round(failure_rate, 3),
+                "slow_call_rate": round(slow_rate, 3),
+                "retry_after_seconds": math.ceil(self._retry_after()) if state == OPEN else 0,
+                "rejected": self._rejected,
+                "last_error": self._last_error,
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+def get_breaker(name: str, **options) -> CircuitBreaker:
+    """Returns the process-wide breaker called `name`, creating it with `options` on first use."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **options)
+        return breaker
+
+def snapshot_all() -> Dict[str, dict]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+def reset_all() -> None:
+    """Resets every breaker of this process (between eval runs that must not affect each other)."""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        breaker.reset()
@@ -1,8 +1,7 @@
 # backend/app/core/config.py
 # (Updated with Firebase Initialization and a dedicated AI_REGION)
 
-import firebase_admin
-from firebase_admin import credentials
+import threading
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import PostgresDsn, validator, Field
 from typing import Optional, Dict, Any
@@ -15,6 +14,11 @@ class Settings(BaseSettings):
     GCP_REGION: str
     # AI_REGION is the specific region for the AI model API call, which may differ.
     AI_REGION: str # <--- ADDED: Dedicated setting for the AI service region
+    # Comma-separated Vertex AI locations to choose between by measured latency
+    # (e.g. "us-central1,europe-west4,global"). Defaults to AI_REGION, then global.
+    AI_LOCATIONS: Optional[str] = None
+    # How often a location that is not currently the fastest gets a real call to re-measure it.
+    VERTEX_LOCATION_PROBE_SECONDS: float = 60.0
     
     GOOGLE_APPLICATION_CREDENTIALS: Optional[str] = None
 
@@ -60,6 +64,49 @@ class Settings(BaseSettings):
         else:
             raise ValueError("Cannot assemble DATABASE_URL: Insufficient DB connection parameters.")
 
+    # Read replica for history, analytics and export reads (app/db/database.py,
+    # get_read_db). Unset, everything goes to the primary. Reads fall back to the
+    # primary while the replica is unreachable or more than REPLICA_MAX_LAG_SECONDS
+    # behind; the lag is re-measured at most every REPLICA_LAG_CHECK_SECONDS.
+    DATABASE_REPLICA_URL: Optional[str] = None
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_SECONDS: float = 2.0
+
+    # --- Submission Storage ---
+    # On PostgreSQL, `submissions` is range-partitioned by month on submitted_at
+    # (app/db/partitions.py). Partitions are created SUBMISSION_PARTITIONS_AHEAD months
+    # in advance by the production entrypoint (app/entrypoint.py) before it starts
+    # its workers and by `python manage_submissions.py partition`; rows
+    # outside them land in a default partition and move out once their month's
+    # partition is created.
+    SUBMISSIONS_PARTITIONED: bool = Field(default=True)
+    SUBMISSION_PARTITIONS_AHEAD: int = Field(default=3)
+    # `python manage_submissions.py archive` moves ai_feedback and ocr_text of rows older
+    # than this into zstd-compressed JSON lines blobs under SUBMISSION_ARCHIVE_PREFIX in
+    # the image bucket, keeping a slim row that points at the blob
+    # (app/services/submission_archive.py).
+    SUBMISSION_ARCHIVE_AFTER_MONTHS: int = Field(default=6)
+    SUBMISSION_ARCHIVE_PREFIX: str = Field(default="archive/submissions")
+    SUBMISSION_ARCHIVE_CHUNK_ROWS: int = Field(default=2000)
+    # `python manage_submissions.py export` appends new rows to Parquet datasets under
+    # this local directory or gs:// URI for analytics (app/services/submission_export.py).
+    # Rows younger than SUBMISSION_EXPORT_SETTLE_SECONDS wait for the next run, so an
+    # insert still in flight is never skipped.
+    SUBMISSION_EXPORT_URI: str = Field(default="")
+    SUBMISSION_EXPORT_BATCH_ROWS: int = Field(default=5000)
+    SUBMISSION_EXPORT_SETTLE_SECONDS: int = Field(default=300)
+
+    # --- Idempotency Keys ---
+    # A submission POST with an Idempotency-Key header runs once per (user, key); retries
+    # get the stored response (app/services/idempotency.py). Keys are kept this long.
+    IDEMPOTENCY_KEY_TTL_HOURS: int = Field(default=24)
+    # A retry arriving while the first request still runs waits this long for its
+    # response before getting a 409, re-reading the key every IDEMPOTENCY_POLL_SECONDS.
+    IDEMPOTENCY_WAIT_SECONDS: float = Field(default=30.0)
+    IDEMPOTENCY_POLL_SECONDS: float = Field(default=0.5)
+    # A key still in progress after this long is taken over (its worker died).
+    IDEMPOTENCY_LOCK_SECONDS: int = Field(default=300)
+
     # --- MVP Specifics ---
     PROBLEM_ID_MVP: Optional[str] = Field(default=None)
     CANONICAL_SOLUTION_MVP: Optional[str] = Field(default=None)
@@ -67,18 +114,162 @@ class Settings(BaseSettings):
     # --- Firebase ---
     FIREBASE_PROJECT_ID: Optional[str] = Field(default=None)
 
+    # --- Image Storage ---
+    # Name uploaded images after their SHA-256 (submissions/<user>/sha256/<hex>) so a
+    # retried or repeated upload of the same bytes is skipped instead of stored again.
+    # Names this instance has seen stored are remembered (up to GCS_KNOWN_OBJECTS_SIZE).
+    GCS_CONTENT_ADDRESSED: bool = Field(default=False)
+    GCS_KNOWN_OBJECTS_SIZE: int = Field(default=10000)
+
+    # --- Image Derivatives ---
+    # After the analysis, submissions store a WebP thumbnail and a WebP copy with the
+    # error boxes drawn in next to the original, with year-long Cache-Control, for
+    # history lists and result screens (app/services/image_derivatives.py). They are
+    # rendered alongside the OCR wait; a submission waits at most
+    # DERIVATIVE_TIMEOUT_SECONDS for them and is stored without them after that.
+    DERIVATIVES_ENABLED: bool = Field(default=True)
+    DERIVATIVE_THUMBNAIL_SIDE: int = Field(default=320)
+    DERIVATIVE_ANNOTATED_SIDE: int = Field(default=1280)
+    DERIVATIVE_WEBP_QUALITY: int = Field(default=75)
+    DERIVATIVE_WORKERS: int = Field(default=4)
+    DERIVATIVE_TIMEOUT_SECONDS: float = Field(default=5.0)
+
+    # --- Analysis Pipeline ---
+    # Region detector for the first pipeline stage: "gemini" (model call) or
+    # "local" (classical CV in app/services/region_detector.py, Gemini as fallback).
+    REGION_DETECTOR: str = Field(default="gemini")
+    # Pick model, thinking budget and region limit per submission from cheap image
+    # features (app/services/analysis_router.py). ANALYSIS_ROUTING_POLICY optionally
+    # overrides the tier table with a JSON list of tiers.
+    ANALYSIS_ROUTING: bool = Field(default=True)
+    ANALYSIS_ROUTING_POLICY: Optional[str] = Field(default=None)
+    # Prompt templates for the model calls (app/services/prompt_builder.py): "v2" sends
+    # the detected regions as a compact id table and gets ids back; "v1" is the
+    # original JSON-box prompt.
+    PROMPT_VERSION: str = Field(default="v2")
+
+    # --- OCR (Cloud Vision) ---
+    # Submissions are OCR'd alongside the Gemini analysis and the text is stored in
+    # Submission.ocr_text. Requests are grouped into batch_annotate_images calls of up
+    # to OCR_BATCH_SIZE images, waiting at most OCR_BATCH_WINDOW_MS for a batch to
+    # fill; results are cached by image hash (app/services/ocr_service.py).
+    OCR_ENABLED: bool = Field(default=True)
+    OCR_BATCH_SIZE: int = Field(default=16)
+    OCR_BATCH_WINDOW_MS: int = Field(default=50)
+    OCR_MAX_CONCURRENT_BATCHES: int = Field(default=4)
+    OCR_CACHE_SIZE: int = Field(default=1024)
+    # How long a submission waits for OCR after its analysis is done; the text is left empty on timeout.
+    OCR_TIMEOUT_SECONDS: float = Field(default=10.0)
+
+    # --- Tutor Chat ---
+    CHAT_MODEL: str = Field(default="gemini-2.5-flash")
+    # Recent turns are sent verbatim up to this many (estimated) tokens; older ones are summarized.
+    CHAT_HISTORY_TOKEN_BUDGET: int = Field(default=2000)
+    CHAT_CONTEXT_CACHE_TTL_SECONDS: int = Field(default=3600)
+
+    # --- Admission Control ---
+    # Model-backed POST endpoints run at most ADMISSION_MAX_IN_FLIGHT at a time per
+    # worker. When queued requests keep waiting longer than the target delay for a
+    # whole interval, new ones get 503 + Retry-After (app/core/admission.py).
+    ADMISSION_CONTROL: bool = Field(default=True)
+    ADMISSION_MAX_IN_FLIGHT: int = Field(default=32)
+    ADMISSION_TARGET_DELAY_MS: int = Field(default=1000)
+    ADMISSION_INTERVAL_MS: int = Field(default=3000)
+    ADMISSION_MAX_QUEUE_WAIT_MS: int = Field(default=10000)
+
+    # --- Quotas ---
+    # Analyses per user and per class (Firebase custom claim `class_id`) in sliding
+    # windows; over a limit, model-backed endpoints answer 429 (app/core/quota.py).
+    # 0 turns a limit off. Counts are shared between instances through the database
+    # every QUOTA_FLUSH_SECONDS.
+    QUOTA_ENABLED: bool = Field(default=True)
+    QUOTA_USER_PER_MINUTE: int = Field(default=10)
+    QUOTA_USER_PER_DAY: int = Field(default=300)
+    QUOTA_CLASS_PER_MINUTE: int = Field(default=150)
+    QUOTA_CLASS_PER_DAY: int = Field(default=6000)
+    QUOTA_FLUSH_SECONDS: float = Field(default=5.0)
+
+    # --- Internals Endpoints ---
+    # Bearer token for /metrics/* (the full health report, admission and memory
+    # profiles). Unset, those routes answer 404; the public /health only gives the
+    # overall status and the circuit-breaker states.
+    METRICS_TOKEN: Optional[str] = Field(default=None)
+
+    # --- Memory Profiling ---
+    # Opt-in: traces MEMORY_PROFILE_SAMPLE_RATE of HTTP requests with tracemalloc and
+    # reports peak/retained memory and top allocation sites per route at
+    # /metrics/memory (app/core/memory_profiler.py, behind METRICS_TOKEN). Tracing is slow; keep it off in
+    # normal operation.
+    MEMORY_PROFILING: bool = Field(default=False)
+    MEMORY_PROFILE_SAMPLE_RATE: float = Field(default=0.05)
+    MEMORY_PROFILE_TOP_SITES: int = Field(default=10)
+    # Stack depth recorded per allocation; deeper attributes library allocations to app code.
+    MEMORY_PROFILE_FRAMES: int = Field(default=8)
+
+    # --- Model Call Scheduling ---
+    # Concurrent model calls per worker, shared between the interactive, test and
+    # background priority classes (app/core/priority_scheduler.py). A waiting call's
+    # weight grows by its base weight every PRIORITY_AGING_SECONDS it waits.
+    MODEL_CONCURRENCY: int = Field(default=16)
+    PRIORITY_AGING_SECONDS: float = Field(default=5.0)
+
+    # --- Live Analysis (WebSocket) ---
+    # Canvas updates are coalesced until the student pauses for LIVE_DEBOUNCE_SECONDS
+    # (or LIVE_MAX_WAIT_SECONDS pass while they keep writing); the last line counts as
+    # complete after LIVE_LINE_IDLE_SECONDS without changes. Each connection may start
+    # LIVE_ANALYSES_PER_MINUTE analyses (bursts of LIVE_ANALYSIS_BURST), and all
+    # connections of a worker together LIVE_WORKER_ANALYSES_PER_MINUTE
+    # (app/services/live_analysis.py).
+    LIVE_ANALYSIS: bool = Field(default=True)
+    LIVE_DEBOUNCE_SECONDS: float = Field(default=0.8)
+    LIVE_MAX_WAIT_SECONDS: float = Field(default=4.0)
+    LIVE_LINE_IDLE_SECONDS: float = Field(default=2.5)
+    LIVE_ANALYSES_PER_MINUTE: float = Field(default=6.0)
+    LIVE_ANALYSIS_BURST: int = Field(default=2)
+    LIVE_WORKER_ANALYSES_PER_MINUTE: float = Field(default=120.0)
+    LIVE_MAX_SESSIONS: int = Field(default=500)
+    LIVE_MAX_CANVAS_SIDE: int = Field(default=4096)
+    LIVE_MAX_STROKE_POINTS: int = Field(default=100_000)
+    LIVE_MAX_SNAPSHOT_BYTES: int = Field(default=4 * 1024 * 1024)
+
+    # --- Circuit Breakers ---
+    # Vertex AI and GCS calls fail fast once BREAKER_FAILURE_RATE of recent calls
+    # failed (or 80% were slower than the *_SLOW_CALL_SECONDS limit), and are
+    # probed again after BREAKER_OPEN_SECONDS (app/core/circuit_breaker.py).
+    BREAKER_FAILURE_RATE: float = Field(default=0.5)
+    BREAKER_OPEN_SECONDS: float = Field(default=30.0)
+    VERTEX_SLOW_CALL_SECONDS: float = Field(default=30.0)
+    GCS_SLOW_CALL_SECONDS: float = Field(default=10.0)
+    # Recent analyses kept in memory to answer repeats while Vertex is unavailable.
+    DEGRADED_CACHE_SIZE: int = Field(default=512)
+
+    # --- Startup ---
+    # Build SDK clients (Firebase, GCS, GenAI) in a background task right after
+    # startup instead of on the first request that needs them.
+    WARMUP_ON_STARTUP: bool = Field(default=True)
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 settings = Settings()
 
 # FIREBASE ADMIN INITIALIZATION
-try:
-    if not firebase_admin._apps:
-        cred = credentials.ApplicationDefault()
-
-        firebase_admin.initialize_app(cred, {
-            'projectId': settings.FIREBASE_PROJECT_ID,
-        })
-    print("Firebase Admin SDK initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Firebase Admin SDK: {e}")
\ No newline at end of file
+# Deferred until first use (token verification or the startup warm-up) so that
+# importing the app does not pay for firebase_admin and credential discovery.
+_firebase_lock = threading.Lock()
+
+def init_firebase() -> None:
+    """Initializes the Firebase Admin SDK once per process."""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        with _firebase_lock:
+            if firebase_admin._apps:
+                return
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred, {
+                'projectId': settings.FIREBASE_PROJECT_ID,
+            })
+            print("Firebase Admin SDK initialized successfully.")
+    except Exception as e:
+        print(f"Error initializing Firebase Admin SDK: {e}")
\ No newline at end of file
@@ -0,0 +1,213 @@
+# backend/app/core/memory_profiler.py
+"""
+Opt-in per-request memory profiling with tracemalloc.
+
+With MEMORY_PROFILING on, MemoryProfilingMiddleware traces a random
+MEMORY_PROFILE_SAMPLE_RATE of HTTP requests and records, per route:
+
+* peak: the most memory allocated at once while the request ran, counted
+  from what was already allocated when it started,
+* retained: what the request allocated and still held when it finished
+  (a route whose retained memory never comes down is leaking),
+* the top allocation sites at the high-water mark: a watcher thread takes a
+  snapshot whenever traced memory reaches a new high, so transient buffers
+  (image copies, request bodies) show up, not just what survives.
+
+tracemalloc sees every thread, so only one request is traced at a time and a
+sample taken while other requests were in flight is counted as overlapped;
+profile at low concurrency for clean numbers. Tracing slows allocation-heavy
+code down severalfold, which is why it is sampled and off by default.
+
+The report is served at /metrics/memory.
+"""
+
+import asyncio
+import collections
+import functools
+import os
+import random
+import threading
+import tracemalloc
+from typing import Dict, Optional
+
+# Traced-memory growth (fraction) that triggers a new high-water snapshot.
+SNAPSHOT_GROWTH = 0.1
+POLL_SECONDS = 0.005
+_IGNORED = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@functools.lru_cache(maxsize=4096)
+def _short(filename: str) -> str:
+    if not filename.startswith("<"):
+        filename = os.path.abspath(filename)
+    for marker in ("site-packages" + os.sep, os.sep + "lib" + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    if filename.startswith(_APP_DIR + os.sep):
+        return "app" + filename[len(_APP_DIR):]
+    return filename
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+    """The allocating line, plus the innermost app line that led to it."""
+    innermost = traceback[-1]
+    site = f"{_short(innermost.filename)}:{innermost.lineno}"
+    if not site.startswith("app" + os.sep):
+        caller = next((frame for frame in reversed(traceback) if _short(frame.filename).startswith("app" + os.sep)), None)
+        if caller is not None:
+            site += f" (from {_short(caller.filename)}:{caller.lineno})"
+    return site
+
+class _Trace:
+    """
+    One traced request: tracemalloc plus a thread snapshotting each new high.
+    The kept snapshot is itself traced memory; its size is subtracted from the
+    readings, and the peak is reset after each snapshot so that building it
+    does not count either.
+    """
+
+    def __init__(self, frames: int, overlapped: bool):
+        tracemalloc.start(frames)
+        self.overlapped = overlapped
+        self.high_water = None
+        self._high = 0
+        self._peak = 0
+        self._overhead = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="memory-profiler", daemon=True)
+        self._thread.start()
+
+    def _read(self) -> int:
+        """Records the peak so far and returns the request's current traced memory."""
+        current, peak = tracemalloc.get_traced_memory()
+        self._peak = max(self._peak, peak - self._overhead)
+        return current - self._overhead
+
+    def _watch(self) -> None:
+        while not self._done.wait(POLL_SECONDS):
+            current = self._read()
+            if current > self._high * (1 + SNAPSHOT_GROWTH) and current > 64 * 1024:
+                self._high = current
+                self._snapshot()
+
+    def _snapshot(self) -> None:
+        self.high_water = None  # keep a single snapshot alive
+        before = tracemalloc.get_traced_memory()[0]
+        self.high_water = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        tracemalloc.reset_peak()
+        self._overhead = tracemalloc.get_traced_memory()[0] - before
+
+    def finish(self) -> tuple:
+        """Stops tracing; returns (peak, retained, high-water snapshot)."""
+        self._done.set()
+        self._thread.join()
+        retained = self._read()
+        if self.high_water is None:
+            self._snapshot()
+        tracemalloc.stop()
+        return max(self._peak, retained), max(0, retained), self.high_water
+
+class MemoryProfiler:
+    """Samples requests for tracing and aggregates the results per route."""
+
+    def __init__(self, sample_rate: float, top_sites: int = 10, frames: int = 8, rng: Optional[random.Random] = None):
+        self.sample_rate = sample_rate
+        self.top_sites = top_sites
+        self.frames = frames
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._tracing = False
+        self._in_flight = 0
+        self._routes: Dict[str, dict] = {}
+        self._counters = collections.Counter()
+
+    def start(self) -> Optional[_Trace]:
+        """Called at the start of every request; returns a trace if this one is sampled."""
+        with self._lock:
+            self._in_flight += 1
+            if self._rng.random() >= self.sample_rate:
+                return None
+            if self._tracing or tracemalloc.is_tracing():
+                self._counters["skipped_busy"] += 1
+                return None
+            self._tracing = True
+            overlapped = self._in_flight > 1
+        return _Trace(self.frames, overlapped)
+
+    def finish(self, trace: Optional[_Trace], route: str) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if trace is not None:
+                trace.overlapped = trace.overlapped or self._in_flight > 0
+        if trace is None:
+            return
+        try:
+            peak, retained, snapshot = trace.finish()
+        finally:
+            with self._lock:
+                self._tracing = False
+        sites = collections.Counter()
+        for stat in snapshot.statistics("traceback")[:self.top_sites * 3]:
+            sites[_site(stat.traceback)] += stat.size
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "samples": 0, "overlapped": 0, "peak_total": 0, "peak_max": 0,
+                "retained_total": 0, "retained_max": 0, "sites": collections.Counter(),
+            })
+            stats["samples"] += 1
+            stats["overlapped"] += int(trace.overlapped)
+            stats["peak_total"] += peak
+            stats["peak_max"] = max(stats["peak_max"], peak)
+            stats["retained_total"] += retained
+            stats["retained_max"] = max(stats["retained_max"], retained)
+            for site, size in sites.most_common(self.top_sites):
+                stats["sites"][site] = max(stats["sites"][site], size)
+            stats["sites"] = collections.Counter(dict(stats["sites"].most_common(self.top_sites * 2)))
+            self._counters["traced"] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+            self._counters.clear()
+
+    def report(self) -> dict:
+        kib = lambda size: round(size / 1024, 1)
+        with self._lock:
+            routes = {
+                route: {
+                    "samples": stats["samples"],
+                    "overlapped": stats["overlapped"],
+                    "peak_kib_mean": kib(stats["peak_total"] / stats["samples"]),
+                    "peak_kib_max": kib(stats["peak_max"]),
+                    "retained_kib_mean": kib(stats["retained_total"] / stats["samples"]),
+                    "retained_kib_max": kib(stats["retained_max"]),
+                    "top_sites": [
+                        {"site": site, "kib": kib(size)} for site, size in stats["sites"].most_common(self.top_sites)
+                    ],
+                }
+                for route, stats in sorted(self._routes.items(), key=lambda item: -item[1]["peak_max"])
+            }
+            return {"sample_rate": self.sample_rate, **dict(self._counters), "routes": routes}
+
+class MemoryProfilingMiddleware:
+    """ASGI middleware that runs sampled HTTP requests under a MemoryProfiler trace."""
+
+    def __init__(self, app, profiler: MemoryProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = self.profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router stores the matched route in the scope; fall back to the raw path.
+            route = scope.get("route")
+            name = f"{scope['method']} {getattr(route, 'path', None) or scope['path']}"
+            if trace is None:
+                self.profiler.finish(None, name)
+            else:
+                # Snapshot statistics take a while; keep them off the event loop.
+                await asyncio.get_running_loop().run_in_executor(None, self.profiler.finish, trace, name)
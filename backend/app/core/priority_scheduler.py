@@ -0,0 +1,185 @@
+# backend/app/core/priority_scheduler.py
+"""
+Priority lanes for model calls.
+
+Student submissions, live checks while writing, AI test endpoints and bulk work (grading jobs, the
+evaluation harness) all need the same Vertex AI quota and worker threads. The
+scheduler caps concurrent model calls per worker and decides who goes next:
+
+* Each priority class reserves some slots that only it can use; the rest are
+  shared.
+* When a slot frees up, the waiting call with the highest score
+  `weight * (1 + waited / aging_seconds)` among the classes that may start
+  gets it. Weights put interactive work first, and aging guarantees that a
+  background call which has waited long enough eventually wins.
+
+The class of the current request is held in a contextvar (set by
+PriorityMiddleware from the route, or by `use_priority` for in-process jobs),
+so model calls pick it up on the threadpool without extra arguments.
+"""
+
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional
+
+from app.core import admission
+
+INTERACTIVE = "interactive"
+LIVE = "live"
+BACKGROUND = "background"
+TEST = "test"
+
+class PriorityClass(NamedTuple):
+    weight: float
+    reserved: int  # slots only this class may use
+
+DEFAULT_CLASSES: Dict[str, PriorityClass] = {
+    INTERACTIVE: PriorityClass(weight=8.0, reserved=4),
+    LIVE: PriorityClass(weight=4.0, reserved=0),  # speculative checks while writing; submits go first
+    TEST: PriorityClass(weight=2.0, reserved=1),
+    BACKGROUND: PriorityClass(weight=1.0, reserved=1),
+}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+def current_priority() -> str:
+    return _priority.get()
+
+@contextlib.contextmanager
+def use_priority(name: str) -> Iterator[None]:
+    """Runs the enclosed model calls in priority class `name`."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "granted")
+
+    def __init__(self, priority: str, enqueued: float):
+        self.priority = priority
+        self.enqueued = enqueued
+        self.granted = False
+
+class PriorityScheduler:
+    def __init__(
+        self,
+        capacity: int,
+        classes: Mapping[str, PriorityClass] = DEFAULT_CLASSES,
+        aging_seconds: float = 5.0,
+        clock=time.monotonic,
+    ):
+        reserved = sum(c.reserved for c in classes.values())
+        if reserved > capacity:
+            raise ValueError(f"Reserved slots ({reserved}) exceed capacity ({capacity}).")
+        self.capacity = capacity
+        self.classes = dict(classes)
+        self.aging_seconds = aging_seconds
+        self._clock = clock
+        self._shared_capacity = capacity - reserved
+        self._cond = threading.Condition()
+        self._waiters: List[_Waiter] = []
+        self._running = {name: 0 for name in self.classes}
+        self._started = {name: 0 for name in self.classes}
+        self._waited = {name: 0.0 for name in self.classes}
+
+    def _shared_in_use(self) -> int:
+        return sum(max(0, self._running[name] - c.reserved) for name, c in self.classes.items())
+
+    def _can_start(self, priority: str) -> bool:
+        return (
+            self._running[priority] < self.classes[priority].reserved
+            or self._shared_in_use() < self._shared_capacity
+        )
+
+    def _dispatch(self, now: float) -> None:
+        """Grants free slots to the best-scoring eligible waiters (lock held)."""
+        granted = False
+        while self._waiters:
+            eligible = [w for w in self._waiters if self._can_start(w.priority)]
+            if not eligible:
+                break
+            best = max(
+                eligible,
+                key=lambda w: self.classes[w.priority].weight * (1 + (now - w.enqueued) / self.aging_seconds),
+            )
+            self._waiters.remove(best)
+            best.granted = True
+            self._running[best.priority] += 1
+            self._started[best.priority] += 1
+            self._waited[best.priority] += now - best.enqueued
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[str] = None) -> Iterator[None]:
+        """
+        Holds one model-call slot for the enclosed block.
+
+        Raises:
+            admission.ClientDisconnected: the client went away while waiting.
+        """
+        priority = priority or current_priority()
+        if priority not in self.classes:
+            priority = BACKGROUND
+        with self._cond:
+            waiter = _Waiter(priority, self._clock())
+            self._waiters.append(waiter)
+            self._dispatch(self._clock())
+            while not waiter.granted:
+                self._cond.wait(timeout=0.5)
+                if not waiter.granted and admission.client_disconnected():
+                    self._waiters.remove(waiter)
+                    raise admission.ClientDisconnected("client disconnected while waiting for a model slot")
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[priority] -= 1
+                self._dispatch(self._clock())
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            waiting = {name: 0 for name in self.classes}
+            for w in self._waiters:
+                waiting[w.priority] += 1
+            return {
+                name: {
+                    "running": self._running[name],
+                    "waiting": waiting[name],
+                    "started": self._started[name],
+                    "mean_wait_ms": round(1000 * self._waited[name] / self._started[name], 1) if self._started[name] else 0.0,
+                }
+                for name in self.classes
+            }
+
+class PriorityMiddleware:
+    """
+    Sets the priority class for each request: from the first matching path
+    prefix in `path_priorities`, otherwise interactive. Clients may lower
+    (never raise) their class with an `X-Request-Priority` header, which bulk
+    jobs use to mark themselves as background.
+    """
+
+    def __init__(self, app, path_priorities: Mapping[str, str], classes: Iterable[str] = DEFAULT_CLASSES):
+        self.app = app
+        self.path_priorities = dict(path_priorities)
+        self.classes = list(classes)  # highest priority first
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        priority = next(
+            (p for prefix, p in self.path_priorities.items() if scope["path"].startswith(prefix)),
+            INTERACTIVE,
+        )
+        requested = dict(scope.get("headers") or []).get(b"x-request-priority", b"").decode("latin-1").strip().lower()
+        if requested in self.classes and self.classes.index(requested) > self.classes.index(priority):
+            priority = requested
+        with use_priority(priority):
+            await self.app(scope, receive, send)
@@ -0,0 +1,327 @@
+# backend/app/core/quota.py
+"""
+Per-user and per-class quotas on model-backed requests.
+
+Each analysis (a submission, an ai_test run, a tutor reply) is charged
+against sliding windows of the user's uid and, when the Firebase token
+carries a `class_id` custom claim, of the class:
+QUOTA_USER_PER_MINUTE / QUOTA_USER_PER_DAY and QUOTA_CLASS_PER_MINUTE /
+QUOTA_CLASS_PER_DAY (0 turns a limit off). A request over any limit gets a
+429 with Retry-After from the `charge_analysis()` dependency, before the
+image is uploaded or a model is called. Requests that fail, or only get a
+degraded result (feedback status other than "ok"), are refunded.
+
+Windows are sliding-window counters: a count per fixed window plus the
+previous window's count, weighted by how much of it the sliding window still
+covers. That is two integers per subject and window, a good approximation of
+an exact request log. Checks run in memory under one lock and take a few
+microseconds.
+
+Counts are shared between instances through the quota_usage table. Every
+QUOTA_FLUSH_SECONDS a background thread adds this instance's new charges to
+the table (one upsert per subject, window and bucket), reads back the totals
+and deletes rows that have left every window. Charges made elsewhere
+therefore count here within one flush interval; in between, each instance
+only adds its own, so N instances can together admit up to N-1 intervals'
+worth of extra charges.
+"""
+
+import collections
+import math
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import and_, delete, or_, select
+
+from .config import settings
+from .security import User, get_current_user
+
+USER = "user"
+CLASS = "class"
+MINUTE = 60
+DAY = 24 * 3600
+
+# (scope, subject, window seconds)
+Key = Tuple[str, str, int]
+
+class QuotaExceeded(Exception):
+    """Raised when a charge would go over a limit; `retry_after` is in seconds."""
+    def __init__(self, scope: str, window: int, limit: int, retry_after: float):
+        super().__init__(f"{scope} quota of {limit} per {window}s exceeded")
+        self.scope = scope
+        self.window = window
+        self.limit = limit
+        self.retry_after = retry_after
+
+class _Counter:
+    """Charges of one subject in one window size, per bucket (unix time // window)."""
+    __slots__ = ("own", "others", "pending")
+
+    def __init__(self):
+        self.own: Dict[int, int] = {}      # charged on this instance
+        self.others: Dict[int, int] = {}   # charged on other instances, as of the last flush
+        self.pending: Dict[int, int] = {}  # charged here and not yet written to the table
+
+    def total(self, bucket: int) -> int:
+        return self.own.get(bucket, 0) + self.others.get(bucket, 0)
+
+def _retry_after(current: int, previous: int, elapsed: float, window: int, room: int) -> float:
+    """Seconds until current + previous * (1 - elapsed / window) <= room, with no new charges."""
+    if room < 0:
+        return float(window)  # more units than the limit: never, so report one window
+    if current <= room:
+        if previous <= 0:
+            return 0.0
+        return max(0.0, window * (1 - (room - current) / previous) - elapsed)
+    # Only once the current bucket has become the (fading) previous one.
+    return (window - elapsed) + window * (1 - room / current)
+
+class Charge:
+    """Units charged for one request; `refund()` gives them back (e.g. for a replayed response)."""
+    __slots__ = ("_tracker", "_entries", "_units")
+
+    def __init__(self, tracker: Optional["QuotaTracker"], entries: List[Tuple[Key, int]], units: int):
+        self._tracker = tracker
+        self._entries = entries
+        self._units = units
+
+    def refund(self) -> None:
+        if self._tracker is not None and self._entries:
+            self._tracker.refund(self)
+            self._entries = []
+
+NO_CHARGE = Charge(None, [], 0)
+
+class QuotaTracker:
+    """
+    Sliding-window quota counters for one instance.
+
+    `limits` maps a scope (USER, CLASS) to its (window seconds, max units)
+    pairs; a limit of 0 or less is not enforced.
+    """
+
+    def __init__(self, limits: Dict[str, List[Tuple[int, int]]], clock: Callable[[], float] = time.time):
+        self.limits = limits
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters: Dict[Key, _Counter] = {}
+        self._dirty = set()  # keys with pending charges
+        self.stats = collections.Counter()
+
+    def charge(self, user_id: str, class_id: Optional[str] = None, units: int = 1) -> Charge:
+        """
+        Charges `units` to the user (and class) if every window has room.
+
+        Raises:
+            QuotaExceeded: for the first limit without room; nothing is charged.
+        """
+        now = self._clock()
+        subjects = [(USER, user_id)] if class_id is None else [(USER, user_id), (CLASS, class_id)]
+        entries = []
+        with self._lock:
+            for scope, subject in subjects:
+                for window, limit in self.limits.get(scope, ()):
+                    if limit <= 0:
+                        continue
+                    key = (scope, subject, window)
+                    counter = self._counters.get(key)
+                    if counter is None:
+                        counter = self._counters[key] = _Counter()
+                    bucket = int(now // window)
+                    elapsed = now - bucket * window
+                    current, previous = counter.total(bucket), counter.total(bucket - 1)
+                    if current + previous * (1 - elapsed / window) + units > limit:
+                        self.stats[f"rejected_{scope}"] += 1
+                        raise QuotaExceeded(
+                            scope, window, limit, _retry_after(current, previous, elapsed, window, limit - units)
+                        )
+                    entries.append((key, bucket))
+            self._add(entries, units)
+            self.stats["charged"] += 1
+        return Charge(self, entries, units)
+
+    def _add(self, entries: List[Tuple[Key, int]], units: int) -> None:
+        """Adds `units` to each (key, bucket); the caller holds the lock."""
+        for key, bucket in entries:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = _Counter()
+            counter.own[bucket] = counter.own.get(bucket, 0) + units
+            counter.pending[bucket] = counter.pending.get(bucket, 0) + units
+            self._dirty.add(key)
+
+    def refund(self, charge: "Charge") -> None:
+        with self._lock:
+            self._add(charge._entries, -charge._units)
+            self.stats["refunded"] += 1
+
+    def usage(self, scope: str, subject: str, window: int) -> float:
+        """The subject's current sliding-window count, as the next check would see it."""
+        now = self._clock()
+        with self._lock:
+            counter = self._counters.get((scope, subject, window))
+            if counter is None:
+                return 0.0
+            bucket = int(now // window)
+            return counter.total(bucket) + counter.total(bucket - 1) * (1 - (now - bucket * window) / window)
+
+    def flush(self, session_factory) -> None:
+        """
+        Writes this instance's new charges to quota_usage and refreshes the
+        counts made by other instances. On a database error the charges stay
+        pending for the next flush. The lock is taken per chunk of counters,
+        so checks keep running while a large flush goes on.
+        """
+        from ..db.models import QuotaUsage
+
+        with self._flush_lock:
+            now = self._clock()
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            deltas = []
+            for chunk in _chunks(list(dirty)):
+                with self._lock:
+                    for key in chunk:
+                        counter = self._counters[key]
+                        pending, counter.pending = counter.pending, {}
+                        scope, subject, window = key
+                        deltas.extend(
+                            {"scope": scope, "subject": subject, "window_seconds": window, "bucket": bucket, "count": delta}
+                            for bucket, delta in pending.items() if delta
+                        )
+            windows = sorted({window for pairs in self.limits.values() for window, _ in pairs})
+            table = QuotaUsage.__table__
+            live = or_(*[and_(table.c.window_seconds == w, table.c.bucket >= int(now // w) - 1) for w in windows])
+            start = time.perf_counter()
+            try:
+                with session_factory() as db:
+                    if deltas:
+                        db.execute(_upsert(db.get_bind().dialect.name, table), deltas)
+                    db.execute(delete(table).where(~live))
+                    rows = db.execute(select(
+                        table.c.scope, table.c.subject, table.c.window_seconds, table.c.bucket, table.c.count
+                    ).where(live)).all()
+                    db.commit()
+            except Exception as e:
+                with self._lock:
+                    for delta in deltas:
+                        key = (delta["scope"], delta["subject"], delta["window_seconds"])
+                        counter = self._counters[key]
+                        counter.pending[delta["bucket"]] = counter.pending.get(delta["bucket"], 0) + delta["count"]
+                        self._dirty.add(key)
+                self.stats["flush_errors"] += 1
+                print(f"Quota flush failed, keeping {len(deltas)} pending counts: {type(e).__name__} - {e}")
+                return
+            self.stats["flushes"] += 1
+            self.stats["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+            totals: Dict[Key, Dict[int, int]] = collections.defaultdict(dict)
+            for scope, subject, window, bucket, count in rows:
+                totals[(scope, subject, window)][bucket] = count
+            with self._lock:
+                keys = list(self._counters)
+            keys.extend(totals.keys() - set(keys))
+            for chunk in _chunks(keys):
+                with self._lock:
+                    for key in chunk:
+                        counter = self._counters.get(key)
+                        if counter is None:
+                            counter = self._counters[key] = _Counter()
+                        oldest = int(now // key[2]) - 1
+                        counter.own = {bucket: n for bucket, n in counter.own.items() if bucket >= oldest}
+                        # The table holds everyone's charges, including what this instance has flushed.
+                        counter.others = {
+                            bucket: count - (counter.own.get(bucket, 0) - counter.pending.get(bucket, 0))
+                            for bucket, count in totals.get(key, {}).items()
+                        }
+                        if not (counter.own or counter.others or counter.pending):
+                            del self._counters[key]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"subjects_tracked": len(self._counters), **dict(self.stats)}
+
+def _chunks(items: list, size: int = 500):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _upsert(dialect: str, table):
+    """INSERT ... ON CONFLICT that adds to the count, for PostgreSQL and SQLite."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"quota_usage upserts are not implemented for {dialect}")
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_={"count": table.c.count + statement.excluded.count},
+    )
+
+tracker = QuotaTracker({
+    USER: [(MINUTE, settings.QUOTA_USER_PER_MINUTE), (DAY, settings.QUOTA_USER_PER_DAY)],
+    CLASS: [(MINUTE, settings.QUOTA_CLASS_PER_MINUTE), (DAY, settings.QUOTA_CLASS_PER_DAY)],
+})
+
+_flusher: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+def start_flusher(session_factory=None) -> None:
+    """Starts the background thread that shares counts through the database."""
+    global _flusher
+    if _flusher is not None:
+        return
+    if session_factory is None:
+        from ..db.database import SessionLocal
+        session_factory = SessionLocal
+    _stop.clear()
+
+    def run():
+        while not _stop.wait(settings.QUOTA_FLUSH_SECONDS):
+            tracker.flush(session_factory)
+        tracker.flush(session_factory)  # hand the last charges over on shutdown
+
+    _flusher = threading.Thread(target=run, name="quota-flush", daemon=True)
+    _flusher.start()
+
+def stop_flusher() -> None:
+    global _flusher
+    if _flusher is None:
+        return
+    _stop.set()
+    _flusher.join(timeout=10)
+    _flusher = None
+
+def charge_analysis(units: int = 1):
+    """
+    Dependency factory: charges `units` analyses to the current user and
+    their class, or answers 429 with Retry-After. The dependency yields the
+    Charge, so an endpoint that ends up doing no work (a replay, a degraded
+    result) can refund it; a request that fails with an error is refunded here.
+    """
+    async def dependency(current_user: User = Depends(get_current_user)) -> AsyncIterator[Charge]:
+        if not settings.QUOTA_ENABLED:
+            yield NO_CHARGE
+            return
+        try:
+            charge = tracker.charge(current_user.uid, current_user.class_id, units)
+        except QuotaExceeded as e:
+            per = "minute" if e.window == MINUTE else "day" if e.window == DAY else f"{e.window}s"
+            raise HTTPException(
+                status_code=429,
+                detail=f"Your {'class' if e.scope == CLASS else 'account'} has used its {e.limit} analyses per {per}.",
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+            )
+        try:
+            yield charge
+        except Exception:
+            charge.refund()
+            raise
+    return dependency
+
+def snapshot() -> dict:
+    return {"enabled": settings.QUOTA_ENABLED, **tracker.snapshot()}
@@ -0,0 +1,65 @@
+# backend/app/core/responses.py
+"""
+Fast JSON responses and the compact submission payload.
+
+FastJSONResponse serializes with orjson when it is installed (falling back to
+the stdlib encoder with compact separators). Returning it directly from an
+endpoint skips FastAPI's response_model re-validation and jsonable_encoder
+pass, which is where most of the serialization time goes for large feedback.
+"""
+
+import json
+from typing import Any, Optional
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is used instead
+    orjson = None
+
+def dumps(content: Any) -> bytes:
+    """Serializes plain JSON-compatible data to UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def compact_submission_payload(
+    *,
+    submission_id: Optional[int],
+    image_gcs_url: str,
+    ocr_text: str,
+    ai_feedback_data: dict,
+    pack_boxes: bool = False,
+    thumbnail_url: Optional[str] = None,
+    annotated_url: Optional[str] = None,
+) -> dict:
+    """
+    Builds the compact submission response, which carries the feedback once
+    (no duplicate `ai_feedback` JSON string).
+
+    With `pack_boxes`, errors are sent column-wise: `boxes` is a list of integer
+    [x1, y1, x2, y2] arrays and `labels` holds the matching error texts.
+    """
+    payload = {
+        "submission_id": submission_id,
+        "image_gcs_url": image_gcs_url,
+        "thumbnail_url": thumbnail_url,
+        "annotated_url": annotated_url,
+        "ocr_text": ocr_text,
+        "translated_handwriting": ai_feedback_data.get("translated_handwriting", ""),
+        "status": ai_feedback_data.get("status", "ok"),
+    }
+    errors = ai_feedback_data.get("errors", [])
+    if pack_boxes:
+        boxes = np.asarray([error["box_2d"] for error in errors], dtype=np.float64).reshape(-1, 4)
+        payload["boxes"] = np.rint(boxes).astype(np.int32).tolist()
+        payload["labels"] = [error["error_text"] for error in errors]
+    else:
+        payload["errors"] = errors
+    return payload
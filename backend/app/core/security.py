@@ -1,17 +1,21 @@
 # backend/app/core/security.py
 
+import secrets
 from typing import Optional
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from firebase_admin import auth
 from pydantic import BaseModel
 from starlette import status
 
+from .config import init_firebase, settings
+
 # This is our Pydantic model for User data.
 # It ensures that the user data we get from Firebase has a predictable structure.
 class User(BaseModel):
     uid: str
     email: Optional[str] = None
+    # Custom claim set for students enrolled in a class; classes share a quota (app/core/quota.py).
+    class_id: Optional[str] = None
     # You can add more fields here if you need them, e.g., name, picture
 
 # This is our "bouncer". It's a reusable dependency.
@@ -32,12 +36,25 @@ async def get_current_user(
             detail="Bearer token missing",
         )
 
+    return verify_id_token(creds.credentials)
+
+def verify_id_token(token: str) -> User:
+    """
+    Verifies a Firebase ID token and returns the user data. Used directly by
+    WebSocket endpoints, where the token arrives in the first message.
+
+    Raises HTTPException with status 401 if the token is invalid or expired.
+    """
+    # firebase_admin is imported on first use to keep cold starts fast.
+    init_firebase()
+    from firebase_admin import auth
+
     try:
         # The core of the bouncer's logic: ask Firebase to verify the ID card.
-        decoded_token = auth.verify_id_token(creds.credentials)
+        decoded_token = auth.verify_id_token(token)
 
         # If the card is valid, create a User object with the info.
-        return User(uid=decoded_token["uid"], email=decoded_token.get("email"))
+        return User(uid=decoded_token["uid"], email=decoded_token.get("email"), class_id=decoded_token.get("class_id"))
 
     except auth.InvalidIdTokenError:
         raise HTTPException(
@@ -56,3 +73,21 @@ async def get_current_user(
             detail="Could not validate credentials",
         )
 
+
+metrics_bearer_scheme = HTTPBearer(auto_error=False)
+
+async def require_metrics_token(
+    creds: Optional[HTTPAuthorizationCredentials] = Depends(metrics_bearer_scheme),
+) -> None:
+    """
+    Guards the internals endpoints (/metrics/*) with the METRICS_TOKEN bearer
+    token. They answer 404 while no token is configured.
+    """
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if creds is None or not secrets.compare_digest(creds.credentials.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -0,0 +1,75 @@
+# backend/app/core/single_flight.py
+"""
+Single-flight call coalescing.
+
+When several callers ask for the same key at the same time, only the first one
+(the leader) runs the function; everyone else blocks on the leader's result.
+The result or exception is shared with every caller of that flight, and the
+key is forgotten as soon as the flight finishes, so later calls recompute.
+
+Endpoints in this app are sync and run on the threadpool, so flights are
+coordinated with a lock and concurrent.futures.Future rather than asyncio.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Future] = {}
+        self._followers: Dict[Hashable, int] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Runs `fn` once per concurrent set of callers sharing `key`.
+
+        Returns:
+            A tuple of (result, shared). `shared` is True for callers that
+            received the result of another caller's flight.
+
+        Raises:
+            Whatever `fn` raised, in the leader and in every waiting caller.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._flights[key] = flight
+                self._followers[key] = 0
+            else:
+                self._followers[key] += 1
+
+        if not leader:
+            return flight.result(), True
+
+        # The key is forgotten before the outcome is published, so a caller that
+        # calls again after seeing it starts a new flight instead of rejoining this one.
+        try:
+            result = fn()
+        except BaseException as e:
+            self._forget(key)
+            flight.set_exception(e)
+            raise
+        self._forget(key)
+        flight.set_result(result)
+        return result, False
+
+    def _forget(self, key: Hashable) -> None:
+        with self._lock:
+            del self._flights[key]
+            del self._followers[key]
+
+    def followers(self, key: Hashable) -> int:
+        """Number of callers waiting on the leader of `key`'s flight (0 if none)."""
+        with self._lock:
+            return self._followers.get(key, 0)
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed."""
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,84 @@
+# backend/app/core/startup_profile.py
+"""
+Startup profiling for Cloud Run cold starts.
+
+Runs `import app.main` in a fresh interpreter with `-X importtime` and reports
+which modules (and which top-level packages) dominate import time.
+
+Usage (from the backend directory):
+    python -m app.core.startup_profile [--module app.main] [--top 25]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """
+    Parses the `-X importtime` lines written to stderr.
+
+    Each line looks like: `import time:       self [us] |  cumulative | imported package`
+    """
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append(ImportTiming(name.strip(), int(fields[0]), int(fields[1]), depth))
+    return timings
+
+def profile_imports(module: str = "app.main") -> List[ImportTiming]:
+    """
+    Imports `module` in a child interpreter and returns its per-module import timings.
+    """
+    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        tail = result.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise RuntimeError(f"Importing {module} failed: {tail[0]}")
+    return parse_importtime(result.stderr)
+
+def by_package(timings: List[ImportTiming]) -> Dict[str, int]:
+    """Sums self time per top-level package (e.g. 'google', 'firebase_admin', 'app')."""
+    totals: Dict[str, int] = defaultdict(int)
+    for timing in timings:
+        totals[timing.module.split(".")[0]] += timing.self_us
+    return dict(totals)
+
+def print_report(module: str, top: int) -> None:
+    timings = profile_imports(module)
+    total_us = sum(t.self_us for t in timings)
+
+    print(f"Import profile for {module}: {total_us / 1000:.1f} ms across {len(timings)} modules")
+    print(f"\nTop {top} modules by cumulative time:")
+    for t in sorted(timings, key=lambda t: t.cumulative_us, reverse=True)[:top]:
+        print(f"  {t.cumulative_us / 1000:9.1f} ms  (self {t.self_us / 1000:7.1f} ms)  {t.module}")
+
+    print(f"\nTop {top} packages by self time:")
+    for package, us in sorted(by_package(timings).items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"  {us / 1000:9.1f} ms  {package}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report per-module import time for the API.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    print_report(args.module, args.top)
@@ -0,0 +1,67 @@
+# backend/app/db/crud_chat.py
+
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+def get_or_create_conversation(db: Session, *, submission_id: int, user_id: str) -> models.Conversation:
+    """
+    Return the conversation attached to a submission, creating it on first use.
+    When two first messages race, the one that loses the unique submission_id
+    insert returns the winner's conversation.
+    """
+    conversation = find_conversation(db, submission_id=submission_id)
+    if conversation is None:
+        conversation = models.Conversation(submission_id=submission_id, user_id=user_id)
+        db.add(conversation)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return find_conversation(db, submission_id=submission_id)
+        db.refresh(conversation)
+    return conversation
+
+def find_conversation(db: Session, *, submission_id: int) -> Optional[models.Conversation]:
+    """
+    Return the conversation attached to a submission, or None if there is none yet.
+    """
+    return (
+        db.query(models.Conversation)
+        .filter(models.Conversation.submission_id == submission_id)
+        .first()
+    )
+
+def get_conversation(db: Session, *, conversation_id: int) -> Optional[models.Conversation]:
+    return db.get(models.Conversation, conversation_id)
+
+def add_messages(db: Session, *, conversation_id: int, turns: Sequence[Tuple[str, str]]) -> None:
+    """
+    Append several (role, content) turns to a conversation in one transaction.
+    """
+    db.add_all(
+        models.ChatMessage(conversation_id=conversation_id, role=role, content=content) for role, content in turns
+    )
+    db.commit()
+
+def update_conversation(db: Session, *, conversation_id: int, **values) -> None:
+    """
+    Set columns of a conversation (summary, context cache) without loading it.
+    """
+    db.query(models.Conversation).filter(models.Conversation.id == conversation_id).update(
+        values, synchronize_session=False
+    )
+    db.commit()
+
+def list_messages(db: Session, *, conversation_id: int, after_id: int = 0) -> List[models.ChatMessage]:
+    """
+    Return a conversation's turns in order, optionally only those after `after_id`.
+    """
+    return (
+        db.query(models.ChatMessage)
+        .filter(models.ChatMessage.conversation_id == conversation_id, models.ChatMessage.id > after_id)
+        .order_by(models.ChatMessage.id)
+        .all()
+    )
@@ -0,0 +1,30 @@
+# backend/app/db/crud_problem.py
+
+import json
+from typing import List
+from sqlalchemy.orm import Session
+
+from . import models
+
+def list_problems(db: Session) -> List[models.Problem]:
+    """
+    Return every problem in the catalog.
+    """
+    return db.query(models.Problem).all()
+
+def upsert_problem(
+    db: Session, *, problem_id: str, title: str, canonical_steps: List[str], statement: str = None
+) -> models.Problem:
+    """
+    Create a catalog problem, or replace its title, statement and solution if it exists.
+    """
+    problem = db.get(models.Problem, problem_id)
+    if problem is None:
+        problem = models.Problem(id=problem_id)
+        db.add(problem)
+    problem.title = title
+    problem.statement = statement
+    problem.canonical_steps = json.dumps(canonical_steps)
+    db.commit()
+    db.refresh(problem)
+    return problem
@@ -1,5 +1,8 @@
 # backend/app/db/crud_submission.py
 
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import Row
 from sqlalchemy.orm import Session
 
 from .. import schemas
@@ -23,6 +26,8 @@ def create_submission(db: Session, *, submission: schemas.SubmissionCreate) -> m
         image_gcs_url=str(submission.image_gcs_url), # Ensure URL is a string
         ocr_text=submission.ocr_text,
         ai_feedback=submission.ai_feedback,
+        thumbnail_url=submission.thumbnail_url,
+        annotated_url=submission.annotated_url,
     )
 
     # Add the new instance to the session, commit it to the database,
@@ -31,4 +36,54 @@ def create_submission(db: Session, *, submission: schemas.SubmissionCreate) -> m
     db.commit()
     db.refresh(db_submission)
     
-    return db_submission
\ No newline at end of file
+    return db_submission
+
+def update_submission(
+    db: Session, *, submission_id: int, submission: schemas.SubmissionCreate
+) -> Optional[models.Submission]:
+    """
+    Replaces the stored result of the user's submission `submission_id` (the
+    retry of a degraded keyed request); None if the row is gone.
+    """
+    db_submission = get_submission(db, submission_id=submission_id, user_id=submission.user_id)
+    if db_submission is None:
+        return None
+    db_submission.image_gcs_url = str(submission.image_gcs_url)
+    db_submission.ocr_text = submission.ocr_text
+    db_submission.ai_feedback = submission.ai_feedback
+    db_submission.thumbnail_url = submission.thumbnail_url
+    db_submission.annotated_url = submission.annotated_url
+    db.commit()
+    db.refresh(db_submission)
+    return db_submission
+
+def get_submission(db: Session, *, submission_id: int, user_id: str) -> Optional[models.Submission]:
+    """
+    Fetch a submission by id, scoped to the user who owns it.
+    """
+    return (
+        db.query(models.Submission)
+        .filter(models.Submission.id == submission_id, models.Submission.user_id == user_id)
+        .first()
+    )
+
+def list_recent_submissions(
+    db: Session, *, user_id: str, limit: int = 20, days: int = 90
+) -> List[Row]:
+    """
+    The user's submissions from the last `days` days, newest first, with only
+    the columns a history list shows (the feedback and OCR text are not read).
+    The time bound lets PostgreSQL skip the partitions of older months.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    Submission = models.Submission
+    return (
+        db.query(
+            Submission.id, Submission.problem_id, Submission.submitted_at,
+            Submission.image_gcs_url, Submission.thumbnail_url, Submission.annotated_url,
+        )
+        .filter(Submission.user_id == user_id, Submission.submitted_at >= since)
+        .order_by(Submission.submitted_at.desc())
+        .limit(limit)
+        .all()
+    )
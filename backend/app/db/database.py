@@ -1,8 +1,11 @@
 # backend/app/db/database.py
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from typing import Generator
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Generator, Optional
 
 from app.core.config import settings
 
@@ -17,9 +20,121 @@ engine = create_engine(str(settings.DATABASE_URL), pool_pre_ping=True)
 # This session is the "handle" we'll use to interact with the database.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sessions for read-only work (history, analytics, export). They are bound per
+# session to the replica when it is configured and fresh enough, otherwise to
+# the primary, and refuse to flush so a write can never land on either by mistake.
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@event.listens_for(ReadSessionLocal, "before_flush")
+def _reject_writes(session, flush_context, instances):
+    raise RuntimeError("Read sessions are read-only; use get_db / SessionLocal for writes.")
+
+# Seconds the replica is behind the primary; 0 when it is streaming and has replayed
+# all it received (an idle primary would otherwise make an up-to-date replica look
+# stale). A replica whose WAL receiver is not streaming has nothing left to replay
+# either, so it is judged by its last replay time instead.
+_POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+replica_engine = None
+_replica_lock = threading.Lock()
+_replica_state = {"checked_at": 0.0, "usable": False, "lag_seconds": None}
+routing_counters = {"replica_reads": 0, "primary_reads": 0, "replica_lagging": 0, "replica_errors": 0}
+
+def configure_replica(url: Optional[str]) -> None:
+    """(Re)creates the replica engine from `url`; None routes every read to the primary."""
+    global replica_engine
+    if replica_engine is not None:
+        replica_engine.dispose()
+    replica_engine = None
+    if url:
+        connect_args = {}
+        if url.startswith("postgresql"):
+            connect_args = {"connect_timeout": 2}  # fail over quickly when it is down
+        elif url.startswith("sqlite"):
+            connect_args = {"check_same_thread": False}
+        replica_engine = create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+    _replica_state.update(checked_at=0.0, usable=False, lag_seconds=None)
+
+def _replica_lag(connection) -> float:
+    if connection.dialect.name != "postgresql":
+        return 0.0
+    return float(connection.execute(_POSTGRES_LAG_SQL).scalar())
+
+def _mark_replica_down(reason: Exception) -> None:
+    routing_counters["replica_errors"] += 1
+    _replica_state.update(checked_at=time.monotonic(), usable=False, lag_seconds=None)
+    print(f"Read replica unavailable, reading from the primary: {type(reason).__name__} - {reason}")
+
+def replica_usable() -> bool:
+    """
+    Whether reads may go to the replica: it is configured, reachable and at
+    most REPLICA_MAX_LAG_SECONDS behind. The answer is cached for
+    REPLICA_LAG_CHECK_SECONDS; while one thread re-checks, others use the
+    cached answer.
+    """
+    if replica_engine is None:
+        return False
+    if time.monotonic() - _replica_state["checked_at"] < settings.REPLICA_LAG_CHECK_SECONDS:
+        return _replica_state["usable"]
+    if not _replica_lock.acquire(blocking=False):
+        return _replica_state["usable"]
+    try:
+        with replica_engine.connect() as connection:
+            lag = _replica_lag(connection)
+    except Exception as e:
+        _mark_replica_down(e)
+        return False
+    finally:
+        _replica_lock.release()
+    usable = lag <= settings.REPLICA_MAX_LAG_SECONDS
+    if not usable:
+        routing_counters["replica_lagging"] += 1
+        print(f"Read replica is {lag:.1f}s behind; reading from the primary.")
+    _replica_state.update(checked_at=time.monotonic(), usable=usable, lag_seconds=lag)
+    return usable
+
+def read_session() -> Session:
+    """A read-only session on the replica when it is usable, else on the primary."""
+    if replica_usable():
+        routing_counters["replica_reads"] += 1
+        return ReadSessionLocal(bind=replica_engine)
+    routing_counters["primary_reads"] += 1
+    return ReadSessionLocal(bind=engine)
+
+def snapshot() -> dict:
+    return {
+        "replica_configured": replica_engine is not None,
+        "replica_in_use": replica_engine is not None and _replica_state["usable"],
+        "replica_lag_seconds": _replica_state["lag_seconds"],
+        **routing_counters,
+    }
+
+configure_replica(settings.DATABASE_REPLICA_URL)
+
 def get_db() -> Generator:
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db() -> Generator:
+    """
+    Dependency for endpoints that only read (history and the like); writes go
+    through get_db. A replica connection failure marks the replica down, so
+    the following requests read from the primary.
+    """
+    db = read_session()
+    try:
+        yield db
+    except OperationalError as e:
+        if replica_engine is not None and db.get_bind() is replica_engine:
+            _mark_replica_down(e)
+        raise
+    finally:
+        db.close()
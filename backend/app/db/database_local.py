@@ -39,11 +39,10 @@ def get_local_db() -> Generator:
 
 def init_local_db():
     """Initialize the local SQLite database with tables"""
-    from app.db.base import Base
-    from app.db.models import Submission
+    from app.db.partitions import create_schema
     
     engine = get_local_db_engine()
     
-    # Create all tables
-    Base.metadata.create_all(bind=engine)
+    # Create all tables (and add columns an older local database is missing)
+    create_schema(engine)
     print("✅ Local SQLite database initialized successfully")
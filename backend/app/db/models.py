@@ -1,25 +1,160 @@
 # backend/app/db/models.py
 
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, func
+from sqlalchemy import Column, ForeignKey, ForeignKeyConstraint, Index, Integer, String, Text, TIMESTAMP, UniqueConstraint, func
 from .base import Base
+from ..core.config import settings
+
+def submissions_partitioned(dialect) -> bool:
+    """True when `submissions` is (to be) created as a partitioned table on this dialect."""
+    return settings.SUBMISSIONS_PARTITIONED and dialect.name == "postgresql"
 
 class Submission(Base):
     """
     Database model for a user's submission.
+
+    On PostgreSQL the table is partitioned by month on `submitted_at` (see
+    app/db/partitions.py), with a primary key of (id, submitted_at); queries
+    that bound `submitted_at` only touch the matching partitions.
+
+    Once a row is archived, `ai_feedback` and `ocr_text` are NULL and
+    `archive_uri` names the blob holding them (app/services/submission_archive.py).
     """
     __tablename__ = "submissions"
+    __table_args__ = (
+        # Recent history of a user / a problem, newest first.
+        Index("ix_submissions_user_id_submitted_at", "user_id", "submitted_at"),
+        Index("ix_submissions_problem_id_submitted_at", "problem_id", "submitted_at"),
+    )
 
     # Columns for the 'submissions' table
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, nullable=False, index=True)
-    problem_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)
+    problem_id = Column(String, nullable=False)
     image_gcs_url = Column(String(2048), nullable=False)
     ocr_text = Column(Text, nullable=True)
     ai_feedback = Column(Text, nullable=True)
+    archive_uri = Column(String(2048), nullable=True)
+    # WebP derivatives stored next to the image (app/services/image_derivatives.py).
+    thumbnail_url = Column(String(2048), nullable=True)
+    annotated_url = Column(String(2048), nullable=True)
 
     # The 'server_default=func.now()' tells the PostgreSQL database to automatically
     # set the current timestamp when a new row is created.
     submitted_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
 
     def __repr__(self):
-        return f"<Submission(id={self.id}, user_id='{self.user_id}', problem_id='{self.problem_id}')>"
\ No newline at end of file
+        return f"<Submission(id={self.id}, user_id='{self.user_id}', problem_id='{self.problem_id}')>"
+
+class Conversation(Base):
+    """
+    Follow-up chat about a single submission.
+
+    Older turns are folded into `summary` once the history outgrows the token
+    budget; `summarized_through` is the id of the last message folded in.
+    """
+    __tablename__ = "conversations"
+    __table_args__ = (
+        # A partitioned `submissions` has no unique key on id alone to reference.
+        ForeignKeyConstraint(["submission_id"], ["submissions.id"]).ddl_if(
+            callable_=lambda ddl, target, bind, **kw: not submissions_partitioned(kw["dialect"])
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    submission_id = Column(Integer, nullable=False, unique=True, index=True)
+    user_id = Column(String, nullable=False, index=True)
+    summary = Column(Text, nullable=True)
+    summarized_through = Column(Integer, nullable=False, default=0)
+
+    # Vertex context cache holding the image and initial feedback, if one was created.
+    context_cache_name = Column(String(512), nullable=True)
+    context_cache_expires_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<Conversation(id={self.id}, submission_id={self.submission_id})>"
+
+class ChatMessage(Base):
+    """
+    A single chat turn. `role` is either 'user' or 'model'.
+    """
+    __tablename__ = "chat_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False, index=True)
+    role = Column(String(16), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ChatMessage(id={self.id}, conversation_id={self.conversation_id}, role='{self.role}')>"
+
+
+class Problem(Base):
+    """
+    A catalog problem with its precomputed canonical solution.
+
+    `canonical_steps` is a JSON list of the solution's lines in order; the last
+    one is the final answer.
+    """
+    __tablename__ = "problems"
+
+    id = Column(String, primary_key=True)
+    title = Column(String(256), nullable=False)
+    statement = Column(Text, nullable=True)
+    canonical_steps = Column(Text, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<Problem(id='{self.id}', title='{self.title}')>"
+
+class IdempotencyKey(Base):
+    """
+    A client-supplied Idempotency-Key of a submission POST and the response it
+    produced (app/services/idempotency.py).
+
+    `status` is 'in_progress' while the first request with the key runs and
+    'completed' once `response_body` holds what it returned, or 'degraded'
+    when it only stored a degraded result in `submission_id`, which the next
+    retry updates. `attempt` grows
+    each time another request takes the key over, so two workers can never
+    both believe they hold it.
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    key = Column(String(255), nullable=False)
+    # sha256 of the image and request options; the key may not be reused for another request.
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False)
+    attempt = Column(Integer, nullable=False, default=1)
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    submission_id = Column(Integer, nullable=True)
+    # When the current attempt started; the key expires IDEMPOTENCY_KEY_TTL_HOURS later.
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(user_id='{self.user_id}', key='{self.key}', status='{self.status}')>"
+
+class QuotaUsage(Base):
+    """
+    Analyses charged to a user or class in one quota bucket, summed over all
+    instances (app/core/quota.py). `bucket` is the unix time divided by
+    `window_seconds`; rows are deleted once their bucket has left the window.
+    """
+    __tablename__ = "quota_usage"
+
+    scope = Column(String(16), primary_key=True)
+    subject = Column(String, primary_key=True)
+    window_seconds = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<QuotaUsage(scope='{self.scope}', subject='{self.subject}', bucket={self.bucket}, count={self.count})>"
@@ -0,0 +1,249 @@
+# backend/app/db/partitions.py
+"""
+Monthly range partitioning of the `submissions` table on PostgreSQL.
+
+The partitioned table keeps the model's columns and indexes (every index is
+created per partition), with a primary key of (id, submitted_at) because a
+partitioned table's unique keys must include the partition key. Partitions
+are named submissions_pYYYY_MM and cover [first of month, first of next
+month); submissions_default takes rows outside them, so an insert never
+fails when the partition job is late.
+
+`ensure_partitions()` creates the partitions for the current month and
+SUBMISSION_PARTITIONS_AHEAD months after it and is safe to run repeatedly,
+also from several instances at once (they take turns on an advisory lock).
+The production entrypoint runs it once before starting its workers;
+`python manage_submissions.py partition` does the same for instances that
+stay up for months. Rows that reached the default
+partition before their month's partition existed are moved into it.
+`convert_to_partitioned()` turns an existing plain `submissions` table into
+the partitioned layout, keeping its rows in one legacy partition.
+"""
+
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from ..core.config import settings
+from .models import Submission, submissions_partitioned
+
+TABLE = Submission.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+LEGACY_PARTITION = f"{TABLE}_legacy"
+_PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})$")
+# Serializes ensure_partitions() across instances for the rest of the transaction.
+_PARTITION_LOCK_SQL = text(f"SELECT pg_advisory_xact_lock(hashtext('{TABLE}_partitions'))")
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+def is_partitioned(connection: Connection) -> bool:
+    """True when `submissions` exists and is a partitioned table."""
+    if connection.dialect.name != "postgresql":
+        return False
+    kind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": TABLE}
+    ).scalar()
+    return kind == "p"
+
+def create_partitioned_table(connection: Connection) -> None:
+    """
+    Creates `submissions` as a partitioned table with its indexes and default
+    partition. Does nothing if the table already exists.
+    """
+    if inspect(connection).has_table(TABLE):
+        return
+    table = Submission.__table__
+    columns = ",\n    ".join(str(CreateColumn(column).compile(dialect=connection.dialect)) for column in table.columns)
+    connection.execute(text(
+        f"CREATE TABLE {TABLE} (\n    {columns},\n    PRIMARY KEY (id, submitted_at)\n)"
+        f" PARTITION BY RANGE (submitted_at)"
+    ))
+    for index in table.indexes:
+        connection.execute(CreateIndex(index))
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+    print(f"Created partitioned table {TABLE}.")
+
+def list_partitions(connection: Connection) -> List[Tuple[str, Optional[date]]]:
+    """(name, month) of each partition, month None for the default and legacy ones, oldest first."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE}).scalars().all()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1) if match else None))
+    return sorted(partitions, key=lambda item: (item[1] is not None, item[1] or date.min, item[0]))
+
+def ensure_partitions(connection: Connection, today: Optional[date] = None, ahead: Optional[int] = None) -> List[str]:
+    """
+    Creates the monthly partitions from this month through `ahead` months
+    later (SUBMISSION_PARTITIONS_AHEAD by default). Returns the names created.
+
+    When rows of a month already sit in the default partition (the job ran
+    late), they are moved into the new partition, which is then attached;
+    this locks the default partition while it runs.
+    """
+    if not is_partitioned(connection):
+        return []
+    connection.execute(_PARTITION_LOCK_SQL)  # the next instance waits, then finds the partitions
+    today = today or datetime.now(timezone.utc).date()
+    ahead = settings.SUBMISSION_PARTITIONS_AHEAD if ahead is None else ahead
+    existing = {name for name, _ in list_partitions(connection)}
+    created = []
+    first = month_start(today)
+    for offset in range(ahead + 1):
+        month = add_months(first, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        bounds = (f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        try:
+            with connection.begin_nested():
+                if _in_default(connection, month):
+                    moved = _move_out_of_default(connection, name, month, bounds)
+                    print(f"Moved {moved} row(s) of {month:%Y-%m} out of {DEFAULT_PARTITION} into {name}.")
+                else:
+                    connection.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} {bounds}"))
+        except Exception as e:
+            print(f"Could not create partition {name}: {type(e).__name__} - {e}")
+            continue
+        created.append(name)
+    if created:
+        print(f"Created partitions: {', '.join(created)}")
+    return created
+
+def _in_default(connection: Connection, month: date) -> bool:
+    return connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE submitted_at >= :start AND submitted_at < :end)"
+    ), {"start": month, "end": add_months(month, 1)}).scalar()
+
+def _move_out_of_default(connection: Connection, name: str, month: date, bounds: str) -> int:
+    """
+    Creates the month's partition as a plain table, moves the month's rows
+    from the default partition into it and attaches it (the attach then finds
+    no overlapping rows left in the default partition). Returns the rows moved.
+    """
+    window = {"start": month, "end": add_months(month, 1)}
+    in_month = "submitted_at >= :start AND submitted_at < :end"
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), window).rowcount
+    connection.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} {bounds}"))
+    return moved
+
+def convert_to_partitioned(connection: Connection, today: Optional[date] = None) -> bool:
+    """
+    Converts an existing plain `submissions` table in place:
+
+    1. the old table is renamed to submissions_legacy (with its indexes and
+       id sequence kept; its primary key becomes (id, submitted_at)),
+    2. the partitioned table is created, drawing ids from the same sequence,
+    3. the old table is attached as the partition for everything before the
+       next month, after a CHECK constraint proves its rows fit; rows stay
+       where they are,
+    4. the monthly partitions from next month on are created, and the
+       conversations -> submissions foreign key is dropped.
+
+    Run it inside one transaction during a quiet period; it takes an exclusive
+    lock on `submissions`. Returns False if the table is already partitioned.
+    """
+    if is_partitioned(connection):
+        return False
+    boundary = add_months(month_start(today or datetime.now(timezone.utc).date()), 1)
+
+    connection.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    add_missing_columns(connection)
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": TABLE}).scalar()
+    connection.execute(text("ALTER TABLE IF EXISTS conversations DROP CONSTRAINT IF EXISTS conversations_submission_id_fkey"))
+    connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_PARTITION}"))
+    # Index and constraint names are schema-wide; free them for the new table.
+    for (index,) in connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"),
+        {"table": LEGACY_PARTITION},
+    ).all():
+        connection.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+
+    create_partitioned_table(connection)
+    if sequence:
+        # Keep numbering ids from the old sequence; the new table's own one is dropped.
+        own = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": TABLE}).scalar()
+        connection.execute(text(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')"))
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+        if own and own != sequence:
+            connection.execute(text(f"DROP SEQUENCE {own}"))
+
+    # A partition needs the parent's key; this rebuilds the key index once.
+    primary_key = connection.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype = 'p'"
+    ), {"table": LEGACY_PARTITION}).scalar()
+    drop_key = f'DROP CONSTRAINT "{primary_key}", ' if primary_key else ""
+    connection.execute(text(f"ALTER TABLE {LEGACY_PARTITION} {drop_key}ADD PRIMARY KEY (id, submitted_at)"))
+    # A validated CHECK lets ATTACH skip its own scan of the table.
+    connection.execute(text(
+        f"ALTER TABLE {LEGACY_PARTITION} ADD CONSTRAINT {LEGACY_PARTITION}_range "
+        f"CHECK (submitted_at IS NOT NULL AND submitted_at < '{boundary.isoformat()}')"
+    ))
+    connection.execute(text(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY_PARTITION} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+    ))
+    connection.execute(text(f"ALTER TABLE {LEGACY_PARTITION} DROP CONSTRAINT {LEGACY_PARTITION}_range"))
+    print(f"Converted {TABLE} to a partitioned table; existing rows are in {LEGACY_PARTITION}.")
+    ensure_partitions(connection, today=boundary)
+    return True
+
+def compact_partitions(engine, before: date) -> List[str]:
+    """
+    Rewrites (VACUUM FULL) the monthly partitions that end on or before
+    `before`, returning the space of text cleared by archival to the
+    filesystem. Each rewrite locks only its own, no longer written, partition.
+    """
+    with engine.connect() as connection:
+        months = [(name, month) for name, month in list_partitions(connection) if month and add_months(month, 1) <= before]
+    compacted = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for name, _ in months:
+            connection.execute(text(f"VACUUM (FULL, ANALYZE) {name}"))
+            compacted.append(name)
+    if compacted:
+        print(f"Compacted partitions: {', '.join(compacted)}")
+    return compacted
+
+def create_schema(engine) -> None:
+    """
+    Creates all tables, with `submissions` partitioned when
+    SUBMISSIONS_PARTITIONED is set and the database is PostgreSQL, and adds
+    columns missing from an existing `submissions` table.
+    """
+    from .base import Base
+
+    with engine.begin() as connection:
+        if submissions_partitioned(connection.dialect):
+            create_partitioned_table(connection)
+            ensure_partitions(connection)
+        Base.metadata.create_all(bind=connection)
+        add_missing_columns(connection)
+
+def add_missing_columns(connection: Connection) -> None:
+    """Adds model columns that an existing `submissions` table predates (e.g. archive_uri)."""
+    existing = {column["name"] for column in inspect(connection).get_columns(TABLE)}
+    for column in Submission.__table__.columns:
+        if column.name not in existing:
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN {ddl}"))
+            print(f"Added column {TABLE}.{column.name}.")
@@ -1,13 +1,80 @@
 # backend/app/entrypoint.py
+#
+# Production server entrypoint. Run from the backend directory with:
+#   python -m app.entrypoint
+#
+# All knobs are environment variables so Cloud Run revisions can be tuned
+# without rebuilding the image:
+#   PORT                        Port to bind (default 8080)
+#   WEB_CONCURRENCY             Worker processes (default: one per CPU core)
+#   UVICORN_LIMIT_CONCURRENCY   Max concurrent connections per worker before 503s (default unlimited)
+#   UVICORN_BACKLOG             Socket listen backlog (default 2048)
+#   UVICORN_KEEPALIVE           Keep-alive timeout in seconds (default 75, above the Cloud Run LB's 60)
+#   UVICORN_GRACEFUL_TIMEOUT    Seconds to drain in-flight requests on SIGTERM (default 9, Cloud Run allows 10)
+#   LOG_LEVEL                   uvicorn log level (default info)
 import os
 import uvicorn
-from main import app
 
-if __name__ == "__main__":
-    port = int(os.getenv("PORT", "8080"))
+APP_IMPORT_STRING = "app.main:app"
+
+def _env_int(name: str, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def default_workers() -> int:
+    """One worker per core available to this process (respects CPU affinity/cgroup pinning)."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+def preload() -> None:
+    """
+    Loads and validates shared config in the supervisor before any worker starts,
+    so a bad environment fails the container once instead of crash-looping every worker.
+    """
+    from app.core.config import settings  # noqa: F401
+    import app.main  # noqa: F401
+
+def prepare_partitions() -> None:
+    """
+    Creates the coming months' submissions partitions (app/db/partitions.py) once,
+    in the supervisor, so inserts do not pile up in the default partition and
+    workers do not each run the DDL. Failures are only logged.
+    """
+    from app.core.config import settings
+    from app.db import partitions
+    from app.db.database import engine
+
+    if not settings.SUBMISSIONS_PARTITIONED:
+        return
+    try:
+        with engine.begin() as connection:
+            partitions.ensure_partitions(connection)
+    except Exception as e:
+        print(f"Could not prepare submissions partitions: {type(e).__name__} - {e}")
+
+def main() -> None:
+    port = _env_int("PORT", 8080)
+    workers = _env_int("WEB_CONCURRENCY", default_workers())
+
+    preload()
+    prepare_partitions()
+    print(f"Starting {APP_IMPORT_STRING} on :{port} with {workers} worker(s)")
+
     uvicorn.run(
-        app,
+        APP_IMPORT_STRING,
         host="0.0.0.0",
         port=port,
-        log_level="info"
-    ) 
\ No newline at end of file
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=_env_int("UVICORN_LIMIT_CONCURRENCY", None),
+        backlog=_env_int("UVICORN_BACKLOG", 2048),
+        timeout_keep_alive=_env_int("UVICORN_KEEPALIVE", 75),
+        timeout_graceful_shutdown=_env_int("UVICORN_GRACEFUL_TIMEOUT", 9),
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+    )
+
+if __name__ == "__main__":
+    main()
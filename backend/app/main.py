@@ -1,16 +1,93 @@
-from fastapi import FastAPI, Depends
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from .core.config import settings
-from .core.security import get_current_user, User
+from .core.admission import AdmissionController, AdmissionMiddleware
+from .core import circuit_breaker, quota
+from .core.memory_profiler import MemoryProfiler, MemoryProfilingMiddleware
+from .core.priority_scheduler import LIVE, PriorityMiddleware, TEST
+from .core.config import settings, init_firebase
+from .core.security import get_current_user, require_metrics_token, User
 from .api.v1.api_v1 import api_router as api_v1_router # IMPORT OUR NEW V1 ROUTER
 
+def warm_up() -> None:
+    """
+    Builds the heavy SDK clients ahead of the first request.
+    Each step is timed and failures are only logged; the lazy getters retry on first use.
+    """
+    from .services import feedback_service, gcs_service, ocr_service
+
+    steps = [
+        ("firebase_admin", init_firebase),
+        ("google.cloud.storage", gcs_service.get_storage_client),
+        ("google.genai", feedback_service.get_genai_client),
+    ]
+    if settings.OCR_ENABLED:
+        steps.append(("google.cloud.vision", ocr_service.get_vision_client))
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+            print(f"Warm-up: {name} ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            print(f"Warm-up: {name} failed: {type(e).__name__} - {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in a worker thread so the container reports healthy immediately.
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        warmup_task = asyncio.get_running_loop().run_in_executor(None, warm_up)
+    if settings.QUOTA_ENABLED:
+        quota.start_flusher()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await asyncio.get_running_loop().run_in_executor(None, quota.stop_flusher)
+
 app = FastAPI(
     title="LiveSolve AI API",
     description="API for the LiveSolve handwriting analysis and feedback tool.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
+)
+
+# Model-backed endpoints that go through admission control.
+ADMISSION_PATH_PREFIXES = ("/api/v1/submission/", "/api/v1/ai/", "/api/v1/chat/")
+
+admission_controller = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    target_delay=settings.ADMISSION_TARGET_DELAY_MS / 1000,
+    interval=settings.ADMISSION_INTERVAL_MS / 1000,
+    max_queue_wait=settings.ADMISSION_MAX_QUEUE_WAIT_MS / 1000,
+)
+
+memory_profiler = MemoryProfiler(
+    sample_rate=settings.MEMORY_PROFILE_SAMPLE_RATE,
+    top_sites=settings.MEMORY_PROFILE_TOP_SITES,
+    frames=settings.MEMORY_PROFILE_FRAMES,
 )
 
+# Innermost, so only requests that get past admission control are traced.
+if settings.MEMORY_PROFILING:
+    app.add_middleware(MemoryProfilingMiddleware, profiler=memory_profiler)
+
+# Model calls from live checks and the AI test endpoints queue behind submissions.
+app.add_middleware(PriorityMiddleware, path_priorities={"/api/v1/live/": LIVE, "/api/v1/ai/": TEST})
+
+# Added before CORS so that 503 responses still carry the CORS headers.
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=admission_controller,
+        path_prefixes=ADMISSION_PATH_PREFIXES,
+    )
+
 # Configure CORS
 origins = [
     "http://localhost:5173",  # Vite dev server for local development
@@ -37,6 +114,71 @@ async def read_root():
         "status": "healthy"
     }
 
+@app.exception_handler(circuit_breaker.CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: circuit_breaker.CircuitOpenError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc.name} is temporarily unavailable; retry later."},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+@app.get("/health")
+async def read_health():
+    """
+    Public health check. Always 200 so that an outage of Vertex AI or GCS does
+    not get healthy instances restarted; `status` is "degraded" while any
+    circuit breaker is not closed. The full report is at /metrics/health.
+    """
+    breakers = circuit_breaker.snapshot_all()
+    degraded = any(b["state"] != circuit_breaker.CLOSED for b in breakers.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "dependencies": {name: b["state"] for name, b in breakers.items()},
+    }
+
+# --- INTERNALS (METRICS_TOKEN required) ---
+@app.get("/metrics/health", dependencies=[Depends(require_metrics_token)])
+async def read_health_details():
+    """Dependency health and this worker's counters, for dashboards."""
+    from .db import database
+    from .services import (
+        feedback_service, gcs_service, idempotency, image_derivatives, live_analysis, ocr_service, prompt_builder,
+    )
+
+    breakers = circuit_breaker.snapshot_all()
+    degraded = any(b["state"] != circuit_breaker.CLOSED for b in breakers.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "dependencies": breakers,
+        "vertex_locations": feedback_service.vertex_selector.snapshot(),
+        "model_scheduler": feedback_service.model_scheduler.snapshot(),
+        "admission": admission_controller.snapshot(),
+        "live_analysis": live_analysis.snapshot(),
+        "image_uploads": dict(gcs_service.upload_counters),
+        "image_derivatives": image_derivatives.snapshot(),
+        "ocr": ocr_service.snapshot(),
+        "token_usage": prompt_builder.usage_snapshot(),
+        "database": database.snapshot(),
+        "idempotency": idempotency.snapshot(),
+        "quota": quota.snapshot(),
+    }
+
+@app.get("/metrics/admission", dependencies=[Depends(require_metrics_token)])
+async def read_admission_metrics():
+    """Queue and shedding counters of this worker's admission controller."""
+    return admission_controller.snapshot()
+
+@app.get("/metrics/memory", dependencies=[Depends(require_metrics_token)])
+async def read_memory_metrics(reset: bool = False):
+    """
+    Per-route memory profile of this worker's sampled requests (MEMORY_PROFILING);
+    `reset=true` starts a new collection period after returning the current one.
+    """
+    report = {"enabled": settings.MEMORY_PROFILING, **memory_profiler.report()}
+    if reset:
+        memory_profiler.reset()
+    return report
+
 # --- API ROUTERS ---
 # Include the v1 router. All routes defined in api_v1.py will now be active
 # and prefixed with /api/v1.
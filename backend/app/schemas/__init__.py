@@ -1 +1,2 @@
 from .submission import *
+from .chat import *
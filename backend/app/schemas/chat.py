@@ -0,0 +1,21 @@
+#
+# FILE: backend/app/schemas/chat.py
+#
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+class ChatMessageCreate(BaseModel):
+    """A follow-up question from the student about a submission."""
+    message: str = Field(min_length=1, max_length=4000)
+
+class ChatMessageResponse(BaseModel):
+    role: str  # 'user' or 'model'
+    content: str
+    created_at: datetime
+    model_config = {"from_attributes": True}
+
+class ChatHistoryResponse(BaseModel):
+    submission_id: int
+    summary: Optional[str] = None  # Condensed form of turns no longer sent to the model
+    messages: List[ChatMessageResponse]
@@ -3,7 +3,7 @@
 #
 from pydantic import BaseModel, HttpUrl
 from datetime import datetime
-from typing import List, Tuple, Any
+from typing import List, Optional, Tuple, Any
 
 # --- UPDATED: Schemas for AI Feedback with Translation and Error Bounding Boxes ---
 
@@ -22,6 +22,9 @@ class AIFeedbackResponse(BaseModel):
     """
     translated_handwriting: str  # Complete translation of all handwriting in the image
     errors: List[ErrorEntry]  # List of error entries with bounding boxes
+    # "ok", "cached" (an earlier result for the same image, served while the model
+    # is unavailable) or "unavailable" (no analysis could be made)
+    status: str = "ok"
 
 # --- Schemas for Orchestration Endpoint ---
 
@@ -35,6 +38,8 @@ class SubmissionCreate(SubmissionBase):
     """Schema for creating a new submission record in the database."""
     user_id: str
     problem_id: str
+    thumbnail_url: Optional[str] = None
+    annotated_url: Optional[str] = None
 
 class SubmissionResponse(SubmissionBase):
     """
@@ -42,6 +47,22 @@ class SubmissionResponse(SubmissionBase):
     The 'ai_feedback_data' field now contains the structured AI feedback with translation and errors.
     """
     ai_feedback_data: AIFeedbackResponse
+    submission_id: Optional[int] = None  # Used to open a follow-up chat about this submission
+    # Small WebP renderings (thumbnail, photo with the error boxes drawn in); None if not rendered
+    thumbnail_url: Optional[str] = None
+    annotated_url: Optional[str] = None
+
+class SubmissionSummary(BaseModel):
+    """One entry of a user's submission history: links to the images, no feedback."""
+    submission_id: int
+    problem_id: str
+    submitted_at: datetime
+    image_gcs_url: str
+    thumbnail_url: Optional[str] = None
+    annotated_url: Optional[str] = None
+
+class SubmissionHistoryResponse(BaseModel):
+    submissions: List[SubmissionSummary]
 
 # --- Schemas for Database Model ---
 
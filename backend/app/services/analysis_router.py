@@ -0,0 +1,111 @@
+# backend/app/services/analysis_router.py
+"""
+Complexity-aware routing for the analysis pipeline.
+
+Cheap image features (ink density, text line count, ink component count) are
+computed locally and matched against a policy table; the first matching tier
+decides which models, thinking budget and region limit a submission gets. A
+canvas holding `2+2=4` takes the fast tier while a page of derivations keeps
+full reasoning.
+
+The table can be replaced without a deploy by setting ANALYSIS_ROUTING_POLICY
+to a JSON list of tiers (same fields as RouteTier).
+"""
+
+import json
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services import region_detector
+
+class RouteTier(BaseModel):
+    """
+    One row of the policy table. A tier matches when every limit that is set
+    is satisfied; a tier with no limits matches everything.
+    """
+    name: str
+    max_ink_density: Optional[float] = None
+    max_lines: Optional[int] = None
+    max_regions: Optional[int] = None
+
+    detection_model: str
+    error_model: str
+    thinking_budget: int
+    region_limit: int
+
+class ImageFeatures(NamedTuple):
+    ink_density: float  # fraction of pixels that are ink
+    line_count: int
+    region_count: int  # ink components, a proxy for symbol count
+
+DEFAULT_POLICY = [
+    RouteTier(
+        name="trivial",
+        max_ink_density=0.04, max_lines=1, max_regions=12,
+        detection_model="gemini-2.5-flash-lite", error_model="gemini-2.5-flash-lite",
+        thinking_budget=0, region_limit=12,
+    ),
+    RouteTier(
+        name="standard",
+        max_lines=4, max_regions=60,
+        detection_model="gemini-2.5-flash", error_model="gemini-2.5-flash",
+        thinking_budget=512, region_limit=30,
+    ),
+    RouteTier(
+        name="hard",
+        detection_model="gemini-2.5-flash", error_model="gemini-2.5-flash",
+        thinking_budget=1024, region_limit=30,
+    ),
+]
+
+@lru_cache(maxsize=1)
+def get_policy() -> List[RouteTier]:
+    """Returns the configured policy table (ANALYSIS_ROUTING_POLICY) or the default one."""
+    if settings.ANALYSIS_ROUTING_POLICY:
+        return [RouteTier(**tier) for tier in json.loads(settings.ANALYSIS_ROUTING_POLICY)]
+    return DEFAULT_POLICY
+
+def policy_fingerprint() -> str:
+    """Stable identifier of the active policy, for use in cache and coalescing keys."""
+    return json.dumps([tier.model_dump() for tier in get_policy()], sort_keys=True)
+
+def measure(image_bytes: bytes) -> ImageFeatures:
+    """Computes the routing features from the same ink mask the local detector uses."""
+    mask = region_detector.load_ink_mask(image_bytes)
+    components = region_detector.connected_components(mask)
+    sizes = components[:, 2:] - components[:, :2]
+    lines = region_detector.segment_lines(mask, max(1, int(region_detector.MIN_LINE_GAP * mask.shape[0])))
+    return ImageFeatures(
+        ink_density=float(mask.mean()) if mask.size else 0.0,
+        line_count=len(lines),
+        region_count=int((sizes >= region_detector.MIN_COMPONENT_SIZE).any(axis=1).sum()),
+    )
+
+def _matches(tier: RouteTier, features: ImageFeatures) -> bool:
+    return (
+        (tier.max_ink_density is None or features.ink_density <= tier.max_ink_density)
+        and (tier.max_lines is None or features.line_count <= tier.max_lines)
+        and (tier.max_regions is None or features.region_count <= tier.max_regions)
+    )
+
+def choose_route(image_bytes: bytes) -> RouteTier:
+    """
+    Picks the policy tier for an image and logs the decision.
+    If features cannot be computed the last (most capable) tier is used.
+    """
+    policy = get_policy()
+    try:
+        features = measure(image_bytes)
+    except Exception as e:
+        print(f"Routing: could not measure image ({type(e).__name__} - {e}); using '{policy[-1].name}'")
+        return policy[-1]
+
+    tier = next((t for t in policy if _matches(t, features)), policy[-1])
+    print(
+        f"Routing: ink={features.ink_density:.3f} lines={features.line_count} regions={features.region_count} "
+        f"-> '{tier.name}' ({tier.error_model}, thinking_budget={tier.thinking_budget}, region_limit={tier.region_limit})"
+    )
+    return tier
@@ -0,0 +1,214 @@
+# backend/app/services/box_geometry.py
+"""
+Vectorized geometry for the bounding boxes returned by the model.
+
+All boxes live in the model's 0-1000 normalized frame and are handled as
+(N, 4) float arrays in [x1, y1, x2, y2] order (the order the frontend uses).
+The model itself speaks [y1, x1, y2, x2]; use `from_model_boxes` and
+`to_model_boxes` at that boundary instead of swapping in Python loops.
+
+Overlap queries use a shapely STRtree when shapely is installed and the
+pairwise problem is large enough to benefit; otherwise a dense NumPy
+broadcast is used.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely import STRtree
+except ImportError:  # shapely is optional; fall back to dense NumPy
+    shapely = None
+    STRtree = None
+
+NORMALIZED_MAX = 1000.0
+
+# Below this many candidate pairs a dense broadcast beats building a tree.
+STRTREE_MIN_PAIRS = 20_000
+
+
+def from_model_boxes(raw_boxes: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts raw model boxes ([y1, x1, y2, x2]) to an (N, 4) [x1, y1, x2, y2] array.
+
+    Args:
+        raw_boxes: Box coordinate lists exactly as returned by the model.
+
+    Returns:
+        A tuple of (boxes, well_formed). Rows that did not hold four finite
+        numbers are NaN in `boxes` and False in `well_formed`.
+    """
+    boxes = np.full((len(raw_boxes), 4), np.nan, dtype=np.float64)
+    for i, raw in enumerate(raw_boxes):
+        if raw is not None and len(raw) == 4:
+            try:
+                boxes[i] = raw
+            except (TypeError, ValueError):
+                pass
+    boxes = boxes[:, [1, 0, 3, 2]]
+    well_formed = np.isfinite(boxes).all(axis=1)
+    return boxes, well_formed
+
+
+def to_model_boxes(boxes: np.ndarray) -> np.ndarray:
+    """Converts [x1, y1, x2, y2] rows back to the model's [y1, x1, y2, x2] order."""
+    return np.asarray(boxes)[:, [1, 0, 3, 2]]
+
+
+def clamp_boxes(boxes: np.ndarray, max_value: float = NORMALIZED_MAX) -> np.ndarray:
+    """
+    Orders each box's corners and clamps them into [0, max_value].
+
+    NaN rows stay NaN so they can still be filtered by `valid_mask`.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x1 = np.fmin(boxes[:, 0], boxes[:, 2])
+    x2 = np.fmax(boxes[:, 0], boxes[:, 2])
+    y1 = np.fmin(boxes[:, 1], boxes[:, 3])
+    y2 = np.fmax(boxes[:, 1], boxes[:, 3])
+    ordered = np.stack([x1, y1, x2, y2], axis=1)
+    return np.clip(ordered, 0.0, max_value)
+
+
+def valid_mask(boxes: np.ndarray, min_size: float = 1.0) -> np.ndarray:
+    """Returns a boolean mask of boxes that are finite and at least `min_size` wide and tall."""
+    boxes = np.asarray(boxes, dtype=np.float64)
+    finite = np.isfinite(boxes).all(axis=1)
+    with np.errstate(invalid="ignore"):
+        wide = (boxes[:, 2] - boxes[:, 0]) >= min_size
+        tall = (boxes[:, 3] - boxes[:, 1]) >= min_size
+    return finite & wide & tall
+
+
+def areas(boxes: np.ndarray) -> np.ndarray:
+    """Returns the area of each [x1, y1, x2, y2] box."""
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def paired_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Returns the IoU of a[k] with b[k] for every row k."""
+    ix1 = np.maximum(a[:, 0], b[:, 0])
+    iy1 = np.maximum(a[:, 1], b[:, 1])
+    ix2 = np.minimum(a[:, 2], b[:, 2])
+    iy2 = np.minimum(a[:, 3], b[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    union = areas(a) + areas(b) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Returns the dense (len(a), len(b)) IoU matrix."""
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    union = areas(a)[:, None] + areas(b)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def overlapping_pairs(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds every pair (i, j) where a[i] and b[j] overlap with a positive area.
+
+    Returns:
+        A tuple of (i, j, iou) arrays of equal length.
+    """
+    if len(a) == 0 or len(b) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0, dtype=np.float64)
+
+    if STRtree is not None and len(a) * len(b) >= STRTREE_MIN_PAIRS:
+        tree = STRtree(shapely.box(b[:, 0], b[:, 1], b[:, 2], b[:, 3]))
+        i, j = tree.query(shapely.box(a[:, 0], a[:, 1], a[:, 2], a[:, 3]), predicate="intersects")
+        iou = paired_iou(a[i], b[j])
+    else:
+        dense = iou_matrix(a, b)
+        i, j = np.nonzero(dense)
+        iou = dense[i, j]
+
+    positive = iou > 0
+    return i[positive], j[positive], iou[positive]
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: Optional[np.ndarray] = None,
+    iou_threshold: float = 0.5,
+) -> np.ndarray:
+    """
+    Greedy non-max suppression.
+
+    Args:
+        boxes: (N, 4) [x1, y1, x2, y2] array.
+        scores: Optional priority per box. When omitted, earlier boxes win,
+                which matches the model's own output ordering.
+        iou_threshold: Boxes overlapping a kept box above this IoU are dropped.
+
+    Returns:
+        Indices of the kept boxes, in priority order.
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+
+    order = np.arange(n) if scores is None else np.argsort(-np.asarray(scores), kind="stable")
+    rank = np.empty(n, dtype=np.intp)
+    rank[order] = np.arange(n)
+
+    i, j, iou = overlapping_pairs(boxes, boxes)
+    edge = (i != j) & (iou > iou_threshold) & (rank[i] < rank[j])
+    winners, losers = i[edge], j[edge]
+
+    # Group suppression edges by the higher-priority box so each kept box
+    # can knock out its neighbours with a single slice.
+    by_winner = np.argsort(winners, kind="stable")
+    winners, losers = winners[by_winner], losers[by_winner]
+    starts = np.searchsorted(winners, np.arange(n), side="left")
+    ends = np.searchsorted(winners, np.arange(n), side="right")
+
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for idx in order:
+        if suppressed[idx]:
+            continue
+        keep.append(idx)
+        suppressed[losers[starts[idx]:ends[idx]]] = True
+    return np.asarray(keep, dtype=np.intp)
+
+
+def snap_to_regions(
+    boxes: np.ndarray,
+    regions: np.ndarray,
+    min_iou: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Replaces each box with the detected region it overlaps most.
+
+    Args:
+        boxes: (N, 4) boxes to snap (e.g. error boxes from the model).
+        regions: (M, 4) pre-detected regions the boxes should come from.
+        min_iou: Minimum IoU required to snap; boxes below it are left as-is.
+
+    Returns:
+        A tuple of (snapped_boxes, region_index). `region_index[k]` is the
+        region chosen for box k, or -1 if nothing overlapped enough.
+    """
+    snapped = np.array(boxes, dtype=np.float64, copy=True)
+    matched = np.full(len(boxes), -1, dtype=np.intp)
+    i, j, iou = overlapping_pairs(snapped, regions)
+    if len(i) == 0:
+        return snapped, matched
+
+    # Sort by (box, iou) so the last entry per box is its best region.
+    order = np.lexsort((iou, i))
+    i, j, iou = i[order], j[order], iou[order]
+    last = np.r_[i[1:] != i[:-1], True]
+    best_box, best_region, best_iou = i[last], j[last], iou[last]
+
+    accepted = best_iou > min_iou
+    matched[best_box[accepted]] = best_region[accepted]
+    snapped[best_box[accepted]] = regions[best_region[accepted]]
+    return snapped, matched
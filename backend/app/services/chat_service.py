@@ -0,0 +1,225 @@
+# backend/app/services/chat_service.py
+"""
+Follow-up chat with the AI tutor about a single submission.
+
+The stable context for a conversation (the canvas image and the feedback the
+student already saw) is put into a Vertex context cache once, so each turn
+only sends the rolling summary, the recent turns and the new question. When a
+cache cannot be created (e.g. the context is below Vertex's minimum cacheable
+size) the context is referenced inline by GCS URI instead; keeping it as an
+identical prefix on every turn still lets Vertex's implicit caching apply.
+
+History is kept under CHAT_HISTORY_TOKEN_BUDGET: turns that no longer fit are
+folded into Conversation.summary by a cheap summarization call.
+"""
+
+import datetime
+import mimetypes
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.db import crud_chat, models
+from app.db.database import SessionLocal
+from app.services import feedback_service, gcs_service
+
+SYSTEM_INSTRUCTION = """
+You are a patient math tutor. The student's handwritten work and the errors
+already highlighted for them are attached. Answer their follow-up questions
+about this work: explain mistakes step by step, prefer hints over full
+solutions, and keep answers short.
+"""
+
+SUMMARY_INSTRUCTION = """
+Condense this tutoring conversation into a short summary (at most 120 words)
+that keeps what the student asked, what was explained, and anything still
+unresolved. Write it in the third person.
+"""
+
+# Reuse a cache only if it will outlive a slow streamed reply.
+CACHE_EXPIRY_MARGIN = datetime.timedelta(seconds=60)
+# After a failed cache creation, don't retry for this submission until then.
+CACHE_RETRY_AFTER = datetime.timedelta(minutes=10)
+# Most submissions whose failure is remembered; the oldest are forgotten first.
+CACHE_FAILURES_SIZE = 10_000
+
+# Submission id -> when to try caching again, oldest first (every entry waits
+# CACHE_RETRY_AFTER, so that is also expiry order).
+_cache_failures: "OrderedDict[int, datetime.datetime]" = OrderedDict()
+_cache_failures_lock = threading.Lock()
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English and math text)."""
+    return max(1, len(text) // 4)
+
+def split_history(
+    messages: Sequence[models.ChatMessage], budget: int
+) -> Tuple[List[models.ChatMessage], List[models.ChatMessage]]:
+    """
+    Splits turns into (folded, recent): the newest turns that fit in `budget`
+    tokens, and everything older. The newest turn is always kept.
+    """
+    recent = []
+    used = 0
+    for message in reversed(messages):
+        cost = estimate_tokens(message.content)
+        if recent and used + cost > budget:
+            break
+        recent.append(message)
+        used += cost
+    recent.reverse()
+    return list(messages[:len(messages) - len(recent)]), recent
+
+def _context_parts(image_gcs_url: str, ai_feedback: Optional[str]):
+    from google.genai.types import Part
+
+    gcs_uri = gcs_service.public_url_to_gcs_uri(image_gcs_url)
+    mime_type = mimetypes.guess_type(gcs_uri)[0] or "image/png"
+    return [
+        Part.from_uri(file_uri=gcs_uri, mime_type=mime_type),
+        Part.from_text(text=f"Feedback already shown to the student (JSON):\n{ai_feedback or '{}'}"),
+    ]
+
+def _live_cache_name(conversation: models.Conversation, now: datetime.datetime) -> Optional[str]:
+    """The conversation's context cache, if it will outlive a slow streamed reply."""
+    expires_at = conversation.context_cache_expires_at
+    if expires_at is not None and expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+    if conversation.context_cache_name and expires_at and expires_at - CACHE_EXPIRY_MARGIN > now:
+        return conversation.context_cache_name
+    return None
+
+def _create_context_cache(
+    submission_id: int, image_gcs_url: str, ai_feedback: Optional[str], now: datetime.datetime
+) -> Optional[Tuple[str, datetime.datetime]]:
+    """
+    Creates a context cache for a submission's conversation and returns its
+    (name, expiry). Returns None when caching is unavailable; the caller then
+    sends the context inline.
+    """
+    from google.genai.types import Content, CreateCachedContentConfig
+
+    with _cache_failures_lock:
+        retry_at = _cache_failures.get(submission_id)
+        if retry_at and retry_at <= now:
+            del _cache_failures[submission_id]
+    if retry_at and retry_at > now:
+        return None
+
+    try:
+        ttl = settings.CHAT_CONTEXT_CACHE_TTL_SECONDS
+        cache = feedback_service.create_context_cache(
+            model=settings.CHAT_MODEL,
+            config=CreateCachedContentConfig(
+                contents=[Content(role="user", parts=_context_parts(image_gcs_url, ai_feedback))],
+                system_instruction=SYSTEM_INSTRUCTION,
+                ttl=f"{ttl}s",
+                display_name=f"submission-{submission_id}",
+            ),
+        )
+    except Exception as e:
+        print(f"Context caching unavailable for submission {submission_id}, sending context inline: {e}")
+        with _cache_failures_lock:
+            _cache_failures[submission_id] = now + CACHE_RETRY_AFTER
+            _cache_failures.move_to_end(submission_id)
+            while _cache_failures and (
+                len(_cache_failures) > CACHE_FAILURES_SIZE or next(iter(_cache_failures.values())) <= now
+            ):
+                _cache_failures.popitem(last=False)
+        return None
+    return cache.name, now + datetime.timedelta(seconds=ttl)
+
+def _summarize(previous_summary: Optional[str], folded: Sequence[models.ChatMessage]) -> str:
+    """
+    Folds older turns into the running summary. Falls back to plain truncation
+    if the model call fails so the budget is still honoured.
+    """
+    from google.genai.types import GenerateContentConfig, ThinkingConfig
+
+    transcript = "\n".join(f"{m.role}: {m.content}" for m in folded)
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+    try:
+        response = feedback_service.generate_content(
+            model=settings.CHAT_MODEL,
+            contents=[transcript],
+            config=GenerateContentConfig(
+                system_instruction=SUMMARY_INSTRUCTION,
+                temperature=0,
+                thinking_config=ThinkingConfig(thinking_budget=0),
+            ),
+        )
+        if response.text:
+            return response.text.strip()
+    except Exception as e:
+        print(f"Chat summarization failed, truncating instead: {type(e).__name__} - {e}")
+    return transcript[-2000:]
+
+def stream_reply(
+    *,
+    conversation_id: int,
+    image_gcs_url: str,
+    ai_feedback: Optional[str],
+    message: str,
+) -> Iterator[str]:
+    """
+    Streams the tutor's reply to the student's message chunk by chunk, then
+    records both turns together. A reply that fails or is abandoned by the
+    client records neither, so the history never holds an unanswered turn.
+
+    Database sessions are only held while reading or writing, never during
+    a model call (summarization, cache creation or the streamed reply). All
+    three go through the model scheduler and the Vertex circuit breaker.
+    """
+    from google.genai.types import Content, GenerateContentConfig, Part, ThinkingConfig
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with SessionLocal() as db:
+        conversation = crud_chat.get_conversation(db, conversation_id=conversation_id)
+        submission_id, summary = conversation.submission_id, conversation.summary
+        cache_name = _live_cache_name(conversation, now)
+        messages = crud_chat.list_messages(
+            db, conversation_id=conversation_id, after_id=conversation.summarized_through
+        )
+
+    pending = models.ChatMessage(conversation_id=conversation_id, role="user", content=message)
+    folded, recent = split_history([*messages, pending], settings.CHAT_HISTORY_TOKEN_BUDGET)
+    updates = {}
+    if folded:
+        summary = _summarize(summary, folded)
+        updates.update(summary=summary, summarized_through=folded[-1].id)
+    if cache_name is None:
+        created = _create_context_cache(submission_id, image_gcs_url, ai_feedback, now)
+        if created is not None:
+            cache_name, expires_at = created
+            updates.update(context_cache_name=cache_name, context_cache_expires_at=expires_at)
+    if updates:
+        with SessionLocal() as db:
+            crud_chat.update_conversation(db, conversation_id=conversation_id, **updates)
+
+    turns = [Content(role=m.role, parts=[Part.from_text(text=m.content)]) for m in recent]
+    preamble = [] if cache_name else _context_parts(image_gcs_url, ai_feedback)
+    if summary:
+        preamble.append(Part.from_text(text=f"Summary of our earlier conversation: {summary}"))
+    contents = ([Content(role="user", parts=preamble)] if preamble else []) + turns
+
+    config = GenerateContentConfig(
+        cached_content=cache_name,
+        system_instruction=None if cache_name else SYSTEM_INSTRUCTION,
+        temperature=0.3,
+        thinking_config=ThinkingConfig(thinking_budget=0),
+    )
+
+    reply = []
+    for chunk in feedback_service.generate_content_stream(
+        model=settings.CHAT_MODEL, contents=contents, config=config
+    ):
+        if chunk.text:
+            reply.append(chunk.text)
+            yield chunk.text
+
+    with SessionLocal() as db:
+        crud_chat.add_messages(
+            db, conversation_id=conversation_id, turns=[("user", message), ("model", "".join(reply))]
+        )
@@ -1,8 +1,62 @@
-from google.cloud import storage
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Iterator, Optional
+from app.core import admission
+from app.core.circuit_breaker import CircuitOpenError, get_breaker
+from app.core.priority_scheduler import PriorityScheduler
 from app.core.config import settings
+from app.core.single_flight import SingleFlight
 from app.schemas.submission import ErrorEntry, AIFeedbackResponse
+from app.services import (
+    analysis_router, box_geometry, gcs_service, problem_catalog, prompt_builder, region_detector, vertex_locations,
+)
 from pydantic import BaseModel
-import json
+
+DETECTION_MODEL = "gemini-2.5-flash"
+DETECTION_THINKING_BUDGET = 0
+DETECTION_REGION_LIMIT = 30
+ERROR_MODEL = "gemini-2.5-flash"
+ERROR_TEMPERATURE = 0.5
+ERROR_THINKING_BUDGET = 512
+
+DETECTION_PROMPT = "Output the bounding box of all individual syntaxes or group of notations (as appropriate) in the math work."
+ERROR_PROMPT = "Output the bounding box of the error in the math work."
+# Task line of the error-selection prompt for templates that answer with region ids.
+ERROR_ID_PROMPT = "Output the ids of the regions that contain an error in the math work."
+
+# Detections overlapping an earlier detection above this IoU are duplicates.
+DETECTION_NMS_IOU = 0.7
+# An error box must overlap a detected region at least this much to be snapped to it.
+ERROR_SNAP_MIN_IOU = 0.1
+
+# Used for every submission when ANALYSIS_ROUTING is off.
+DEFAULT_ROUTE = analysis_router.RouteTier(
+    name="default",
+    detection_model=DETECTION_MODEL,
+    error_model=ERROR_MODEL,
+    thinking_budget=ERROR_THINKING_BUDGET,
+    region_limit=DETECTION_REGION_LIMIT,
+)
+
+# In-flight analyses keyed on (image sha256, analysis config).
+_analysis_flights = SingleFlight()
+
+vertex_breaker = get_breaker(
+    "vertex",
+    failure_rate_threshold=settings.BREAKER_FAILURE_RATE,
+    slow_call_seconds=settings.VERTEX_SLOW_CALL_SECONDS,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+)
+
+# Caps concurrent model calls and lets interactive requests go first.
+model_scheduler = PriorityScheduler(settings.MODEL_CONCURRENCY, aging_seconds=settings.PRIORITY_AGING_SECONDS)
+
+# Last good feedback per (image sha256, problem id), served when analysis fails.
+_recent_feedback: "OrderedDict[tuple, AIFeedbackResponse]" = OrderedDict()
+_recent_feedback_lock = threading.Lock()
 
 class BoundingBox(BaseModel):
     """
@@ -16,165 +70,344 @@ class BoundingBox(BaseModel):
     box_2d: list[int]
     label: str
 
-def get_errorbouding_from_image(gcs_uri: str) -> dict:
+def get_genai_client(location: Optional[str] = None):
     """
-    Detects errors in the math work by comparing against pre-detected bounding boxes.
+    Returns the process-wide Vertex AI GenAI client for `location` (the primary
+    configured location by default), importing the SDK on first use.
     """
+    return _genai_client(location or vertex_selector.primary)
+
+@lru_cache(maxsize=None)
+def _genai_client(location: str):
     import google.genai as genai
-    from google.genai.types import GenerateContentConfig, Part, ThinkingConfig
-    import io
 
-    all_bounding_boxes = get_bounding_from_image(gcs_uri)
-    if not all_bounding_boxes:
-        return AIFeedbackResponse(translated_handwriting="No content detected", errors=[]).model_dump()
+    return genai.Client(
+        vertexai=True,
+        project=settings.GCP_PROJECT_ID,
+        location=location,
+    )
 
-    prompt_boxes = []
-    for bbox in all_bounding_boxes:
-        x1, y1, x2, y2 = bbox.box_2d
-        prompt_boxes.append({"box_2d": [y1, x1, y2, x2], "label": bbox.label})
-    bounding_boxes_json = json.dumps(prompt_boxes, indent=2)
+# Model calls go to the fastest healthy location and fail over to the others.
+# The lambda looks get_genai_client up on every call so it can be swapped out.
+vertex_selector = vertex_locations.LocationSelector(
+    vertex_locations.candidate_locations(),
+    client_factory=lambda location: get_genai_client(location),
+    probe_interval=settings.VERTEX_LOCATION_PROBE_SECONDS,
+)
 
-    try:
-        storage_client = storage.Client(project=settings.GCP_PROJECT_ID)
-        bucket_name = gcs_uri.split("/")[2]
-        blob_name = "/".join(gcs_uri.split("/")[3:])
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        in_mem_file = io.BytesIO()
-        blob.download_to_file(in_mem_file)
-        in_mem_file.seek(0)
-
-        client = genai.Client(
-            vertexai=True,
-            project=settings.GCP_PROJECT_ID,
-            location='global',
+def generate_content(**kwargs):
+    """
+    client.models.generate_content for pipeline calls: waits for a model slot in
+    the request's priority class, then runs on the best Vertex AI location
+    under the overall Vertex circuit breaker. Bad-request errors are raised
+    without counting as Vertex failures: one user's bad upload must not open
+    the breaker for everyone.
+    """
+    with model_scheduler.slot():
+        return vertex_breaker.call(
+            vertex_selector.generate_content, is_failure=vertex_locations.is_retryable, **kwargs
         )
 
-        config = GenerateContentConfig(
-            system_instruction="""
-            Return bounding boxes as an array with labels for errors only.
-            Never return masks. Limit to 5 objects.
-            If no error found, return an empty list.
-            YOU MUST choose from these pre-analyzed bounding boxes for the syntax:
-            """,
-            temperature=0.5,
-            response_mime_type="application/json",
-            response_schema=list[BoundingBox],
-            thinking_config=ThinkingConfig(thinking_budget=512)
+def generate_content_stream(**kwargs) -> Iterator:
+    """
+    client.models.generate_content_stream for chat replies, on the primary
+    location: holds a model slot until the stream ends and runs under the
+    Vertex circuit breaker, like `generate_content`.
+    """
+    with model_scheduler.slot():
+        yield from vertex_breaker.call_stream(
+            get_genai_client().models.generate_content_stream, is_failure=vertex_locations.is_retryable, **kwargs
         )
 
-        prompt = f"""
-        Output the bounding box of the error in the math work.
-        YOU MUST choose from these pre-analyzed bounding boxes for the syntax:
-        {bounding_boxes_json}
-        """
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                Part.from_bytes(
-                    data=in_mem_file.getvalue(),
-                    mime_type="image/png",
-                ),
-                prompt
-            ],
-            config=config,
-        )
-        print(f"AI Response for errors: {response.json()}")
-
-        region_list = response.parsed if hasattr(response, "parsed") else []
-        errors = []
-        for region in region_list:
-            box_2d_from_model = region.box_2d if hasattr(region, 'box_2d') else []
-            label = region.label if hasattr(region, 'label') else "AI detected error"
-            if len(box_2d_from_model) == 4:
-                y1, x1, y2, x2 = box_2d_from_model
-                norm_box_2d = [x1, y1, x2, y2]
-            else:
-                norm_box_2d = [0, 0, 0, 0]
-            errors.append(ErrorEntry(error_text=label, box_2d=norm_box_2d))
-        
-        try:
-            feedback = AIFeedbackResponse(
-                translated_handwriting="AI feedback based on detected errors",
-                errors=errors
-            )
-            return feedback.model_dump()
-        except Exception as e:
-            print(f"AIFeedbackResponse validation error: {e}")
-            return AIFeedbackResponse(translated_handwriting="", errors=[]).model_dump()
+def create_context_cache(**kwargs):
+    """client.caches.create on the primary location, under the model scheduler and the Vertex circuit breaker."""
+    with model_scheduler.slot():
+        return vertex_breaker.call(get_genai_client().caches.create, is_failure=vertex_locations.is_retryable, **kwargs)
+
+def _validated_boxes(region_list, default_label: str) -> tuple[np.ndarray, list[str]]:
+    """
+    Converts parsed model regions into clamped [x1, y1, x2, y2] boxes and labels.
+    Malformed or degenerate boxes are dropped instead of being replaced by [0, 0, 0, 0].
+    """
+    raw_boxes = [getattr(region, 'box_2d', None) for region in region_list]
+    labels = [getattr(region, 'label', None) or default_label for region in region_list]
+    boxes, well_formed = box_geometry.from_model_boxes(raw_boxes)
+    boxes = box_geometry.clamp_boxes(boxes)
+    keep = well_formed & box_geometry.valid_mask(boxes)
+    if not keep.all():
+        print(f"Dropped {int((~keep).sum())} malformed box(es) from model output.")
+    return boxes[keep], [label for label, k in zip(labels, keep) if k]
+
+def _analysis_config() -> tuple:
+    """
+    Everything besides the image that changes the analysis result.
+    Part of the coalescing key so callers with different settings never share a flight.
+    """
+    routing = analysis_router.policy_fingerprint() if settings.ANALYSIS_ROUTING else DEFAULT_ROUTE.model_dump_json()
+    return (
+        settings.REGION_DETECTOR, routing, settings.PROMPT_VERSION, DETECTION_THINKING_BUDGET, ERROR_TEMPERATURE,
+        DETECTION_NMS_IOU, ERROR_SNAP_MIN_IOU,
+    )
+
+def _choose_route(image_bytes: bytes) -> analysis_router.RouteTier:
+    if settings.ANALYSIS_ROUTING:
+        return analysis_router.choose_route(image_bytes)
+    return DEFAULT_ROUTE
+
+def get_errorbouding_from_image(
+    gcs_uri: str, image_bytes: Optional[bytes] = None, problem_id: Optional[str] = None
+) -> dict:
+    """
+    Detects errors in the math work by comparing against pre-detected bounding boxes.
+
+    Concurrent calls for the same image bytes and analysis config (a client retry,
+    or two tabs submitting the same canvas) share a single model pipeline run.
+
+    If the analysis fails, or Vertex AI / GCS are behind an open circuit breaker,
+    a degraded result comes back immediately: the last feedback for the same
+    image (status "cached") or an empty one with status "unavailable".
+
+    Args:
+        gcs_uri: The GCS URI of the image, used to download it when `image_bytes` is not given.
+        image_bytes: The image content, if the caller already has it in memory.
+        problem_id: Catalog problem the work answers. Its reference solution is given
+                    to the model, and work matching it skips the error-selection call.
+    """
+    cache_key = None
+    try:
+        if image_bytes is None:
+            image_bytes = gcs_service.download_image_bytes(gcs_uri)
+        key = (hashlib.sha256(image_bytes).hexdigest(), problem_id, _analysis_config())
+        cache_key = key[:2]
+
+        def checkpoint():
+            # Stop between model calls once nobody is waiting for the result.
+            if _analysis_flights.followers(key) == 0:
+                admission.raise_if_cancelled()
 
+        while True:
+            try:
+                feedback, shared = _analysis_flights.do(key, lambda: _analyze_image(image_bytes, problem_id, checkpoint))
+                break
+            except admission.ClientDisconnected:
+                if admission.client_disconnected():
+                    raise
+                # Joined just as the leader's client left and it stopped: run the analysis again.
+                print(f"Analysis for image {key[0][:12]} abandoned by its leader; retrying for a waiting client.")
+        if shared:
+            print(f"Coalesced analysis for image {key[0][:12]} with an in-flight request.")
+        else:
+            _remember_feedback(cache_key, feedback)
+        return feedback.model_dump()
+    except admission.ClientDisconnected:
+        print("Client disconnected; analysis abandoned.")
+        raise
+    except CircuitOpenError as e:
+        print(f"Skipping analysis: {e}")
+        return _degraded_feedback(cache_key).model_dump()
     except Exception as e:
         print(f"Error in get_errorbouding_from_image (Vertex AI): {type(e).__name__} - {e}")
         import traceback
         traceback.print_exc()
-        return AIFeedbackResponse(translated_handwriting="", errors=[]).model_dump()
+        return _degraded_feedback(cache_key).model_dump()
 
-def get_bounding_from_image(gcs_uri: str) -> list[BoundingBox]:
+def _remember_feedback(cache_key: tuple, feedback: AIFeedbackResponse) -> None:
+    with _recent_feedback_lock:
+        _recent_feedback[cache_key] = feedback
+        _recent_feedback.move_to_end(cache_key)
+        while len(_recent_feedback) > settings.DEGRADED_CACHE_SIZE:
+            _recent_feedback.popitem(last=False)
+
+def _degraded_feedback(cache_key: Optional[tuple]) -> AIFeedbackResponse:
+    with _recent_feedback_lock:
+        cached = _recent_feedback.get(cache_key) if cache_key else None
+    if cached is not None:
+        return cached.model_copy(update={"status": "cached"})
+    return AIFeedbackResponse(translated_handwriting="", errors=[], status="unavailable")
+
+def _transcribed_lines(boxes: list[BoundingBox]) -> list[str]:
     """
-    Detects all math regions in the image and returns bounding boxes (normalized to 0-1000) with placeholder labels.
-    Uses Vertex AI/GenAI SDK (google-genai) for bounding box detection.
+    Rebuilds the written lines from detected regions: boxes are grouped into
+    rows by vertical overlap and their labels joined left to right. Boxes that
+    sit inside a larger detected group are skipped so text is not repeated.
+    """
+    if not boxes:
+        return []
+    arr = np.array([box.box_2d for box in boxes], dtype=np.float64)
+    _, first = np.unique(arr, axis=0, return_index=True)
+    unique = np.zeros(len(arr), dtype=bool)
+    unique[first] = True
+    contains = (
+        (arr[:, None, :2] <= arr[None, :, :2]).all(axis=2) & (arr[:, None, 2:] >= arr[None, :, 2:]).all(axis=2)
+    )
+    np.fill_diagonal(contains, False)
+    contains &= unique[:, None]
+    outer = unique & ~contains.any(axis=0)
+
+    rows: list[list[int]] = []
+    for i in sorted(np.flatnonzero(outer), key=lambda i: (arr[i, 1] + arr[i, 3]) / 2):
+        top, bottom = arr[i, 1], arr[i, 3]
+        if rows:
+            row_top = arr[rows[-1], 1].min()
+            row_bottom = arr[rows[-1], 3].max()
+            overlap = min(bottom, row_bottom) - max(top, row_top)
+            if overlap > 0.5 * min(bottom - top, row_bottom - row_top):
+                rows[-1].append(i)
+                continue
+        rows.append([i])
+    return [" ".join(boxes[i].label for i in sorted(row, key=lambda i: arr[i, 0])) for row in rows]
+
+def _analyze_image(
+    image_bytes: bytes,
+    problem_id: Optional[str] = None,
+    checkpoint: Callable[[], None] = admission.raise_if_cancelled,
+) -> AIFeedbackResponse:
+    """
+    Runs the two-call pipeline (region detection, then error selection).
+    Work that matches the problem's reference solution skips the second call.
+    `checkpoint` is called before each model call and raises to abandon the work.
+    Raises on any failure so the error reaches every coalesced caller.
     """
-    import google.genai as genai
     from google.genai.types import GenerateContentConfig, Part, ThinkingConfig
-    import io
 
-    try:
-        storage_client = storage.Client(project=settings.GCP_PROJECT_ID)
-        bucket_name = gcs_uri.split("/")[2]
-        blob_name = "/".join(gcs_uri.split("/")[3:])
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        in_mem_file = io.BytesIO()
-        blob.download_to_file(in_mem_file)
-        in_mem_file.seek(0)
-
-        client = genai.Client(
-            vertexai=True,
-            project=settings.GCP_PROJECT_ID,
-            location='global',
-        )
+    route = _choose_route(image_bytes)
+    checkpoint()
+    all_bounding_boxes = _detect_regions(image_bytes, route)
+    if not all_bounding_boxes:
+        return AIFeedbackResponse(translated_handwriting="No content detected", errors=[])
+
+    lines = _transcribed_lines(all_bounding_boxes)
+    if problem_catalog.is_correct_solution(problem_id, lines):
+        print(f"Work matches the reference solution for {problem_id}; skipping error selection.")
+        return AIFeedbackResponse(translated_handwriting="\n".join(lines), errors=[])
+    problem = problem_catalog.get_problem(problem_id)
+    reference = (
+        "Reference solution steps:\n" + "\n".join(problem.steps) if problem else "No reference solution is available."
+    )
+
+    region_boxes = np.array([bbox.box_2d for bbox in all_bounding_boxes], dtype=np.float64)
+    version = settings.PROMPT_VERSION
+    prompt = prompt_builder.error_prompt(
+        version,
+        task=ERROR_PROMPT if version == "v1" else ERROR_ID_PROMPT,
+        reference=reference,
+        region_boxes=region_boxes,
+        labels=[bbox.label for bbox in all_bounding_boxes],
+    )
 
-        config = GenerateContentConfig(
-            system_instruction="""
-            Return bounding boxes as an array with labels.
-            Never return masks. Limit to 30 objects.
-            Be as detailed as possible.
-            """,
-            temperature=0,
-            response_mime_type="application/json",
-            response_schema=list[BoundingBox],
-            thinking_config=ThinkingConfig(thinking_budget=0)
+    checkpoint()
+
+    config = GenerateContentConfig(
+        system_instruction=prompt.system_instruction,
+        temperature=ERROR_TEMPERATURE,
+        response_mime_type="application/json",
+        response_schema=list[prompt_builder.ErrorPick] if prompt.answers_with_ids else list[BoundingBox],
+        thinking_config=ThinkingConfig(thinking_budget=route.thinking_budget)
+    )
+
+    response = generate_content(
+        model=route.error_model,
+        contents=[
+            Part.from_bytes(
+                data=image_bytes,
+                mime_type="image/png",
+            ),
+            prompt.text
+        ],
+        config=config,
+    )
+    print(f"AI Response for errors: {response.json()}")
+    prompt_builder.record_usage("errors", response, prompt)
+
+    region_list = (response.parsed if hasattr(response, "parsed") else None) or []
+    if prompt.answers_with_ids:
+        # Ids name detected regions, so the boxes need no snapping.
+        error_boxes, labels, invalid = prompt_builder.picked_regions(region_list, region_boxes)
+        if invalid:
+            print(f"Dropped {invalid} error pick(s) with an unknown region id.")
+    else:
+        error_boxes, labels = _validated_boxes(region_list, default_label="AI detected error")
+        # The model is told to pick from the pre-analyzed regions; enforce it.
+        error_boxes, matched = box_geometry.snap_to_regions(
+            error_boxes, region_boxes, min_iou=ERROR_SNAP_MIN_IOU
         )
+        if (matched < 0).any():
+            print(f"{int((matched < 0).sum())} error box(es) did not match a detected region; keeping model coordinates.")
+    errors = [
+        ErrorEntry(error_text=label, box_2d=box)
+        for label, box in zip(labels, error_boxes.tolist())
+    ]
 
-        prompt = "Output the bounding box of all individual syntaxes or group of notations (as appropriate) in the math work."
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                Part.from_bytes(
-                    data=in_mem_file.getvalue(),
-                    mime_type="image/png",
-                ),
-                prompt
-            ],
-            config=config,
+    try:
+        return AIFeedbackResponse(
+            translated_handwriting="AI feedback based on detected errors",
+            errors=errors
         )
-        print(f"AI Response for all boxes: {response.json()}")
-
-        region_list = response.parsed if hasattr(response, "parsed") else []
-        bounding_boxes = []
-        for region in region_list:
-            box_2d_from_model = region.box_2d if hasattr(region, 'box_2d') else []
-            label = region.label if hasattr(region, 'label') else "AI detected math region"
-            if len(box_2d_from_model) == 4:
-                y1, x1, y2, x2 = box_2d_from_model
-                norm_box_2d = [x1, y1, x2, y2]
-            else:
-                norm_box_2d = [0, 0, 0, 0]
-            bounding_boxes.append(BoundingBox(box_2d=norm_box_2d, label=label))
-        return bounding_boxes
+    except Exception as e:
+        print(f"AIFeedbackResponse validation error: {e}")
+        return AIFeedbackResponse(translated_handwriting="", errors=[])
+
+def get_bounding_from_image(gcs_uri: str, image_bytes: Optional[bytes] = None) -> list[BoundingBox]:
+    """
+    Detects all math regions in the image and returns bounding boxes (normalized to 0-1000) with placeholder labels.
+    Uses Vertex AI/GenAI SDK (google-genai) for bounding box detection.
+    """
+    try:
+        if image_bytes is None:
+            image_bytes = gcs_service.download_image_bytes(gcs_uri)
+        return _detect_regions(image_bytes, _choose_route(image_bytes))
     except Exception as e:
         print(f"Error in get_bounding_from_image (Vertex AI): {type(e).__name__} - {e}")
         import traceback
         traceback.print_exc()
-        return []
\ No newline at end of file
+        return []
+
+def _detect_regions(image_bytes: bytes, route: analysis_router.RouteTier) -> list[BoundingBox]:
+    """
+    Finds up to `route.region_limit` candidate regions with the configured
+    detector (REGION_DETECTOR). The local detector falls back to Gemini if it
+    fails or finds no ink.
+    """
+    if settings.REGION_DETECTOR == "local":
+        try:
+            regions = region_detector.detect_regions(image_bytes, max_regions=route.region_limit)
+            if regions:
+                return [BoundingBox(box_2d=region.box_2d, label=region.label) for region in regions]
+            print("Local region detector found no ink; falling back to Gemini.")
+        except Exception as e:
+            print(f"Local region detector failed, falling back to Gemini: {type(e).__name__} - {e}")
+    return _detect_regions_with_gemini(image_bytes, route)
+
+def _detect_regions_with_gemini(image_bytes: bytes, route: analysis_router.RouteTier = DEFAULT_ROUTE) -> list[BoundingBox]:
+    from google.genai.types import GenerateContentConfig, Part, ThinkingConfig
+
+    prompt = prompt_builder.detection_prompt(settings.PROMPT_VERSION, DETECTION_PROMPT, route.region_limit)
+    config = GenerateContentConfig(
+        system_instruction=prompt.system_instruction,
+        temperature=0,
+        response_mime_type="application/json",
+        response_schema=list[BoundingBox],
+        thinking_config=ThinkingConfig(thinking_budget=DETECTION_THINKING_BUDGET)
+    )
+
+    response = generate_content(
+        model=route.detection_model,
+        contents=[
+            Part.from_bytes(
+                data=image_bytes,
+                mime_type="image/png",
+            ),
+            prompt.text
+        ],
+        config=config,
+    )
+    print(f"AI Response for all boxes: {response.json()}")
+    prompt_builder.record_usage("detect", response, prompt)
+
+    region_list = (response.parsed if hasattr(response, "parsed") else None) or []
+    boxes, labels = _validated_boxes(region_list, default_label="AI detected math region")
+    keep = box_geometry.non_max_suppression(boxes, iou_threshold=DETECTION_NMS_IOU)
+    return [
+        BoundingBox(box_2d=box, label=labels[i])
+        for i, box in zip(keep.tolist(), np.rint(boxes[keep]).astype(int).tolist())
+    ]
@@ -1,24 +1,88 @@
 # backend/app/services/gcs_service.py
 
+import hashlib
+import threading
 import uuid
-from google.cloud import storage
+from collections import OrderedDict
+from functools import lru_cache
 from fastapi import UploadFile
 from typing import Optional
 
+from ..core.circuit_breaker import CircuitOpenError, get_breaker
 from ..core.config import settings
 
-# Initialize the Google Cloud Storage client
-storage_client = storage.Client(project=settings.GCP_PROJECT_ID)
+gcs_breaker = get_breaker(
+    "gcs",
+    failure_rate_threshold=settings.BREAKER_FAILURE_RATE,
+    slow_call_seconds=settings.GCS_SLOW_CALL_SECONDS,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+)
+
+# Content-addressed object names this instance knows are stored, most recent last.
+_known_objects: "OrderedDict[str, None]" = OrderedDict()
+_known_objects_lock = threading.Lock()
+upload_counters = {"uploaded": 0, "skipped_known": 0, "skipped_existing": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+@lru_cache(maxsize=1)
+def get_storage_client():
+    """
+    Returns the process-wide Google Cloud Storage client.
+
+    The client (and google.cloud.storage itself) is created on first use rather
+    than at import time, which keeps Cloud Run cold starts short.
+    """
+    from google.cloud import storage
+
+    return storage.Client(project=settings.GCP_PROJECT_ID)
+
+def public_url_to_gcs_uri(public_url: str) -> str:
+    """
+    Converts a https://storage.googleapis.com/<bucket>/<path> URL into gs://<bucket>/<path>.
+    """
+    return public_url.replace("https://storage.googleapis.com/", "gs://", 1)
+
+def download_image_bytes(gcs_uri: str) -> bytes:
+    """
+    Downloads the object behind a gs://bucket/path URI into memory.
+    """
+    bucket_name = gcs_uri.split("/")[2]
+    blob_name = "/".join(gcs_uri.split("/")[3:])
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    return gcs_breaker.call(blob.download_as_bytes)
+
+def read_upload(file: UploadFile) -> bytes:
+    """
+    Reads an uploaded file into memory and closes Starlette's spooled copy of
+    it (in memory up to 1 MB, a temporary file beyond), so the request holds
+    the image once while it is uploaded and analysed. Pass the bytes on as
+    `image_bytes`; `file.file` cannot be read again.
+    """
+    image_bytes = file.file.read()
+    file.file.close()
+    return image_bytes
 
 def upload_image_to_gcs(
     file: UploadFile,
-    user_id: str
+    user_id: str,
+    image_bytes: Optional[bytes] = None,
 ) -> Optional[str]:
     """
     Uploads an image file to the Google Cloud Storage bucket and returns its public URL.
+    Raises CircuitOpenError without trying while GCS is failing.
+
+    With GCS_CONTENT_ADDRESSED the object is named after the SHA-256 of the
+    bytes (see `content_addressed_name`), and bytes that are already stored are
+    not uploaded again; the submission row keeps the reference to the shared
+    object. `image_bytes` saves re-reading the file when the caller has it.
     """
     try:
-        bucket = storage_client.bucket(settings.GCS_BUCKET_NAME)
+        bucket = get_storage_client().bucket(settings.GCS_BUCKET_NAME)
+        if image_bytes is None:
+            image_bytes = file.file.read()
+            file.file.seek(0)
+
+        if settings.GCS_CONTENT_ADDRESSED:
+            return _upload_content_addressed(bucket, image_bytes, user_id, file.content_type)
         
         parts = file.filename.split('.')
         file_extension = parts[-1] if len(parts) > 1 else 'jpg'
@@ -30,10 +94,66 @@ def upload_image_to_gcs(
         # REVERTED: The predefined_acl parameter has been removed as it is
         # incompatible with this bucket's Uniform Bucket-Level Access setting.
         # Permissions will now be controlled at the bucket level via IAM.
-        blob.upload_from_file(file.file, content_type=file.content_type)
+        # From the bytes in hand: a known size goes up in one multipart request, where
+        # upload_from_file on the spooled file starts a resumable session and reads it
+        # into a fresh 100 MB chunk buffer.
+        gcs_breaker.call(blob.upload_from_string, image_bytes, content_type=file.content_type)
 
         return blob.public_url
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error uploading to GCS: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def content_addressed_name(user_id: str, image_bytes: bytes) -> str:
+    """
+    Object name for `image_bytes` in the content-addressed layout. Names are
+    scoped per user, so identical images from different users stay separate
+    objects: one user's upload never reveals whether another user stored the
+    same bytes, and a user's images can still be deleted by prefix.
+    """
+    return f"submissions/{user_id}/sha256/{hashlib.sha256(image_bytes).hexdigest()}"
+
+def _upload_content_addressed(bucket, image_bytes: bytes, user_id: str, content_type: Optional[str]) -> str:
+    blob = bucket.blob(content_addressed_name(user_id, image_bytes))
+    with _known_objects_lock:
+        known = blob.name in _known_objects
+        if known:
+            _known_objects.move_to_end(blob.name)
+    if known:
+        _count(skipped_known=1, bytes_saved=len(image_bytes))
+        return blob.public_url
+
+    # Not known here (another instance may have stored it): upload with a
+    # "does not exist" precondition rather than paying a metadata round trip
+    # before every new image.
+    if gcs_breaker.call(_upload_if_absent, blob, image_bytes, content_type):
+        _count(uploaded=1, bytes_uploaded=len(image_bytes))
+    else:
+        _count(skipped_existing=1, bytes_uploaded=len(image_bytes))
+    _remember_object(blob.name)
+    return blob.public_url
+
+def _upload_if_absent(blob, image_bytes: bytes, content_type: Optional[str]) -> bool:
+    """False when the object already exists (GCS answers 412 and keeps the stored copy)."""
+    from google.api_core.exceptions import PreconditionFailed
+
+    try:
+        blob.upload_from_string(image_bytes, content_type=content_type, if_generation_match=0)
+        return True
+    except PreconditionFailed:
+        return False
+
+def _count(**deltas: int) -> None:
+    with _known_objects_lock:
+        for key, delta in deltas.items():
+            upload_counters[key] += delta
+
+def _remember_object(name: str) -> None:
+    with _known_objects_lock:
+        _known_objects[name] = None
+        _known_objects.move_to_end(name)
+        while len(_known_objects) > settings.GCS_KNOWN_OBJECTS_SIZE:
+            _known_objects.popitem(last=False)
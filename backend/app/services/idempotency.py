@@ -0,0 +1,288 @@
+# backend/app/services/idempotency.py
+"""
+Idempotency keys for submission POSTs.
+
+Clients on flaky networks retry a submission whose response they never saw.
+With an `Idempotency-Key` header, every request carrying the same key (per
+user, for IDEMPOTENCY_KEY_TTL_HOURS) gets the response of a single run: one
+upload, one analysis, one `submissions` row.
+
+The state lives in the idempotency_keys table, so a retry that lands on
+another worker or instance sees it:
+
+* the first request inserts the key as in_progress (the unique
+  (user_id, key) constraint settles races), runs, and stores its status code
+  and response body as completed;
+* a retry of a completed key gets the stored response back, marked with an
+  `Idempotent-Replayed: true` header;
+* a retry while the first request still runs waits for it, for up to
+  IDEMPOTENCY_WAIT_SECONDS, and returns its response; if it is still running
+  then, the retry gets a 409 with Retry-After. Waiters on the same worker are
+  woken as soon as the response is stored, others re-read the key every
+  IDEMPOTENCY_POLL_SECONDS;
+* a request that fails releases its key, so the client's next retry runs
+  again. One that only gets a degraded analysis (feedback status other than
+  "ok") keeps the key as degraded, with its submission id: the retry runs
+  again and updates that row instead of adding another. A key left in progress for IDEMPOTENCY_LOCK_SECONDS (its worker
+  died) is taken over by the next request.
+
+A key is tied to a fingerprint of its request (image sha256 and options);
+reusing it for a different request is a 422.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db import models
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+DEGRADED = "degraded"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Suggested to a retry that gave up waiting for the first request.
+RETRY_AFTER_SECONDS = 5
+
+# Keys held by requests on this worker; set when the key completes or is released,
+# which wakes local waiters at once.
+_waiters: Dict[Tuple[str, str], threading.Event] = {}
+_waiters_lock = threading.Lock()
+counters = {"claimed": 0, "replayed": 0, "waited": 0, "taken_over": 0, "conflicts": 0, "released": 0, "deferred": 0}
+
+class Claim(NamedTuple):
+    """
+    The outcome of `claim()`: either `record` is held by this request, which
+    should run and then `complete()`, `defer()` or `release()` it, or
+    `replay` is the stored response to return as is. A held record's
+    `submission_id` is set when an earlier degraded run already stored a row.
+    """
+    record: Optional[models.IdempotencyKey]
+    replay: Optional[Response]
+
+def fingerprint(image_bytes: bytes, **params) -> str:
+    """sha256 of the uploaded image and the request options that shape the response."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _age(record: models.IdempotencyKey) -> float:
+    created_at = record.created_at
+    if created_at.tzinfo is None:  # SQLite returns naive UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (_now() - created_at).total_seconds()
+
+def _find(db: Session, user_id: str, key: str) -> Optional[models.IdempotencyKey]:
+    return (
+        db.query(models.IdempotencyKey)
+        .filter(models.IdempotencyKey.user_id == user_id, models.IdempotencyKey.key == key)
+        .execution_options(populate_existing=True)
+        .first()
+    )
+
+def _hold(record: models.IdempotencyKey) -> Claim:
+    with _waiters_lock:
+        _waiters[(record.user_id, record.key)] = threading.Event()
+    return Claim(record, None)
+
+def _wait(user_id: str, key: str, timeout: float) -> None:
+    with _waiters_lock:
+        event = _waiters.get((user_id, key))
+    if event is None:  # held by another worker: poll
+        time.sleep(timeout)
+    else:
+        event.wait(timeout)
+
+def _wake(user_id: str, key: str) -> None:
+    with _waiters_lock:
+        event = _waiters.pop((user_id, key), None)
+    if event is not None:
+        event.set()
+
+def _replay(record: models.IdempotencyKey) -> Response:
+    counters["replayed"] += 1
+    return Response(
+        content=record.response_body,
+        status_code=record.response_status,
+        media_type="application/json",
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+def _take_over(db: Session, record: models.IdempotencyKey, request_hash: str, keep_submission: bool = False) -> bool:
+    """
+    Restarts an expired, abandoned or degraded key for this request, unless
+    another request got there first. `keep_submission` keeps the row of a
+    degraded run for the retry to update.
+    """
+    updated = (
+        db.query(models.IdempotencyKey)
+        .filter(models.IdempotencyKey.id == record.id, models.IdempotencyKey.attempt == record.attempt)
+        .update({
+            "request_hash": request_hash, "status": IN_PROGRESS, "attempt": record.attempt + 1,
+            "response_status": None, "response_body": None, "created_at": _now(),
+            **({} if keep_submission else {"submission_id": None}),
+        }, synchronize_session=False)
+    )
+    db.commit()
+    return updated == 1
+
+def claim(db: Session, *, user_id: str, key: str, request_hash: str) -> Claim:
+    """
+    Claims `key` for this request or returns the response of the request that
+    already used it, waiting for that one to finish if needed.
+
+    Raises:
+        HTTPException: 422 if the key was used for a different request, 409
+            (with Retry-After) if the first request is still running after
+            IDEMPOTENCY_WAIT_SECONDS.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    waited = False
+    while True:
+        record = models.IdempotencyKey(
+            user_id=user_id, key=key, request_hash=request_hash, status=IN_PROGRESS, attempt=1, created_at=_now()
+        )
+        db.add(record)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        else:
+            counters["claimed"] += 1
+            return _hold(record)
+
+        record = _find(db, user_id, key)
+        if record is None:  # released in the meantime
+            continue
+        age = _age(record)
+        if age > settings.IDEMPOTENCY_KEY_TTL_HOURS * 3600 or (
+            record.status == IN_PROGRESS and age > settings.IDEMPOTENCY_LOCK_SECONDS
+        ):
+            previous = record.status
+            if _take_over(db, record, request_hash):
+                counters["taken_over"] += 1
+                print(f"Took over idempotency key {key!r} of user {user_id} ({previous}, {age:.0f}s old).")
+                return _hold(_find(db, user_id, key))
+            continue
+        if record.request_hash != request_hash:
+            counters["conflicts"] += 1
+            db.rollback()
+            raise HTTPException(
+                status_code=422, detail="This Idempotency-Key was already used for a different request."
+            )
+        if record.status == COMPLETED:
+            replay = _replay(record)
+            db.rollback()
+            return Claim(None, replay)
+        if record.status == DEGRADED:
+            if _take_over(db, record, request_hash, keep_submission=True):
+                counters["claimed"] += 1
+                return _hold(_find(db, user_id, key))
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed; retry later.",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+        if not waited:
+            counters["waited"] += 1
+            waited = True
+        db.rollback()  # hold no transaction (or snapshot) while waiting
+        _wait(user_id, key, min(settings.IDEMPOTENCY_POLL_SECONDS, remaining))
+
+def complete(db: Session, record: models.IdempotencyKey, response: Response, submission_id: Optional[int] = None) -> None:
+    """
+    Stores the rendered response of the request holding `record`. A failure
+    to store it is logged, not raised: the submission itself is already
+    saved, and the key is taken over once IDEMPOTENCY_LOCK_SECONDS pass.
+    """
+    try:
+        updated = (
+            db.query(models.IdempotencyKey)
+            .filter(models.IdempotencyKey.id == record.id, models.IdempotencyKey.attempt == record.attempt)
+            .update({
+                "status": COMPLETED, "response_status": response.status_code,
+                "response_body": response.body.decode("utf-8"), "submission_id": submission_id,
+            }, synchronize_session=False)
+        )
+        db.commit()
+        if not updated:
+            print(f"Idempotency key {record.key!r} of user {record.user_id} was taken over before it completed.")
+    except Exception as e:
+        db.rollback()
+        print(f"Could not store the response of idempotency key {record.key!r}: {type(e).__name__} - {e}")
+    finally:
+        _wake(record.user_id, record.key)
+
+def defer(db: Session, record: models.IdempotencyKey, submission_id: int) -> None:
+    """
+    Leaves the key of a request that stored a degraded result open for the
+    client's retry, which runs again and updates row `submission_id`.
+    """
+    user_id = key = None
+    try:
+        user_id, key = record.user_id, record.key
+        (
+            db.query(models.IdempotencyKey)
+            .filter(models.IdempotencyKey.id == record.id, models.IdempotencyKey.attempt == record.attempt)
+            .update({"status": DEGRADED, "submission_id": submission_id}, synchronize_session=False)
+        )
+        db.commit()
+        counters["deferred"] += 1
+    except Exception as e:
+        db.rollback()
+        print(f"Could not defer idempotency key {key!r}: {type(e).__name__} - {e}")
+    finally:
+        if key is not None:
+            _wake(user_id, key)
+
+def release(db: Session, record: models.IdempotencyKey) -> None:
+    """Forgets the key of a request that failed, so that the client's retry runs again."""
+    user_id = key = None
+    try:
+        db.rollback()
+        # Read before the delete: once the row is gone an expired record cannot reload.
+        user_id, key = record.user_id, record.key
+        (
+            db.query(models.IdempotencyKey)
+            .filter(models.IdempotencyKey.id == record.id, models.IdempotencyKey.attempt == record.attempt)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        counters["released"] += 1
+    except Exception as e:
+        db.rollback()
+        print(f"Could not release idempotency key {key!r}: {type(e).__name__} - {e}")
+    finally:
+        if key is not None:
+            _wake(user_id, key)
+
+def purge_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Deletes keys older than IDEMPOTENCY_KEY_TTL_HOURS; returns how many."""
+    cutoff = (now or _now()) - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted = (
+        db.query(models.IdempotencyKey)
+        .filter(models.IdempotencyKey.created_at < cutoff)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+def snapshot() -> dict:
+    with _waiters_lock:
+        held = len(_waiters)
+    return {**counters, "keys_held": held}
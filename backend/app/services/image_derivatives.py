@@ -0,0 +1,175 @@
+# backend/app/services/image_derivatives.py
+"""
+Small precomputed renderings of a submission's photo.
+
+History lists and result screens only need a thumbnail, and the result
+screen draws the error boxes over the photo on the client. Loading the
+original (several MB from a phone camera) for that is most of the bytes a
+history page moves. After the analysis, submissions therefore render two
+WebP derivatives with Pillow and store them next to the original:
+
+    <original object>.thumb.webp                 at most DERIVATIVE_THUMBNAIL_SIDE px
+    <original object>.annotated-<hash>.webp      at most DERIVATIVE_ANNOTATED_SIDE px,
+                                                 with the error boxes drawn in
+
+<hash> is taken from the error boxes, so each object's bytes never change
+once written. Both are uploaded with a year-long `immutable` Cache-Control
+and their public URLs are stored on the submission row
+(thumbnail_url / annotated_url).
+
+Like OCR, rendering is auxiliary: `start_derivatives()` runs in a small
+thread pool next to the OCR wait, and `wait_for_urls()` returns (None, None)
+when it fails or takes longer than DERIVATIVE_TIMEOUT_SECONDS; the client
+then falls back to the original. `backfill()` fills in older rows.
+"""
+
+import hashlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db import models
+from . import gcs_service
+
+CONTENT_TYPE = "image/webp"
+# Derivative names change with their content, so caches may keep them for good.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+BOX_COLOR = (220, 38, 38)
+
+_executor = ThreadPoolExecutor(max_workers=settings.DERIVATIVE_WORKERS, thread_name_prefix="derivatives")
+_counters_lock = threading.Lock()
+derivative_counters = {"rendered": 0, "failed": 0, "timed_out": 0, "bytes_original": 0, "bytes_derivatives": 0, "render_ms": 0.0}
+
+def _encode(image) -> bytes:
+    buffer = io.BytesIO()
+    # method 2 is within a few percent of the default's size at under half its time.
+    image.save(buffer, format="WEBP", quality=settings.DERIVATIVE_WEBP_QUALITY, method=2)
+    return buffer.getvalue()
+
+def render(image_bytes: bytes, errors: List[dict]) -> Tuple[bytes, bytes]:
+    """
+    Returns (thumbnail, annotated) WebP bytes for an image and its
+    `ai_feedback_data["errors"]` (boxes as [x1, y1, x2, y2] in the 0-1000
+    frame). The photo is decoded once, at reduced size for JPEGs.
+    """
+    from PIL import Image, ImageDraw
+
+    side = settings.DERIVATIVE_ANNOTATED_SIDE
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        source.draft("RGB", (side, side))  # cheap JPEG downscale on decode
+        annotated = source.convert("RGB")
+    # What is left after draft is at most a 2x reduction, where bilinear looks as
+    # good as the default bicubic at half the time.
+    annotated.thumbnail((side, side), resample=Image.Resampling.BILINEAR)
+    thumbnail = annotated.copy()
+    thumbnail.thumbnail((settings.DERIVATIVE_THUMBNAIL_SIDE, settings.DERIVATIVE_THUMBNAIL_SIDE))
+
+    width, height = annotated.size
+    draw = ImageDraw.Draw(annotated)
+    line = max(2, round(max(width, height) / 320))
+    for error in errors:
+        x1, y1, x2, y2 = error["box_2d"]
+        draw.rectangle(
+            [x1 * width / 1000, y1 * height / 1000, x2 * width / 1000, y2 * height / 1000],
+            outline=BOX_COLOR, width=line,
+        )
+    return _encode(thumbnail), _encode(annotated)
+
+def derivative_names(original_url: str, errors: List[dict]) -> Tuple[str, str]:
+    """Object names of the thumbnail and the annotated image, next to the original."""
+    original = gcs_service.public_url_to_gcs_uri(original_url).split("/", 3)[3]
+    boxes = json.dumps([error["box_2d"] for error in errors], separators=(",", ":"))
+    return f"{original}.thumb.webp", f"{original}.annotated-{hashlib.sha256(boxes.encode()).hexdigest()[:12]}.webp"
+
+def _upload(name: str, data: bytes) -> str:
+    blob = gcs_service.get_storage_client().bucket(settings.GCS_BUCKET_NAME).blob(name)
+    blob.cache_control = CACHE_CONTROL
+    gcs_service.gcs_breaker.call(blob.upload_from_string, data, content_type=CONTENT_TYPE)
+    return blob.public_url
+
+def create_derivatives(image_bytes: bytes, original_url: str, errors: List[dict]) -> Tuple[str, str]:
+    """Renders and uploads both derivatives; returns their public URLs."""
+    start = time.perf_counter()
+    thumbnail, annotated = render(image_bytes, errors)
+    render_ms = (time.perf_counter() - start) * 1000
+    thumbnail_name, annotated_name = derivative_names(original_url, errors)
+    urls = _upload(thumbnail_name, thumbnail), _upload(annotated_name, annotated)
+    with _counters_lock:
+        derivative_counters["rendered"] += 1
+        derivative_counters["bytes_original"] += len(image_bytes)
+        derivative_counters["bytes_derivatives"] += len(thumbnail) + len(annotated)
+        derivative_counters["render_ms"] += render_ms
+    return urls
+
+def start_derivatives(image_bytes: bytes, original_url: str, errors: List[dict]) -> Optional[Future]:
+    """
+    Starts `create_derivatives` in the background and returns its future;
+    with DERIVATIVES_ENABLED off this returns None.
+    """
+    if not settings.DERIVATIVES_ENABLED:
+        return None
+    return _executor.submit(create_derivatives, image_bytes, original_url, errors)
+
+def wait_for_urls(future: Optional[Future], timeout: Optional[float] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The (thumbnail, annotated) URLs of a `start_derivatives` future, or
+    (None, None) when derivatives are off, failed or did not finish within
+    `timeout` (DERIVATIVE_TIMEOUT_SECONDS by default).
+    """
+    if future is None:
+        return None, None
+    try:
+        return future.result(timeout=settings.DERIVATIVE_TIMEOUT_SECONDS if timeout is None else timeout)
+    except Exception as e:
+        with _counters_lock:
+            derivative_counters["timed_out" if not future.done() else "failed"] += 1
+        print(f"Image derivatives unavailable for this submission: {type(e).__name__} - {e}")
+        return None, None
+
+def backfill(db: Session, limit: int = 500, before_id: Optional[int] = None) -> dict:
+    """
+    Renders the derivatives of up to `limit` submissions that have none,
+    newest (highest id) first, below `before_id` when given, downloading
+    each original. Rows whose image or feedback cannot be read are counted
+    and skipped. The stats' `next_before_id` continues after this batch, so
+    rows that keep failing are passed over instead of filling every batch;
+    it is None once no rows are left.
+    """
+    from . import submission_archive
+
+    Submission = models.Submission
+    query = db.query(Submission).filter(Submission.thumbnail_url.is_(None))
+    if before_id is not None:
+        query = query.filter(Submission.id < before_id)
+    rows = query.order_by(Submission.id.desc()).limit(limit).all()
+    stats = {"rows": len(rows), "rendered": 0, "skipped": 0,
+             "next_before_id": rows[-1].id if len(rows) == limit else None}
+    for submission in rows:
+        submission_id = submission.id
+        try:
+            feedback = json.loads(submission_archive.feedback_of(submission) or "{}")
+            image_bytes = gcs_service.download_image_bytes(gcs_service.public_url_to_gcs_uri(submission.image_gcs_url))
+            submission.thumbnail_url, submission.annotated_url = create_derivatives(
+                image_bytes, submission.image_gcs_url, feedback.get("errors", [])
+            )
+            db.commit()
+            stats["rendered"] += 1
+        except Exception as e:
+            db.rollback()
+            stats["skipped"] += 1
+            print(f"No derivatives for submission {submission_id}: {type(e).__name__} - {e}")
+    return stats
+
+def snapshot() -> dict:
+    """Derivative counters for /metrics/health."""
+    with _counters_lock:
+        stats = dict(derivative_counters)
+    rendered = stats.pop("render_ms")
+    stats["render_ms_mean"] = round(rendered / stats["rendered"], 1) if stats["rendered"] else None
+    return {"enabled": settings.DERIVATIVES_ENABLED, **stats}
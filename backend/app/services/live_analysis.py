@@ -0,0 +1,446 @@
+# backend/app/services/live_analysis.py
+"""
+Live analysis while the student writes (the /live WebSocket).
+
+The client streams stroke batches, or whole canvas snapshots, as the student
+writes. Each connection gets a LiveSession that:
+
+* keeps the current canvas: strokes are appended and rendered only when a
+  check runs, and a snapshot replaces everything drawn before it,
+* debounces: nothing is checked until the student pauses for
+  LIVE_DEBOUNCE_SECONDS, or until LIVE_MAX_WAIT_SECONDS have passed since the
+  first unchecked change while they keep writing. Updates that arrive in
+  between, or while an analysis runs, are coalesced into the next check,
+* splits the canvas into text lines with the region detector's projection
+  profile and analyzes only lines that are complete (a line has been started
+  below them, or the canvas has been idle for LIVE_LINE_IDLE_SECONDS) and
+  whose ink changed since they were last analyzed. The line above the first
+  new line goes along as context; errors on it are ignored,
+* takes a token from its own bucket and then from the worker-wide one before
+  each analysis. When a bucket is empty the token is reserved and the session
+  waits its turn, coalescing changes meanwhile, and the client is told it is
+  throttled,
+* charges each analysis to the user's quota (app/core/quota.py) through the
+  endpoint's `analyze`; a user over quota is told so and checked again once
+  Retry-After has passed.
+
+Error boxes are pushed in the usual 0-1000 [x1, y1, x2, y2] frame, relative to
+the whole canvas.
+"""
+
+import asyncio
+import base64
+import contextlib
+import hashlib
+import io
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core import admission, quota
+from app.core.config import settings
+from app.services import region_detector
+
+# Padding around the cropped lines, as a fraction of the tallest line's height.
+CROP_PADDING = 0.5
+# How long to wait before retrying lines whose analysis came back unavailable.
+UNAVAILABLE_BACKOFF_SECONDS = 10.0
+
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `burst`. Tokens are reserved
+    rather than polled: a caller that finds the bucket empty still gets the
+    next free token and is told how long to wait for it, so throttled callers
+    are served in order instead of all retrying at once.
+    """
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token; returns the seconds until it may be used (0: now)."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate if self.rate > 0 else float("inf")
+
+# Budget shared by every live connection of this worker; bursts up to ten seconds' worth.
+worker_budget = TokenBucket(
+    settings.LIVE_WORKER_ANALYSES_PER_MINUTE / 60,
+    burst=max(1.0, settings.LIVE_WORKER_ANALYSES_PER_MINUTE / 6),
+)
+
+class Stroke(NamedTuple):
+    points: Tuple[Tuple[float, float], ...]
+    width: float
+    erase: bool
+
+class Line(NamedTuple):
+    top: int  # pixel rows, bottom exclusive
+    bottom: int
+    left: int  # pixel columns of the ink, right exclusive
+    right: int
+    fingerprint: str
+
+class Canvas:
+    """The drawing as the server knows it: an optional snapshot with strokes drawn over it."""
+
+    def __init__(self):
+        self.clear()
+
+    def add_strokes(self, width, height, strokes) -> None:
+        """
+        Raises:
+            ValueError: a malformed batch, or a canvas/stroke count over the limits.
+        """
+        width, height = _dimension(width), _dimension(height)
+        parsed = []
+        for stroke in strokes:
+            points = tuple((float(x), float(y)) for x, y in stroke["points"])
+            if not points:
+                continue
+            parsed.append(Stroke(points, float(stroke.get("width", 3)), bool(stroke.get("erase", False))))
+        total = self.points + sum(len(stroke.points) for stroke in parsed)
+        if total > settings.LIVE_MAX_STROKE_POINTS:
+            raise ValueError("Too many stroke points; send a snapshot instead.")
+        # The canvas grows as the student writes; never shrink it under existing ink.
+        self.width, self.height = max(self.width, width), max(self.height, height)
+        self.strokes.extend(parsed)
+        self.points = total
+
+    def set_snapshot(self, mask: np.ndarray) -> None:
+        """Replaces the drawing with the ink mask of a snapshot (see `decode_snapshot`)."""
+        self.snapshot = mask
+        self.height, self.width = mask.shape
+        self.strokes, self.points = [], 0
+
+    def undo(self, count: int = 1) -> None:
+        count = max(0, min(int(count), len(self.strokes)))
+        for stroke in self.strokes[len(self.strokes) - count:]:
+            self.points -= len(stroke.points)
+        del self.strokes[len(self.strokes) - count:]
+
+    def clear(self) -> None:
+        self.width = 0
+        self.height = 0
+        self.snapshot: Optional[np.ndarray] = None  # ink mask of the last snapshot
+        self.strokes: List[Stroke] = []
+        self.points = 0
+
+    def frozen(self) -> "Canvas":
+        """A copy for rendering off the event loop while new strokes keep arriving."""
+        copy = Canvas()
+        copy.width, copy.height, copy.snapshot = self.width, self.height, self.snapshot
+        copy.strokes, copy.points = list(self.strokes), self.points
+        return copy
+
+    def render(self):
+        """The canvas as a grayscale PIL image: black ink on white."""
+        from PIL import Image, ImageDraw
+
+        image = Image.new("L", (max(1, self.width), max(1, self.height)), 255)
+        if self.snapshot is not None:
+            ink = Image.fromarray(np.where(self.snapshot, 0, 255).astype(np.uint8))
+            image.paste(ink, (0, 0))
+        draw = ImageDraw.Draw(image)
+        for stroke in self.strokes:
+            fill = 255 if stroke.erase else 0
+            width = max(1, round(stroke.width))
+            if len(stroke.points) == 1:
+                (x, y), r = stroke.points[0], width / 2
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=fill)
+            else:
+                draw.line(stroke.points, fill=fill, width=width, joint="curve")
+        return image
+
+def _dimension(value) -> int:
+    value = int(value)
+    if not 0 < value <= settings.LIVE_MAX_CANVAS_SIDE:
+        raise ValueError(f"Canvas dimensions must be between 1 and {settings.LIVE_MAX_CANVAS_SIDE} pixels.")
+    return value
+
+def find_lines(mask: np.ndarray) -> List[Line]:
+    """Text lines of an ink mask, top to bottom, each with a fingerprint of its ink and position."""
+    lines = []
+    height = mask.shape[0]
+    for top, bottom in region_detector.segment_lines(mask, max(1, int(region_detector.MIN_LINE_GAP * height))):
+        band = mask[top:bottom]
+        columns = np.flatnonzero(band.any(axis=0))
+        left, right = int(columns[0]), int(columns[-1]) + 1
+        digest = hashlib.sha1(f"{top},{bottom},{left},{right}".encode())
+        digest.update(np.packbits(band[:, left:right]).tobytes())
+        lines.append(Line(top, bottom, left, right, digest.hexdigest()))
+    return lines
+
+class Check(NamedTuple):
+    lines: List[Line]
+    complete: int  # lines[:complete] are complete
+    new: List[int]  # indices of complete lines not analyzed in their current form
+    crop: Optional[bytes]  # PNG of the lines to analyze
+    crop_box: Tuple[int, int, int, int]  # its [x1, y1, x2, y2] in canvas pixels
+    size: Tuple[int, int]  # canvas width, height
+
+def plan_check(canvas: Canvas, analyzed: Iterable[str], idle: bool) -> Check:
+    """
+    Renders the canvas, finds the complete lines that still need analysis and
+    crops them (plus the line above, for context) into a PNG.
+    """
+    image = canvas.render()
+    lines = find_lines(np.asarray(image) < 128)
+    complete = len(lines) if idle else max(0, len(lines) - 1)
+    analyzed = set(analyzed)
+    new = [i for i in range(complete) if lines[i].fingerprint not in analyzed]
+    if not new:
+        return Check(lines, complete, [], None, (0, 0, 0, 0), image.size)
+
+    included = lines[max(0, new[0] - 1):new[-1] + 1]
+    pad = int(CROP_PADDING * max(line.bottom - line.top for line in included))
+    crop_box = (
+        max(0, min(line.left for line in included) - pad),
+        max(0, included[0].top - pad),
+        min(image.width, max(line.right for line in included) + pad),
+        min(image.height, included[-1].bottom + pad),
+    )
+    buffer = io.BytesIO()
+    image.crop(crop_box).save(buffer, format="PNG", compress_level=1)
+    return Check(lines, complete, new, buffer.getvalue(), crop_box, image.size)
+
+def _to_canvas_frame(box: List[float], crop_box, size) -> List[int]:
+    """Maps a 0-1000 box in the crop to the 0-1000 frame of the whole canvas."""
+    x1, y1, x2, y2 = crop_box
+    width, height = size
+    xs = [(x1 + box[i] / 1000 * (x2 - x1)) / width * 1000 for i in (0, 2)]
+    ys = [(y1 + box[i] / 1000 * (y2 - y1)) / height * 1000 for i in (1, 3)]
+    return [round(xs[0]), round(ys[0]), round(xs[1]), round(ys[1])]
+
+def _line_of(box: List[int], lines: List[Line], height: int) -> int:
+    """Index of the line whose band is closest to the box's vertical center."""
+    center = (box[1] + box[3]) / 2 / 1000 * height
+    return min(
+        range(len(lines)),
+        key=lambda i: 0 if lines[i].top <= center < lines[i].bottom else min(abs(center - lines[i].top), abs(center - lines[i].bottom)),
+    )
+
+_sessions: "set[LiveSession]" = set()
+_counters = {"analyses": 0, "throttled": 0, "over_quota": 0, "updates": 0, "lines_analyzed": 0}
+
+def snapshot() -> dict:
+    """Live connections and counters of this worker, for /metrics/health."""
+    return {"sessions": len(_sessions), **_counters}
+
+def decode_snapshot(image_bytes: bytes) -> np.ndarray:
+    """
+    Ink mask of a PNG/JPEG canvas snapshot. Decoding a full-size canvas takes
+    a few hundred milliseconds, so sessions call this off the event loop.
+
+    Raises:
+        ValueError: a snapshot over LIVE_MAX_SNAPSHOT_BYTES or one that does not decode.
+    """
+    if len(image_bytes) > settings.LIVE_MAX_SNAPSHOT_BYTES:
+        raise ValueError("Snapshot too large.")
+    try:
+        return region_detector.load_ink_mask(image_bytes, max_side=settings.LIVE_MAX_CANVAS_SIDE)
+    except Exception as e:
+        raise ValueError(f"Could not decode snapshot: {type(e).__name__}") from e
+
+def _decode_base64_snapshot(image: str) -> np.ndarray:
+    return decode_snapshot(base64.b64decode(image, validate=True))
+
+def open_sessions() -> int:
+    return len(_sessions)
+
+class LiveSession:
+    """
+    State of one live connection. The endpoint awaits `handle()` /
+    `set_snapshot()` for each client message and runs `run()` as a task next
+    to its receive loop.
+
+    Args:
+        analyze: runs the feedback pipeline on PNG bytes; returns the feedback dict.
+            Raises quota.QuotaExceeded when the user may not run another analysis.
+        send: pushes a JSON-serializable message to the client.
+    """
+
+    def __init__(
+        self,
+        problem_id: Optional[str],
+        analyze: Callable[[bytes, Optional[str]], Awaitable[dict]],
+        send: Callable[[dict], Awaitable[None]],
+        *,
+        budget: Optional[TokenBucket] = None,
+        shared_budget: TokenBucket = worker_budget,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.problem_id = problem_id
+        self.analyze = analyze
+        self.send = send
+        self.budget = budget or TokenBucket(
+            settings.LIVE_ANALYSES_PER_MINUTE / 60, burst=settings.LIVE_ANALYSIS_BURST, clock=clock
+        )
+        self.shared_budget = shared_budget
+        self._clock = clock
+        self.canvas = Canvas()
+        self._changed = asyncio.Event()
+        self._last_change = clock()
+        self._first_pending: Optional[float] = None  # first change not covered by a check yet
+        self._awaiting_idle = False  # the last line becomes complete once the canvas is idle
+        self._not_before = 0.0  # waiting for a reserved token, or backing off, until then
+        self._paid = 0  # budgets (per-connection, then shared) already holding a token for the next analysis
+        self._throttled = False
+        self._results: Dict[str, List[dict]] = {}  # line fingerprint -> errors on that line
+        self._pushed: Optional[list] = None
+        _sessions.add(self)
+
+    def close(self) -> None:
+        _sessions.discard(self)
+
+    # --- client messages ---
+
+    async def handle(self, message: dict) -> None:
+        """
+        Applies one JSON message: "strokes", "undo", "clear" or "snapshot".
+
+        Raises:
+            ValueError: unknown or malformed message.
+        """
+        kind = message.get("type")
+        try:
+            if kind == "strokes":
+                self.canvas.add_strokes(message["width"], message["height"], message["strokes"])
+            elif kind == "undo":
+                self.canvas.undo(message.get("count", 1))
+            elif kind == "clear":
+                self.canvas.clear()
+            elif kind == "snapshot":
+                self.canvas.set_snapshot(await asyncio.to_thread(_decode_base64_snapshot, message["image"]))
+            else:
+                raise ValueError(f"Unknown message type: {kind!r}")
+        except (KeyError, TypeError, IndexError) as e:
+            raise ValueError(f"Malformed {kind!r} message.") from e
+        self._touch()
+
+    async def set_snapshot(self, image_bytes: bytes) -> None:
+        """Replaces the canvas with a PNG/JPEG snapshot (a binary frame), decoded in a worker thread."""
+        self.canvas.set_snapshot(await asyncio.to_thread(decode_snapshot, image_bytes))
+        self._touch()
+
+    def _touch(self) -> None:
+        now = self._clock()
+        self._last_change = now
+        if self._first_pending is None:
+            self._first_pending = now
+        _counters["updates"] += 1
+        self._changed.set()
+
+    # --- analysis loop ---
+
+    def _next_check_in(self) -> Optional[float]:
+        """Seconds until the next check is due, or None while there is nothing to check."""
+        due = None
+        if self._first_pending is not None:
+            due = min(
+                self._last_change + settings.LIVE_DEBOUNCE_SECONDS,
+                self._first_pending + settings.LIVE_MAX_WAIT_SECONDS,
+            )
+        if self._awaiting_idle:
+            idle_at = self._last_change + settings.LIVE_LINE_IDLE_SECONDS
+            due = idle_at if due is None else min(due, idle_at)
+        if due is None:
+            return None
+        return max(0.0, max(due, self._not_before) - self._clock())
+
+    async def run(self) -> None:
+        """Checks the canvas whenever a check is due; runs until cancelled."""
+        while True:
+            delay = self._next_check_in()
+            if delay is None or delay > 0:
+                self._changed.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                continue
+            try:
+                await self._check()
+            except admission.ClientDisconnected:
+                return
+
+    async def _check(self) -> None:
+        now = self._clock()
+        idle = now - self._last_change >= settings.LIVE_LINE_IDLE_SECONDS
+        pending_since, self._first_pending = self._first_pending, None
+        check = await asyncio.to_thread(plan_check, self.canvas.frozen(), list(self._results), idle)
+        self._awaiting_idle = check.complete < len(check.lines)
+
+        current = {line.fingerprint for line in check.lines}
+        self._results = {fp: errors for fp, errors in self._results.items() if fp in current}
+        if not check.new:
+            await self._push("ok", check)
+            return
+
+        # Reserve the connection's token first, and only then one from the
+        # shared budget, so a connection waiting on its own budget holds no
+        # worker-wide capacity.
+        for bucket in [self.budget, self.shared_budget][self._paid:]:
+            self._paid += 1
+            wait = bucket.reserve()
+            if wait > 0:
+                self._first_pending = pending_since or now
+                self._not_before = now + wait
+                _counters["throttled"] += 1
+                if not self._throttled:
+                    self._throttled = True
+                    await self.send({"type": "status", "state": "throttled", "retry_after": round(wait, 1)})
+                return
+        self._paid = 0
+        self._throttled = False
+
+        try:
+            feedback = await self.analyze(check.crop, self.problem_id)
+        except quota.QuotaExceeded as e:
+            _counters["over_quota"] += 1
+            self._first_pending = pending_since or now
+            self._not_before = self._clock() + e.retry_after
+            await self.send({"type": "status", "state": "over_quota", "retry_after": round(e.retry_after, 1)})
+            return
+        _counters["analyses"] += 1
+        status = feedback.get("status", "ok")
+        if status == "unavailable":
+            self._first_pending = pending_since or now
+            self._not_before = self._clock() + UNAVAILABLE_BACKOFF_SECONDS
+            await self.send({"type": "status", "state": "unavailable", "retry_after": UNAVAILABLE_BACKOFF_SECONDS})
+            return
+
+        found: Dict[int, List[dict]] = {i: [] for i in check.new}
+        for error in feedback.get("errors", []):
+            box = _to_canvas_frame(error["box_2d"], check.crop_box, check.size)
+            line = _line_of(box, check.lines, check.size[1])
+            if line in found:
+                found[line].append({"error_text": error["error_text"], "box_2d": box})
+        for i, errors in found.items():
+            self._results[check.lines[i].fingerprint] = errors
+        _counters["lines_analyzed"] += len(check.new)
+        await self._push(status, check)
+
+    async def _push(self, status: str, check: Check) -> None:
+        """Sends the errors on the current lines, unless nothing changed since the last push."""
+        errors = [error for line in check.lines for error in self._results.get(line.fingerprint, [])]
+        if errors == self._pushed and status == "ok":
+            return
+        self._pushed = errors
+        await self.send({
+            "type": "feedback",
+            "errors": errors,
+            "status": status,
+            "lines": len(check.lines),
+            "lines_checked": sum(1 for line in check.lines if line.fingerprint in self._results),
+        })
@@ -1,9 +1,65 @@
 # backend/app/services/ocr_service.py
+"""
+OCR through the Cloud Vision API.
+
+Submissions start OCR with `start_ocr(image_bytes)` before the Gemini analysis
+and collect the text with `wait_for_text()` afterwards, so both run at the same
+time. Behind `start_ocr`:
+
+* results are cached by the image's SHA-256 (an LRU of OCR_CACHE_SIZE
+  entries), and concurrent requests for the same image share one future,
+* requests are queued and sent in batch_annotate_images calls of up to
+  OCR_BATCH_SIZE images: a batch goes out when it is full or OCR_BATCH_WINDOW_MS
+  after its first image arrived, with up to OCR_MAX_CONCURRENT_BATCHES in
+  flight,
+* calls go through the "vision" circuit breaker.
+
+The Vision API's async batch annotation writes its results to GCS and is
+meant for offline jobs; on the request path, short synchronous batches keep
+the call count down without adding more than the batch window of latency.
+
+OCR is auxiliary: `wait_for_text()` returns "" instead of raising when OCR
+fails or takes too long.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
-from google.cloud import vision
 from fastapi import HTTPException, status
 from google.api_core import exceptions as google_exceptions 
 
+from ..core.circuit_breaker import get_breaker
+from ..core.config import settings
+
+# Vision feature for the batched path; the dense-text model reads handwriting better.
+OCR_FEATURE = "DOCUMENT_TEXT_DETECTION"
+# The Vision API rejects batch requests larger than this, so batches are also cut by size.
+BATCH_MAX_BYTES = 8 * 1024 * 1024
+
+vision_breaker = get_breaker(
+    "vision",
+    failure_rate_threshold=settings.BREAKER_FAILURE_RATE,
+    slow_call_seconds=settings.GCS_SLOW_CALL_SECONDS,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+)
+
+class OcrError(Exception):
+    """The Vision API answered, but could not read this image."""
+
+@lru_cache(maxsize=1)
+def get_vision_client():
+    """
+    Returns the process-wide Vision client, importing the SDK on first use.
+    """
+    from google.cloud import vision
+
+    return vision.ImageAnnotatorClient()
+
 def perform_ocr_on_gcs_image(gcs_uri: str) -> str:
     """
     Performs OCR on an image stored in Google Cloud Storage.
@@ -20,8 +76,11 @@ def perform_ocr_on_gcs_image(gcs_uri: str) -> str:
     Raises:
         HTTPException: If the Vision API call fails or returns an error.
     """
+    # Imported here so the Vision SDK is only loaded when OCR is actually used.
+    from google.cloud import vision
+
     try:
-        client = vision.ImageAnnotatorClient()
+        client = get_vision_client()
         image = vision.Image()
         image.source.image_uri = gcs_uri
         response = client.text_detection(image=image)
@@ -61,4 +120,169 @@ def perform_ocr_on_gcs_image(gcs_uri: str) -> str:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected server error occurred while processing the image."
-        )
\ No newline at end of file
+        )
+
+def annotate_batch(images: List[bytes]) -> List[Union[str, Exception]]:
+    """
+    OCRs several images in one batch_annotate_images call.
+    Returns the text, or an OcrError, per image in order.
+    """
+    from google.cloud import vision
+
+    requests = [
+        vision.AnnotateImageRequest(
+            image=vision.Image(content=image_bytes),
+            features=[vision.Feature(type_=vision.Feature.Type[OCR_FEATURE])],
+        )
+        for image_bytes in images
+    ]
+    response = vision_breaker.call(get_vision_client().batch_annotate_images, requests=requests)
+    results: List[Union[str, Exception]] = []
+    for item in response.responses:
+        if item.error.message:
+            results.append(OcrError(item.error.message))
+        else:
+            results.append(item.full_text_annotation.text if item.full_text_annotation else "")
+    return results
+
+class OcrBatcher:
+    """
+    Collects single-image requests into batches for `annotate` (a function
+    from a list of image bytes to a list of text-or-exception).
+    """
+
+    def __init__(
+        self,
+        annotate: Callable[[List[bytes]], List[Union[str, Exception]]],
+        *,
+        batch_size: int,
+        window: float,
+        max_concurrent_batches: int,
+        max_batch_bytes: int = BATCH_MAX_BYTES,
+    ):
+        self.annotate = annotate
+        self.batch_size = batch_size
+        self.window = window
+        self.max_batch_bytes = max_batch_bytes
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[bytes, Future, float]] = []
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="ocr-batch")
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.images = 0
+
+    def submit(self, image_bytes: bytes) -> Future:
+        future: Future = Future()
+        with self._cond:
+            self._queue.append((image_bytes, future, time.monotonic()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name="ocr-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _take_batch(self) -> List[Tuple[bytes, Future, float]]:
+        """Pops the next batch off the queue: full, over the byte limit, or due (lock held)."""
+        while True:
+            if self._queue:
+                size, count = 0, 0
+                for image_bytes, _, _ in self._queue[:self.batch_size]:
+                    if count and size + len(image_bytes) > self.max_batch_bytes:
+                        break
+                    size += len(image_bytes)
+                    count += 1
+                remaining = self._queue[0][2] + self.window - time.monotonic()
+                if count < len(self._queue) or count == self.batch_size or remaining <= 0:
+                    batch, self._queue = self._queue[:count], self._queue[count:]
+                    return batch
+                self._cond.wait(remaining)
+            else:
+                self._cond.wait()
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: List[Tuple[bytes, Future, float]]) -> None:
+        self.batches += 1
+        self.images += len(batch)
+        try:
+            results = self.annotate([image_bytes for image_bytes, _, _ in batch])
+            if len(results) != len(batch):
+                raise OcrError(f"Vision returned {len(results)} results for {len(batch)} images")
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+# The lambda looks annotate_batch up on every batch so it can be swapped out.
+ocr_batcher = OcrBatcher(
+    lambda images: annotate_batch(images),
+    batch_size=settings.OCR_BATCH_SIZE,
+    window=settings.OCR_BATCH_WINDOW_MS / 1000,
+    max_concurrent_batches=settings.OCR_MAX_CONCURRENT_BATCHES,
+)
+
+_text_cache: "OrderedDict[str, str]" = OrderedDict()
+_in_flight: Dict[str, Future] = {}
+_cache_lock = threading.Lock()
+ocr_counters = {"requests": 0, "cache_hits": 0, "joined_in_flight": 0, "failures": 0}
+
+def start_ocr(image_bytes: bytes) -> Optional[Future]:
+    """
+    Starts (or reuses) OCR of `image_bytes` and returns a future of its text.
+    Cached images return an already completed future; with OCR_ENABLED off
+    this returns None.
+    """
+    if not settings.OCR_ENABLED:
+        return None
+    key = hashlib.sha256(image_bytes).hexdigest()
+    with _cache_lock:
+        ocr_counters["requests"] += 1
+        if key in _text_cache:
+            ocr_counters["cache_hits"] += 1
+            _text_cache.move_to_end(key)
+            future: Future = Future()
+            future.set_result(_text_cache[key])
+            return future
+        if key in _in_flight:
+            ocr_counters["joined_in_flight"] += 1
+            return _in_flight[key]
+        future = ocr_batcher.submit(image_bytes)
+        _in_flight[key] = future
+    future.add_done_callback(lambda done: _finish(key, done))
+    return future
+
+def _finish(key: str, future: Future) -> None:
+    with _cache_lock:
+        _in_flight.pop(key, None)
+        if future.exception() is not None:
+            ocr_counters["failures"] += 1
+        else:
+            _text_cache[key] = future.result()
+            _text_cache.move_to_end(key)
+            while len(_text_cache) > settings.OCR_CACHE_SIZE:
+                _text_cache.popitem(last=False)
+
+def snapshot() -> dict:
+    """OCR counters for /metrics/health."""
+    with _cache_lock:
+        return {**ocr_counters, "batches": ocr_batcher.batches, "images_sent": ocr_batcher.images, "cached": len(_text_cache)}
+
+def wait_for_text(future: Optional[Future], timeout: Optional[float] = None) -> str:
+    """
+    The text of a `start_ocr` future, or "" when OCR is off (None), failed or
+    did not finish within `timeout` (OCR_TIMEOUT_SECONDS by default).
+    """
+    if future is None:
+        return ""
+    try:
+        return future.result(timeout=settings.OCR_TIMEOUT_SECONDS if timeout is None else timeout)
+    except Exception as e:
+        print(f"OCR unavailable for this submission: {type(e).__name__} - {e}")
+        return ""
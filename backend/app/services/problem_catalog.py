@@ -0,0 +1,143 @@
+# backend/app/services/problem_catalog.py
+"""
+In-memory problem catalog and fast local answer check.
+
+The catalog is read from the `problems` table (filled with
+`manage_problems.py seed`) once per process and indexed by problem id, with
+every canonical step pre-normalized. The single MVP problem from settings
+(PROBLEM_ID_MVP / CANONICAL_SOLUTION_MVP, steps separated by newlines) is
+added when the table does not have it. A load that cannot reach the database
+is served until the next attempt, RETRY_MIN_SECONDS later and doubling up to
+RETRY_MAX_SECONDS, instead of being kept for the life of the process.
+
+`is_correct_solution` compares a student's transcribed lines with the reference
+steps by normalized string matching, so obviously correct work can skip the
+error-selection model call. Transcriptions come from the student's
+handwriting, so they are never evaluated as expressions.
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+
+DEFAULT_PROBLEM_ID = "problem_1_algebra"
+RETRY_MIN_SECONDS = 5.0
+RETRY_MAX_SECONDS = 300.0
+
+_SYMBOL_REPLACEMENTS = str.maketrans({
+    "−": "-", "–": "-", "—": "-",
+    "×": "*", "·": "*", "⋅": "*", "∙": "*",
+    "÷": "/", "∶": ":",
+    "²": "^2", "³": "^3",
+})
+
+class CatalogEntry(NamedTuple):
+    problem_id: str
+    title: str
+    steps: List[str]
+    normalized_steps: frozenset  # every step, normalized, for O(1) membership checks
+    final_answer: str  # normalized last step
+
+_catalog: Optional[Dict[str, CatalogEntry]] = None
+_catalog_lock = threading.Lock()
+_retry_at: Optional[float] = None  # set while the last load could not read the table
+_retry_delay = RETRY_MIN_SECONDS
+
+def normalize(text: str) -> str:
+    """
+    Canonical string form of a line of math: unified operators, no whitespace,
+    no explicit multiplication before a letter or bracket, and equation sides
+    in a fixed order.
+    """
+    text = text.translate(_SYMBOL_REPLACEMENTS).lower()
+    text = re.sub(r"\s+", "", text).rstrip(".")
+    text = re.sub(r"\*(?=[a-z(])", "", text)
+    if text.count("=") == 1:
+        left, right = text.split("=")
+        text = "=".join(sorted([left, right]))
+    return text
+
+def _entry(problem_id: str, title: str, steps: List[str]) -> CatalogEntry:
+    steps = [step.strip() for step in steps if step and step.strip()]
+    return CatalogEntry(
+        problem_id=problem_id,
+        title=title,
+        steps=steps,
+        normalized_steps=frozenset(normalize(step) for step in steps),
+        final_answer=normalize(steps[-1]) if steps else "",
+    )
+
+def _load() -> Tuple[Dict[str, CatalogEntry], bool]:
+    """Returns the catalog and whether the problems table could be read."""
+    catalog: Dict[str, CatalogEntry] = {}
+    loaded = True
+    try:
+        from app.db import crud_problem
+        from app.db.database import SessionLocal
+
+        with SessionLocal() as db:
+            for problem in crud_problem.list_problems(db):
+                catalog[problem.id] = _entry(problem.id, problem.title, json.loads(problem.canonical_steps))
+    except Exception as e:
+        loaded = False
+        print(f"Could not load problem catalog from the database: {type(e).__name__} - {e}")
+
+    if settings.PROBLEM_ID_MVP and settings.CANONICAL_SOLUTION_MVP and settings.PROBLEM_ID_MVP not in catalog:
+        catalog[settings.PROBLEM_ID_MVP] = _entry(
+            settings.PROBLEM_ID_MVP, settings.PROBLEM_ID_MVP, settings.CANONICAL_SOLUTION_MVP.splitlines()
+        )
+    print(f"Problem catalog loaded with {len(catalog)} problem(s).")
+    return catalog, loaded
+
+def get_catalog() -> Dict[str, CatalogEntry]:
+    """
+    Returns the catalog, loading it on first use and again once the retry
+    time of a failed load has come. While one thread reloads, the others
+    keep getting the catalog they have.
+    """
+    global _catalog, _retry_at, _retry_delay
+    catalog = _catalog
+    if catalog is not None and (_retry_at is None or time.monotonic() < _retry_at):
+        return catalog
+    if not _catalog_lock.acquire(blocking=catalog is None):
+        return catalog
+    try:
+        if _catalog is None or (_retry_at is not None and time.monotonic() >= _retry_at):
+            _catalog, loaded = _load()
+            if loaded:
+                _retry_at, _retry_delay = None, RETRY_MIN_SECONDS
+            else:
+                print(f"Retrying the problem catalog load in {_retry_delay:.0f}s.")
+                _retry_at = time.monotonic() + _retry_delay
+                _retry_delay = min(_retry_delay * 2, RETRY_MAX_SECONDS)
+        return _catalog
+    finally:
+        _catalog_lock.release()
+
+def reload() -> None:
+    """Drops the in-memory catalog so the next lookup re-reads the database."""
+    global _catalog, _retry_at, _retry_delay
+    with _catalog_lock:
+        _catalog, _retry_at, _retry_delay = None, None, RETRY_MIN_SECONDS
+
+def get_problem(problem_id: Optional[str]) -> Optional[CatalogEntry]:
+    return get_catalog().get(problem_id) if problem_id else None
+
+def default_problem_id() -> str:
+    return settings.PROBLEM_ID_MVP or DEFAULT_PROBLEM_ID
+
+def is_correct_solution(problem_id: Optional[str], lines: List[str]) -> bool:
+    """
+    True when every transcribed line matches a reference step and the last
+    line matches the reference final answer.
+    """
+    entry = get_problem(problem_id)
+    if entry is None or not entry.steps or not lines:
+        return False
+    if not all(normalize(line) in entry.normalized_steps for line in lines):
+        return False
+    return normalize(lines[-1]) == entry.final_answer
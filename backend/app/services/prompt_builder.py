@@ -0,0 +1,185 @@
+# backend/app/services/prompt_builder.py
+"""
+Prompt templates for the analysis pipeline, and token accounting per stage.
+
+Templates are versioned (PROMPT_VERSION) so a prompt change can be compared
+against the previous one (benchmarks/eval_feedback.py) and rolled back:
+
+* "v1" is the original prompt: the detected regions go into the
+  error-selection prompt as indented JSON objects, the instructions are
+  repeated in the system instruction and the prompt, and the model answers
+  with full boxes that are snapped back onto the regions.
+* "v2" lists the regions as a compact table with short indexed ids
+  ("3|=7|500,600,800,900"), keeps the fixed rules in the system instruction
+  only, and lets the model answer with ids, which map straight back to the
+  detected boxes.
+
+`record_usage()` reads the token counts Vertex AI reports in
+`usage_metadata` and keeps per-stage totals for /metrics/health; `estimate_tokens()`
+approximates the count of a text part before it is sent.
+"""
+
+import json
+import re
+import textwrap
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.services import box_geometry
+
+PROMPT_VERSIONS = ("v1", "v2")
+# The model answers with at most this many errors.
+MAX_ERRORS = 5
+
+class ErrorPick(BaseModel):
+    """An error the model picked from the region table (v2 templates)."""
+    id: int
+    label: str
+
+@dataclass(frozen=True)
+class Prompt:
+    """The text parts of one model call."""
+    version: str
+    system_instruction: str
+    text: str
+    # True when the model answers with ErrorPick ids instead of boxes.
+    answers_with_ids: bool = False
+
+def detection_prompt(version: str, task: str, region_limit: int) -> Prompt:
+    """The region-detection call: find every notation group on the canvas."""
+    if version == "v1":
+        system_instruction = f"""
+        Return bounding boxes as an array with labels.
+        Never return masks. Limit to {region_limit} objects.
+        Be as detailed as possible.
+        """
+    else:
+        system_instruction = (
+            f"Return bounding boxes as an array with labels. Never return masks. "
+            f"Limit to {region_limit} objects. Be as detailed as possible."
+        )
+    return Prompt(version=_checked(version), system_instruction=system_instruction, text=task)
+
+def error_prompt(version: str, task: str, reference: str, region_boxes: np.ndarray, labels: Sequence[str]) -> Prompt:
+    """
+    The error-selection call.
+
+    Args:
+        version: Template version, one of PROMPT_VERSIONS.
+        task: The instruction line (feedback_service.ERROR_PROMPT or ERROR_ID_PROMPT).
+        reference: The problem's reference solution text.
+        region_boxes: Detected regions, (N, 4) [x1, y1, x2, y2] in the 0-1000 frame.
+        labels: The detected label of each region.
+    """
+    model_boxes = box_geometry.to_model_boxes(region_boxes).astype(int).tolist()
+    if _checked(version) == "v1":
+        bounding_boxes_json = json.dumps(
+            [{"box_2d": box, "label": label} for box, label in zip(model_boxes, labels)], indent=2
+        )
+        return Prompt(
+            version=version,
+            system_instruction="""
+        Return bounding boxes as an array with labels for errors only.
+        Never return masks. Limit to 5 objects.
+        If no error found, return an empty list.
+        YOU MUST choose from these pre-analyzed bounding boxes for the syntax:
+        """,
+            text=f"""
+    {task}
+    {reference}
+    YOU MUST choose from these pre-analyzed bounding boxes for the syntax:
+    {bounding_boxes_json}
+    """,
+        )
+
+    table = "\n".join(
+        f"{i}|{_one_line(label)}|{','.join(map(str, box))}" for i, (box, label) in enumerate(zip(model_boxes, labels))
+    )
+    return Prompt(
+        version=version,
+        system_instruction=textwrap.dedent(f"""\
+            Return an array for errors only: the id of each region of the table that contains an
+            error, and a short label describing the error. Only use ids from the table.
+            At most {MAX_ERRORS} entries. If no error is found, return an empty list.
+            Table rows are id|detected text|box as ymin,xmin,ymax,xmax in 0-1000 image coordinates."""),
+        text=f"{task}\n{reference}\nRegions:\n{table}",
+        answers_with_ids=True,
+    )
+
+def picked_regions(picks, region_boxes: np.ndarray) -> tuple[np.ndarray, list[str], int]:
+    """
+    Maps ErrorPick answers onto the detected regions.
+    Returns the picked boxes, their labels and how many picks had no valid id.
+    Repeated ids keep their first label.
+    """
+    rows, labels, seen, invalid = [], [], set(), 0
+    for pick in picks:
+        region_id = getattr(pick, "id", None)
+        if not isinstance(region_id, int) or not 0 <= region_id < len(region_boxes):
+            invalid += 1
+            continue
+        if region_id in seen:
+            continue
+        seen.add(region_id)
+        rows.append(region_id)
+        labels.append(getattr(pick, "label", None) or "AI detected error")
+    rows, labels = rows[:MAX_ERRORS], labels[:MAX_ERRORS]
+    return region_boxes[rows].reshape(-1, 4), labels, invalid
+
+def _one_line(label: str) -> str:
+    # The table is line- and pipe-delimited; keep labels from breaking it.
+    return " ".join(str(label).replace("|", "/").split())
+
+def _checked(version: str) -> str:
+    if version not in PROMPT_VERSIONS:
+        raise ValueError(f"Unknown prompt version {version!r}; expected one of {PROMPT_VERSIONS}.")
+    return version
+
+# Gemini's tokenizer gives every digit its own token; other text averages about 4 characters a token.
+_DIGIT = re.compile(r"\d")
+CHARS_PER_TOKEN = 4.0
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Gemini token count of a text part (no API call)."""
+    digits = len(_DIGIT.findall(text))
+    return digits + int(round((len(text) - digits) / CHARS_PER_TOKEN))
+
+_usage_lock = threading.Lock()
+_usage: dict[str, dict[str, int]] = {}
+
+def record_usage(stage: str, response: Any, prompt: Optional[Prompt] = None) -> Optional[dict]:
+    """
+    Logs and accumulates the token counts of one model response under `stage`
+    ("detect", "errors"). Responses without usage_metadata are ignored.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    counts = {
+        "input": getattr(usage, "prompt_token_count", None) or 0,
+        "cached": getattr(usage, "cached_content_token_count", None) or 0,
+        "output": getattr(usage, "candidates_token_count", None) or 0,
+        "thinking": getattr(usage, "thoughts_token_count", None) or 0,
+    }
+    if prompt is not None:
+        counts["estimated_text"] = estimate_tokens(prompt.system_instruction) + estimate_tokens(prompt.text)
+    version = f" (prompt {prompt.version})" if prompt is not None else ""
+    print(
+        f"Tokens for {stage}{version}: {counts['input']} in ({counts['cached']} cached), "
+        f"{counts['output']} out, {counts['thinking']} thinking"
+    )
+    with _usage_lock:
+        totals = _usage.setdefault(stage, {"calls": 0})
+        totals["calls"] += 1
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+    return counts
+
+def usage_snapshot() -> dict:
+    """Token totals per stage since start, for /metrics/health."""
+    with _usage_lock:
+        return {stage: dict(totals) for stage, totals in _usage.items()}
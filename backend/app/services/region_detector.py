@@ -0,0 +1,212 @@
+# backend/app/services/region_detector.py
+"""
+Local region detector for canvas handwriting.
+
+A classical-CV replacement for the first Gemini call: canvas exports are clean,
+high-contrast ink on a flat (often transparent) background, so symbols and
+expressions can be found in milliseconds with NumPy alone:
+
+1. Ink mask: alpha channel for transparent exports, otherwise distance from
+   the background (median) luminance.
+2. Connected components via run-length encoding and union-find over runs that
+   touch on adjacent rows (8-connectivity).
+3. Line segmentation from the horizontal projection profile.
+4. Components whose columns overlap within a line are merged into symbols
+   (e.g. the two bars of '=', the dot of 'i'), and symbols separated by small
+   gaps are grouped into expressions.
+
+Boxes are returned as [x1, y1, x2, y2] in the same 0-1000 normalized frame the
+Gemini detector uses.
+"""
+
+import io
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+# Images are downscaled so the longer side is at most this many pixels.
+MAX_SIDE = 1024
+# Components smaller than this many pixels (in both directions) are specks.
+MIN_COMPONENT_SIZE = 2
+# Blank rows needed between two text lines, as a fraction of image height.
+MIN_LINE_GAP = 0.006
+# Symbols closer than this fraction of the line height belong to one expression.
+EXPRESSION_GAP = 0.6
+
+class Region(NamedTuple):
+    box_2d: List[int]  # [x1, y1, x2, y2] in the 0-1000 frame
+    label: str
+
+def load_ink_mask(image_bytes: bytes, max_side: int = MAX_SIDE) -> np.ndarray:
+    """
+    Decodes an image and returns a boolean mask of ink pixels.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (max_side, max_side))  # cheap JPEG downscale on decode
+        channel = None
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            alpha = image.convert("RGBA").getchannel("A")
+            if alpha.getextrema()[0] < 128:  # a transparent export: ink is whatever was drawn
+                channel = alpha
+        uses_alpha = channel is not None
+        if channel is None:
+            channel = image.convert("L")
+
+    # Shrink a single band with an integer box filter, which is far cheaper
+    # than resampling the full-colour image.
+    factor = -(-max(channel.size) // max_side)
+    if factor > 1:
+        channel = channel.reduce(factor)
+    pixels = np.asarray(channel, dtype=np.int16)
+
+    if uses_alpha:
+        return pixels >= 64
+    background = int(np.median(pixels))
+    return np.abs(pixels - background) > 60
+
+def connected_components(mask: np.ndarray) -> np.ndarray:
+    """
+    Labels 8-connected ink components.
+
+    Returns:
+        An (K, 4) int array of [x1, y1, x2, y2] pixel boxes (x2/y2 exclusive).
+    """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+    n = len(run_rows)
+    if n == 0:
+        return np.empty((0, 4), dtype=np.int64)
+
+    # Runs are in row-major order, so encoding (row, col) as a single key keeps
+    # them sorted and lets searchsorted find, for every run, the contiguous
+    # range of runs on the previous row that touch it (including diagonally).
+    stride = width + 2
+    start_keys = run_rows * stride + run_starts
+    end_keys = run_rows * stride + run_ends
+    prev_row = (run_rows - 1) * stride
+    lo = np.searchsorted(end_keys, prev_row + run_starts, side="left")
+    hi = np.searchsorted(start_keys, prev_row + run_ends, side="right")
+    counts = np.clip(hi - lo, 0, None)
+
+    a = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    b = np.repeat(lo, counts) + offsets
+
+    labels = np.arange(n)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, a, labels[b])
+        np.minimum.at(labels, b, labels[a])
+        labels = labels[labels]  # pointer jumping
+        if np.array_equal(labels, previous):
+            break
+
+    _, component = np.unique(labels, return_inverse=True)
+    k = component.max() + 1
+    boxes = np.empty((k, 4), dtype=np.int64)
+    boxes[:, 0] = width
+    boxes[:, 1] = height
+    boxes[:, 2:] = 0
+    np.minimum.at(boxes[:, 0], component, run_starts)
+    np.minimum.at(boxes[:, 1], component, run_rows)
+    np.maximum.at(boxes[:, 2], component, run_ends)
+    np.maximum.at(boxes[:, 3], component, run_rows + 1)
+    return boxes
+
+def segment_lines(mask: np.ndarray, min_gap: int) -> List[Tuple[int, int]]:
+    """
+    Splits the image into text lines using the horizontal projection profile.
+
+    Returns:
+        (top, bottom) row ranges, bottom exclusive.
+    """
+    has_ink = mask.any(axis=1).astype(np.int8)
+    padded = np.concatenate([[0], has_ink, [0]])
+    starts = np.flatnonzero(np.diff(padded) == 1)
+    ends = np.flatnonzero(np.diff(padded) == -1)
+    lines: List[List[int]] = []
+    for top, bottom in zip(starts.tolist(), ends.tolist()):
+        if lines and top - lines[-1][1] < min_gap:
+            lines[-1][1] = bottom
+        else:
+            lines.append([top, bottom])
+    return [(top, bottom) for top, bottom in lines]
+
+def _merge_overlapping_columns(boxes: np.ndarray) -> np.ndarray:
+    """Merges boxes (sorted by x1) whose column ranges overlap into symbol boxes."""
+    merged = [boxes[0].copy()]
+    for box in boxes[1:]:
+        current = merged[-1]
+        overlap = min(current[2], box[2]) - max(current[0], box[0])
+        narrower = min(current[2] - current[0], box[2] - box[0])
+        if overlap > 0.5 * narrower:
+            current[:2] = np.minimum(current[:2], box[:2])
+            current[2:] = np.maximum(current[2:], box[2:])
+        else:
+            merged.append(box.copy())
+    return np.array(merged)
+
+def _group_expressions(symbols: np.ndarray, line_height: int) -> List[np.ndarray]:
+    """Groups symbols (sorted by x1) into expressions split at wide gaps."""
+    groups = [[symbols[0]]]
+    for symbol in symbols[1:]:
+        gap = symbol[0] - max(s[2] for s in groups[-1])
+        if gap > EXPRESSION_GAP * line_height:
+            groups.append([symbol])
+        else:
+            groups[-1].append(symbol)
+    return [np.array(group) for group in groups]
+
+def detect_regions(image_bytes: bytes, max_regions: int = 30) -> List[Region]:
+    """
+    Detects symbol and expression regions in a canvas image.
+
+    Symbol-level boxes are returned when they fit within `max_regions`;
+    otherwise the coarser expression-level boxes are used (and, if even those
+    exceed the limit, the first `max_regions` in reading order).
+    """
+    mask = load_ink_mask(image_bytes)
+    height, width = mask.shape
+    boxes = connected_components(mask)
+    if len(boxes) == 0:
+        return []
+    sizes = boxes[:, 2:] - boxes[:, :2]
+    boxes = boxes[(sizes >= MIN_COMPONENT_SIZE).any(axis=1)]
+    if len(boxes) == 0:
+        return []
+
+    lines = segment_lines(mask, max(1, int(MIN_LINE_GAP * height)))
+    line_tops = np.array([top for top, _ in lines])
+    centers = (boxes[:, 1] + boxes[:, 3]) / 2
+    line_of = np.clip(np.searchsorted(line_tops, centers, side="right") - 1, 0, len(lines) - 1)
+
+    symbol_regions: List[Tuple[np.ndarray, str]] = []
+    expression_regions: List[Tuple[np.ndarray, str]] = []
+    line_number = 0
+    for line_index in range(len(lines)):
+        in_line = boxes[line_of == line_index]
+        if len(in_line) == 0:
+            continue
+        in_line = in_line[np.argsort(in_line[:, 0], kind="stable")]
+        symbols = _merge_overlapping_columns(in_line)
+        line_height = int(symbols[:, 3].max() - symbols[:, 1].min())
+        line_number += 1
+        for j, symbol in enumerate(symbols, start=1):
+            symbol_regions.append((symbol, f"line {line_number} symbol {j}"))
+        for j, group in enumerate(_group_expressions(symbols, line_height), start=1):
+            box = np.array([group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max()])
+            expression_regions.append((box, f"line {line_number} expression {j}"))
+
+    regions = symbol_regions if len(symbol_regions) <= max_regions else expression_regions
+    regions = regions[:max_regions]
+    scale = np.array([1000 / width, 1000 / height, 1000 / width, 1000 / height])
+    return [
+        Region(box_2d=np.rint(box * scale).astype(int).tolist(), label=label)
+        for box, label in regions
+    ]
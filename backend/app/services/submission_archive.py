@@ -0,0 +1,139 @@
+# backend/app/services/submission_archive.py
+"""
+Archival of old submissions' large text columns to compressed blobs.
+
+`archive_submissions()` walks the rows submitted before a cutoff one month
+at a time, in chunks of SUBMISSION_ARCHIVE_CHUNK_ROWS. Each chunk is
+written as JSON lines (id, user_id, problem_id, submitted_at, ocr_text,
+ai_feedback), compressed with zstd, to
+
+    gs://<GCS_BUCKET_NAME>/<SUBMISSION_ARCHIVE_PREFIX>/<YYYY-MM>/<first id>-<last id>.jsonl.zst
+
+and the rows are then updated to a slim form: ai_feedback and ocr_text are
+NULL and archive_uri points at the blob. The job can be stopped and rerun at
+any point; a blob left behind by an interrupted run is reused, not rewritten.
+
+Readers go through `feedback_of()` / `archived_fields()`, which load an
+archived row's text back from its blob (recently read blobs are cached).
+"""
+
+import json
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional
+
+from google.api_core.exceptions import PreconditionFailed
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db import models
+from ..db.partitions import add_months, month_start
+from . import gcs_service
+
+ZSTD_LEVEL = 10
+# Decompressed archive chunks kept in memory for reads.
+ARCHIVE_CACHE_SIZE = 8
+
+def archive_cutoff(today: Optional[date] = None) -> datetime:
+    """Start of the month SUBMISSION_ARCHIVE_AFTER_MONTHS before this one (UTC)."""
+    today = today or datetime.now(timezone.utc).date()
+    return _as_datetime(add_months(month_start(today), -settings.SUBMISSION_ARCHIVE_AFTER_MONTHS))
+
+def _as_datetime(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def archive_submissions(db: Session, before: Optional[datetime] = None, chunk_rows: Optional[int] = None) -> dict:
+    """
+    Moves ai_feedback and ocr_text of rows submitted before `before`
+    (archive_cutoff() by default) into archive blobs. Returns counters.
+    """
+    before = before or archive_cutoff()
+    chunk_rows = chunk_rows or settings.SUBMISSION_ARCHIVE_CHUNK_ROWS
+    Submission = models.Submission
+    pending = and_(
+        Submission.submitted_at < before,
+        Submission.archive_uri.is_(None),
+        or_(Submission.ai_feedback.is_not(None), Submission.ocr_text.is_not(None)),
+    )
+    stats = {"rows": 0, "blobs": 0, "bytes_raw": 0, "bytes_compressed": 0}
+    oldest = db.execute(select(func.min(Submission.submitted_at)).where(pending)).scalar()
+    if oldest is None:
+        return stats
+
+    month = month_start(oldest.date())
+    while _as_datetime(month) < before:
+        start, end = _as_datetime(month), min(before, _as_datetime(add_months(month, 1)))
+        # Bounding submitted_at keeps every query on this month's partition.
+        in_month = and_(pending, Submission.submitted_at >= start, Submission.submitted_at < end)
+        ids = db.execute(select(Submission.id).where(in_month).order_by(Submission.id)).scalars().all()
+        for offset in range(0, len(ids), chunk_rows):
+            _archive_chunk(db, month, ids[offset:offset + chunk_rows], in_month, stats)
+        month = add_months(month, 1)
+    print(
+        f"Archived {stats['rows']} submission(s) into {stats['blobs']} blob(s): "
+        f"{stats['bytes_raw'] / 2**20:.1f} MiB -> {stats['bytes_compressed'] / 2**20:.1f} MiB"
+    )
+    return stats
+
+def _archive_chunk(db: Session, month: date, ids, in_month, stats: dict) -> None:
+    import zstandard
+
+    Submission = models.Submission
+    rows = db.execute(
+        select(
+            Submission.id, Submission.user_id, Submission.problem_id, Submission.submitted_at,
+            Submission.ocr_text, Submission.ai_feedback,
+        ).where(in_month, Submission.id.in_(ids)).order_by(Submission.id)
+    ).all()
+    if not rows:
+        return
+    raw = "".join(
+        json.dumps({
+            "id": row.id, "user_id": row.user_id, "problem_id": row.problem_id,
+            "submitted_at": row.submitted_at.isoformat(), "ocr_text": row.ocr_text, "ai_feedback": row.ai_feedback,
+        }, ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode("utf-8")
+    compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+
+    name = f"{settings.SUBMISSION_ARCHIVE_PREFIX}/{month:%Y-%m}/{rows[0].id}-{rows[-1].id}.jsonl.zst"
+    blob = gcs_service.get_storage_client().bucket(settings.GCS_BUCKET_NAME).blob(name)
+    try:
+        gcs_service.gcs_breaker.call(
+            blob.upload_from_string, compressed, content_type="application/zstd", if_generation_match=0
+        )
+    except PreconditionFailed:
+        pass  # written by an earlier, interrupted run for the same rows
+    archive_uri = f"gs://{settings.GCS_BUCKET_NAME}/{name}"
+
+    archived = [row.id for row in rows]
+    db.execute(
+        update(Submission)
+        .where(in_month, Submission.id.in_(archived))
+        .values(ai_feedback=None, ocr_text=None, archive_uri=archive_uri)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    stats["rows"] += len(archived)
+    stats["blobs"] += 1
+    stats["bytes_raw"] += len(raw)
+    stats["bytes_compressed"] += len(compressed)
+
+@lru_cache(maxsize=ARCHIVE_CACHE_SIZE)
+def _load_chunk(archive_uri: str) -> Dict[int, dict]:
+    import zstandard
+
+    compressed = gcs_service.download_image_bytes(archive_uri)
+    raw = zstandard.ZstdDecompressor().decompress(compressed)
+    return {record["id"]: record for record in map(json.loads, raw.splitlines())}
+
+def archived_fields(archive_uri: str, submission_id: int) -> dict:
+    """The archived {"ocr_text", "ai_feedback", ...} of one submission; raises KeyError if absent."""
+    return _load_chunk(archive_uri)[submission_id]
+
+def feedback_of(submission: models.Submission) -> Optional[str]:
+    """The submission's ai_feedback JSON text, read back from the archive if it was moved there."""
+    if submission.archive_uri is None:
+        return submission.ai_feedback
+    return archived_fields(submission.archive_uri, submission.id)["ai_feedback"]
@@ -0,0 +1,264 @@
+# backend/app/services/submission_export.py
+"""
+Incremental export of submissions to Parquet datasets for analytics.
+
+`export_submissions()` streams the rows added since the last run through a
+server-side cursor (SUBMISSION_EXPORT_BATCH_ROWS at a time) and writes two
+datasets under the destination (a local directory or gs:// URI), both
+hive-partitioned by day and problem:
+
+    <dest>/submissions/date=YYYY-MM-DD/problem_id=<id>/part-<run>-<n>.parquet
+        one row per submission: id, user, time, image, OCR text, translation,
+        status, error count, whether it was read from the archive
+    <dest>/errors/date=YYYY-MM-DD/problem_id=<id>/part-<run>-<n>.parquet
+        one row per AIFeedbackResponse error: submission id, user, time,
+        position, error_text and the box as x1, y1, x2, y2
+
+Archived rows have their text read back from the archive blobs.
+
+<dest>/_watermark.json records the last exported id; the next run picks up
+after it, and only rows older than SUBMISSION_EXPORT_SETTLE_SECONDS are
+taken. The watermark is written after every file is closed, and file names
+depend only on the rows written, so a run that fails part-way is simply run
+again: it covers the same rows (the watermark notes the pending range
+before any file is written) and overwrites its own files.
+
+Memory stays bounded whatever the table size: one cursor batch, at most
+MAX_BUFFERED_ROWS rows waiting for a row group, and at most MAX_OPEN_FILES
+open files (rows come in id order, so only the last few days are active).
+"""
+
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db import models
+from . import submission_archive
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser is used instead
+    _loads = json.loads
+
+WATERMARK_FILE = "_watermark.json"
+ROW_GROUP_ROWS = 10_000
+MAX_BUFFERED_ROWS = 20_000
+MAX_OPEN_FILES = 32
+
+def _schemas():
+    import pyarrow as pa
+
+    timestamp = pa.timestamp("us", tz="UTC")
+    submissions = pa.schema([
+        ("submission_id", pa.int64()), ("user_id", pa.string()), ("submitted_at", timestamp),
+        ("image_gcs_url", pa.string()), ("ocr_text", pa.string()), ("translated_handwriting", pa.string()),
+        ("status", pa.string()), ("error_count", pa.int32()), ("archived", pa.bool_()),
+    ])
+    errors = pa.schema([
+        ("submission_id", pa.int64()), ("user_id", pa.string()), ("submitted_at", timestamp),
+        ("error_index", pa.int32()), ("error_text", pa.string()),
+        ("x1", pa.float32()), ("y1", pa.float32()), ("x2", pa.float32()), ("y2", pa.float32()),
+    ])
+    return submissions, errors
+
+def _filesystem(dest: str):
+    from pyarrow import fs
+
+    if "://" not in dest:
+        dest = os.path.abspath(dest)
+        os.makedirs(dest, exist_ok=True)
+        return fs.LocalFileSystem(), dest
+    filesystem, path = fs.FileSystem.from_uri(dest)
+    return filesystem, path.rstrip("/")
+
+def read_watermark(filesystem, root: str) -> dict:
+    try:
+        with filesystem.open_input_stream(f"{root}/{WATERMARK_FILE}") as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return {"last_id": 0}
+
+def _write_watermark(filesystem, root: str, watermark: dict) -> None:
+    with filesystem.open_output_stream(f"{root}/{WATERMARK_FILE}") as f:
+        f.write(json.dumps(watermark, indent=2).encode("utf-8"))
+
+class _DatasetWriter:
+    """
+    Appends rows to one hive-partitioned dataset. Rows are buffered per
+    partition and written a row group at a time; the largest buffers are
+    flushed early when MAX_BUFFERED_ROWS is reached, and the least recently
+    used file is closed when MAX_OPEN_FILES are open (a later row for that
+    partition starts its next part file).
+    """
+
+    def __init__(self, filesystem, root: str, schema, run: str):
+        self.filesystem = filesystem
+        self.root = root
+        self.schema = schema
+        self.run = run
+        self.buffers: Dict[Tuple[str, str], Dict[str, list]] = {}
+        self.buffered = 0
+        self.writers: "OrderedDict[Tuple[str, str], object]" = OrderedDict()
+        self.parts: Dict[Tuple[str, str], int] = {}
+        self.files = 0
+        self.rows = 0
+
+    def add(self, key: Tuple[str, str], row: tuple) -> None:
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = {name: [] for name in self.schema.names}
+        for name, value in zip(self.schema.names, row):
+            buffer[name].append(value)
+        self.buffered += 1
+        if len(buffer["submission_id"]) >= ROW_GROUP_ROWS:
+            self._flush(key)
+        elif self.buffered >= MAX_BUFFERED_ROWS:
+            for key in sorted(self.buffers, key=lambda k: len(self.buffers[k]["submission_id"]), reverse=True):
+                self._flush(key)
+                if self.buffered < MAX_BUFFERED_ROWS // 2:
+                    break
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        import pyarrow as pa
+
+        buffer = self.buffers.pop(key, None)
+        if not buffer:
+            return
+        count = len(buffer["submission_id"])
+        self._writer(key).write_table(pa.Table.from_pydict(buffer, schema=self.schema))
+        self.buffered -= count
+        self.rows += count
+
+    def _writer(self, key: Tuple[str, str]):
+        import pyarrow.parquet as pq
+
+        writer = self.writers.get(key)
+        if writer is not None:
+            self.writers.move_to_end(key)
+            return writer
+        if len(self.writers) >= MAX_OPEN_FILES:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        day, problem_id = key
+        directory = f"{self.root}/date={day}/problem_id={quote(problem_id, safe='')}"
+        self.filesystem.create_dir(directory, recursive=True)
+        part = self.parts[key] = self.parts.get(key, -1) + 1
+        writer = pq.ParquetWriter(
+            f"{directory}/part-{self.run}-{part:04d}.parquet", self.schema,
+            filesystem=self.filesystem, compression="zstd",
+        )
+        self.writers[key] = writer
+        self.files += 1
+        return writer
+
+    def close(self) -> None:
+        for key in list(self.buffers):
+            self._flush(key)
+        while self.writers:
+            _, writer = self.writers.popitem(last=False)
+            writer.close()
+
+def _feedback(row) -> Tuple[Optional[str], Optional[str], bool]:
+    """(ocr_text, ai_feedback, archived) of a row, read from its archive blob if needed."""
+    if row.archive_uri is None:
+        return row.ocr_text, row.ai_feedback, False
+    try:
+        fields = submission_archive.archived_fields(row.archive_uri, row.id)
+    except KeyError:
+        return None, None, True
+    return fields.get("ocr_text"), fields.get("ai_feedback"), True
+
+def _flatten(row, submissions: _DatasetWriter, errors: _DatasetWriter) -> None:
+    submitted_at = row.submitted_at.astimezone(timezone.utc)
+    key = (submitted_at.date().isoformat(), row.problem_id)
+    ocr_text, ai_feedback, archived = _feedback(row)
+    feedback = {}
+    if ai_feedback:
+        try:
+            feedback = _loads(ai_feedback)
+        except ValueError:
+            print(f"Export: submission {row.id} has unreadable ai_feedback; exporting it without errors.")
+    entries = feedback.get("errors") or []
+    submissions.add(key, (
+        row.id, row.user_id, submitted_at, row.image_gcs_url, ocr_text,
+        feedback.get("translated_handwriting"), feedback.get("status"),
+        len(entries) if ai_feedback else None, archived,
+    ))
+    for index, entry in enumerate(entries):
+        box = entry.get("box_2d") or []
+        x1, y1, x2, y2 = box if len(box) == 4 else (None, None, None, None)
+        errors.add(key, (row.id, row.user_id, submitted_at, index, entry.get("error_text"), x1, y1, x2, y2))
+
+def export_submissions(
+    db: Session, dest: Optional[str] = None, *, batch_rows: Optional[int] = None, until: Optional[datetime] = None,
+) -> dict:
+    """
+    Exports the submissions added since the last run to `dest`
+    (SUBMISSION_EXPORT_URI by default) and advances its watermark.
+    `until` (default: now minus SUBMISSION_EXPORT_SETTLE_SECONDS) bounds the
+    rows taken. Returns counters.
+    """
+    dest = dest or settings.SUBMISSION_EXPORT_URI
+    if not dest:
+        raise ValueError("No export destination: pass one or set SUBMISSION_EXPORT_URI.")
+    batch_rows = batch_rows or settings.SUBMISSION_EXPORT_BATCH_ROWS
+    until = until or datetime.now(timezone.utc) - timedelta(seconds=settings.SUBMISSION_EXPORT_SETTLE_SECONDS)
+    filesystem, root = _filesystem(dest)
+    watermark = read_watermark(filesystem, root)
+    stats = {"rows": 0, "error_rows": 0, "files": 0, "last_id": watermark["last_id"]}
+
+    Submission = models.Submission
+    upper = watermark.get("pending_id")
+    if upper is None:
+        # Ids are handed out in insert order, so everything up to the newest settled
+        # row is committed; later ids wait for the next run.
+        upper = db.execute(
+            select(func.max(Submission.id)).where(Submission.id > watermark["last_id"], Submission.submitted_at < until)
+        ).scalar()
+        if upper is None:
+            return stats
+        # A failed run is retried over exactly the same rows, so it rewrites the same files.
+        _write_watermark(filesystem, root, {**watermark, "pending_id": upper})
+
+    run = f"{watermark['last_id'] + 1:012d}"
+    submission_schema, error_schema = _schemas()
+    submissions = _DatasetWriter(filesystem, f"{root}/submissions", submission_schema, run)
+    errors = _DatasetWriter(filesystem, f"{root}/errors", error_schema, run)
+    result = db.execute(
+        select(
+            Submission.id, Submission.user_id, Submission.problem_id, Submission.submitted_at,
+            Submission.image_gcs_url, Submission.ocr_text, Submission.ai_feedback, Submission.archive_uri,
+        )
+        .where(Submission.id > watermark["last_id"], Submission.id <= upper)
+        .order_by(Submission.id)
+        .execution_options(yield_per=batch_rows)
+    )
+    try:
+        for batch in result.partitions():
+            for row in batch:
+                _flatten(row, submissions, errors)
+    finally:
+        result.close()
+        submissions.close()
+        errors.close()
+
+    stats.update(
+        rows=submissions.rows, error_rows=errors.rows, files=submissions.files + errors.files, last_id=upper,
+    )
+    _write_watermark(filesystem, root, {
+        "last_id": upper, "exported_at": datetime.now(timezone.utc).isoformat(),
+        "rows": stats["rows"], "error_rows": stats["error_rows"],
+    })
+    print(
+        f"Exported {stats['rows']} submission(s) and {stats['error_rows']} error row(s) "
+        f"in {stats['files']} file(s); watermark now {upper}."
+    )
+    return stats
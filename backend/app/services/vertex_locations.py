@@ -0,0 +1,174 @@
+# backend/app/services/vertex_locations.py
+"""
+Latency-based Vertex AI location selection with failover.
+
+Model calls can be served from several Vertex AI locations (AI_LOCATIONS, by
+default AI_REGION and then the global endpoint). For every location the
+selector keeps an exponentially weighted moving average of call latency and
+of the error rate, measured on real calls, and sends each call to the
+healthy location with the best score. Every location also has its own
+circuit breaker ("vertex-<location>"), so one that keeps failing is skipped
+until its half-open probes succeed.
+
+A call that fails with a server-side or quota error is retried once in each
+remaining location before the error is raised. Requests the API rejects as
+invalid (other 4xx) are raised straight away: they would fail everywhere.
+
+Locations that are not the current best are sent one real call every
+`probe_interval` seconds so their averages stay fresh.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.circuit_breaker import CircuitOpenError, get_breaker
+from app.core.config import settings
+
+# Smoothing factor of the latency and error-rate averages.
+EWMA_ALPHA = 0.3
+# A location's score is its latency average scaled up by this much per unit of error rate.
+ERROR_PENALTY = 4.0
+# 4xx codes that depend on the location (timeouts, regional quota) and are worth a retry elsewhere.
+RETRYABLE_CLIENT_CODES = {408, 429}
+
+def candidate_locations() -> List[str]:
+    """Configured locations in order of preference, without duplicates."""
+    if settings.AI_LOCATIONS:
+        locations = [location.strip() for location in settings.AI_LOCATIONS.split(",")]
+    else:
+        locations = [settings.AI_REGION, "global"]
+    return list(dict.fromkeys(location for location in locations if location))
+
+def is_retryable(error: Exception) -> bool:
+    """False for errors the API returns for a bad request, which no other location would accept."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return code in RETRYABLE_CLIENT_CODES
+    return True
+
+class LocationStats:
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None  # EWMA of successful call latency, seconds
+        self.error_rate = 0.0  # EWMA of failures (1) and successes (0)
+        self.calls = 0
+        self.last_used = 0.0
+
+    def score(self) -> float:
+        return (self.latency or 0.0) * (1 + ERROR_PENALTY * self.error_rate)
+
+class LocationSelector:
+    def __init__(
+        self,
+        locations: List[str],
+        client_factory: Callable[[str], object],
+        *,
+        probe_interval: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not locations:
+            raise ValueError("At least one Vertex AI location is required.")
+        self.locations = list(locations)
+        self.client_factory = client_factory
+        self.probe_interval = probe_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats: Dict[str, LocationStats] = {location: LocationStats() for location in self.locations}
+        self._breakers = {
+            location: get_breaker(
+                f"vertex-{location}",
+                failure_rate_threshold=settings.BREAKER_FAILURE_RATE,
+                slow_call_seconds=settings.VERTEX_SLOW_CALL_SECONDS,
+                open_seconds=settings.BREAKER_OPEN_SECONDS,
+            )
+            for location in self.locations
+        }
+
+    @property
+    def primary(self) -> str:
+        """The first configured location, used for regional resources such as context caches."""
+        return self.locations[0]
+
+    def ranked(self) -> List[str]:
+        """
+        Locations to try, best first. Unmeasured locations rank first (in
+        configured order) so that each gets measured; one stale location is
+        moved to the front when it is due for a probe.
+        """
+        now = self._clock()
+        with self._lock:
+            order = sorted(
+                self.locations,
+                key=lambda location: (
+                    self._stats[location].latency is not None,
+                    self._stats[location].score(),
+                    self.locations.index(location),
+                ),
+            )
+            stale = [
+                location for location in order[1:]
+                if self._stats[location].latency is not None
+                and now - self._stats[location].last_used >= self.probe_interval
+            ]
+            if stale:
+                order.remove(stale[0])
+                order.insert(0, stale[0])
+                self._stats[stale[0]].last_used = now  # one probe per interval, even under concurrency
+        return order
+
+    def record(self, location: str, duration: float, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            stats = self._stats[location]
+            stats.calls += 1
+            stats.last_used = self._clock()
+            stats.error_rate = (1 - EWMA_ALPHA) * stats.error_rate + EWMA_ALPHA * (error is not None)
+            if error is None:
+                stats.latency = duration if stats.latency is None else (1 - EWMA_ALPHA) * stats.latency + EWMA_ALPHA * duration
+
+    def generate_content(self, **kwargs):
+        """
+        client.models.generate_content on the best available location,
+        failing over to the others.
+
+        Raises:
+            CircuitOpenError: every location's breaker is open.
+            The last error, when every location that was tried failed.
+        """
+        last_error: Optional[Exception] = None
+        for location in self.ranked():
+            breaker = self._breakers[location]
+            if not breaker.allow():
+                continue
+            start = self._clock()
+            try:
+                response = self.client_factory(location).models.generate_content(**kwargs)
+            except Exception as e:
+                duration = self._clock() - start
+                if not is_retryable(e):
+                    breaker.record(duration)  # the location answered; the request was at fault
+                    raise
+                breaker.record(duration, e)
+                self.record(location, duration, e)
+                print(f"Vertex AI call failed in {location}: {type(e).__name__} - {e}")
+                last_error = e
+                continue
+            duration = self._clock() - start
+            breaker.record(duration)
+            self.record(location, duration)
+            return response
+
+        if last_error is not None:
+            raise last_error
+        retry_after = min(breaker.snapshot()["retry_after_seconds"] for breaker in self._breakers.values())
+        raise CircuitOpenError("vertex", retry_after)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                location: {
+                    "latency_ms": None if stats.latency is None else round(stats.latency * 1000, 1),
+                    "error_rate": round(stats.error_rate, 3),
+                    "calls": stats.calls,
+                }
+                for location, stats in self._stats.items()
+            }
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Admission Control Load Test
+===========================
+
+Serves a minimal analysis endpoint (feedback_service.get_errorbouding_from_image
+against a slowed fake GenAI client) with uvicorn, offers it more load than it
+can handle, and compares end-to-end latency with and without the admission
+middleware (app.core.admission). With admission on, admitted requests should
+stay within roughly target delay + service time while the excess gets 503s;
+without it, latency grows for as long as the overload lasts.
+
+A last phase sends requests with a client timeout shorter than the service
+time and checks that queued work is dropped and running work stops before
+its second model call.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_admission.py [--rate 30] [--duration 10] [--model-latency 1.0]
+
+The defaults overload the 40-thread pool that sync endpoints run on (about
+20 req/s at 2 s per request), which is what happens when Vertex slows down.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from app.core.admission import AdmissionController, AdmissionMiddleware
+from app.services import feedback_service
+
+
+class FakeRegion:
+    """A detected region, or an error pick (box and id) from the error-selection call."""
+
+    def __init__(self, box_2d, label, id=None):
+        self.box_2d = box_2d
+        self.label = label
+        self.id = id
+
+
+class FakeResponse:
+    def __init__(self, parsed):
+        self.parsed = parsed
+
+    def json(self):
+        return "{}"
+
+
+class FakeModels:
+    """Stands in for client.models; sleeps like a remote model and counts calls per stage."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = {"detect": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        stage = "errors" if "errors only" in config.system_instruction else "detect"
+        with self._lock:
+            self.calls[stage] += 1
+        time.sleep(self.latency)
+        if stage == "detect":
+            return FakeResponse([FakeRegion([100, 100, 200, 400], "2x+3"), FakeRegion([300, 100, 400, 400], "=7")])
+        return FakeResponse([FakeRegion([300, 100, 400, 400], "=7", id=1)])
+
+
+class FakeClient:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+def build_app(controller):
+    app = FastAPI()
+
+    @app.post("/analyze")
+    def analyze(request_id: str):
+        # Distinct bytes per request so single-flight does not coalesce them.
+        return feedback_service.get_errorbouding_from_image(
+            gcs_uri="gs://unused/unused.png", image_bytes=request_id.encode()
+        )
+
+    if controller is not None:
+        app.add_middleware(AdmissionMiddleware, controller=controller, path_prefixes=["/analyze"])
+    return app
+
+
+def serve(app):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def offer_load(base_url: str, rate: float, duration: float, timeout: float):
+    results = []  # (status or exception name, latency seconds)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one(i: int):
+            start = time.perf_counter()
+            try:
+                response = await client.post("/analyze", params={"request_id": f"req-{i}-{time.time_ns()}"}, content=b"x" * 2048)
+                results.append((response.status_code, time.perf_counter() - start, response.headers.get("retry-after")))
+            except httpx.TimeoutException:
+                results.append(("timeout", time.perf_counter() - start, None))
+
+        tasks = []
+        for i in range(int(rate * duration)):
+            tasks.append(asyncio.create_task(one(i)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+    return results
+
+
+def report(name: str, results) -> None:
+    ok = sorted(latency for status, latency, _ in results if status == 200)
+    shed = [retry for status, _, retry in results if status == 503]
+    other = len(results) - len(ok) - len(shed)
+    line = f"{name}: {len(ok)} ok, {len(shed)} shed (503), {other} other"
+    if ok:
+        p99 = ok[min(len(ok) - 1, int(len(ok) * 0.99))]
+        line += f" | ok latency p50 {statistics.median(ok):.2f}s p99 {p99:.2f}s max {ok[-1]:.2f}s"
+    if shed:
+        line += f" | Retry-After {min(int(r) for r in shed)}-{max(int(r) for r in shed)}s"
+    print(line)
+
+
+def run_phase(name, controller, models, rate, duration, timeout):
+    feedback_service.get_genai_client = lambda location=None: FakeClient(models)
+    server, thread, base_url = serve(build_app(controller))
+    try:
+        results = asyncio.run(offer_load(base_url, rate, duration, timeout))
+        time.sleep(models.latency * 3)  # let abandoned work reach its checkpoint
+    finally:
+        server.should_exit = True
+        thread.join()
+    report(name, results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=30, help="Offered requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of offered load")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="Seconds per fake model call (two per request)")
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--target-delay", type=float, default=1.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--max-queue-wait", type=float, default=5.0)
+    args = parser.parse_args()
+
+    service_time = 2 * args.model_latency
+    print(
+        f"offered {args.rate:.0f} req/s for {args.duration:.0f}s; capacity with admission "
+        f"~{args.max_in_flight / service_time:.1f} req/s ({args.max_in_flight} in flight x {service_time:.1f}s)"
+    )
+
+    def controller():
+        return AdmissionController(
+            max_in_flight=args.max_in_flight,
+            target_delay=args.target_delay,
+            interval=args.interval,
+            max_queue_wait=args.max_queue_wait,
+        )
+
+    run_phase("no admission  ", None, FakeModels(args.model_latency), args.rate, args.duration, timeout=120)
+    admitted = controller()
+    results = run_phase("with admission", admitted, FakeModels(args.model_latency), args.rate, args.duration, timeout=120)
+    print(f"  metrics: {admitted.snapshot()}")
+    bound = args.max_queue_wait + service_time
+    worst = max((latency for status, latency, _ in results if status == 200), default=0.0)
+    assert worst <= bound + 1.0, f"admitted latency {worst:.2f}s exceeds {bound:.2f}s"
+
+    # Clients give up after half a model call: queued ones must never start,
+    # running ones must stop before the error-selection call.
+    impatient = controller()
+    models = FakeModels(args.model_latency)
+    run_phase("impatient     ", impatient, models, rate=args.max_in_flight * 4, duration=1, timeout=args.model_latency / 2)
+    snapshot = impatient.snapshot()
+    print(f"  metrics: {snapshot}; model calls {models.calls}")
+    assert models.calls["errors"] == 0, models.calls
+    assert snapshot["disconnected_queued"] > 0 and snapshot["disconnected_running"] > 0, snapshot
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Box Geometry Benchmark
+======================
+
+Times the vectorized box helpers in app.services.box_geometry on synthetic
+detections at increasing box counts, with and without the shapely STRtree.
+
+Usage:
+    python benchmarks/bench_box_geometry.py [--sizes 100 1000 5000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import box_geometry
+
+
+def random_boxes(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Generates n boxes in the 0-1000 frame, sized like handwritten symbols."""
+    origin = rng.uniform(0, 960, size=(n, 2))
+    size = rng.uniform(8, 40, size=(n, 2))
+    return np.hstack([origin, origin + size])
+
+
+def best_of(repeat: int, fn, *args, **kwargs) -> float:
+    """Returns the best wall time in milliseconds over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(sizes, repeat: int) -> None:
+    rng = np.random.default_rng(42)
+    have_shapely = box_geometry.STRtree is not None
+    default_threshold = box_geometry.STRTREE_MIN_PAIRS
+
+    print(f"shapely STRtree available: {have_shapely}")
+    print(f"{'boxes':>8} {'mode':>8} {'clamp+valid':>12} {'nms':>10} {'snap(5)':>10} {'snap(all)':>10}")
+
+    modes = [("dense", float("inf"))]
+    if have_shapely:
+        modes.append(("strtree", 0))
+
+    for n in sizes:
+        raw = box_geometry.to_model_boxes(random_boxes(rng, n)).tolist()
+        boxes, _ = box_geometry.from_model_boxes(raw)
+        errors = random_boxes(rng, 5)
+        many_errors = random_boxes(rng, n)
+
+        for mode, threshold in modes:
+            box_geometry.STRTREE_MIN_PAIRS = threshold
+            t_clamp = best_of(repeat, lambda: box_geometry.valid_mask(box_geometry.clamp_boxes(boxes)))
+            t_nms = best_of(repeat, box_geometry.non_max_suppression, boxes, iou_threshold=0.5)
+            t_snap = best_of(repeat, box_geometry.snap_to_regions, errors, boxes)
+            t_snap_all = best_of(repeat, box_geometry.snap_to_regions, many_errors, boxes)
+            print(f"{n:>8} {mode:>8} {t_clamp:>10.2f}ms {t_nms:>8.2f}ms {t_snap:>8.2f}ms {t_snap_all:>8.2f}ms")
+
+    box_geometry.STRTREE_MIN_PAIRS = default_threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 300, 1000, 3000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Circuit Breaker Fault Injection Check
+=====================================
+
+Drives feedback_service.get_errorbouding_from_image and
+gcs_service.download_image_bytes through fault-injecting fakes (a GenAI client
+that can fail or stall, a storage client that can fail) and checks that:
+
+* the breaker opens on the failure-rate and slow-call thresholds,
+* once open, analyses return in milliseconds: the last feedback for a known
+  image with status "cached", otherwise status "unavailable",
+* after the open period, half-open probes close the breaker again when the
+  dependency has recovered (and reopen it when it has not),
+* bad-request (4xx) errors are not counted: they never open the breaker,
+* /health reports the breaker states, and /metrics/health (with the
+  metrics token) their details.
+
+Breakers are configured for the test through the environment (1 s open
+period, 0.5 s slow-call limit) before the app is imported.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_circuit_breaker.py [--model-latency 0.05]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+OPEN_SECONDS = 1.0
+SLOW_CALL_SECONDS = 0.5
+os.environ["BREAKER_OPEN_SECONDS"] = str(OPEN_SECONDS)
+os.environ["VERTEX_SLOW_CALL_SECONDS"] = str(SLOW_CALL_SECONDS)
+os.environ["GCS_SLOW_CALL_SECONDS"] = str(SLOW_CALL_SECONDS)
+METRICS_TOKEN = os.environ["METRICS_TOKEN"] = "bench-metrics"
+
+from app.core import circuit_breaker
+from app.services import feedback_service, gcs_service
+
+
+class FakeRegion:
+    """A detected region, or an error pick (box and id) from the error-selection call."""
+
+    def __init__(self, box_2d, label, id=None):
+        self.box_2d = box_2d
+        self.label = label
+        self.id = id
+
+
+class FakeResponse:
+    def __init__(self, parsed):
+        self.parsed = parsed
+
+    def json(self):
+        return "{}"
+
+
+class BadRequest(Exception):
+    """Like the API's 400 INVALID_ARGUMENT for an image it cannot read."""
+    code = 400
+
+
+class FaultyModels:
+    """Stands in for client.models. `mode` is "ok", "fail", "bad" or "slow" and can be flipped at any time."""
+
+    def __init__(self, latency: float, slow_latency: float):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.mode = "ok"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        with self._lock:
+            self.calls += 1
+        if self.mode == "fail":
+            time.sleep(self.latency)
+            raise RuntimeError("injected: 503 UNAVAILABLE")
+        if self.mode == "bad":
+            raise BadRequest("injected: 400 INVALID_ARGUMENT")
+        time.sleep(self.slow_latency if self.mode == "slow" else self.latency)
+        if "errors only" in config.system_instruction:
+            return FakeResponse([FakeRegion([300, 100, 400, 400], "=7", id=1)])
+        return FakeResponse([FakeRegion([100, 100, 200, 400], "2x+3"), FakeRegion([300, 100, 400, 400], "=7")])
+
+
+class FakeClient:
+    def __init__(self, models):
+        self.models = models
+
+
+class FaultyBlob:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def download_as_bytes(self):
+        self.storage.calls += 1
+        if self.storage.fail:
+            raise ConnectionError("injected: GCS unreachable")
+        return b"stored-canvas"
+
+
+class FaultyStorage:
+    def __init__(self):
+        self.fail = False
+        self.calls = 0
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name):
+        return FaultyBlob(self)
+
+
+def analyze(image: bytes) -> tuple:
+    start = time.perf_counter()
+    result = feedback_service.get_errorbouding_from_image(gcs_uri="gs://unused/unused.png", image_bytes=image)
+    return result, time.perf_counter() - start
+
+
+def check_state_machine() -> None:
+    now = [0.0]
+    breaker = circuit_breaker.CircuitBreaker(
+        "unit", window_size=10, minimum_calls=4, open_seconds=10, half_open_probes=2, slow_call_seconds=1.0,
+        clock=lambda: now[0],
+    )
+    for failed in (False, True, False):
+        breaker.record(0.1, RuntimeError() if failed else None)
+    assert breaker.state == circuit_breaker.CLOSED  # below minimum_calls
+    breaker.record(0.1, RuntimeError())
+    assert breaker.state == circuit_breaker.OPEN  # 2 of 4 failed
+    assert not breaker.allow()
+    now[0] = 10.0
+    assert breaker.allow() and breaker.allow() and not breaker.allow()  # two probes only
+    breaker.record(0.1)
+    breaker.record(2.0)  # a slow probe counts against recovery
+    assert breaker.state == circuit_breaker.OPEN
+    now[0] = 20.0
+    assert breaker.allow() and breaker.allow()
+    breaker.record(0.1)
+    breaker.record(0.1)
+    assert breaker.state == circuit_breaker.CLOSED
+    for _ in range(4):
+        breaker.record(1.5)
+    assert breaker.state == circuit_breaker.OPEN  # slow-call rate
+    print("State machine: failure rate, slow calls, half-open probing OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    check_state_machine()
+
+    breaker = feedback_service.vertex_breaker
+    models = FaultyModels(args.model_latency, slow_latency=SLOW_CALL_SECONDS + args.model_latency)
+    feedback_service.get_genai_client = lambda location=None: FakeClient(models)
+
+    result, elapsed = analyze(b"known-canvas")
+    assert result["status"] == "ok" and result["errors"], result
+    print(f"Healthy analysis: {elapsed * 1000:.0f} ms")
+
+    models.mode = "fail"
+    i = 0
+    while breaker.state == circuit_breaker.CLOSED:
+        result, _ = analyze(f"new-canvas-{i}".encode())
+        assert result["status"] == "unavailable", result
+        i += 1
+    print(f"Failures: breaker opened after {i} failing analyses ({breaker.snapshot()['failure_rate']:.0%} failed)")
+
+    calls_before = models.calls
+    result, elapsed = analyze(b"known-canvas")
+    assert result["status"] == "cached" and result["errors"], result
+    fast_fail = elapsed
+    result, elapsed = analyze(b"never-seen")
+    assert result["status"] == "unavailable", result
+    assert models.calls == calls_before, "open breaker must not call the model"
+    print(f"Open: cached result in {fast_fail * 1000:.1f} ms, unavailable in {elapsed * 1000:.1f} ms, no model calls")
+
+    time.sleep(OPEN_SECONDS)
+    result, _ = analyze(b"probe-while-down")  # the probe fails -> reopen
+    assert breaker.state == circuit_breaker.OPEN
+    time.sleep(OPEN_SECONDS)
+    models.mode = "ok"
+    analyze(b"probe-1")  # detection + error call: two successful probes
+    assert breaker.state == circuit_breaker.CLOSED, breaker.snapshot()
+    print("Recovery: failed probe reopened the breaker, successful probes closed it")
+
+    models.mode = "bad"
+    for i in range(10):
+        result, _ = analyze(f"unreadable-canvas-{i}".encode())
+        assert result["status"] == "unavailable", result
+    assert breaker.state == circuit_breaker.CLOSED and breaker.snapshot()["failure_rate"] == 0, breaker.snapshot()
+    print("Bad requests: 10 rejected analyses left the breaker closed")
+
+    models.mode = "slow"
+    i = 0
+    while breaker.state == circuit_breaker.CLOSED:
+        analyze(f"slow-canvas-{i}".encode())
+        i += 1
+    print(f"Slow calls: breaker opened after {i} slow analyses ({breaker.snapshot()['slow_call_rate']:.0%} slow)")
+    time.sleep(OPEN_SECONDS)
+    models.mode = "ok"
+    analyze(b"probe-2")
+    assert breaker.state == circuit_breaker.CLOSED
+
+    storage = FaultyStorage()
+    gcs_service.get_storage_client = lambda: storage
+    storage.fail = True
+    while gcs_service.gcs_breaker.state == circuit_breaker.CLOSED:
+        result = feedback_service.get_errorbouding_from_image(gcs_uri="gs://bucket/canvas.png")
+        assert result["status"] == "unavailable", result
+    downloads = storage.calls
+    start = time.perf_counter()
+    result = feedback_service.get_errorbouding_from_image(gcs_uri="gs://bucket/canvas.png")
+    assert result["status"] == "unavailable" and storage.calls == downloads
+    print(f"GCS: breaker opened after {downloads} failed downloads; next analysis failed fast in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    health = client.get("/health").json()
+    assert health["status"] == "degraded" and health["dependencies"]["gcs"] == circuit_breaker.OPEN, health
+    print(f"/health: {health['status']}, vertex={health['dependencies']['vertex']}, gcs={health['dependencies']['gcs']}")
+    assert client.get("/metrics/health").status_code == 401
+    details = client.get("/metrics/health", headers={"Authorization": f"Bearer {METRICS_TOKEN}"}).json()
+    assert details["dependencies"]["gcs"]["retry_after_seconds"] >= 1, details["dependencies"]
+    print(f"/metrics/health: gcs last_error {details['dependencies']['gcs']['last_error']!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Cold Start Benchmark
+====================
+
+Measures time-to-first-healthy-response of `app.main:app`: a fresh uvicorn
+process is spawned and `GET /` is polled until it returns 200. This is the
+number Cloud Run pays on every scale-from-zero.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_cold_start.py [--runs 5] [--no-warmup]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_healthy(warmup: bool, timeout: float) -> float:
+    """Starts one server process and returns seconds until `/` answers 200."""
+    port = free_port()
+    env = dict(os.environ, WARMUP_ON_STARTUP=str(warmup).lower())
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Server exited early with code {proc.returncode}; check your .env")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"Server not healthy after {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--no-warmup", action="store_true", help="Disable the background SDK warm-up task")
+    args = parser.parse_args()
+
+    samples = [time_to_healthy(not args.no_warmup, args.timeout) * 1000 for _ in range(args.runs)]
+    print(f"time-to-first-healthy-response over {args.runs} runs (warm-up {'off' if args.no_warmup else 'on'}):")
+    print(f"  min    {min(samples):8.1f} ms")
+    print(f"  median {statistics.median(samples):8.1f} ms")
+    print(f"  max    {max(samples):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
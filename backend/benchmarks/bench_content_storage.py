@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Image Storage Benchmark
+=========================================
+
+Replays a submission stream through gcs_service.upload_image_to_gcs against a
+local storage backend (a directory standing in for the bucket, with simulated
+round-trip time and bandwidth) and compares the uuid layout with the
+content-addressed one (GCS_CONTENT_ADDRESSED):
+
+* a share of submissions are client retries of the user's previous image,
+  which land on the same instance,
+* a share re-submit an older image of the same user after the request moved
+  to another instance, which does not know the object yet (the upload's
+  "does not exist" precondition catches it),
+* the rest are new canvases.
+
+Reports bytes sent, bytes stored, objects and upload latency for both layouts.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_content_storage.py [--submissions 400] [--retry-rate 0.25] [--resubmit-rate 0.1]
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import UploadFile
+from google.api_core.exceptions import PreconditionFailed
+
+from app.core.config import settings
+from app.services import gcs_service
+
+
+class LocalBlob:
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def upload_from_file(self, file, content_type=None):
+        self.upload_from_string(file.read(), content_type=content_type)
+
+    def upload_from_string(self, data: bytes, content_type=None, if_generation_match=None):
+        self.bucket.client.transfer(len(data))
+        if if_generation_match == 0 and os.path.exists(self.path):
+            raise PreconditionFailed(f"{self.name} already exists")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def download_as_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.bucket.client.transfer(len(data))
+        return data
+
+
+class LocalBucket:
+    def __init__(self, client: "LocalStorageClient", name: str):
+        self.client = client
+        self.name = name
+        self.root = os.path.join(client.root, name)
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self, name)
+
+
+class LocalStorageClient:
+    """google.cloud.storage.Client stand-in on the local filesystem, with simulated network cost."""
+
+    def __init__(self, root: str, rtt: float, bandwidth: float):
+        self.root = root
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.bytes_sent = 0
+
+    def bucket(self, name: str) -> LocalBucket:
+        return LocalBucket(self, name)
+
+    def transfer(self, size: int) -> None:
+        self.bytes_sent += size
+        time.sleep(self.rtt + size / self.bandwidth)
+
+    def stored(self):
+        sizes = [
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(self.root)
+            for name in names
+        ]
+        return len(sizes), sum(sizes)
+
+
+def build_stream(args):
+    """(instance, user, image bytes) per submission."""
+    rng = random.Random(7)
+    history = {}  # user -> images submitted so far
+    last_instance = {}  # user -> instance that served their last submission
+    stream = []
+    for _ in range(args.submissions):
+        user = f"user-{rng.randrange(args.users)}"
+        images = history.setdefault(user, [])
+        roll = rng.random()
+        if images and roll < args.retry_rate:
+            stream.append((last_instance[user], user, images[-1]))
+            continue
+        instance = last_instance[user] = rng.randrange(args.instances)
+        if images and roll < args.retry_rate + args.resubmit_rate:
+            stream.append((instance, user, rng.choice(images)))
+            continue
+        image = rng.randbytes(rng.randint(args.min_kb, args.max_kb) * 1024)
+        images.append(image)
+        stream.append((instance, user, image))
+    return stream
+
+
+def run(stream, content_addressed: bool, args):
+    root = tempfile.mkdtemp(prefix="bench-storage-")
+    client = LocalStorageClient(root, rtt=args.rtt, bandwidth=args.bandwidth_mb * 1024 * 1024)
+    gcs_service.get_storage_client = lambda: client
+    settings.GCS_CONTENT_ADDRESSED = content_addressed
+    for key in gcs_service.upload_counters:
+        gcs_service.upload_counters[key] = 0
+    # Each simulated instance keeps its own index of known objects.
+    indexes = [OrderedDict() for _ in range(args.instances)]
+
+    latencies = []
+    try:
+        for instance, user, image in stream:
+            gcs_service._known_objects = indexes[instance]
+            file = UploadFile(file=io.BytesIO(image), filename="canvas.png", headers={"content-type": "image/png"})
+            start = time.perf_counter()
+            url = gcs_service.upload_image_to_gcs(file=file, user_id=user, image_bytes=image)
+            latencies.append(time.perf_counter() - start)
+            assert url, "upload failed"
+        objects, stored = client.stored()
+    finally:
+        shutil.rmtree(root)
+    return {
+        "sent": client.bytes_sent,
+        "stored": stored,
+        "objects": objects,
+        "latencies": sorted(latencies),
+        "counters": dict(gcs_service.upload_counters),
+    }
+
+
+def report(name: str, result: dict) -> None:
+    latencies = result["latencies"]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name}: sent {result['sent'] / 2**20:.1f} MiB, stored {result['stored'] / 2**20:.1f} MiB "
+        f"in {result['objects']} objects | upload p50 {statistics.median(latencies) * 1000:.0f} ms "
+        f"p95 {p95 * 1000:.0f} ms, total {sum(latencies):.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submissions", type=int, default=400)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--instances", type=int, default=3, help="Simulated Cloud Run instances")
+    parser.add_argument("--retry-rate", type=float, default=0.25, help="Share of submissions that retry the previous image")
+    parser.add_argument("--resubmit-rate", type=float, default=0.1, help="Share that re-submit an older image elsewhere")
+    parser.add_argument("--min-kb", type=int, default=40)
+    parser.add_argument("--max-kb", type=int, default=400)
+    parser.add_argument("--rtt", type=float, default=0.03, help="Simulated round trip per storage call, seconds")
+    parser.add_argument("--bandwidth-mb", type=float, default=20, help="Simulated upload bandwidth, MiB/s")
+    args = parser.parse_args()
+
+    stream = build_stream(args)
+    unique = {(user, image) for _, user, image in stream}
+    print(f"{len(stream)} submissions, {len(unique)} distinct (user, image) pairs, {args.instances} instances")
+
+    legacy = run(stream, content_addressed=False, args=args)
+    report("uuid layout             ", legacy)
+    addressed = run(stream, content_addressed=True, args=args)
+    report("content-addressed layout", addressed)
+    print(f"  counters: {addressed['counters']}")
+
+    saved_sent = 1 - addressed["sent"] / legacy["sent"]
+    saved_stored = 1 - addressed["stored"] / legacy["stored"]
+    print(f"  {saved_sent:.0%} fewer bytes sent, {saved_stored:.0%} fewer bytes stored")
+    assert addressed["objects"] == len(unique), (addressed["objects"], len(unique))
+    assert addressed["sent"] < legacy["sent"] and addressed["stored"] < legacy["stored"]
+
+
+if __name__ == "__main__":
+    main()
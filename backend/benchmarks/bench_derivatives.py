@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Image Derivatives Check
+=======================
+
+Renders the thumbnail and annotated WebP derivatives of
+app/services/image_derivatives.py for a photo-sized JPEG of handwriting
+(--width x --height, noisy like a phone photo of paper) and reports:
+
+* render time (decode, resize, draw, encode) as mean and p95 over --runs,
+* the size of each derivative next to the original, and what a history
+  page of --page entries moves with thumbnails instead of originals,
+* that the boxes are drawn where the 0-1000 frame puts them, and that the
+  object names sit next to the original and change with the boxes.
+
+It then sends submissions through the real submission endpoint, with the
+upload, the analysis and the storage client replaced by fakes, and checks
+that the derivatives are uploaded as WebP with an immutable Cache-Control,
+that their URLs are in the response and in /submission/history, and that a
+slow render leaves them null without failing the submission. The database
+is a temporary SQLite file.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_derivatives.py [--width 4032] [--height 3024] [--runs 10] [--page 20]
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.update(OCR_ENABLED="false", WARMUP_ON_STARTUP="false", ADMISSION_CONTROL="false", QUOTA_ENABLED="false")
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from app.core.config import settings
+from app.services import image_derivatives
+
+ERRORS = [
+    {"error_text": "= 7", "box_2d": [120.0, 80.0, 380.0, 260.0]},
+    {"error_text": "x = 3", "box_2d": [500.0, 600.0, 900.0, 760.0]},
+]
+BUCKET_URL = f"https://storage.googleapis.com/{settings.GCS_BUCKET_NAME}"
+
+
+class FakeStorage:
+    """Stands in for the storage client: keeps uploaded blobs with their metadata."""
+
+    def __init__(self):
+        self.blobs = {}
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name):
+        storage = self
+
+        class Blob:
+            cache_control = None
+            public_url = f"{BUCKET_URL}/{name}"
+
+            def upload_from_string(self, data, content_type=None):
+                time.sleep(storage.delay)
+                with storage._lock:
+                    storage.blobs[name] = (data, content_type, self.cache_control)
+
+        return Blob()
+
+
+def make_photo(width: int, height: int) -> bytes:
+    """Lines of pen strokes on off-white paper with sensor noise, as a phone JPEG."""
+    rng = random.Random(7)
+    paper = Image.new("L", (width, height), 232)
+    draw = ImageDraw.Draw(paper)
+    stroke = max(2, width // 600)
+    for line in range(12):
+        y = height * (line + 1) // 14
+        x = width // 12
+        while x < width * 11 // 12:
+            points = [(x + rng.randint(0, 40), y + rng.randint(-30, 30)) for _ in range(6)]
+            draw.line(points, fill=rng.randint(20, 60), width=stroke)
+            x += rng.randint(30, 90)
+    noise = Image.effect_noise((width, height), 12)
+    photo = Image.blend(paper, noise, 0.15).filter(ImageFilter.GaussianBlur(1)).convert("RGB")
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def check_boxes(annotated: bytes) -> None:
+    with Image.open(io.BytesIO(annotated)) as image:
+        image = image.convert("RGB")
+        width, height = image.size
+        for error in ERRORS:
+            x1, y1, x2, y2 = error["box_2d"]
+            # Middle of the box's left edge, and its centre (not drawn on).
+            edge = image.getpixel((round(x1 * width / 1000), round((y1 + y2) / 2 * height / 1000)))
+            inside = image.getpixel((round((x1 + x2) / 2 * width / 1000), round((y1 + y2) / 2 * height / 1000)))
+            assert edge[0] > 150 and edge[1] < 110, (error, edge)
+            assert not (inside[0] > 150 and inside[1] < 110), (error, inside)
+
+
+def check_names() -> None:
+    original = f"{BUCKET_URL}/submissions/u1/sha256/abc"
+    thumbnail, annotated = image_derivatives.derivative_names(original, ERRORS)
+    again = image_derivatives.derivative_names(original, [dict(e) for e in ERRORS])
+    other = image_derivatives.derivative_names(original, ERRORS[:1])
+    assert thumbnail == "submissions/u1/sha256/abc.thumb.webp", thumbnail
+    assert annotated.startswith("submissions/u1/sha256/abc.annotated-") and annotated.endswith(".webp"), annotated
+    assert again == (thumbnail, annotated) and other[1] != annotated and other[0] == thumbnail
+    print(f"names: {thumbnail}, {annotated}")
+
+
+def check_endpoint(photo: bytes) -> None:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.security import User, get_current_user
+    from app.db.database import get_db, get_read_db
+    from app.db.partitions import create_schema
+    from app.main import app
+    from app.services import feedback_service, gcs_service
+
+    workdir = tempfile.mkdtemp(prefix="bench-derivatives-")
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", connect_args={"check_same_thread": False})
+    create_schema(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    storage = FakeStorage()
+    counter = iter(range(10**6))
+    gcs_service.get_storage_client = lambda: storage
+    gcs_service.upload_image_to_gcs = (
+        lambda file, user_id, image_bytes=None: f"{BUCKET_URL}/submissions/{user_id}/{next(counter)}.jpg"
+    )
+    feedback_service.get_errorbouding_from_image = (
+        lambda gcs_uri, image_bytes=None, problem_id=None: {"translated_handwriting": "2x + 3 = 7", "errors": ERRORS, "status": "ok"}
+    )
+    app.dependency_overrides[get_db] = get_bench_db
+    app.dependency_overrides[get_read_db] = get_bench_db
+    app.dependency_overrides[get_current_user] = lambda: User(uid="bench")
+    client = TestClient(app)
+
+    def submit(**params):
+        response = client.post(
+            "/api/v1/submission/submit/solution", params=params, files={"file": ("photo.jpg", photo, "image/jpeg")}
+        )
+        assert response.status_code == 201, response.text
+        return response
+
+    try:
+        full = submit().json()
+        compact = submit(compact="true").json()
+        for payload in (full, compact):
+            assert payload["thumbnail_url"].endswith(".thumb.webp"), payload
+            assert ".annotated-" in payload["annotated_url"], payload
+        stored = {f"{BUCKET_URL}/{name}": meta for name, meta in storage.blobs.items()}
+        data, content_type, cache_control = stored[full["thumbnail_url"]]
+        assert content_type == "image/webp" and cache_control == image_derivatives.CACHE_CONTROL
+        assert stored[full["annotated_url"]][1:] == ("image/webp", image_derivatives.CACHE_CONTROL)
+        print(f"endpoint: derivatives uploaded as {content_type}, Cache-Control {cache_control!r}")
+
+        # A render slower than the timeout: stored without derivatives.
+        storage.delay, timeout = 0.5, settings.DERIVATIVE_TIMEOUT_SECONDS
+        settings.DERIVATIVE_TIMEOUT_SECONDS = 0.1
+        try:
+            start = time.perf_counter()
+            slow = submit(compact="true").json()
+            waited = time.perf_counter() - start
+        finally:
+            storage.delay, settings.DERIVATIVE_TIMEOUT_SECONDS = 0.0, timeout
+        print(f"slow derivatives: submission stored after {waited:.2f}s with thumbnail_url={slow['thumbnail_url']}")
+        assert slow["thumbnail_url"] is None and slow["annotated_url"] is None and waited < 0.45
+
+        history = client.get("/api/v1/submission/history")
+        assert history.status_code == 200, history.text
+        entries = history.json()["submissions"]
+        assert [entry["submission_id"] for entry in entries] == [slow["submission_id"], compact["submission_id"], full["submission_id"]]
+        assert entries[1]["thumbnail_url"] == compact["thumbnail_url"] and entries[0]["thumbnail_url"] is None
+        print(f"history: {len(entries)} entries in {len(history.content)} bytes; counters {image_derivatives.snapshot()}")
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--page", type=int, default=20, help="Entries on a history page")
+    args = parser.parse_args()
+
+    photo = make_photo(args.width, args.height)
+    image_derivatives.render(photo, ERRORS)  # warm: Pillow's codecs load on first use
+    samples = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        thumbnail, annotated = image_derivatives.render(photo, ERRORS)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(f"render of a {args.width}x{args.height} JPEG ({len(photo) / 1024:.0f} KiB): "
+          f"mean {statistics.mean(samples):.0f} ms, p95 {samples[min(len(samples) - 1, int(len(samples) * 0.95))]:.0f} ms")
+    with Image.open(io.BytesIO(thumbnail)) as image:
+        thumbnail_size = image.size
+    with Image.open(io.BytesIO(annotated)) as image:
+        annotated_size = image.size
+    print(f"thumbnail {thumbnail_size[0]}x{thumbnail_size[1]}: {len(thumbnail) / 1024:.1f} KiB "
+          f"({len(photo) / len(thumbnail):.0f}x smaller); annotated {annotated_size[0]}x{annotated_size[1]}: "
+          f"{len(annotated) / 1024:.1f} KiB ({len(photo) / len(annotated):.0f}x smaller)")
+    print(f"history page of {args.page}: {args.page * len(thumbnail) / 1024:.0f} KiB of thumbnails "
+          f"instead of {args.page * len(photo) / 2**20:.1f} MiB of originals")
+    assert max(thumbnail_size) == settings.DERIVATIVE_THUMBNAIL_SIDE
+    assert max(annotated_size) == min(settings.DERIVATIVE_ANNOTATED_SIDE, max(args.width, args.height))
+    assert len(thumbnail) * 20 < len(photo) and len(annotated) * 3 < len(photo)
+    check_boxes(annotated)
+    check_names()
+    check_endpoint(photo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Submissions Export Benchmark
+============================
+
+Grows a submissions table step by step (rows in submission order over the
+past --days days, 40 problems, about 1 KB of feedback with six errors each)
+and, at every size,
+
+* runs the incremental export (app/services/submission_export.py) into a
+  standing destination, which only picks up the rows added since the last
+  step, and reports its time and throughput,
+* runs a full export into an empty destination under tracemalloc and
+  compares its peak with loading the same rows the naive way (one
+  `.all()`).
+
+The peak of the full export should stay flat as the table grows while the
+naive load grows with it. Finally the older half of the rows is
+archived (a local directory stands in for the bucket) and exported again,
+checking that archived rows come out with their feedback.
+
+Every export is read back with pyarrow.dataset and checked row for row
+against the table. Runs in its own schema (bench_export) of the given
+database, which is dropped at the start and the end.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_export.py [--dsn postgresql://...] [--sizes 50000,200000,400000] [--days 60]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+
+from bench_content_storage import LocalStorageClient
+
+from app.core.config import settings
+from app.db import models, partitions
+from app.services import gcs_service, submission_archive, submission_export
+
+SCHEMA = "bench_export"
+
+# About 1 KB of feedback JSON per row, submitted_at increasing with the id.
+FILL_SQL = """
+INSERT INTO submissions (user_id, problem_id, image_gcs_url, ocr_text, ai_feedback, submitted_at)
+SELECT
+    'user-' || (g * 7919 % 2000),
+    'problem-' || (g % 40),
+    'https://storage.googleapis.com/bench/submissions/' || md5(g::text) || '.png',
+    '2x + 3 = ' || (g % 11),
+    '{"translated_handwriting": "2x + 3 = ' || (g % 11) || '", "errors": ['
+        || (SELECT string_agg('{"error_text": "Sign error in step ' || k || ' (' || md5((g * k)::text) || ')", '
+                || '"box_2d": [' || (g * k) % 900 || ', ' || (g + k) % 900 || ', ' || ((g * k) % 900 + 80) || ', '
+                || ((g + k) % 900 + 60) || ']}', ', ') FROM generate_series(1, 6) k)
+        || '], "status": "ok"}',
+    CAST(:origin AS timestamptz) + g * CAST(:step AS interval)
+FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) g
+"""
+ERRORS_PER_ROW = 6
+
+
+def make_engine(dsn: str):
+    engine = create_engine(dsn, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    return engine
+
+
+def drop_schema(engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+def fill(engine, start: int, stop: int, origin: datetime, step: timedelta) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(FILL_SQL), {
+            "origin": origin.isoformat(), "step": f"{step.total_seconds()} seconds", "start": start, "stop": stop,
+        })
+        connection.execute(text("ANALYZE submissions"))
+
+
+def run_export(Session, dest: str, until: datetime) -> tuple:
+    db = Session()
+    start = time.perf_counter()
+    try:
+        stats = submission_export.export_submissions(db, dest, until=until)
+    finally:
+        db.close()
+    return stats, time.perf_counter() - start
+
+
+def traced(fn):
+    """(result, peak bytes allocated by Python) of fn()."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def naive_load(Session) -> int:
+    db = Session()
+    try:
+        rows = db.execute(select(
+            models.Submission.id, models.Submission.user_id, models.Submission.problem_id,
+            models.Submission.submitted_at, models.Submission.image_gcs_url, models.Submission.ocr_text,
+            models.Submission.ai_feedback, models.Submission.archive_uri,
+        )).all()
+        return len(rows)
+    finally:
+        db.close()
+
+
+def check_dataset(dest: str, rows: int) -> None:
+    submissions = ds.dataset(os.path.join(dest, "submissions"), format="parquet", partitioning="hive")
+    errors = ds.dataset(os.path.join(dest, "errors"), format="parquet", partitioning="hive")
+    table = submissions.to_table(columns=["submission_id", "translated_handwriting", "error_count", "problem_id"])
+    assert table.num_rows == rows, (table.num_rows, rows)
+    ids = table.column("submission_id").to_pylist()
+    assert len(set(ids)) == rows and min(ids) == 1 and max(ids) == rows
+    assert table.column("translated_handwriting").null_count == 0
+    assert pa.compute.all(pa.compute.equal(table.column("error_count"), ERRORS_PER_ROW)).as_py()
+    assert errors.count_rows() == rows * ERRORS_PER_ROW, errors.count_rows()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=str(settings.DATABASE_URL), help="PostgreSQL URL (default: DATABASE_URL)")
+    parser.add_argument("--sizes", default="50000,200000,400000", help="Row counts to measure at, ascending")
+    parser.add_argument("--days", type=int, default=60, help="History the rows are spread over")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    now = datetime.now(timezone.utc)
+    step = timedelta(days=args.days) / sizes[-1]
+    origin = now - timedelta(days=args.days) - step
+    engine = make_engine(args.dsn)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    workdir = tempfile.mkdtemp(prefix="bench-export-")
+    standing = os.path.join(workdir, "standing")
+    peaks = {}
+    try:
+        partitions.create_schema(engine)
+        with engine.begin() as connection:
+            partitions.ensure_partitions(connection, today=origin.date(), ahead=args.days // 28 + 2)
+        loaded = 0
+        for size in sizes:
+            fill(engine, loaded + 1, size, origin, step)
+            stats, seconds = run_export(Session, standing, until=now)
+            assert stats["rows"] == size - loaded, stats
+            check_dataset(standing, size)
+            print(
+                f"{size:>8} rows: incremental export of {stats['rows']} new rows in {seconds:.1f}s "
+                f"({stats['rows'] / seconds:,.0f} rows/s, {stats['files']} files)"
+            )
+            loaded = size
+
+            fresh = os.path.join(workdir, f"full-{size}")
+            (stats, _), python_peak = traced(lambda: run_export(Session, fresh, until=now))
+            check_dataset(fresh, size)
+            shutil.rmtree(fresh)
+            _, naive_peak = traced(lambda: naive_load(Session))
+            peaks[size] = (python_peak, naive_peak)
+            print(
+                f"{'':>8}       full export peak {python_peak / 2**20:.1f} MiB"
+                f" | naive .all() load peak {naive_peak / 2**20:.1f} MiB"
+            )
+
+        stats, _ = run_export(Session, standing, until=now)
+        assert stats["rows"] == 0, stats
+        print("  rerun with no new rows: nothing exported")
+
+        root = os.path.join(workdir, "bucket")
+        gcs_service.get_storage_client = lambda: LocalStorageClient(root, rtt=0.0, bandwidth=float("inf"))
+        cutoff = origin + timedelta(days=args.days / 2)
+        db = Session()
+        try:
+            archived = submission_archive.archive_submissions(db, before=cutoff)["rows"]
+        finally:
+            db.close()
+        archived_dest = os.path.join(workdir, "archived")
+        stats, seconds = run_export(Session, archived_dest, until=now)
+        check_dataset(archived_dest, sizes[-1])
+        exported = ds.dataset(os.path.join(archived_dest, "submissions"), format="parquet", partitioning="hive")
+        from_archive = exported.count_rows(filter=ds.field("archived"))
+        assert from_archive == archived, (from_archive, archived)
+        print(
+            f"  after archiving {archived} rows: full export in {seconds:.1f}s "
+            f"({stats['rows'] / seconds:,.0f} rows/s), {from_archive} rows read from the archive"
+        )
+    finally:
+        shutil.rmtree(workdir)
+        drop_schema(engine)
+        engine.dispose()
+
+    first, last = sizes[0], sizes[-1]
+    export_growth = peaks[last][0] / peaks[first][0]
+    naive_growth = peaks[last][1] / peaks[first][1]
+    print(f"Arrow memory pool high-water mark over all runs: {pa.default_memory_pool().max_memory() / 2**20:.1f} MiB")
+    print(f"Python peak growth {first} -> {last} rows: export x{export_growth:.1f}, naive load x{naive_growth:.1f}")
+    assert export_growth < 1.5 < naive_growth, (export_growth, naive_growth)
+
+
+if __name__ == "__main__":
+    main()
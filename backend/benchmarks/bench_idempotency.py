@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Idempotency Key Check
+=====================
+
+Sends retried submissions through the real submission endpoint, with the
+upload and the analysis replaced by counting fakes (the analysis sleeps
+--analysis-latency seconds like a model call), and checks that:
+
+* a retry of a finished request gets the stored response, byte for byte,
+  without a second upload, analysis or submissions row,
+* --retries concurrent requests with one key run the analysis once and all
+  get its response (the others wait for the first),
+* reusing a key for a different image is a 422,
+* a request that fails releases its key, so the retry runs again; one
+  that gets a degraded result is not replayed either, and its retry
+  updates the same submissions row,
+* a key left in progress by a dead worker is taken over after
+  IDEMPOTENCY_LOCK_SECONDS, and a retry that outwaits
+  IDEMPOTENCY_WAIT_SECONDS gets a 409 with Retry-After,
+* a waiter on another worker (no local wake-up) finds the response by
+  polling the table.
+
+It also reports the added latency of a keyed request and of a replay. The
+database is a temporary SQLite file, or with --dsn a PostgreSQL database (in
+its own schema, bench_idempotency, dropped at the start and the end).
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_idempotency.py [--dsn postgresql://...] [--retries 8] [--analysis-latency 0.5]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.update(OCR_ENABLED="false", WARMUP_ON_STARTUP="false", ADMISSION_CONTROL="false")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.security import User, get_current_user
+from app.db import models
+from app.db.database import get_db
+from app.db.partitions import create_schema
+from app.main import app
+from app.services import feedback_service, gcs_service, idempotency, problem_catalog
+
+SCHEMA = "bench_idempotency"
+URL = "/api/v1/submission/submit/solution"
+
+
+class FakePipeline:
+    """Counts uploads and analyses; the analysis sleeps and can be made to fail or degrade once."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.uploads = 0
+        self.analyses = 0
+        self.fail_next = False
+        self.degrade_next = False
+        self._lock = threading.Lock()
+
+    def upload(self, file, user_id, image_bytes=None):
+        with self._lock:
+            self.uploads += 1
+        return f"https://storage.googleapis.com/{settings.GCS_BUCKET_NAME}/submissions/{user_id}/{len(image_bytes)}.jpg"
+
+    def analyse(self, gcs_uri, image_bytes=None, problem_id=None):
+        with self._lock:
+            self.analyses += 1
+            fail, self.fail_next = self.fail_next, False
+            degrade, self.degrade_next = self.degrade_next, False
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("injected model failure")
+        if degrade:
+            return {"translated_handwriting": "", "errors": [], "status": "unavailable"}
+        return {
+            "translated_handwriting": "2x + 3 = 7",
+            "errors": [{"error_text": "= 7", "box_2d": [120.0, 80.0, 180.0, 260.0]}],
+            "status": "ok",
+        }
+
+
+def make_engine(dsn: str):
+    if not dsn:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-idempotency-"), "bench.db")
+        return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    engine = create_engine(dsn, connect_args={"options": f"-csearch_path={SCHEMA}"}, pool_size=32)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    return engine
+
+
+def submit(client: TestClient, image: bytes, key: str = None, **params):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(URL, params=params, headers=headers, files={"file": ("photo.jpg", image, "image/jpeg")})
+
+
+def median_ms(fn, count: int) -> float:
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", help="PostgreSQL URL (default: a temporary SQLite file)")
+    parser.add_argument("--retries", type=int, default=8, help="Concurrent requests sharing one key")
+    parser.add_argument("--analysis-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    engine = make_engine(args.dsn)
+    create_schema(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def count(model) -> int:
+        with Session() as db:
+            return db.execute(select(func.count()).select_from(model)).scalar()
+
+    fake = FakePipeline(args.analysis_latency)
+    gcs_service.upload_image_to_gcs = fake.upload
+    feedback_service.get_errorbouding_from_image = fake.analyse
+    app.dependency_overrides[get_db] = get_bench_db
+    app.dependency_overrides[get_current_user] = lambda: User(uid="bench")
+    client = TestClient(app, raise_server_exceptions=False)
+    image = os.urandom(200_000)
+    try:
+        # Sequential retry of a finished request.
+        first = submit(client, image, key="retry-1", compact="true")
+        again = submit(client, image, key="retry-1", compact="true")
+        print(f"retry of a finished request: {first.status_code} then {again.status_code}, "
+              f"replayed={again.headers.get(idempotency.REPLAYED_HEADER)}")
+        assert first.status_code == again.status_code == 201, (first.text, again.text)
+        assert again.content == first.content and again.headers[idempotency.REPLAYED_HEADER] == "true"
+        assert (fake.uploads, fake.analyses, count(models.Submission)) == (1, 1, 1)
+        full = submit(client, image, key="retry-full")
+        assert submit(client, image, key="retry-full").content == full.content
+        assert full.json()["ai_feedback_data"]["errors"] and full.json()["submission_id"] == 2
+
+        # Concurrent retries while the first one runs.
+        before = fake.analyses
+        with ThreadPoolExecutor(args.retries) as pool:
+            responses = list(pool.map(lambda _: submit(client, image, key="burst", compact="true"), range(args.retries)))
+        ids = {response.json()["submission_id"] for response in responses}
+        replayed = sum(response.headers.get(idempotency.REPLAYED_HEADER) == "true" for response in responses)
+        print(f"{args.retries} concurrent requests with one key: {fake.analyses - before} analysis, "
+              f"submission ids {sorted(ids)}, {replayed} replayed")
+        assert fake.analyses - before == 1 and len(ids) == 1 and replayed == args.retries - 1
+        assert all(response.status_code == 201 for response in responses)
+
+        # Same key, different request.
+        conflict = submit(client, os.urandom(1000), key="retry-1", compact="true")
+        print(f"key reused for another image: {conflict.status_code}")
+        assert conflict.status_code == 422
+        assert submit(client, image, key="retry-1").status_code == 422  # other options, too
+
+        # A failure releases the key.
+        fake.fail_next = True
+        failed = submit(client, image, key="flaky")
+        retried = submit(client, image, key="flaky")
+        print(f"failed request then retry: {failed.status_code} then {retried.status_code}")
+        assert failed.status_code == 500 and retried.status_code == 201
+        assert idempotency.REPLAYED_HEADER not in retried.headers
+
+        # A degraded result is not replayed: the retry gets a real analysis, stored in the same row.
+        fake.degrade_next = True
+        rows = count(models.Submission)
+        degraded = submit(client, image, key="degraded")
+        retried = submit(client, image, key="degraded")
+        again = submit(client, image, key="degraded")
+        print(f"degraded result then retry: {degraded.json()['ai_feedback_data']['status']} "
+              f"then {retried.json()['ai_feedback_data']['status']}, submission ids "
+              f"{degraded.json()['submission_id']} and {retried.json()['submission_id']}")
+        assert degraded.status_code == retried.status_code == 201
+        assert idempotency.REPLAYED_HEADER not in retried.headers and retried.json()["ai_feedback_data"]["errors"]
+        assert retried.json()["submission_id"] == degraded.json()["submission_id"] and count(models.Submission) == rows + 1
+        assert again.headers[idempotency.REPLAYED_HEADER] == "true" and again.content == retried.content
+
+        # A key abandoned in progress by a dead worker, and a retry that gives up waiting.
+        request_hash = idempotency.fingerprint(
+            image, problem_id=problem_catalog.default_problem_id(), compact=True, pack_boxes=False
+        )
+        now = datetime.now(timezone.utc)
+        with Session() as db:
+            db.add(models.IdempotencyKey(
+                user_id="bench", key="abandoned", request_hash=request_hash, status=idempotency.IN_PROGRESS,
+                attempt=1, created_at=now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS + 60),
+            ))
+            db.add(models.IdempotencyKey(
+                user_id="bench", key="running", request_hash=request_hash, status=idempotency.IN_PROGRESS,
+                attempt=1, created_at=now,
+            ))
+            db.commit()
+        taken = submit(client, image, key="abandoned", compact="true")
+        print(f"key abandoned in progress: {taken.status_code}, taken over")
+        assert taken.status_code == 201 and idempotency.counters["taken_over"] == 1
+        wait, settings.IDEMPOTENCY_WAIT_SECONDS = settings.IDEMPOTENCY_WAIT_SECONDS, 0.3
+        try:
+            busy = submit(client, image, key="running", compact="true")
+        finally:
+            settings.IDEMPOTENCY_WAIT_SECONDS = wait
+        print(f"key still in progress elsewhere: {busy.status_code}, Retry-After {busy.headers.get('retry-after')}")
+        assert busy.status_code == 409 and busy.headers["retry-after"]
+
+        # A waiter on another worker: no local event, so it polls the table.
+        with Session() as db:
+            holder = idempotency.claim(db, user_id="bench", key="remote", request_hash="r" * 64)
+        idempotency._waiters.pop(("bench", "remote"))
+        poll, settings.IDEMPOTENCY_POLL_SECONDS = settings.IDEMPOTENCY_POLL_SECONDS, 0.05
+
+        def finish_later():
+            time.sleep(0.3)
+            with Session() as db:
+                idempotency.complete(db, holder.record, FastJSONResponse(content={"submission_id": 99}, status_code=201), 99)
+
+        try:
+            threading.Thread(target=finish_later).start()
+            start = time.perf_counter()
+            with Session() as db:
+                polled = idempotency.claim(db, user_id="bench", key="remote", request_hash="r" * 64)
+            waited = time.perf_counter() - start
+        finally:
+            settings.IDEMPOTENCY_POLL_SECONDS = poll
+        print(f"waiter on another worker: replay after {waited:.2f}s of polling")
+        assert polled.replay is not None and polled.replay.body == b'{"submission_id":99}'
+
+        # Latency with the model out of the way.
+        fake.latency = 0.0
+        plain = median_ms(lambda i: submit(client, image + i.to_bytes(4, "big"), compact="true"), 50)
+        keyed = median_ms(lambda i: submit(client, image + i.to_bytes(4, "big"), key=f"t-{i}", compact="true"), 50)
+        replay = median_ms(lambda i: submit(client, image + i.to_bytes(4, "big"), key=f"t-{i}", compact="true"), 50)
+        print(f"median request: {plain:.1f} ms without a key, {keyed:.1f} ms with a new key, {replay:.1f} ms replayed")
+
+        later = datetime.now(timezone.utc) + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS, seconds=1)
+        with Session() as db:
+            expired = idempotency.purge_expired(db, now=later)
+        print(f"purge after the TTL: {expired} keys deleted; counters {idempotency.snapshot()}")
+        assert count(models.IdempotencyKey) == 0
+    finally:
+        app.dependency_overrides.clear()
+        if args.dsn:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        else:
+            shutil.rmtree(os.path.dirname(engine.url.database))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
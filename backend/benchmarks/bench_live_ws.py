@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Live Analysis Load Test
+=======================
+
+Serves the app's live analysis WebSocket (/api/v1/live/ws) with uvicorn and a
+fake GenAI client, then connects hundreds of simulated writers at once. Each
+writer streams stroke batches for a few lines of "handwriting", pausing now
+and then like a student thinking, and waits for feedback on every line.
+
+Reports how many canvas updates turned into model calls, how long feedback on
+a completed line took, how often writers were throttled, and checks that:
+
+* every writer got feedback covering all of its lines,
+* model calls stayed within both the per-connection and the worker budget.
+
+Authentication is bypassed, and the live timings and budgets are set through
+the environment before the app is imported. With the defaults, 200 writers
+want about three times the worker budget: feedback slows down (reserved
+tokens are served in order, several lines per analysis) but model calls stay
+within budget. With --writers 30 the budget is not reached and feedback
+arrives about one debounce plus one analysis after a line is completed.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_live_ws.py [--writers 200] [--lines 4] [--model-latency 0.5] [--client-processes 4]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.update({
+    "WARMUP_ON_STARTUP": "false",
+    "ADMISSION_CONTROL": "false",
+    "ANALYSIS_ROUTING": "false",
+    "QUOTA_ENABLED": "false",
+    "LIVE_DEBOUNCE_SECONDS": "0.3",
+    "LIVE_MAX_WAIT_SECONDS": "2",
+    "LIVE_LINE_IDLE_SECONDS": "1",
+    "LIVE_ANALYSES_PER_MINUTE": "12",
+    "LIVE_ANALYSIS_BURST": "2",
+    "LIVE_WORKER_ANALYSES_PER_MINUTE": "480",
+})
+
+import uvicorn
+from websockets.asyncio.client import connect
+
+from app.api.v1.endpoints import live
+from app.core.config import settings
+from app.core.security import User
+from app.main import app
+from app.services import feedback_service, live_analysis
+
+CANVAS = (800, 600)
+LINE_HEIGHT = 60
+BATCH_INTERVAL = 0.5  # seconds between stroke batches (about one pen stroke each) while writing
+
+
+class FakeRegion:
+    """A detected region, or an error pick (box and id) from the error-selection call."""
+
+    def __init__(self, box_2d, label, id=None):
+        self.box_2d = box_2d
+        self.label = label
+        self.id = id
+
+
+class FakeResponse:
+    def __init__(self, parsed):
+        self.parsed = parsed
+
+    def json(self):
+        return "{}"
+
+
+class FakeModels:
+    """Stands in for client.models; sleeps like a remote model and counts calls per stage."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = {"detect": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        stage = "errors" if "errors only" in config.system_instruction else "detect"
+        with self._lock:
+            self.calls[stage] += 1
+        time.sleep(self.latency)
+        if stage == "detect":
+            return FakeResponse([FakeRegion([600, 100, 900, 400], "2x+3"), FakeRegion([600, 500, 900, 800], "=7")])
+        return FakeResponse([FakeRegion([600, 500, 900, 800], "=7", id=1)])
+
+
+class FakeClient:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+def serve():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", ws_max_queue=256))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"ws://127.0.0.1:{port}/api/v1/live/ws"
+
+
+def line_strokes(line: int, x: float, rng: random.Random):
+    """A short zigzag 'glyph' at x on the given line."""
+    top = 40 + line * LINE_HEIGHT * 2
+    points = [[x + i * 3, top + rng.uniform(0, LINE_HEIGHT)] for i in range(6)]
+    return [{"points": points, "width": 3, "erase": False}]
+
+
+async def writer(url: str, index: int, args, stats: dict) -> None:
+    rng = random.Random(index)
+    await asyncio.sleep(rng.uniform(0, 2))  # students don't all start at once
+    async with connect(url, max_queue=None) as socket_:
+        await socket_.send(json.dumps({"type": "auth", "token": f"writer-{index}"}))
+        assert json.loads(await socket_.recv())["type"] == "ready"
+
+        checked = 0
+        done_at = {}  # line number -> when it became complete
+        latencies = []
+
+        async def receive():
+            nonlocal checked
+            async for raw in socket_:
+                message = json.loads(raw)
+                if message["type"] == "feedback":
+                    now = time.perf_counter()
+                    for line in range(checked, message["lines_checked"]):
+                        if line in done_at:
+                            latencies.append(now - done_at[line])
+                    checked = max(checked, message["lines_checked"])
+                    stats["feedback"] += 1
+                elif message["type"] == "status":
+                    stats[message["state"]] += 1
+                elif message["type"] == "error":
+                    stats["errors"] += 1
+                if checked >= args.lines:
+                    return
+
+        receiver = asyncio.create_task(receive())
+        for line in range(args.lines):
+            if line > 0:
+                done_at[line - 1] = time.perf_counter()  # starting a line completes the one above
+            x = 20.0
+            for _ in range(int(args.seconds_per_line / BATCH_INTERVAL)):
+                await socket_.send(json.dumps({
+                    "type": "strokes", "width": CANVAS[0], "height": CANVAS[1],
+                    "strokes": line_strokes(line, x, rng),
+                }))
+                stats["updates"] += 1
+                x = min(CANVAS[0] - 40, x + 40)
+                await asyncio.sleep(BATCH_INTERVAL)
+                if rng.random() < 0.03:
+                    await asyncio.sleep(rng.uniform(0.4, 1.5))  # thinking
+        done_at[args.lines - 1] = time.perf_counter() + settings.LIVE_LINE_IDLE_SECONDS
+        try:
+            await asyncio.wait_for(receiver, timeout=args.timeout)
+        except asyncio.TimeoutError:
+            stats["incomplete"] += 1
+        stats["latencies"].extend(latencies)
+
+
+async def run_writers(url: str, indices, args) -> dict:
+    stats = {"updates": 0, "feedback": 0, "throttled": 0, "unavailable": 0, "errors": 0, "incomplete": 0, "latencies": []}
+    await asyncio.gather(*(writer(url, i, args, stats) for i in indices))
+    return stats
+
+
+def client_process(job):
+    url, indices, args = job
+    return asyncio.run(run_writers(url, indices, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=200, help="Concurrent WebSocket connections")
+    parser.add_argument("--lines", type=int, default=4, help="Lines each writer writes")
+    parser.add_argument("--seconds-per-line", type=float, default=8)
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Seconds per fake model call")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for the last feedback")
+    parser.add_argument("--client-processes", type=int, default=4, help="Processes the writers are spread over")
+    args = parser.parse_args()
+
+    models = FakeModels(args.model_latency)
+    feedback_service.get_genai_client = lambda location=None: FakeClient(models)
+    live.verify_id_token = lambda token: User(uid=token)
+
+    server, thread, url = serve()
+    start = time.perf_counter()
+    try:
+        # Writers run in their own processes so the server gets this one to itself.
+        jobs = [(url, range(i, args.writers, args.client_processes), args) for i in range(args.client_processes)]
+        with multiprocessing.get_context("spawn").Pool(args.client_processes) as pool:
+            parts = pool.map(client_process, jobs)
+        stats = {key: sum(part[key] for part in parts) for key in parts[0] if key != "latencies"}
+        stats["latencies"] = [latency for part in parts for latency in part["latencies"]]
+    finally:
+        server.should_exit = True
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    analyses = models.calls["errors"]
+    latencies = sorted(stats["latencies"])
+    print(
+        f"{args.writers} writers x {args.lines} lines in {elapsed:.1f}s: {stats['updates']} canvas updates -> "
+        f"{analyses} analyses ({models.calls['detect']} detection calls), "
+        f"{stats['updates'] / max(1, analyses):.0f} updates per analysis"
+    )
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"line complete -> feedback: p50 {statistics.median(latencies):.2f}s p95 {p95:.2f}s max {latencies[-1]:.2f}s")
+    print(
+        f"feedback pushes {stats['feedback']}, throttled notices {stats['throttled']}, "
+        f"unavailable {stats['unavailable']}, errors {stats['errors']}, incomplete writers {stats['incomplete']}"
+    )
+    print(f"server counters: {live_analysis.snapshot()}")
+
+    per_connection = args.writers * (settings.LIVE_ANALYSIS_BURST + settings.LIVE_ANALYSES_PER_MINUTE / 60 * elapsed)
+    worker = live_analysis.worker_budget.burst + settings.LIVE_WORKER_ANALYSES_PER_MINUTE / 60 * elapsed
+    print(f"budgets: per-connection total {per_connection:.0f}, worker {worker:.0f}")
+    assert stats["incomplete"] == 0 and stats["errors"] == 0, stats
+    assert analyses <= min(per_connection, worker), (analyses, per_connection, worker)
+
+
+if __name__ == "__main__":
+    main()
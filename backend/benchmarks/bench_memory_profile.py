@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Submission Memory Profile
+=========================
+
+Sends --requests photo-sized uploads one at a time through the real app's
+submission endpoint with the memory profiler (app/core/memory_profiler.py)
+tracing every request, then prints its /metrics/memory report for the route:
+peak and retained memory per request and the top allocation sites at the
+high-water mark, in units of the image size.
+
+The real google-cloud-storage and google-genai clients are used, pointed at
+a fake GCS / Gemini server running in a separate process (so its own
+buffers are not traced); that server stores nothing and answers every
+analysis with two detected regions and one error. The database is a
+temporary SQLite file and authentication is bypassed. OCR is off.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_memory_profile.py [--requests 5] [--image-mb 3]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.update(
+    MEMORY_PROFILING="true", MEMORY_PROFILE_SAMPLE_RATE="1", MEMORY_PROFILE_TOP_SITES="8",
+    OCR_ENABLED="false", WARMUP_ON_STARTUP="false", ADMISSION_CONTROL="false", METRICS_TOKEN="bench-metrics",
+)
+
+ROUTE = "POST /api/v1/submission/submit/solution"
+DETECTED = [{"box_2d": [100, 100, 200, 400], "label": "2x+3"}, {"box_2d": [300, 100, 400, 400], "label": "=7"}]
+ERRORS = [{"id": 1, "label": "=7"}]
+
+
+class FakeBackend(BaseHTTPRequestHandler):
+    """GCS JSON API uploads and Gemini generateContent, answered without keeping anything."""
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload: dict, headers: dict = {}) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stored(self) -> None:
+        self._reply({"name": "submissions/bench/image.jpg", "bucket": "bench", "generation": "1", "size": "1"})
+
+    def do_PUT(self):
+        # The one chunk of a resumable upload.
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._stored()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "uploadType=resumable" in self.path:
+            host = self.headers["Host"]
+            self._reply({}, headers={"Location": f"http://{host}/upload/session/1"})
+            return
+        if self.path.startswith("/upload/storage/"):
+            self._stored()
+            return
+        answer = ERRORS if b"errors only" in body else DETECTED
+        self._reply({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": json.dumps(answer)}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 1000, "candidatesTokenCount": 20, "totalTokenCount": 1020},
+        })
+
+
+def serve(port: int) -> None:
+    ThreadingHTTPServer(("127.0.0.1", port), FakeBackend).serve_forever()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_image(megabytes: float) -> bytes:
+    """A JPEG of noise, which does not compress, at about the requested size."""
+    import io
+
+    from PIL import Image
+
+    side = int((megabytes * 2**20 / 1.6) ** 0.5)
+    rng = random.Random(3)
+    image = Image.frombytes("L", (side, side), bytes(rng.getrandbits(8) for _ in range(side * side))).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--image-mb", type=float, default=3.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    server.start()
+
+    from fastapi.testclient import TestClient
+    from google.api_core.client_options import ClientOptions
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import storage
+    from google.genai import Client
+    from google.genai.types import HttpOptions
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.security import User, get_current_user
+    from app.db.database import get_db
+    from app.db.partitions import create_schema
+    from app.main import app
+    from app.services import feedback_service, gcs_service
+
+    endpoint = f"http://127.0.0.1:{port}"
+    storage_client = storage.Client(
+        project="bench", credentials=AnonymousCredentials(), client_options=ClientOptions(api_endpoint=endpoint)
+    )
+    genai_client = Client(api_key="bench", http_options=HttpOptions(base_url=endpoint))
+    gcs_service.get_storage_client = lambda: storage_client
+    feedback_service.get_genai_client = lambda location=None: genai_client
+
+    workdir = tempfile.mkdtemp(prefix="bench-memory-")
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", connect_args={"check_same_thread": False})
+    create_schema(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_bench_db
+    app.dependency_overrides[get_current_user] = lambda: User(uid="bench")
+
+    image = make_image(args.image_mb)
+    size_kib = len(image) / 1024
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+        with TestClient(app) as client:
+            for i in range(args.requests):
+                # A distinct image each time (bytes after the JPEG end are ignored by decoders),
+                # so the analysis is never served from a cache.
+                upload = image + i.to_bytes(16, "big")
+                response = client.post("/api/v1/submission/submit/solution", files={"file": ("photo.jpg", upload, "image/jpeg")})
+                assert response.status_code == 201, response.text
+                assert response.json()["ai_feedback_data"]["errors"], response.text
+            report = client.get("/metrics/memory", headers={"Authorization": "Bearer bench-metrics"}).json()
+    finally:
+        server.terminate()
+        engine.dispose()
+
+    stats = report["routes"][ROUTE]
+    image_units = lambda kib: kib / size_kib
+    print(f"{ROUTE}: {stats['samples']} requests, image {size_kib:.0f} KiB")
+    print(
+        f"  peak     mean {stats['peak_kib_mean']:>8.0f} KiB ({image_units(stats['peak_kib_mean']):.1f}x image)"
+        f"  max {stats['peak_kib_max']:.0f} KiB"
+    )
+    print(f"  retained mean {stats['retained_kib_mean']:>8.0f} KiB  max {stats['retained_kib_max']:.0f} KiB")
+    print("  top allocation sites at the high-water mark:")
+    for site in stats["top_sites"]:
+        print(f"    {site['kib']:>8.0f} KiB ({image_units(site['kib']):.2f}x)  {site['site']}")
+    assert stats["samples"] == args.requests and stats["overlapped"] == 0, stats
+
+
+if __name__ == "__main__":
+    main()
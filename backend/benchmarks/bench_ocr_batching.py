@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+OCR Batching Benchmark
+======================
+
+Runs concurrent submissions through ocr_service.start_ocr / wait_for_text
+against a fake Vision client (fixed latency per batch_annotate_images call
+plus a little per image) and checks that:
+
+* concurrent images are sent in a few batched calls instead of one each,
+* repeated images are answered from the hash cache, and concurrent repeats
+  share one request,
+* an image the API cannot read fails alone, not with the rest of its batch,
+* OCR started next to a (fake) Gemini analysis finishes inside it: the
+  submission takes about max(analysis, OCR), not the sum.
+
+Compares against one call per image (OCR_BATCH_SIZE=1), which is what the
+old text_detection path did.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_ocr_batching.py [--submissions 200] [--concurrency 32] [--call-latency 0.3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.config import settings
+from app.services import ocr_service
+
+UNREADABLE = b"unreadable"
+
+
+class FakeVisionClient:
+    """ImageAnnotatorClient stand-in; 'reads' each image as a hash of its bytes."""
+
+    def __init__(self, call_latency: float, image_latency: float):
+        self.call_latency = call_latency
+        self.image_latency = image_latency
+        self.calls = 0
+        self.images = 0
+        self._lock = threading.Lock()
+
+    def batch_annotate_images(self, requests):
+        with self._lock:
+            self.calls += 1
+            self.images += len(requests)
+        time.sleep(self.call_latency + self.image_latency * len(requests))
+        responses = []
+        for request in requests:
+            content = request.image.content
+            if content.startswith(UNREADABLE):
+                responses.append(SimpleNamespace(error=SimpleNamespace(message="Bad image data."), full_text_annotation=None))
+            else:
+                text = f"x = {sum(content) % 97}"
+                responses.append(SimpleNamespace(error=SimpleNamespace(message=""), full_text_annotation=SimpleNamespace(text=text)))
+        return SimpleNamespace(responses=responses)
+
+
+def expected_text(image: bytes) -> str:
+    return f"x = {sum(image) % 97}"
+
+
+def reset(batch_size: int, args) -> FakeVisionClient:
+    client = FakeVisionClient(args.call_latency, args.image_latency)
+    ocr_service.get_vision_client = lambda: client
+    ocr_service.ocr_batcher = ocr_service.OcrBatcher(
+        ocr_service.annotate_batch,
+        batch_size=batch_size,
+        window=settings.OCR_BATCH_WINDOW_MS / 1000,
+        max_concurrent_batches=settings.OCR_MAX_CONCURRENT_BATCHES,
+    )
+    ocr_service._text_cache.clear()
+    for key in ocr_service.ocr_counters:
+        ocr_service.ocr_counters[key] = 0
+    return client
+
+
+def build_images(args):
+    rng = random.Random(11)
+    distinct = [rng.randbytes(rng.randint(20, 120) * 1024) for _ in range(args.distinct)]
+    stream = [rng.choice(distinct) for _ in range(args.submissions)]
+    stream[len(stream) // 2] = UNREADABLE + rng.randbytes(1024)
+    return stream
+
+
+def submission(image: bytes, analysis_latency: float):
+    """One submission: OCR in the background, the (fake) analysis in the foreground."""
+    start = time.perf_counter()
+    future = ocr_service.start_ocr(image)
+    time.sleep(analysis_latency)
+    text = ocr_service.wait_for_text(future)
+    return text, time.perf_counter() - start
+
+
+def run(stream, batch_size: int, args) -> dict:
+    client = reset(batch_size, args)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda image: submission(image, args.analysis_latency), stream))
+    elapsed = time.perf_counter() - start
+    return {
+        "client": client,
+        "results": results,
+        "elapsed": elapsed,
+        "counters": ocr_service.snapshot(),
+    }
+
+
+def report(name: str, result: dict, submissions: int) -> None:
+    latencies = sorted(latency for _, latency in result["results"])
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    client = result["client"]
+    print(
+        f"{name}: {submissions} submissions -> {client.calls} Vision calls ({client.images} images) "
+        f"in {result['elapsed']:.1f}s | submission p50 {statistics.median(latencies) * 1000:.0f} ms "
+        f"p95 {p95 * 1000:.0f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submissions", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=120, help="Distinct images in the stream")
+    parser.add_argument("--concurrency", type=int, default=32, help="Submissions in flight")
+    parser.add_argument("--call-latency", type=float, default=0.3, help="Seconds per Vision call")
+    parser.add_argument("--image-latency", type=float, default=0.01, help="Extra seconds per image in a call")
+    parser.add_argument("--analysis-latency", type=float, default=1.0, help="Seconds per fake Gemini analysis")
+    args = parser.parse_args()
+
+    stream = build_images(args)
+    single = run(stream, batch_size=1, args=args)
+    report("one call per image", single, len(stream))
+    batched = run(stream, batch_size=settings.OCR_BATCH_SIZE, args=args)
+    report(f"batched (<= {settings.OCR_BATCH_SIZE})  ", batched, len(stream))
+    print(f"  counters: {batched['counters']}")
+
+    for image, (text, _) in zip(stream, batched["results"]):
+        assert text == ("" if image.startswith(UNREADABLE) else expected_text(image)), text
+    assert batched["counters"]["failures"] == 1, batched["counters"]
+
+    distinct = len(set(stream))
+    client = batched["client"]
+    assert client.images == distinct, (client.images, distinct)
+    assert client.calls <= distinct / 4, (client.calls, distinct)
+
+    # OCR overlaps the analysis: nearly every submission takes about the analysis time.
+    latencies = sorted(latency for _, latency in batched["results"])
+    slack = statistics.median(latencies) - args.analysis_latency
+    print(f"  median time over the analysis alone: {slack * 1000:.0f} ms")
+    assert slack < 0.25 * args.analysis_latency, slack
+
+
+if __name__ == "__main__":
+    main()
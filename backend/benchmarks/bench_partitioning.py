@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Submissions Partitioning Benchmark
+==================================
+
+Grows a submissions table step by step (rows spread over the past --months
+months, about 1 KB of feedback each) and, at every size, measures
+
+* insert latency: single-row inserts through crud_submission.create_submission,
+* recent-history latency: crud_submission.list_recent_submissions for random
+  users (last 90 days, newest 20),
+
+for the previous layout (one table, single-column indexes on user_id and
+problem_id) and the partitioned one (monthly partitions, (user_id,
+submitted_at) index). On the partitioned layout it then archives everything
+older than --archive-months into zstd blobs (a local directory stands in for
+the bucket), compacts the archived partitions, and reports the table size
+before and after plus the latency of reading an archived row's feedback back.
+
+Runs in its own schema (bench_partitioning) of the given database, which is
+dropped at the start and the end.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_partitioning.py [--dsn postgresql://...] [--sizes 20000,80000,320000]
+        [--users 2000] [--months 24] [--archive-months 6]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from bench_content_storage import LocalStorageClient
+
+from app import schemas
+from app.core.config import settings
+from app.db import crud_submission, models, partitions
+from app.db.base import Base
+from app.services import gcs_service, submission_archive
+
+SCHEMA = "bench_partitioning"
+
+# The table as it was before partitioning.
+LEGACY_DDL = [
+    """CREATE TABLE submissions (
+        id SERIAL PRIMARY KEY,
+        user_id VARCHAR NOT NULL,
+        problem_id VARCHAR NOT NULL,
+        image_gcs_url VARCHAR(2048) NOT NULL,
+        ocr_text TEXT,
+        ai_feedback TEXT,
+        archive_uri VARCHAR(2048),
+        thumbnail_url VARCHAR(2048),
+        annotated_url VARCHAR(2048),
+        submitted_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+    )""",
+    "CREATE INDEX ix_submissions_id ON submissions (id)",
+    "CREATE INDEX ix_submissions_user_id ON submissions (user_id)",
+    "CREATE INDEX ix_submissions_problem_id ON submissions (problem_id)",
+]
+
+# About 1 KB of feedback JSON per row, varying with the row number.
+FILL_SQL = """
+INSERT INTO submissions (user_id, problem_id, image_gcs_url, ocr_text, ai_feedback, submitted_at)
+SELECT
+    'user-' || (g * 7919 % :users),
+    'problem-' || (g % 40),
+    'https://storage.googleapis.com/bench/submissions/' || md5(g::text) || '.png',
+    '2x + 3 = ' || (g % 11),
+    '{"translated_handwriting": "2x + 3 = ' || (g % 11) || '", "errors": ['
+        || (SELECT string_agg('{"error_text": "Sign error in step ' || k || ' (' || md5((g * k)::text) || ')", '
+                || '"box_2d": [' || (g * k) % 900 || ', ' || (g + k) % 900 || ', ' || ((g * k) % 900 + 80) || ', '
+                || ((g + k) % 900 + 60) || ']}', ', ') FROM generate_series(1, 6) k)
+        || '], "status": "ok"}',
+    now() - (random() * :months * interval '30 days')
+FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) g
+"""
+
+
+def make_engine(dsn: str):
+    engine = create_engine(dsn, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    return engine
+
+
+def drop_schema(engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+def create_layout(engine, partitioned: bool, months: int) -> None:
+    with engine.begin() as connection:
+        if partitioned:
+            partitions.create_partitioned_table(connection)
+            # Partitions for the whole history, as `migrate` + `partition` would leave them.
+            start = partitions.add_months(partitions.month_start(datetime.now(timezone.utc).date()), -months - 1)
+            partitions.ensure_partitions(connection, today=start, ahead=months + 1 + settings.SUBMISSION_PARTITIONS_AHEAD)
+        else:
+            for statement in LEGACY_DDL:
+                connection.execute(text(statement))
+        Base.metadata.create_all(bind=connection, tables=[models.Conversation.__table__, models.ChatMessage.__table__])
+
+
+def fill(engine, start: int, stop: int, args) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(FILL_SQL), {"users": args.users, "months": args.months, "start": start, "stop": stop})
+        connection.execute(text("ANALYZE submissions"))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000
+
+
+def measure(Session, args, rng: random.Random) -> dict:
+    inserts, queries = [], []
+    db = Session()
+    try:
+        for i in range(args.probes):
+            submission = schemas.SubmissionCreate(
+                user_id=f"user-{rng.randrange(args.users)}", problem_id="problem-1",
+                image_gcs_url="https://storage.googleapis.com/bench/probe.png", ocr_text="x = 2",
+                ai_feedback='{"translated_handwriting": "", "errors": [], "status": "ok"}',
+            )
+            start = time.perf_counter()
+            crud_submission.create_submission(db, submission=submission)
+            inserts.append(time.perf_counter() - start)
+
+            user_id = f"user-{rng.randrange(args.users)}"
+            start = time.perf_counter()
+            crud_submission.list_recent_submissions(db, user_id=user_id)
+            queries.append(time.perf_counter() - start)
+            db.expunge_all()
+    finally:
+        db.close()
+    return {"insert": percentiles(inserts), "recent": percentiles(queries)}
+
+
+def table_size(engine) -> int:
+    with engine.connect() as connection:
+        if partitions.is_partitioned(connection):
+            return sum(
+                connection.execute(text(f"SELECT pg_total_relation_size('{name}')")).scalar()
+                for name, _ in partitions.list_partitions(connection)
+            )
+        return connection.execute(text("SELECT pg_total_relation_size('submissions')")).scalar()
+
+
+def archive_step(engine, Session, args) -> None:
+    root = tempfile.mkdtemp(prefix="bench-archive-")
+    gcs_service.get_storage_client = lambda: LocalStorageClient(root, rtt=0.0, bandwidth=float("inf"))
+    try:
+        before_size = table_size(engine)
+        settings.SUBMISSION_ARCHIVE_AFTER_MONTHS = args.archive_months
+        cutoff = submission_archive.archive_cutoff()
+        db = Session()
+        start = time.perf_counter()
+        try:
+            stats = submission_archive.archive_submissions(db, before=cutoff)
+        finally:
+            db.close()
+        archive_seconds = time.perf_counter() - start
+        partitions.compact_partitions(engine, cutoff.date())
+        after_size = table_size(engine)
+        print(
+            f"  archive before {cutoff:%Y-%m-%d}: {stats['rows']} rows in {archive_seconds:.1f}s, "
+            f"{stats['blobs']} blobs, {stats['bytes_raw'] / 2**20:.1f} MiB -> "
+            f"{stats['bytes_compressed'] / 2**20:.1f} MiB zstd "
+            f"({stats['bytes_raw'] / max(1, stats['bytes_compressed']):.1f}x)"
+        )
+        print(f"  table size {before_size / 2**20:.0f} MiB -> {after_size / 2**20:.0f} MiB after archive + compaction")
+
+        db = Session()
+        try:
+            archived = db.query(models.Submission).filter(models.Submission.archive_uri.is_not(None)).limit(50).all()
+            reads = []
+            for submission in archived:
+                submission_archive._load_chunk.cache_clear()
+                start = time.perf_counter()
+                feedback = submission_archive.feedback_of(submission)
+                reads.append(time.perf_counter() - start)
+                assert feedback and feedback.startswith('{"translated_handwriting"'), feedback
+        finally:
+            db.close()
+        if reads:
+            p50, p95 = percentiles(reads)
+            print(f"  archived feedback read (cold chunk): p50 {p50:.1f} ms p95 {p95:.1f} ms")
+        assert stats["rows"] > 0 and after_size < before_size
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=str(settings.DATABASE_URL), help="PostgreSQL URL (default: DATABASE_URL)")
+    parser.add_argument("--sizes", default="20000,80000,320000", help="Row counts to measure at, ascending")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--months", type=int, default=24, help="History the rows are spread over")
+    parser.add_argument("--probes", type=int, default=200, help="Inserts and history queries per measurement")
+    parser.add_argument("--archive-months", type=int, default=6)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = {}
+    for partitioned in (False, True):
+        layout = "partitioned" if partitioned else "single table"
+        settings.SUBMISSIONS_PARTITIONED = partitioned
+        engine = make_engine(args.dsn)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        rng = random.Random(5)
+        try:
+            create_layout(engine, partitioned, args.months)
+            loaded = 0
+            for size in sizes:
+                fill(engine, loaded + 1, size, args)
+                loaded = size
+                result = results[(layout, size)] = measure(Session, args, rng)
+                print(
+                    f"{layout:<12} {size:>8} rows: insert p50 {result['insert'][0]:.2f} ms p95 {result['insert'][1]:.2f} ms"
+                    f" | recent history p50 {result['recent'][0]:.2f} ms p95 {result['recent'][1]:.2f} ms"
+                    f" | {table_size(engine) / 2**20:.0f} MiB"
+                )
+            if partitioned:
+                archive_step(engine, Session, args)
+                result = measure(Session, args, rng)
+                print(f"  after archive: recent history p50 {result['recent'][0]:.2f} ms p95 {result['recent'][1]:.2f} ms")
+        finally:
+            drop_schema(engine)
+            engine.dispose()
+
+    first, last = sizes[0], sizes[-1]
+    growth = {
+        layout: results[(layout, last)]["recent"][0] / results[(layout, first)]["recent"][0]
+        for layout in ("single table", "partitioned")
+    }
+    print(
+        f"recent-history p50 growth {first} -> {last} rows: single table x{growth['single table']:.1f}, "
+        f"partitioned x{growth['partitioned']:.1f}"
+    )
+    assert growth["partitioned"] < growth["single table"], growth
+
+
+if __name__ == "__main__":
+    main()
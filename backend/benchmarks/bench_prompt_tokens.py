@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Prompt Token Benchmark
+======================
+
+Builds the error-selection prompt with every template version in
+app/services/prompt_builder.py for a set of detection results and compares
+their size in tokens: the text parts sent (system instruction plus prompt)
+and a typical answer (two errors).
+
+Detection results come from the model call recordings of
+benchmarks/eval_feedback.py (--cache: every recorded detection response is
+one sample), or, without recordings, from a built-in set of worked
+solutions laid out the way the detector returns them (up to 30 regions).
+
+Tokens are counted with prompt_builder.estimate_tokens; --count-with-api
+asks Vertex AI's count_tokens for exact numbers instead (needs credentials).
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_prompt_tokens.py [--cache .eval-cache] [--count-with-api]
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import box_geometry, feedback_service, problem_catalog, prompt_builder
+
+# (line of work, tokens in it) for the built-in samples.
+WORKED_LINES = [
+    ["2x", "+", "3", "=", "7"],
+    ["2x", "=", "7", "-", "3"],
+    ["2x", "=", "4"],
+    ["x", "=", "4", "/", "2"],
+    ["x", "=", "2"],
+    ["check:", "2(2)", "+", "3", "=", "7"],
+]
+
+
+def builtin_samples():
+    """Detection results for the first 1..6 lines of a worked solution, in detector order."""
+    samples = []
+    for line_count in range(1, len(WORKED_LINES) + 1):
+        regions = []
+        for row, tokens in enumerate(WORKED_LINES[:line_count]):
+            top = 60 + row * 150
+            x = 80
+            for token in tokens:
+                width = 40 + 35 * len(token)
+                regions.append({"box_2d": [x, top, x + width, top + 110], "label": token})
+                x += width + 25
+            # The detector also returns the whole line as a group.
+            regions.append({"box_2d": [80, top - 10, x - 25, top + 120], "label": " ".join(tokens)})
+        samples.append((f"builtin-{line_count}-lines", regions[:feedback_service.DETECTION_REGION_LIMIT]))
+    return samples
+
+
+def recorded_samples(cache_dir):
+    """Detection responses recorded by eval_feedback.py, as API-frame regions."""
+    samples = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        with open(path) as f:
+            record = json.load(f)
+        parsed = record.get("parsed") or []
+        if not parsed or not all("box_2d" in item for item in parsed) or len(parsed) < 2:
+            continue
+        boxes, well_formed = box_geometry.from_model_boxes([item["box_2d"] for item in parsed])
+        regions = [
+            {"box_2d": box, "label": item.get("label") or ""}
+            for box, item, ok in zip(np.rint(boxes).astype(int).tolist(), parsed, well_formed)
+            if ok
+        ]
+        samples.append((os.path.basename(path)[:12], regions))
+    return samples
+
+
+def typical_answer(version: str, regions) -> str:
+    """The JSON a model would return for two errors in the last regions."""
+    picks = list(range(len(regions)))[-2:]
+    if version == "v1":
+        boxes = box_geometry.to_model_boxes(np.array([regions[i]["box_2d"] for i in picks], dtype=np.float64))
+        answer = [{"box_2d": box, "label": "sign error"} for box in boxes.astype(int).tolist()]
+    else:
+        answer = [{"id": i, "label": "sign error"} for i in picks]
+    return json.dumps(answer)
+
+
+def make_counter(use_api: bool):
+    if not use_api:
+        return prompt_builder.estimate_tokens
+    client = feedback_service.get_genai_client()
+
+    def count(text: str) -> int:
+        return client.models.count_tokens(model=feedback_service.ERROR_MODEL, contents=text).total_tokens
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache", help="eval_feedback.py recording directory to take detection results from")
+    parser.add_argument("--count-with-api", action="store_true", help="Count with Vertex AI count_tokens")
+    args = parser.parse_args()
+
+    samples = recorded_samples(args.cache) if args.cache else builtin_samples()
+    if not samples:
+        sys.exit(f"No recorded detection responses under {args.cache}.")
+    count = make_counter(args.count_with_api)
+    problem = problem_catalog.get_problem(problem_catalog.default_problem_id())
+    reference = "Reference solution steps:\n" + "\n".join(problem.steps) if problem else "No reference solution is available."
+
+    totals = {version: {"input": [], "output": []} for version in prompt_builder.PROMPT_VERSIONS}
+    print(f"{'sample':<22} {'regions':>7}" + "".join(f"  {v + ' in':>8} {v + ' out':>8}" for v in prompt_builder.PROMPT_VERSIONS))
+    for name, regions in samples:
+        boxes = np.array([region["box_2d"] for region in regions], dtype=np.float64)
+        labels = [region["label"] for region in regions]
+        row = f"{name:<22} {len(regions):>7}"
+        for version in prompt_builder.PROMPT_VERSIONS:
+            task = feedback_service.ERROR_PROMPT if version == "v1" else feedback_service.ERROR_ID_PROMPT
+            prompt = prompt_builder.error_prompt(version, task, reference, boxes, labels)
+            sent = count(prompt.system_instruction) + count(prompt.text)
+            answer = count(typical_answer(version, regions))
+            totals[version]["input"].append(sent)
+            totals[version]["output"].append(answer)
+            row += f"  {sent:>8} {answer:>8}"
+        print(row)
+
+    base, compact = totals["v1"], totals["v2"]
+    saved_in = 1 - sum(compact["input"]) / sum(base["input"])
+    saved_out = 1 - sum(compact["output"]) / sum(base["output"])
+    print(
+        f"\nv2 vs v1 over {len(samples)} samples: text input {saved_in:.0%} fewer tokens "
+        f"(median {statistics.median(base['input'])} -> {statistics.median(compact['input'])}), "
+        f"answer {saved_out:.0%} fewer"
+    )
+    assert all(c < b for c, b in zip(compact["input"], base["input"])), "v2 must be smaller on every sample"
+    assert saved_out > 0
+
+
+if __name__ == "__main__":
+    main()
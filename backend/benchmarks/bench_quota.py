@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Quota Check Microbenchmark
+==========================
+
+Times the in-memory quota check of app/core/quota.py and checks its
+behaviour:
+
+* latency of QuotaTracker.charge() for --subjects users spread over
+  classes (user and class windows, per minute and per day), single-threaded
+  as percentiles and from --threads threads at once, and of the
+  charge_analysis() dependency itself,
+* the sliding window on a fake clock: the limit is enforced, Retry-After is
+  when the next charge fits, and the previous window's count fades out
+  linearly,
+* two trackers sharing one database stand in for two instances: each only
+  sees its own charges until they flush, then both see the sum,
+* flush time with every subject active,
+* the real ai_test endpoint refunds requests that fail or only get a
+  degraded result, and answers 429 with Retry-After once the user is over
+  the limit with successful analyses,
+* live analyses are charged the same way: degraded ones are refunded and the
+  one over the limit raises QuotaExceeded.
+
+The database is a temporary SQLite file, or with --dsn a PostgreSQL database
+(in its own schema, bench_quota, dropped at the start and the end).
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_quota.py [--dsn postgresql://...] [--subjects 20000] [--threads 8]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.update(WARMUP_ON_STARTUP="false", ADMISSION_CONTROL="false")
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core import quota
+from app.core.security import User
+from app.db.partitions import create_schema
+
+SCHEMA = "bench_quota"
+LIMITS = {quota.USER: [(quota.MINUTE, 10), (quota.DAY, 300)], quota.CLASS: [(quota.MINUTE, 150), (quota.DAY, 6000)]}
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_engine(dsn: str):
+    if not dsn:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-quota-"), "bench.db")
+        return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    engine = create_engine(dsn, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    return engine
+
+
+def subject(i: int) -> tuple:
+    return f"user-{i}", f"class-{i % 400}"
+
+
+def time_single(tracker: quota.QuotaTracker, subjects: int, calls: int) -> list:
+    samples = []
+    clock = time.perf_counter_ns
+    for i in range(calls):
+        user_id, class_id = subject(i * 7919 % subjects)
+        start = clock()
+        try:
+            tracker.charge(user_id, class_id)
+        except quota.QuotaExceeded:
+            pass
+        samples.append(clock() - start)
+    return samples
+
+
+def time_threads(tracker: quota.QuotaTracker, subjects: int, threads: int, calls: int) -> float:
+    barrier = threading.Barrier(threads + 1)
+
+    def work(offset):
+        barrier.wait()
+        for i in range(calls):
+            try:
+                tracker.charge(*subject((offset + i * 7919) % subjects))
+            except quota.QuotaExceeded:
+                pass
+
+    workers = [threading.Thread(target=work, args=(n * 104729,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (threads * calls) * 1e6
+
+
+def time_dependency(subjects: int, calls: int) -> float:
+    dependency = quota.charge_analysis()
+    users = [User(uid=user_id, class_id=class_id) for user_id, class_id in map(subject, range(subjects))]
+
+    async def run():
+        start = time.perf_counter()
+        for i in range(calls):
+            charges = dependency(current_user=users[i * 7919 % subjects])
+            try:
+                await charges.__anext__()
+            except Exception:
+                continue
+            await charges.aclose()
+        return (time.perf_counter() - start) / calls * 1e6
+
+    return asyncio.run(run())
+
+
+def percentile(samples: list, q: float) -> float:
+    return sorted(samples)[int(len(samples) * q)] / 1000
+
+
+def check_window() -> None:
+    clock = FakeClock(1_000_000 * 60.0)  # the start of a minute bucket
+    tracker = quota.QuotaTracker({quota.USER: [(quota.MINUTE, 10)]}, clock=clock)
+    for _ in range(10):
+        tracker.charge("u")
+    try:
+        tracker.charge("u")
+        raise AssertionError("the 11th charge in a minute was admitted")
+    except quota.QuotaExceeded as e:
+        retry_after = e.retry_after
+    # All ten sit in the current bucket: room only once they fade in the next minute (at 10% of it).
+    assert abs(retry_after - 66.0) < 1e-6, retry_after
+    clock.now += retry_after - 0.5
+    try:
+        tracker.charge("u")
+        raise AssertionError("admitted before Retry-After")
+    except quota.QuotaExceeded:
+        pass
+    clock.now += 0.5
+    tracker.charge("u")
+    clock.now += 30  # 36s into the minute: 1 + 10 * 0.4 = 5 used
+    print(f"sliding window: 11th charge rejected, Retry-After {retry_after:.0f}s; "
+          f"usage {tracker.usage(quota.USER, 'u', quota.MINUTE):.1f}/10 half a minute later")
+    assert abs(tracker.usage(quota.USER, "u", quota.MINUTE) - 5.0) < 1e-6
+    for _ in range(5):
+        tracker.charge("u")
+    try:
+        tracker.charge("u")
+        raise AssertionError("went over the limit")
+    except quota.QuotaExceeded:
+        pass
+
+    charge = tracker.charge("v")
+    charge.refund()
+    assert tracker.usage(quota.USER, "v", quota.MINUTE) == 0
+
+
+def check_instances(Session) -> None:
+    clock = FakeClock(time.time())
+    limits = {quota.USER: [(quota.MINUTE, 10)], quota.CLASS: [(quota.MINUTE, 12)]}
+    a, b = quota.QuotaTracker(limits, clock=clock), quota.QuotaTracker(limits, clock=clock)
+    for _ in range(6):
+        a.charge("shared", "class-x")
+    for _ in range(4):
+        b.charge("shared", "class-x")
+    seen_before = b.usage(quota.USER, "shared", quota.MINUTE)
+    a.flush(Session)
+    b.flush(Session)
+    a.flush(Session)  # picks up b's charges
+    seen_a, seen_b = a.usage(quota.USER, "shared", quota.MINUTE), b.usage(quota.USER, "shared", quota.MINUTE)
+    print(f"two instances, 6 + 4 charges: instance b saw {seen_before:.0f} before flushing, "
+          f"{seen_b:.0f} after (a: {seen_a:.0f})")
+    assert seen_before == 4 and seen_a == seen_b == 10
+    for tracker in (a, b):
+        try:
+            tracker.charge("shared")
+            raise AssertionError("the shared limit was not enforced after the flush")
+        except quota.QuotaExceeded:
+            pass
+    # The class limit spans users and instances.
+    b.charge("other", "class-x")
+    b.charge("other", "class-x")
+    b.flush(Session)
+    a.flush(Session)
+    try:
+        a.charge("third", "class-x")
+        raise AssertionError("the class limit was not enforced")
+    except quota.QuotaExceeded as e:
+        assert e.scope == quota.CLASS
+    # A new instance learns the counts from the table.
+    c = quota.QuotaTracker(limits, clock=clock)
+    c.flush(Session)
+    assert c.usage(quota.CLASS, "class-x", quota.MINUTE) == 12
+    # Rows are dropped once their bucket has left the window.
+    clock.now += 3 * quota.MINUTE
+    a.flush(Session)
+    with Session() as db:
+        left = db.execute(text("SELECT count(*) FROM quota_usage")).scalar()
+    assert left == 0, left
+    print("class limit across users and instances enforced; a new instance reads the counts; expired rows deleted")
+
+
+def check_endpoint() -> None:
+    from fastapi.testclient import TestClient
+
+    from app.core.security import get_current_user
+    from app.main import app
+    from app.services import feedback_service, gcs_service
+
+    def post(client):
+        return client.post("/api/v1/ai/test-feedback", files={"file": ("photo.jpg", b"jpeg", "image/jpeg")})
+
+    uploads = []
+    gcs_service.upload_image_to_gcs = lambda file, user_id, image_bytes=None: uploads.append(user_id)
+    app.dependency_overrides[get_current_user] = lambda: User(uid="scripted", class_id="class-endpoint")
+    limits = quota.tracker.limits
+    quota.tracker.limits = {quota.USER: [(quota.MINUTE, 3)]}
+    try:
+        client = TestClient(app, raise_server_exceptions=False)
+        codes = [post(client) for _ in range(5)]
+    finally:
+        quota.tracker.limits = limits
+        app.dependency_overrides.clear()
+    statuses = [response.status_code for response in codes]
+    print(f"ai_test endpoint, failing upload: statuses {statuses}, uploads attempted {len(uploads)}")
+    # The fake upload returns no URL, so admitted requests fail with 500 after the upload attempt
+    # and are refunded: failures never use up the quota.
+    assert statuses == [500] * 5 and len(uploads) == 5, statuses
+    assert quota.tracker.usage(quota.USER, "scripted", quota.MINUTE) == 0
+
+    # Successful analyses are charged; degraded results (status "unavailable") are refunded.
+    feedback = {"status": "ok"}
+    gcs_service.upload_image_to_gcs = lambda file, user_id, image_bytes=None: uploads.append(user_id) or "https://storage.googleapis.com/bench/photo.jpg"
+    feedback_service.get_errorbouding_from_image = lambda gcs_uri, image_bytes=None: dict(feedback, errors=[])
+    app.dependency_overrides[get_current_user] = lambda: User(uid="scripted", class_id="class-endpoint")
+    quota.tracker.limits = {quota.USER: [(quota.MINUTE, 3)]}
+    try:
+        feedback["status"] = "unavailable"
+        degraded = [post(client).status_code for _ in range(4)]
+        feedback["status"] = "ok"
+        codes = [post(client) for _ in range(5)]
+    finally:
+        quota.tracker.limits = limits
+        app.dependency_overrides.clear()
+    statuses = [response.status_code for response in codes]
+    print(f"ai_test endpoint, limit 3/minute: degraded results {degraded}, then statuses {statuses}, "
+          f"Retry-After {codes[-1].headers.get('retry-after')}")
+    assert degraded == [200] * 4 and statuses == [200, 200, 200, 429, 429], (degraded, statuses)
+    assert int(codes[-1].headers["retry-after"]) >= 1
+
+
+def check_live() -> None:
+    from app.api.v1.endpoints import live
+    from app.services import feedback_service
+
+    feedback = {"status": "unavailable", "errors": []}
+    feedback_service.get_errorbouding_from_image = lambda gcs_uri, image_bytes=None, problem_id=None: dict(feedback)
+    user = User(uid="live-writer", class_id="class-live")
+    limits = quota.tracker.limits
+    quota.tracker.limits = {quota.USER: [(quota.MINUTE, 3)]}
+
+    async def run():
+        outcomes = []
+        for status in ["unavailable"] * 2 + ["ok"] * 4:
+            feedback["status"] = status
+            try:
+                outcomes.append((await live._analyze(user, b"png", None))["status"])
+            except quota.QuotaExceeded as e:
+                outcomes.append(f"over quota, retry after {e.retry_after:.0f}s")
+        return outcomes
+
+    try:
+        outcomes = asyncio.run(run())
+    finally:
+        quota.tracker.limits = limits
+    print(f"live analyses, limit 3/minute: {outcomes}")
+    assert outcomes[:5] == ["unavailable", "unavailable", "ok", "ok", "ok"], outcomes
+    assert outcomes[5].startswith("over quota"), outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", help="PostgreSQL URL (default: a temporary SQLite file)")
+    parser.add_argument("--subjects", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    generous = {scope: [(window, 10**9) for window, _ in pairs] for scope, pairs in LIMITS.items()}
+    tracker = quota.QuotaTracker(generous)
+    time_single(tracker, args.subjects, args.subjects)  # warm: every subject has its counters
+    samples = time_single(tracker, args.subjects, args.calls)
+    print(f"charge(), {args.subjects} users in 400 classes, 4 windows: mean {statistics.mean(samples) / 1000:.2f} us, "
+          f"p50 {percentile(samples, 0.5):.2f} us, p99 {percentile(samples, 0.99):.2f} us, "
+          f"p99.9 {percentile(samples, 0.999):.2f} us")
+    assert percentile(samples, 0.99) < 1000
+
+    rejecting = quota.QuotaTracker(LIMITS)
+    time_single(rejecting, args.subjects, args.subjects * 12)  # every user over 10/minute
+    rejected = time_single(rejecting, args.subjects, args.calls // 4)
+    print(f"charge() over the limit (QuotaExceeded): p50 {percentile(rejected, 0.5):.2f} us, "
+          f"p99 {percentile(rejected, 0.99):.2f} us")
+    assert percentile(rejected, 0.99) < 1000
+
+    per_call = time_threads(tracker, args.subjects, args.threads, args.calls // args.threads)
+    print(f"charge() from {args.threads} threads at once: {per_call:.2f} us per call (one lock, GIL-bound)")
+    quota.tracker = quota.QuotaTracker(generous)
+    print(f"charge_analysis() dependency: {time_dependency(args.subjects, args.calls // 4):.2f} us per call")
+    quota.tracker = quota.QuotaTracker(LIMITS)
+
+    check_window()
+
+    engine = make_engine(args.dsn)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    try:
+        create_schema(engine)
+        check_instances(Session)
+        start = time.perf_counter()
+        tracker.flush(Session)
+        first = time.perf_counter() - start
+        time_single(tracker, args.subjects, args.subjects)
+        # Checks while the next flush runs in the background, as in the app.
+        flusher = threading.Thread(target=tracker.flush, args=(Session,))
+        start = time.perf_counter()
+        flusher.start()
+        during = []
+        while flusher.is_alive():
+            during += time_single(tracker, args.subjects, 1000)
+        print(f"flush of {tracker.snapshot()['subjects_tracked']} active counters: "
+              f"{first * 1000:.0f} ms first, {(time.perf_counter() - start) * 1000:.0f} ms next; "
+              f"charge() meanwhile: p99 {percentile(during, 0.99):.2f} us, max {max(during) / 1e6:.1f} ms")
+        assert percentile(during, 0.99) < 1000
+        check_endpoint()
+        check_live()
+    finally:
+        if args.dsn:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        else:
+            shutil.rmtree(os.path.dirname(engine.url.database))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Read/Write Routing Check
+========================
+
+Exercises the session routing of app/db/database.py with two local SQLite
+files standing in for the primary and the replica (the replica starts as a
+copy of the primary, so rows written later are visibly missing from it):
+
+* a small FastAPI app with one endpoint on get_db and one on get_read_db
+  shows that writes land on the primary and reads come from the replica,
+* a read session refuses to flush,
+* the replica reported more than REPLICA_MAX_LAG_SECONDS behind, an
+  unreachable replica, and a replica failing in the middle of a request all
+  send the following reads to the primary, and reads return to the replica
+  once it is healthy again,
+* no replica configured means every read goes to the primary.
+
+It also times read_session() with the lag check cached and uncached. With
+--dsn, the lag query is run against that PostgreSQL server as the replica
+(a primary reports no lag).
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_read_routing.py [--dsn postgresql://...]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.db import database, models
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/notes/{body}")
+    def add_note(body: str, db=Depends(database.get_db)):
+        db.execute(text("INSERT INTO notes (body) VALUES (:body)"), {"body": body})
+        db.commit()
+        return {"written_to": db.get_bind().url.database}
+
+    @app.get("/notes")
+    def list_notes(db=Depends(database.get_read_db)):
+        rows = db.execute(text("SELECT body FROM notes ORDER BY id")).scalars().all()
+        return {"read_from": db.get_bind().url.database, "notes": rows}
+
+    @app.get("/notes/failing")
+    def failing(db=Depends(database.get_read_db)):
+        raise OperationalError("SELECT 1", {}, Exception("server closed the connection unexpectedly"))
+
+    return app
+
+
+def expire_check() -> None:
+    """Makes the next read re-check the replica instead of using the cached answer."""
+    database._replica_state["checked_at"] = 0.0
+
+
+def time_read_session(count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        database.read_session().close()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", help="PostgreSQL URL to run the replica lag query against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-routing-")
+    primary_path, replica_path = os.path.join(workdir, "primary.db"), os.path.join(workdir, "replica.db")
+    primary = create_engine(f"sqlite:///{primary_path}", connect_args={"check_same_thread": False})
+    with primary.begin() as connection:
+        connection.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT NOT NULL)"))
+        connection.execute(text("INSERT INTO notes (body) VALUES ('replicated')"))
+    shutil.copyfile(primary_path, replica_path)
+
+    original_engine, original_lag = database.engine, database._replica_lag
+    database.engine = primary
+    database.SessionLocal.configure(bind=primary)
+    client = TestClient(make_app(), raise_server_exceptions=False)
+    try:
+        database.configure_replica(f"sqlite:///{replica_path}")
+        written = client.post("/notes/fresh").json()
+        read = client.get("/notes").json()
+        print(f"write -> {os.path.basename(written['written_to'])}, read -> {os.path.basename(read['read_from'])}: {read['notes']}")
+        assert written["written_to"] == primary_path and read["read_from"] == replica_path
+        assert read["notes"] == ["replicated"]  # the replica has not seen the new row
+
+        with database.read_session() as db:
+            db.add(models.Problem(id="p", title="t", canonical_steps="[]"))
+            try:
+                db.flush()
+            except RuntimeError as e:
+                print(f"read session flush refused: {e}")
+            else:
+                raise AssertionError("a read session flushed")
+
+        # Lagging replica: reads move to the primary (which has the new row).
+        database._replica_lag = lambda connection: settings.REPLICA_MAX_LAG_SECONDS + 25
+        expire_check()
+        read = client.get("/notes").json()
+        print(f"replica {settings.REPLICA_MAX_LAG_SECONDS + 25:.0f}s behind: read -> {os.path.basename(read['read_from'])}: {read['notes']}")
+        assert read["read_from"] == primary_path and read["notes"] == ["replicated", "fresh"]
+        database._replica_lag = original_lag
+        expire_check()
+        assert client.get("/notes").json()["read_from"] == replica_path
+
+        # A replica failing mid-request is marked down; the next reads use the primary.
+        assert client.get("/notes/failing").status_code == 500
+        read = client.get("/notes").json()
+        print(f"after a replica error mid-request: read -> {os.path.basename(read['read_from'])}")
+        assert read["read_from"] == primary_path
+        expire_check()
+        assert client.get("/notes").json()["read_from"] == replica_path
+
+        # Unreachable replica.
+        database.configure_replica(f"sqlite:///{os.path.join(workdir, 'missing', 'replica.db')}")
+        read = client.get("/notes").json()
+        print(f"unreachable replica: read -> {os.path.basename(read['read_from'])}")
+        assert read["read_from"] == primary_path
+
+        # No replica.
+        database.configure_replica(None)
+        assert client.get("/notes").json()["read_from"] == primary_path
+        print(f"no replica: read -> primary.db; counters {database.snapshot()}")
+        assert database.routing_counters["replica_lagging"] >= 1 and database.routing_counters["replica_errors"] >= 2
+
+        database.configure_replica(f"sqlite:///{replica_path}")
+        cached = time_read_session(2000)
+        interval = settings.REPLICA_LAG_CHECK_SECONDS
+        settings.REPLICA_LAG_CHECK_SECONDS = 0.0
+        try:
+            uncached = time_read_session(200)
+        finally:
+            settings.REPLICA_LAG_CHECK_SECONDS = interval
+        print(f"read_session(): {cached:.0f} us with the lag check cached, {uncached:.0f} us re-checking every time")
+
+        if args.dsn:
+            database.configure_replica(args.dsn)
+            assert database.replica_usable(), database.snapshot()
+            print(f"PostgreSQL replica lag query: {database.snapshot()['replica_lag_seconds']}s")
+    finally:
+        database.configure_replica(None)
+        database._replica_lag = original_lag
+        database.engine = original_engine
+        database.SessionLocal.configure(bind=original_engine)
+        primary.dispose()
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Region Detector Agreement Benchmark
+===================================
+
+Compares the local classical-CV detector (app.services.region_detector) with
+recorded Gemini detections and reports agreement and latency.
+
+A corpus directory holds canvases (`<name>.png`) next to the Gemini boxes
+recorded for them (`<name>.gemini.json`, a list of {"box_2d": [x1, y1, x2, y2],
+"label": ...} in the 0-1000 frame). Recordings are made once with --record,
+which calls Gemini for every image that does not have one yet; reruns are free.
+
+Usage (from the backend directory):
+    python benchmarks/bench_region_detector.py --corpus path/to/canvases [--record]
+    python benchmarks/bench_region_detector.py --synthetic 50
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import box_geometry, region_detector
+
+
+def record(image_path: str, recording_path: str) -> None:
+    from app.services import feedback_service
+
+    with open(image_path, "rb") as f:
+        boxes = feedback_service._detect_regions_with_gemini(f.read())
+    with open(recording_path, "w") as f:
+        json.dump([box.model_dump() for box in boxes], f)
+    print(f"Recorded {len(boxes)} Gemini boxes for {os.path.basename(image_path)}")
+
+
+def load_corpus(corpus: str, do_record: bool):
+    for image_path in sorted(glob.glob(os.path.join(corpus, "*.png"))):
+        recording_path = image_path[:-len(".png")] + ".gemini.json"
+        if not os.path.exists(recording_path):
+            if not do_record:
+                continue
+            record(image_path, recording_path)
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+        with open(recording_path) as f:
+            reference = [entry["box_2d"] for entry in json.load(f)]
+        yield os.path.basename(image_path), image_bytes, reference
+
+
+def synthetic_corpus(count: int):
+    """Typeset equations on a transparent canvas; the reference is one box per token."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(7)
+    font = ImageFont.load_default(size=44)
+    for i in range(count):
+        width, height = 1200, 700
+        image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        reference = []
+        for line in range(rng.randint(2, 5)):
+            x, y = 30 + rng.randint(0, 40), 30 + line * 130
+            a, b = rng.randint(2, 9), rng.randint(1, 20)
+            for token in [f"{a}x", "+", str(b), "=", str(a * rng.randint(1, 9) + b)]:
+                draw.text((x, y), token, font=font, fill=(20, 20, 20, 255))
+                x1, y1, x2, y2 = draw.textbbox((x, y), token, font=font)
+                reference.append([x1 * 1000 / width, y1 * 1000 / height, x2 * 1000 / width, y2 * 1000 / height])
+                x = x2 + rng.randint(18, 30)
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        yield f"synthetic-{i}", buffer.getvalue(), reference
+
+
+def agreement(predicted: np.ndarray, reference: np.ndarray, threshold: float):
+    """Greedy one-to-one matching at an IoU threshold; returns (matches, best IoU per reference box)."""
+    if len(predicted) == 0 or len(reference) == 0:
+        return 0, np.zeros(len(reference))
+    iou = box_geometry.iou_matrix(reference, predicted)
+    best = iou.max(axis=1)
+    matches = 0
+    used = np.zeros(len(predicted), dtype=bool)
+    for r in np.argsort(-best):
+        candidates = np.where(~used & (iou[r] >= threshold))[0]
+        if len(candidates):
+            used[candidates[np.argmax(iou[r, candidates])]] = True
+            matches += 1
+    return matches, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--corpus", help="Directory of <name>.png + <name>.gemini.json")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Generate N typeset canvases instead")
+    parser.add_argument("--record", action="store_true", help="Call Gemini for images without a recording")
+    parser.add_argument("--iou", type=float, nargs="+", default=[0.3, 0.5])
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus, args.record) if args.corpus else synthetic_corpus(args.synthetic)
+
+    latencies, best_ious = [], []
+    totals = {t: [0, 0, 0] for t in args.iou}  # matches, predicted, reference
+    for name, image_bytes, reference in samples:
+        start = time.perf_counter()
+        regions = region_detector.detect_regions(image_bytes)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        predicted = np.array([r.box_2d for r in regions], dtype=np.float64).reshape(-1, 4)
+        reference = np.array(reference, dtype=np.float64).reshape(-1, 4)
+        for t in args.iou:
+            matches, best = agreement(predicted, reference, t)
+            totals[t][0] += matches
+            totals[t][1] += len(predicted)
+            totals[t][2] += len(reference)
+        best_ious.extend(best.tolist())
+
+    if not latencies:
+        print("No samples found (recordings missing? pass --record)")
+        return
+
+    latencies.sort()
+    print(f"images: {len(latencies)}")
+    print(f"local detector latency: p50 {statistics.median(latencies):.1f} ms, p95 {latencies[int(len(latencies) * 0.95)]:.1f} ms")
+    print(f"mean best IoU per reference box: {statistics.mean(best_ious) if best_ious else 0:.3f}")
+    for t, (matches, predicted, reference) in totals.items():
+        precision = matches / predicted if predicted else 0.0
+        recall = matches / reference if reference else 0.0
+        print(f"IoU>={t:.2f}: precision {precision:.3f}, recall {recall:.3f} ({matches} matched, {predicted} local, {reference} reference)")
+
+
+if __name__ == "__main__":
+    main()
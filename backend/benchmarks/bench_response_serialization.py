@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Submission Response Serialization Benchmark
+===========================================
+
+Compares the cost and payload size of the default SubmissionResponse (feedback
+encoded twice, validated by Pydantic, serialized by FastAPI's encoder) with the
+compact response (feedback once, orjson) and the compact response with packed
+integer boxes, for 5, 30 and 300 error boxes.
+
+Usage (from the backend directory):
+    python benchmarks/bench_response_serialization.py [--sizes 5 30 300] [--repeat 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core import responses
+from app.schemas.submission import AIFeedbackResponse, SubmissionResponse
+
+IMAGE_URL = "https://storage.googleapis.com/livesolve-mvp-images/submissions/user123/0b7c0f7e-8f7a-4f63-9d6f-2d3c6f9a1b2c.png"
+
+
+def make_feedback(n: int) -> dict:
+    rng = random.Random(n)
+    errors = []
+    for i in range(n):
+        x, y = rng.uniform(0, 950), rng.uniform(0, 950)
+        errors.append({"error_text": f"step {i}: sign error", "box_2d": [x, y, x + rng.uniform(10, 50), y + rng.uniform(10, 50)]})
+    return AIFeedbackResponse(translated_handwriting="2x + 3 = 7\n2x = 4\nx = 2", errors=errors).model_dump()
+
+
+def default_path(feedback: dict) -> bytes:
+    """What /submit/solution does today: dumps for the DB column, model validation, FastAPI serialization."""
+    ai_feedback = json.dumps(feedback)
+    response = SubmissionResponse(image_gcs_url=IMAGE_URL, ocr_text="", ai_feedback=ai_feedback, ai_feedback_data=feedback, submission_id=1)
+    validated = SubmissionResponse.model_validate(response.model_dump())  # response_model check
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def compact_path(feedback: dict, pack_boxes: bool) -> bytes:
+    responses.dumps(feedback)  # the DB column is still written
+    payload = responses.compact_submission_payload(
+        submission_id=1, image_gcs_url=IMAGE_URL, ocr_text="", ai_feedback_data=feedback, pack_boxes=pack_boxes
+    )
+    return responses.FastJSONResponse(payload).body
+
+
+def time_us(repeat: int, fn, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 30, 300])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"serializer: {'orjson' if responses.orjson is not None else 'stdlib json'}")
+    print(f"{'boxes':>6} {'mode':>16} {'time':>10} {'bytes':>8}")
+    for n in args.sizes:
+        feedback = make_feedback(n)
+        variants = [
+            ("default", default_path, (feedback,)),
+            ("compact", compact_path, (feedback, False)),
+            ("compact+packed", compact_path, (feedback, True)),
+        ]
+        for name, fn, fn_args in variants:
+            size = len(fn(*fn_args))
+            print(f"{n:>6} {name:>16} {time_us(args.repeat, fn, *fn_args):>8.1f}us {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
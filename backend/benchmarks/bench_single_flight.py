@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Request Coalescing Check
+========================
+
+Fires N concurrent identical analyses through
+feedback_service.get_errorbouding_from_image against a slow fake GenAI
+client and checks that the two-call model pipeline ran exactly once, that
+every caller got the same feedback, that a model failure reaches every
+coalesced caller, and that a caller whose leader stopped because its own
+client left runs the analysis itself.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_single_flight.py [--callers 100] [--model-latency 0.5]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import feedback_service
+
+
+class FakeRegion:
+    """A detected region, or an error pick (box and id) from the error-selection call."""
+
+    def __init__(self, box_2d, label, id=None):
+        self.box_2d = box_2d
+        self.label = label
+        self.id = id
+
+
+class FakeResponse:
+    def __init__(self, parsed):
+        self.parsed = parsed
+
+    def json(self):
+        return "{}"
+
+
+class FakeModels:
+    """Stands in for client.models; counts calls per stage and sleeps like a remote model."""
+
+    def __init__(self, latency: float, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = {"detect": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        stage = "errors" if "errors only" in config.system_instruction else "detect"
+        with self._lock:
+            self.calls[stage] += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("injected model failure")
+        if stage == "detect":
+            return FakeResponse([FakeRegion([100, 100, 200, 400], "2x+3"), FakeRegion([300, 100, 400, 400], "=7")])
+        return FakeResponse([FakeRegion([300, 100, 400, 400], "=7", id=1)])
+
+
+class FakeClient:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+def fire(callers: int, image_bytes: bytes, models: FakeModels):
+    feedback_service.get_genai_client = lambda location=None: FakeClient(models)
+    barrier = threading.Barrier(callers)
+
+    def call(_):
+        barrier.wait()
+        return feedback_service.get_errorbouding_from_image(gcs_uri="gs://unused/unused.png", image_bytes=image_bytes)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        results = list(pool.map(call, range(callers)))
+    return results, time.perf_counter() - start
+
+
+def check_abandoned_leader() -> None:
+    """
+    The leader's client leaves and it stops at a checkpoint that saw no
+    followers; a caller joining right then must get its own analysis, not
+    the leader's ClientDisconnected.
+    """
+    from app.core import admission
+
+    analyze, runs = feedback_service._analyze_image, []
+    joined = threading.Event()
+
+    def stopping_analysis(image_bytes, problem_id, checkpoint):
+        runs.append(admission.client_disconnected())
+        if len(runs) == 1:
+            joined.wait(5)
+            time.sleep(0.05)  # let the follower block on the flight
+            raise admission.ClientDisconnected("client disconnected")
+        return analyze(image_bytes, problem_id, checkpoint)
+
+    def leader():
+        with admission.cancel_when(gone):
+            try:
+                feedback_service.get_errorbouding_from_image(gcs_uri="gs://unused/unused.png", image_bytes=b"left-canvas")
+            except admission.ClientDisconnected:
+                outcome["leader"] = "disconnected"
+
+    def follower():
+        with admission.cancel_when(threading.Event()):
+            joined.set()
+            outcome["follower"] = feedback_service.get_errorbouding_from_image(
+                gcs_uri="gs://unused/unused.png", image_bytes=b"left-canvas"
+            )["status"]
+
+    feedback_service.get_genai_client = lambda location=None: FakeClient(FakeModels(0.0))
+    feedback_service._analyze_image = stopping_analysis
+    gone, outcome = threading.Event(), {}
+    gone.set()
+    try:
+        threads = [threading.Thread(target=leader)]
+        threads[0].start()
+        time.sleep(0.05)
+        threads.append(threading.Thread(target=follower))
+        threads[1].start()
+        for thread in threads:
+            thread.join()
+    finally:
+        feedback_service._analyze_image = analyze
+    assert outcome == {"leader": "disconnected", "follower": "ok"} and runs == [True, False], (outcome, runs)
+    print("A caller that joined an abandoned flight ran the analysis itself")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=100)
+    parser.add_argument("--model-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    models = FakeModels(args.model_latency)
+    results, elapsed = fire(args.callers, b"same-canvas-png", models)
+    assert models.calls == {"detect": 1, "errors": 1}, models.calls
+    assert all(r == results[0] for r in results)
+    assert results[0]["errors"], results[0]
+    print(f"{args.callers} identical callers -> model calls {models.calls} in {elapsed:.2f}s")
+
+    failing = FakeModels(args.model_latency, fail=True)
+    results, elapsed = fire(args.callers, b"failing-canvas-png", failing)
+    # One detection attempt per configured Vertex AI location (failover), still for one flight.
+    assert failing.calls == {"detect": len(feedback_service.vertex_selector.locations), "errors": 0}, failing.calls
+    assert all(r == {"translated_handwriting": "", "errors": [], "status": "unavailable"} for r in results)
+    print(f"{args.callers} identical callers with a failing model -> model calls {failing.calls}, all got the error result")
+
+    models = FakeModels(0.0)
+    fire(1, b"canvas-a", models)
+    fire(1, b"canvas-b", models)
+    assert models.calls == {"detect": 2, "errors": 2}, models.calls
+    print("Distinct images are not coalesced")
+
+    check_abandoned_leader()
+
+
+if __name__ == "__main__":
+    main()
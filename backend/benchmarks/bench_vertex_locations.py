@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Vertex AI Location Selection Check
+==================================
+
+Runs app.services.vertex_locations.LocationSelector against fake per-location
+GenAI clients with their own latency profiles and checks that traffic:
+
+* settles on the fastest location once every location has been measured,
+* fails over to the next best location, without surfacing errors, when the
+  fastest one starts failing (and that location's breaker opens),
+* moves away from a location that gets slow,
+* comes back once the original location recovers (half-open probe, then
+  periodic re-measurement),
+
+and that a request the API rejects as invalid (4xx) is not retried elsewhere.
+
+Breakers use a 1 s open period here (set through the environment before the
+app is imported).
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_vertex_locations.py [--calls 60]
+"""
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ["BREAKER_OPEN_SECONDS"] = "1"
+
+from app.services.vertex_locations import LocationSelector
+
+PROFILES = {"us-central1": 0.040, "europe-west4": 0.010, "global": 0.020}  # seconds per call
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.failing = False
+        self.calls = 0
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        time.sleep(self.latency)
+        if contents == "invalid":
+            raise FakeAPIError(400, "INVALID_ARGUMENT")
+        if self.failing:
+            raise FakeAPIError(503, "UNAVAILABLE")
+        return "ok"
+
+
+class FakeClient:
+    def __init__(self, latency: float):
+        self.models = FakeModels(latency)
+
+
+def run(selector: LocationSelector, clients, calls: int) -> collections.Counter:
+    """Makes `calls` calls and counts which location answered each one."""
+    served = collections.Counter()
+    for _ in range(calls):
+        before = {location: client.models.calls for location, client in clients.items()}
+        assert selector.generate_content(model="m", contents="x", config=None) == "ok"
+        for location, client in clients.items():
+            if client.models.calls > before[location] and not client.models.failing:
+                served[location] += 1
+    return served
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=60)
+    args = parser.parse_args()
+
+    clients = {location: FakeClient(latency) for location, latency in PROFILES.items()}
+    selector = LocationSelector(list(PROFILES), client_factory=lambda location: clients[location], probe_interval=0.5)
+    fastest = min(PROFILES, key=PROFILES.get)
+
+    served = run(selector, clients, args.calls)
+    print(f"steady state: {dict(served)}")
+    assert served[fastest] >= args.calls * 0.8, served
+
+    clients[fastest].models.failing = True
+    served = run(selector, clients, args.calls)
+    print(f"{fastest} failing: {dict(served)} (no errors surfaced)")
+    assert served[fastest] == 0 and served["global"] >= args.calls * 0.8, served
+
+    clients[fastest].models.failing = False
+    clients[fastest].models.latency = 0.080
+    time.sleep(1.1)  # breaker half-opens; the probe succeeds but the location is now slow
+    served = run(selector, clients, args.calls)
+    print(f"{fastest} recovered but slow: {dict(served)}")
+    assert served["global"] >= args.calls * 0.7, served
+
+    clients[fastest].models.latency = PROFILES[fastest]
+    deadline = time.monotonic() + 5
+    served = collections.Counter()
+    while time.monotonic() < deadline and served[fastest] < args.calls // 2:
+        served += run(selector, clients, 10)
+    print(f"{fastest} back to normal: {dict(served)}")
+    assert served[fastest] >= args.calls // 2, served
+
+    invalid_calls = sum(client.models.calls for client in clients.values())
+    try:
+        selector.generate_content(model="m", contents="invalid", config=None)
+    except FakeAPIError as e:
+        assert e.code == 400
+    assert sum(client.models.calls for client in clients.values()) == invalid_calls + 1
+    print("invalid request raised without failover")
+    print(f"averages: {selector.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Worker Scaling Benchmark
+========================
+
+Starts the production entrypoint (python -m app.entrypoint) with increasing
+WEB_CONCURRENCY and drives it with a fixed number of concurrent clients,
+reporting throughput and latency per worker count. The default target is
+/openapi.json, which is pure JSON/Pydantic work inside the process and so
+shows how well the workers spread CPU-bound load across cores.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/bench_worker_scaling.py [--workers 1 2 4] [--clients 64] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_healthy(base_url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited early with code {proc.returncode}; check your .env")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Server not healthy after {timeout}s")
+
+
+async def drive(base_url: str, path: str, clients: int, duration: float) -> list:
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+    return latencies
+
+
+def run_once(workers: int, path: str, clients: int, duration: float) -> None:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), LOG_LEVEL="warning", WARMUP_ON_STARTUP="false")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.entrypoint"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_healthy(base_url, proc)
+        asyncio.run(drive(base_url, path, clients, 1.0))  # warm every worker
+        latencies = asyncio.run(drive(base_url, path, clients, duration))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f"{workers:>7} {len(latencies) / duration:>10.0f} {statistics.median(latencies) * 1000:>9.1f}ms {p95:>9.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/openapi.json")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"GET {args.path} with {args.clients} concurrent clients for {args.duration:.0f}s per run")
+    print(f"{'workers':>7} {'req/s':>10} {'p50':>11} {'p95':>11}")
+    for workers in args.workers:
+        run_once(workers, args.path, args.clients, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Feedback Pipeline Evaluation
+============================
+
+Runs pipeline variants (prompts, temperature, thinking budget, region limits,
+detector, routing) over a labeled corpus and reports, per variant, error-box
+precision/recall at IoU thresholds next to p50/p95 latency, tokens and cost.
+
+Corpus layout: `<name>.png` canvases, each with `<name>.truth.json`:
+
+    {"errors": [[x1, y1, x2, y2], ...], "problem_id": "optional"}
+
+in the same 0-1000 [x1, y1, x2, y2] frame the API returns (an empty list for
+correct work).
+
+Variants file: a JSON list of
+
+    {"name": "t0-no-thinking",
+     "settings": {"ANALYSIS_ROUTING": false},
+     "constants": {"ERROR_TEMPERATURE": 0.0, "ERROR_THINKING_BUDGET": 0}}
+
+where `settings` overrides app settings and `constants` overrides upper-case
+module constants of app.services.feedback_service (including DETECTION_PROMPT,
+ERROR_PROMPT and ERROR_ID_PROMPT); PROMPT_VERSION picks the template set. Without --variants, a small built-in set is compared.
+
+Every model call is recorded under --cache (keyed on model, contents and
+config), so reruns and variants sharing a call replay it for free; replayed
+calls count with their recorded latency. Live calls are spread over a process
+pool and rate-limited across processes. --replay-only never calls Vertex AI:
+the run aborts on a call with no recording, or on any sample that does not
+come back ok (the pipeline would otherwise score it as "unavailable"). Breakers
+and in-flight analyses are reset before every sample, so one variant's
+failures cannot degrade the next.
+
+Usage (from the backend directory, with the usual .env in place):
+    python benchmarks/eval_feedback.py --corpus path/to/labeled [--variants variants.json]
+        [--cache .eval-cache] [--workers 4] [--rate 2] [--replay-only] [--report out.json]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_region_detector import agreement
+
+# USD per million tokens (input, output incl. thinking). Update when pricing changes.
+PRICES = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+DEFAULT_VARIANTS = [
+    {"name": "baseline"},
+    {"name": "no-routing", "settings": {"ANALYSIS_ROUTING": False}},
+    {"name": "no-routing-t0-no-thinking", "settings": {"ANALYSIS_ROUTING": False},
+     "constants": {"ERROR_TEMPERATURE": 0.0, "ERROR_THINKING_BUDGET": 0}},
+    {"name": "local-detector", "settings": {"REGION_DETECTOR": "local"}},
+    {"name": "prompt-v1", "settings": {"PROMPT_VERSION": "v1"}},
+]
+
+# --- worker process state ---
+
+_cache_dir = None
+_replay_only = False
+_rate_lock = None
+_next_call_at = None
+_min_interval = 0.0
+_originals = {}
+
+
+def _init_worker(cache_dir, replay_only, rate_lock, next_call_at, min_interval):
+    global _cache_dir, _replay_only, _rate_lock, _next_call_at, _min_interval
+    _cache_dir, _replay_only = cache_dir, replay_only
+    _rate_lock, _next_call_at, _min_interval = rate_lock, next_call_at, min_interval
+
+    from app.core.config import settings
+    from app.services import feedback_service
+    from google.genai import types  # noqa: F401  # imported lazily by the pipeline; keep it out of sample latency
+
+    _originals["settings"] = settings.model_dump()
+    _originals["constants"] = {name: getattr(feedback_service, name) for name in dir(feedback_service) if name.isupper()}
+    real_client = feedback_service.get_genai_client
+    feedback_service.get_genai_client = lambda location=None: SimpleNamespace(
+        models=RecordingModels(lambda: real_client(location))
+    )
+
+
+def _rate_limit():
+    """Spaces live model calls at least `_min_interval` apart across all workers."""
+    if not _min_interval:
+        return
+    with _rate_lock:
+        now = time.time()
+        wait = _next_call_at.value - now
+        _next_call_at.value = max(now, _next_call_at.value) + _min_interval
+    if wait > 0:
+        time.sleep(wait)
+
+
+def _content_key(model, contents, config) -> str:
+    digest = hashlib.sha256(model.encode())
+    for item in contents:
+        inline = getattr(item, "inline_data", None)
+        digest.update(hashlib.sha256(inline.data).digest() if inline is not None else str(item).encode())
+    try:
+        config_json = config.model_dump_json(exclude={"response_schema"}, exclude_none=True)
+    except Exception:
+        config_json = repr(config)
+    digest.update(config_json.encode())
+    digest.update(repr(getattr(config, "response_schema", None)).encode())
+    return digest.hexdigest()
+
+
+class RecordingModels:
+    """client.models stand-in that replays recorded responses and records live ones."""
+
+    calls = []  # per task: (model, latency, usage, replayed)
+    missing = []  # per task: recordings --replay-only did not find
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+
+    def generate_content(self, model, contents, config):
+        path = os.path.join(_cache_dir, _content_key(model, contents, config) + ".json")
+        if os.path.exists(path):
+            with open(path) as f:
+                record = json.load(f)
+            replayed = True
+        else:
+            if _replay_only:
+                RecordingModels.missing.append(os.path.basename(path))
+                raise RuntimeError(f"no recording for this call ({os.path.basename(path)}) and --replay-only is set")
+            _rate_limit()
+            start = time.perf_counter()
+            response = self.client_factory().models.generate_content(model=model, contents=contents, config=config)
+            usage = getattr(response, "usage_metadata", None)
+            record = {
+                "model": model,
+                "latency": time.perf_counter() - start,
+                "parsed": [item.model_dump() for item in (getattr(response, "parsed", None) or [])],
+                "usage": {
+                    "input": getattr(usage, "prompt_token_count", None) or 0,
+                    "output": getattr(usage, "candidates_token_count", None) or 0,
+                    "thinking": getattr(usage, "thoughts_token_count", None) or 0,
+                },
+            }
+            with open(path + ".tmp", "w") as f:
+                json.dump(record, f)
+            os.replace(path + ".tmp", path)
+            replayed = False
+
+        RecordingModels.calls.append((model, record["latency"], record["usage"], replayed))
+        item_type = typing.get_args(config.response_schema)[0]  # list[BoundingBox] or list[ErrorPick]
+        parsed = [item_type(**item) for item in record["parsed"]]
+        usage = SimpleNamespace(
+            prompt_token_count=record["usage"]["input"],
+            candidates_token_count=record["usage"]["output"],
+            thoughts_token_count=record["usage"]["thinking"],
+        )
+        return SimpleNamespace(parsed=parsed, usage_metadata=usage, json=lambda: json.dumps(record["parsed"]))
+
+
+def _apply_variant(variant):
+    from app.core import circuit_breaker
+    from app.core.config import settings
+    from app.core.single_flight import SingleFlight
+    from app.services import analysis_router, feedback_service
+
+    for name, value in {**_originals["settings"], **variant.get("settings", {})}.items():
+        setattr(settings, name, value)
+    for name, value in {**_originals["constants"], **variant.get("constants", {})}.items():
+        setattr(feedback_service, name, value)
+    analysis_router.get_policy.cache_clear()
+    feedback_service._recent_feedback.clear()  # never score one variant's cached result against another
+    feedback_service._analysis_flights = SingleFlight()
+    circuit_breaker.reset_all()  # failures of an earlier sample must not short-circuit this one
+    if "DEFAULT_ROUTE" not in variant.get("constants", {}):
+        # DEFAULT_ROUTE is built from the constants at import; rebuild it from the overrides.
+        feedback_service.DEFAULT_ROUTE = analysis_router.RouteTier(
+            name="default",
+            detection_model=feedback_service.DETECTION_MODEL,
+            error_model=feedback_service.ERROR_MODEL,
+            thinking_budget=feedback_service.ERROR_THINKING_BUDGET,
+            region_limit=feedback_service.DETECTION_REGION_LIMIT,
+        )
+
+
+def _run_sample(variant, name, image_path, problem_id):
+    """Runs one canvas through one variant; returns the predicted boxes and cost/latency data."""
+    import contextlib
+    import io
+
+    from app.core.priority_scheduler import BACKGROUND, use_priority
+    from app.services import feedback_service
+
+    _apply_variant(variant)
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    RecordingModels.calls, RecordingModels.missing = [], []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), use_priority(BACKGROUND):
+        result = feedback_service.get_errorbouding_from_image(
+            gcs_uri="gs://eval/unused.png", image_bytes=image_bytes, problem_id=problem_id
+        )
+    local_seconds = time.perf_counter() - start
+    # The pipeline turns model errors into a degraded result; under --replay-only
+    # that means the recordings are incomplete, so stop rather than score it.
+    if _replay_only and RecordingModels.missing:
+        raise RuntimeError(f"{variant['name']}/{name}: no recording for {', '.join(dict.fromkeys(RecordingModels.missing))} and --replay-only is set")
+    if _replay_only and result.get("status", "ok") != "ok":
+        raise RuntimeError(f"{variant['name']}/{name}: status {result.get('status')!r} under --replay-only")
+    calls = RecordingModels.calls
+    model_seconds = sum(latency for _, latency, _, _ in calls)
+    replayed_seconds = sum(latency for _, latency, _, replayed in calls if replayed)
+    return {
+        "variant": variant["name"],
+        "sample": name,
+        "boxes": [error["box_2d"] for error in result["errors"]],
+        "status": result.get("status", "ok"),
+        # Replayed calls return instantly; add back their recorded latency.
+        "latency": local_seconds + replayed_seconds,
+        "model_seconds": model_seconds,
+        "calls": [(model, usage) for model, _, usage, _ in calls],
+        "replayed": sum(1 for *_, replayed in calls if replayed),
+    }
+
+
+# --- parent process ---
+
+def load_corpus(corpus):
+    samples = []
+    for image_path in sorted(glob.glob(os.path.join(corpus, "*.png"))):
+        truth_path = image_path[:-len(".png")] + ".truth.json"
+        if not os.path.exists(truth_path):
+            continue
+        with open(truth_path) as f:
+            truth = json.load(f)
+        samples.append((os.path.basename(image_path)[:-len(".png")], image_path, truth.get("problem_id"), truth.get("errors", [])))
+    return samples
+
+
+def cost(calls) -> float:
+    total = 0.0
+    for model, usage in calls:
+        price_in, price_out = PRICES.get(model, (0.0, 0.0))
+        total += (usage["input"] * price_in + (usage["output"] + usage["thinking"]) * price_out) / 1e6
+    return total
+
+
+def report(variant_name, results, truths, thresholds):
+    latencies = sorted(r["latency"] for r in results)
+    row = {
+        "variant": variant_name,
+        "samples": len(results),
+        "unavailable": sum(1 for r in results if r["status"] != "ok"),
+        "p50_latency": statistics.median(latencies),
+        "p95_latency": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "input_tokens": statistics.mean(sum(u["input"] for _, u in r["calls"]) for r in results),
+        "output_tokens": statistics.mean(sum(u["output"] + u["thinking"] for _, u in r["calls"]) for r in results),
+        "cost_per_1k": 1000 * statistics.mean(cost(r["calls"]) for r in results),
+        "replayed_calls": sum(r["replayed"] for r in results),
+        "live_calls": sum(len(r["calls"]) - r["replayed"] for r in results),
+    }
+    for t in thresholds:
+        matched = predicted = expected = 0
+        for r in results:
+            truth = np.array(truths[r["sample"]], dtype=np.float64).reshape(-1, 4)
+            boxes = np.array(r["boxes"], dtype=np.float64).reshape(-1, 4)
+            m, _ = agreement(boxes, truth, t)
+            matched, predicted, expected = matched + m, predicted + len(boxes), expected + len(truth)
+        row[f"precision@{t}"] = matched / predicted if predicted else 1.0
+        row[f"recall@{t}"] = matched / expected if expected else 1.0
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", required=True, help="Directory of <name>.png + <name>.truth.json")
+    parser.add_argument("--variants", help="JSON file with the variants to compare")
+    parser.add_argument("--cache", default=".eval-cache", help="Directory of recorded model calls")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="Live model calls per second across all workers (0: unlimited)")
+    parser.add_argument("--replay-only", action="store_true")
+    parser.add_argument("--iou", type=float, nargs="+", default=[0.3, 0.5])
+    parser.add_argument("--report", help="Write the per-variant rows (and per-sample results) to this JSON file")
+    args = parser.parse_args()
+
+    variants = DEFAULT_VARIANTS
+    if args.variants:
+        with open(args.variants) as f:
+            variants = json.load(f)
+    samples = load_corpus(args.corpus)
+    if not samples:
+        print("No labeled samples found (<name>.png next to <name>.truth.json).")
+        return
+    truths = {name: errors for name, _, _, errors in samples}
+    os.makedirs(args.cache, exist_ok=True)
+
+    rate_lock = multiprocessing.Lock()
+    next_call_at = multiprocessing.Value("d", 0.0)
+    min_interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(args.cache, args.replay_only, rate_lock, next_call_at, min_interval),
+    ) as pool:
+        futures = [
+            pool.submit(_run_sample, variant, name, image_path, problem_id)
+            for variant in variants
+            for name, image_path, problem_id, _ in samples
+        ]
+        results = [future.result() for future in futures]
+    print(f"{len(samples)} samples x {len(variants)} variants in {time.perf_counter() - start:.1f}s\n")
+
+    rows = [report(v["name"], [r for r in results if r["variant"] == v["name"]], truths, args.iou) for v in variants]
+    header = (
+        f"{'variant':<28}" + "".join(f"  P@{t:<4} R@{t:<4}" for t in args.iou)
+        + "   p50 s   p95 s   in tok  out tok  $/1k  unavail  live/replayed"
+    )
+    print(header)
+    for row in rows:
+        print(
+            f"{row['variant']:<28}"
+            + "".join(f"  {row[f'precision@{t}']:.3f}  {row[f'recall@{t}']:.3f}" for t in args.iou)
+            + f"  {row['p50_latency']:6.2f}  {row['p95_latency']:6.2f}  {row['input_tokens']:7.0f}  {row['output_tokens']:7.0f}"
+            + f"  {row['cost_per_1k']:5.2f}  {row['unavailable']:7d}  {row['live_calls']}/{row['replayed_calls']}"
+        )
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"variants": rows, "results": results}, f, indent=2)
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# backend/manage_problems.py
+"""
+Maintenance of the problem catalog (the `problems` table read by
+app/services/problem_catalog.py).
+
+The seed file is a JSON list of problems:
+
+    [{"id": "problem_2_linear", "title": "Linear equation",
+      "statement": "Solve 3x - 5 = 10.",
+      "steps": ["3x - 5 = 10", "3x = 15", "x = 5"]}]
+
+`steps` is the reference solution in order; the last step is the final
+answer. Problems already in the table are replaced. Running servers keep
+their loaded catalog until they restart.
+
+Usage (from the backend directory, with the usual .env in place):
+    python manage_problems.py seed problems.json
+    python manage_problems.py list
+"""
+
+import argparse
+import json
+import logging
+
+from app.db import crud_problem
+from app.db.database import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def seed(path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        problems = json.load(f)
+    for problem in problems:
+        if not problem.get("id") or not problem.get("steps"):
+            raise ValueError(f"Every problem needs an id and a non-empty steps list: {problem!r}")
+    db = SessionLocal()
+    try:
+        for problem in problems:
+            crud_problem.upsert_problem(
+                db,
+                problem_id=problem["id"],
+                title=problem.get("title") or problem["id"],
+                canonical_steps=[str(step) for step in problem["steps"]],
+                statement=problem.get("statement"),
+            )
+    finally:
+        db.close()
+    logger.info(f"Seeded {len(problems)} problem(s) from {path}.")
+
+def list_problems() -> None:
+    db = SessionLocal()
+    try:
+        problems = crud_problem.list_problems(db)
+    finally:
+        db.close()
+    for problem in problems:
+        steps = json.loads(problem.canonical_steps)
+        logger.info(f"{problem.id:<32} {len(steps):>3} steps  {problem.title}")
+    logger.info(f"{len(problems)} problem(s).")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = commands.add_parser("seed", help="Insert or replace the problems of a JSON file")
+    seed_parser.add_argument("path", help="JSON list of {id, title, statement, steps}")
+    commands.add_parser("list", help="Problems in the catalog table")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        seed(args.path)
+    else:
+        list_problems()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# backend/manage_submissions.py
+"""
+Maintenance of the submissions table (app/db/partitions.py,
+app/services/submission_archive.py, app/services/submission_export.py) and
+of the idempotency keys of submission requests (app/services/idempotency.py)
+and the image derivatives of submissions (app/services/image_derivatives.py).
+
+Usage (from the backend directory, with the usual .env in place):
+    python manage_submissions.py partition            # create upcoming monthly partitions; run daily
+    python manage_submissions.py migrate              # convert an existing plain table to partitions
+    python manage_submissions.py archive [--before 2025-01-01] [--compact]
+    python manage_submissions.py export [--dest gs://bucket/analytics]   # new rows to Parquet
+    python manage_submissions.py purge-keys           # drop expired idempotency keys; run daily
+    python manage_submissions.py derivatives [--limit 500] [--before-id N]   # thumbnails for rows that have none
+    python manage_submissions.py status
+"""
+
+import argparse
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.db import partitions
+from app.db.database import SessionLocal, engine, read_session
+from app.services import idempotency, image_derivatives, submission_archive, submission_export
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def partition() -> None:
+    with engine.begin() as connection:
+        if not partitions.is_partitioned(connection):
+            logger.warning("submissions is not partitioned; run `migrate` first.")
+            return
+        created = partitions.ensure_partitions(connection)
+    logger.info(f"{len(created)} partition(s) created.")
+
+def migrate() -> None:
+    with engine.begin() as connection:
+        if partitions.convert_to_partitioned(connection):
+            logger.info("submissions is now partitioned by month.")
+        else:
+            logger.info("submissions is already partitioned.")
+
+def archive(before: str = None, compact: bool = False) -> None:
+    cutoff = (
+        datetime.fromisoformat(before).replace(tzinfo=timezone.utc) if before
+        else submission_archive.archive_cutoff()
+    )
+    logger.info(f"Archiving submissions before {cutoff.isoformat()}...")
+    db = SessionLocal()
+    try:
+        stats = submission_archive.archive_submissions(db, before=cutoff)
+    finally:
+        db.close()
+    logger.info(f"Archive run finished: {stats}")
+    if compact and stats["rows"]:
+        # Cleared text only frees space once the rows are rewritten.
+        compacted = partitions.compact_partitions(engine, cutoff.date())
+        if not compacted:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.execute(text("VACUUM (ANALYZE) submissions"))
+        logger.info(f"Compacted {len(compacted)} partition(s).")
+
+def export(dest: str = None) -> None:
+    db = read_session()  # the replica when one is configured
+    try:
+        stats = submission_export.export_submissions(db, dest)
+    finally:
+        db.close()
+    logger.info(f"Export run finished: {stats}")
+
+def purge_keys() -> None:
+    db = SessionLocal()
+    try:
+        deleted = idempotency.purge_expired(db)
+    finally:
+        db.close()
+    logger.info(f"Deleted {deleted} expired idempotency key(s).")
+
+def derivatives(limit: int, before_id: int = None) -> None:
+    totals = {"rows": 0, "rendered": 0, "skipped": 0}
+    while True:
+        db = SessionLocal()
+        try:
+            stats = image_derivatives.backfill(db, limit=limit, before_id=before_id)
+        finally:
+            db.close()
+        for name in totals:
+            totals[name] += stats[name]
+        before_id = stats["next_before_id"]
+        if before_id is None:
+            break
+        # Lets an interrupted run resume where it stopped.
+        logger.info(f"Derivatives batch done: {stats}; resume with --before-id {before_id}")
+    logger.info(f"Derivatives run finished: {totals}")
+
+def status() -> None:
+    with engine.connect() as connection:
+        if not partitions.is_partitioned(connection):
+            logger.info("submissions is not partitioned.")
+            return
+        for name, _ in partitions.list_partitions(connection):
+            rows, size, archived = connection.execute(text(
+                f"SELECT count(*), pg_total_relation_size('{name}'), count(archive_uri) FROM {name}"
+            )).one()
+            logger.info(f"{name:<24} {rows:>10} rows {archived:>10} archived {size / 2**20:>10.1f} MiB")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("partition", help="Create the monthly partitions for the coming months")
+    commands.add_parser("migrate", help="Convert a plain submissions table to the partitioned layout")
+    archive_parser = commands.add_parser("archive", help="Move old rows' feedback into compressed blobs")
+    archive_parser.add_argument("--before", help="Archive rows submitted before this date (default: by config)")
+    archive_parser.add_argument(
+        "--compact", action="store_true", help="Rewrite the fully archived monthly partitions afterwards (VACUUM FULL)"
+    )
+    export_parser = commands.add_parser("export", help="Append rows added since the last export to Parquet datasets")
+    export_parser.add_argument("--dest", help="Local directory or gs:// URI (default: SUBMISSION_EXPORT_URI)")
+    commands.add_parser("purge-keys", help="Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS")
+    derivatives_parser = commands.add_parser("derivatives", help="Render thumbnails and annotated images for older rows")
+    derivatives_parser.add_argument("--limit", type=int, default=500, help="Rows per batch, newest first")
+    derivatives_parser.add_argument("--before-id", type=int, help="Only rows with a lower id (resumes a run)")
+    commands.add_parser("status", help="Rows, archived rows and size per partition")
+    args = parser.parse_args()
+
+    if args.command == "partition":
+        partition()
+    elif args.command == "migrate":
+        migrate()
+    elif args.command == "archive":
+        archive(args.before, args.compact)
+    elif args.command == "export":
+        export(args.dest)
+    elif args.command == "purge-keys":
+        purge_keys()
+    elif args.command == "derivatives":
+        derivatives(args.limit, args.before_id)
+    else:
+        status()
+
+if __name__ == "__main__":
+    main()
@@ -88,6 +88,10 @@ const AppLayout: React.FC = () => {
         ? await testAIFeedback(imageFile, token)
         : await submitSolution(imageFile, token);
 
+      if (apiResponse.ai_feedback_data?.status === 'unavailable') {
+        setSubmissionError('AI feedback is temporarily unavailable. Please try again in a moment.');
+      }
+
       if (apiResponse.ai_feedback_data && apiResponse.ai_feedback_data.errors) {
         const translatedBoxes = apiResponse.ai_feedback_data.errors.map(error => {
           const [x1, y1, x2, y2] = error.box_2d;
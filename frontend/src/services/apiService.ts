@@ -19,6 +19,7 @@ export interface ErrorEntry {
 export interface AIFeedbackData {
   translated_handwriting: string; // Complete translation of all handwriting in the image
   errors: ErrorEntry[]; // List of error entries with bounding boxes
+  status?: 'ok' | 'cached' | 'unavailable'; // 'unavailable' when the AI service could not analyze the work
 }
 
 /**
@@ -29,6 +30,7 @@ export interface SubmissionResult {
   ocr_text: string;
   ai_feedback: string; // JSON string of the AI feedback data
   ai_feedback_data: AIFeedbackData; // Structured AI feedback data
+  submission_id?: number; // Used to open a follow-up chat about this submission
 }
 
 /**
@@ -126,4 +128,69 @@ export const testBoundingBoxes = async (imageFile: File, token: string): Promise
   }
 
   return response.json();
-};
\ No newline at end of file
+};
+
+// --- Live analysis while writing (WebSocket) ---
+
+/**
+ * A pen stroke in canvas pixels, as sent to the live analysis socket.
+ */
+export interface LiveStroke {
+  points: [number, number][];
+  width: number;
+  erase?: boolean;
+}
+
+/**
+ * Messages pushed by the live analysis socket.
+ */
+export type LiveMessage =
+  | { type: 'ready'; limits: Record<string, number> }
+  | { type: 'feedback'; errors: ErrorEntry[]; status: AIFeedbackData['status']; lines: number; lines_checked: number }
+  | { type: 'status'; state: 'throttled' | 'unavailable'; retry_after: number }
+  | { type: 'error'; detail: string };
+
+export interface LiveSession {
+  sendStrokes: (strokes: LiveStroke[], canvasWidth: number, canvasHeight: number) => void;
+  sendSnapshot: (image: Blob) => void;
+  undo: (count?: number) => void;
+  clear: () => void;
+  close: () => void;
+}
+
+/**
+ * Opens a live analysis session. Send each finished stroke (or a canvas
+ * snapshot); the server debounces them and pushes error boxes, in the 0-1000
+ * frame of the whole canvas, as lines are completed.
+ *
+ * @param token The Firebase auth ID token for the user.
+ * @param onMessage Called for every message from the server.
+ * @param problemId Catalog problem the work answers (the server default if omitted).
+ */
+export const openLiveSession = (
+  token: string,
+  onMessage: (message: LiveMessage) => void,
+  problemId?: string,
+): LiveSession => {
+  const socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/api/v1/live/ws`);
+  const pending: (string | Blob)[] = [];
+  const send = (data: string | Blob) => {
+    if (socket.readyState === WebSocket.OPEN) socket.send(data);
+    else pending.push(data);
+  };
+
+  socket.onopen = () => {
+    socket.send(JSON.stringify({ type: 'auth', token, problem_id: problemId }));
+    pending.splice(0).forEach(data => socket.send(data));
+  };
+  socket.onmessage = event => onMessage(JSON.parse(event.data) as LiveMessage);
+
+  return {
+    sendStrokes: (strokes, canvasWidth, canvasHeight) =>
+      send(JSON.stringify({ type: 'strokes', width: Math.ceil(canvasWidth), height: Math.ceil(canvasHeight), strokes })),
+    sendSnapshot: image => send(image),
+    undo: (count = 1) => send(JSON.stringify({ type: 'undo', count })),
+    clear: () => send(JSON.stringify({ type: 'clear' })),
+    close: () => socket.close(),
+  };
+};